@@ -0,0 +1,120 @@
+# -*- coding: utf-8 -*-
+
+"""
+Anthropic 请求转换基准：直接构建 payload 与原两步路径对比。
+
+原路径：convert_anthropic_to_openai_request -> build_kiro_payload，
+再对每条消息 model_dump() 作为 token 计数输入（改造前 /v1/messages 的做法）。
+新路径：build_kiro_payload_from_anthropic，直接返回消息字段字典。
+
+负载为一段长 agent 对话（默认 120 条消息、40 个工具），分别在 history/工具
+缓存开启和关闭时测量每次转换的耗时。两个缓存默认都关闭，"on" 一行按
+--history-cache-mb / --tool-spec-cache-mb 开启。
+
+用法:
+    python benchmarks/bench_anthropic_payload.py [--messages 120] [--tools 40] [--iterations 500]
+                                                 [--history-cache-mb 64] [--tool-spec-cache-mb 16]
+"""
+
+import argparse
+import os
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+_TMP = tempfile.mkdtemp(prefix="kirogate-bench-")
+os.environ["USER_DB_FILE"] = os.path.join(_TMP, "users.db")
+os.environ["METRICS_DB_FILE"] = os.path.join(_TMP, "metrics.db")
+os.environ.setdefault("PROXY_API_KEY", "bench")
+
+from loguru import logger  # noqa: E402
+
+logger.remove()
+
+from kiro_gateway.converters import (  # noqa: E402
+    build_kiro_payload,
+    build_kiro_payload_from_anthropic,
+    convert_anthropic_to_openai_request,
+)
+from kiro_gateway.history_cache import history_cache  # noqa: E402
+from kiro_gateway.models import AnthropicMessagesRequest  # noqa: E402
+from kiro_gateway.tool_spec_cache import tool_spec_cache  # noqa: E402
+
+
+def make_request(message_count: int, tool_count: int) -> AnthropicMessagesRequest:
+    tools = [
+        {
+            "name": f"tool_{k}",
+            "description": "Tool description. " * 40,
+            "input_schema": {
+                "type": "object",
+                "properties": {f"p{j}": {"type": "string", "description": "parameter " * 5} for j in range(15)},
+            },
+        }
+        for k in range(tool_count)
+    ]
+    messages = []
+    for i in range(message_count):
+        if i % 2 == 0:
+            content = [{"type": "text", "text": "hello " * 100}]
+            if i:
+                content.append({"type": "tool_result", "tool_use_id": f"toolu_{i - 1}", "content": "r" * 500})
+            messages.append({"role": "user", "content": content})
+        else:
+            messages.append({"role": "assistant", "content": [
+                {"type": "text", "text": "working on it " * 20},
+                {"type": "tool_use", "id": f"toolu_{i}", "name": "tool_1", "input": {"q": "z" * 200}},
+            ]})
+    return AnthropicMessagesRequest(
+        model="claude-sonnet-4", max_tokens=1024, system="S" * 2000, tools=tools, messages=messages
+    )
+
+
+def two_step(request: AnthropicMessagesRequest) -> None:
+    openai_request = convert_anthropic_to_openai_request(request)
+    build_kiro_payload(openai_request, "conversation", "arn")
+    [message.model_dump() for message in openai_request.messages]
+    if openai_request.tools:
+        [tool.model_dump() for tool in openai_request.tools]
+
+
+def direct(request: AnthropicMessagesRequest) -> None:
+    build_kiro_payload_from_anthropic(request, "conversation", "arn")
+
+
+def ms_per_call(fn, request: AnthropicMessagesRequest, iterations: int) -> float:
+    fn(request)
+    start = time.perf_counter()
+    for _ in range(iterations):
+        fn(request)
+    return (time.perf_counter() - start) / iterations * 1000
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--messages", type=int, default=120, help="Messages in the conversation")
+    parser.add_argument("--tools", type=int, default=40, help="Tool definitions in the request")
+    parser.add_argument("--iterations", type=int, default=500, help="Conversions per measurement")
+    parser.add_argument("--history-cache-mb", type=float, default=64.0, help="History cache budget of the 'on' row")
+    parser.add_argument("--tool-spec-cache-mb", type=float, default=16.0, help="Tool spec cache budget of the 'on' row")
+    args = parser.parse_args()
+
+    request = make_request(args.messages, args.tools)
+    budgets = int(args.history_cache_mb * 1024 * 1024), int(args.tool_spec_cache_mb * 1024 * 1024)
+
+    print(f"{'caches':<10}{'two-step ms':>14}{'direct ms':>12}{'speedup':>10}")
+    for label, enabled in (("off", False), ("on", True)):
+        history_cache.max_bytes, tool_spec_cache.max_bytes = budgets if enabled else (0, 0)
+        history_cache.clear()
+        tool_spec_cache.clear()
+        before = ms_per_call(two_step, request, args.iterations)
+        after = ms_per_call(direct, request, args.iterations)
+        print(f"{label:<10}{before:>14.3f}{after:>12.3f}{before / after:>9.2f}x")
+
+
+if __name__ == "__main__":
+    main()
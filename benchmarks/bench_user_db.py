@@ -0,0 +1,133 @@
+# -*- coding: utf-8 -*-
+
+"""
+用户数据库吞吐基准：连接池 + WAL 与每次调用新建连接（改造前的实现）对比。
+
+分别测量 verify_api_key、get_user、record_token_usage 的单线程 ops/sec，
+以及多线程混合负载（读写比约 8:1）的总 ops/sec。数据库建在临时目录中。
+
+用法:
+    python benchmarks/bench_user_db.py [--seconds 2] [--threads 8]
+"""
+
+import argparse
+import gc
+import os
+import sqlite3
+import sys
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+_TMP = tempfile.mkdtemp(prefix="kirogate-bench-")
+os.environ["USER_DB_FILE"] = os.path.join(_TMP, "users.db")
+os.environ["METRICS_DB_FILE"] = os.path.join(_TMP, "metrics.db")
+os.environ.setdefault("PROXY_API_KEY", "bench")
+
+from loguru import logger  # noqa: E402
+
+logger.remove()
+
+from kiro_gateway import database  # noqa: E402
+
+
+def _per_call_conn(db):
+    """Connection-per-call _get_conn (implementation before the pool)."""
+    @contextmanager
+    def _get_conn():
+        conn = sqlite3.connect(db._db_path, timeout=30.0)
+        conn.row_factory = sqlite3.Row
+        try:
+            yield conn
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            conn.close()
+    return _get_conn
+
+
+def make_db(name: str, pooled: bool):
+    database.USER_DB_FILE = os.path.join(_TMP, f"{name}.db")
+    db = database.UserDatabase()
+    if not pooled:
+        # 改造前使用默认的 rollback journal
+        gc.collect()
+        conn = sqlite3.connect(db._db_path)
+        conn.execute("PRAGMA journal_mode=DELETE")
+        conn.close()
+        db._get_conn = _per_call_conn(db)
+    user = db.create_user(username=name, email=f"{name}@bench.local")
+    db.donate_token(user.id, f"refresh-{name}", "public")
+    token_id = db.get_user_tokens(user.id)[0].id
+    plain_key, _ = db.generate_api_key(user.id, "bench")
+    return db, user.id, token_id, plain_key
+
+
+def ops_per_sec(fn, seconds: float) -> float:
+    count = 0
+    deadline = time.perf_counter() + seconds
+    start = time.perf_counter()
+    while time.perf_counter() < deadline:
+        for _ in range(50):
+            fn()
+        count += 50
+    return count / (time.perf_counter() - start)
+
+
+def mixed_ops_per_sec(ops, threads: int, seconds: float) -> float:
+    counts = [0] * threads
+    stop = threading.Event()
+
+    def worker(index: int):
+        n = 0
+        while not stop.is_set():
+            ops[n % len(ops)]()
+            n += 1
+        counts[index] = n
+
+    workers = [threading.Thread(target=worker, args=(i,)) for i in range(threads)]
+    start = time.perf_counter()
+    for worker_thread in workers:
+        worker_thread.start()
+    time.sleep(seconds)
+    stop.set()
+    for worker_thread in workers:
+        worker_thread.join()
+    return sum(counts) / (time.perf_counter() - start)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--seconds", type=float, default=2.0, help="Duration of each measurement")
+    parser.add_argument("--threads", type=int, default=8, help="Threads for the mixed workload")
+    args = parser.parse_args()
+
+    rows = []
+    for label, pooled in (("per-call", False), ("pooled", True)):
+        db, user_id, token_id, plain_key = make_db(label, pooled)
+        single = {
+            "verify_api_key": lambda: db.verify_api_key(plain_key),
+            "get_user": lambda: db.get_user(user_id),
+            "record_token_usage": lambda: db.record_token_usage(token_id, True),
+        }
+        result = {name: ops_per_sec(fn, args.seconds) for name, fn in single.items()}
+        mixed = [single["verify_api_key"], single["get_user"]] * 4 + [single["record_token_usage"]]
+        result[f"mixed x{args.threads}"] = mixed_ops_per_sec(mixed, args.threads, args.seconds)
+        rows.append((label, result))
+
+    names = list(rows[0][1])
+    print(f"{'operation':<22}" + "".join(f"{label:>14}" for label, _ in rows) + f"{'speedup':>10}")
+    for name in names:
+        before, after = rows[0][1][name], rows[1][1][name]
+        print(f"{name:<22}{before:>14,.0f}{after:>14,.0f}{after / before:>9.1f}x")
+
+
+if __name__ == "__main__":
+    main()
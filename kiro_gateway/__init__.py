@@ -83,6 +83,7 @@ from kiro_gateway.converters import (
     extract_text_content,
     merge_adjacent_messages,
     # Anthropic converters
+    build_kiro_payload_from_anthropic,
     convert_anthropic_to_openai_request,
     convert_anthropic_tools_to_openai,
     convert_anthropic_messages_to_openai,
@@ -146,6 +147,7 @@ __all__ = [
     "build_kiro_payload",
     "extract_text_content",
     "merge_adjacent_messages",
+    "build_kiro_payload_from_anthropic",
     "convert_anthropic_to_openai_request",
     "convert_anthropic_tools_to_openai",
     "convert_anthropic_messages_to_openai",
@@ -34,6 +34,7 @@ from loguru import logger
 
 from kiro_gateway.chunked_processor import ChunkedDocumentProcessor, CHARS_PER_TOKEN_ESTIMATE
 from kiro_gateway.config import settings, AUTO_CHUNK_THRESHOLD, CHUNK_MAX_CHARS, CHUNK_OVERLAP_CHARS
+from kiro_gateway.token_calibration import token_calibrator
 
 
 class AutoChunkedProcessor:
@@ -65,6 +66,15 @@ class AutoChunkedProcessor:
             overlap_tokens=self.overlap_chars // CHARS_PER_TOKEN_ESTIMATE
         )
 
+    def _exceeds_threshold(self, text: str) -> bool:
+        """
+        检查文本是否超过分片阈值。
+
+        阈值按 CHARS_PER_TOKEN_ESTIMATE 设定；中文等每 token 字符数较少的文本
+        按在线校准结果（见 token_calibration.py）换算后的阈值判断。
+        """
+        return len(text) > token_calibrator.char_limit(self.threshold, (text,), CHARS_PER_TOKEN_ESTIMATE)
+
     def extract_long_content(self, messages: List[Any]) -> tuple[Optional[str], int, str]:
         """
         从消息列表中提取长文档内容。
@@ -86,7 +96,7 @@ class AutoChunkedProcessor:
                 continue
 
             # 检查字符串类型
-            if isinstance(content, str) and len(content) > self.threshold:
+            if isinstance(content, str) and self._exceeds_threshold(content):
                 return content, i, "string"
 
             # 检查列表类型（多模态内容）
@@ -94,7 +104,7 @@ class AutoChunkedProcessor:
                 for block in content:
                     if isinstance(block, dict) and block.get("type") == "text":
                         text = block.get("text", "")
-                        if len(text) > self.threshold:
+                        if self._exceeds_threshold(text):
                             return text, i, "list"
 
         return None, -1, ""
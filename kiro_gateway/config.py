@@ -150,6 +150,22 @@ class Settings(BaseSettings):
     # 默认最大输入 token 数
     default_max_input_tokens: int = Field(default=200000)
 
+    # ==================================================================================================
+    # 数据库设置
+    # ==================================================================================================
+
+    # 用户数据库连接池大小（WAL 模式下读写互不阻塞）
+    user_db_pool_size: int = Field(default=8, alias="USER_DB_POOL_SIZE")
+
+    # SQLite 忙等待超时（秒）- 写锁被占用时的最长等待时间
+    db_busy_timeout: float = Field(default=30.0, alias="DB_BUSY_TIMEOUT")
+
+    # 数据库执行线程单次事务合并的最大操作数
+    db_write_batch_size: int = Field(default=64, alias="DB_WRITE_BATCH_SIZE")
+
+    # 管理后台列表总数/平均值缓存时间（秒），相关表写入时立即失效，0 表示禁用
+    admin_count_cache_ttl: float = Field(default=30.0, alias="ADMIN_COUNT_CACHE_TTL")
+
     # ==================================================================================================
     # Tool Description 处理（Kiro API 限制）
     # ==================================================================================================
@@ -165,6 +181,79 @@ class Settings(BaseSettings):
     # 日志级别：TRACE, DEBUG, INFO, WARNING, ERROR, CRITICAL
     log_level: str = Field(default="INFO", alias="LOG_LEVEL")
 
+    # ==================================================================================================
+    # 监控设置
+    # ==================================================================================================
+
+    # 事件循环延迟采样间隔（秒）
+    event_loop_lag_interval: float = Field(default=0.5, alias="EVENT_LOOP_LAG_INTERVAL")
+
+    # 事件循环阻塞检测阈值（秒）- 采样任务唤醒超时超过该值时抓取事件循环线程调用栈，0 表示禁用
+    event_loop_block_threshold: float = Field(default=0.25, alias="EVENT_LOOP_BLOCK_THRESHOLD")
+
+    # 统计数据写入间隔（秒）- 内存中的计数器/IP 统计按此间隔批量落盘，
+    # 进程崩溃时最多丢失这段时间内的统计；正常关闭时会全部写入
+    metrics_flush_interval: float = Field(default=5.0, alias="METRICS_FLUSH_INTERVAL")
+
+    # IP 统计最大条目数 - 0 表示不限制（精确统计所有 IP）；
+    # 大于 0 时使用 Space-Saving 算法只保留请求最多的 N 个 IP，内存和 ip_stats 表大小固定
+    ip_stats_max_entries: int = Field(default=0, alias="IP_STATS_MAX_ENTRIES")
+
+    # 多进程统计模式 - 多个 uvicorn worker / 副本共享同一个 metrics.db 时开启；
+    # 各进程以增量方式累加计数，并定期从数据库合并其他进程的数据
+    metrics_multiprocess: bool = Field(default=False, alias="METRICS_MULTIPROCESS")
+
+    # 请求阶段 span 导出文件 - 为空表示不导出；
+    # 设置后每个请求的阶段耗时以 OTLP/JSON 格式逐行追加到该文件
+    trace_export_file: str = Field(default="", alias="TRACE_EXPORT_FILE")
+
+    # ==================================================================================================
+    # Token 计数设置
+    # ==================================================================================================
+
+    # Token 计数缓存内存上限（MB）- 按文本哈希缓存 tiktoken 计数结果，0 表示禁用
+    token_count_cache_mb: float = Field(default=8.0, alias="TOKEN_COUNT_CACHE_MB")
+
+    # 超过该字符数的文本在线程池中编码（tiktoken 编码时释放 GIL），避免阻塞事件循环；0 表示始终在事件循环内编码
+    tokenizer_offload_chars: int = Field(default=16384, alias="TOKENIZER_OFFLOAD_CHARS")
+
+    # Token 编码线程池大小
+    tokenizer_workers: int = Field(default=2, alias="TOKENIZER_WORKERS")
+
+    # Anthropic 流式响应中间 usage 间隔（output tokens）- 每生成约该数量的 token 发送一次
+    # 带当前 output_tokens 的 message_delta 事件；0 表示只在结束时发送（Anthropic 默认行为）
+    stream_usage_interval_tokens: int = Field(default=0, alias="STREAM_USAGE_INTERVAL_TOKENS")
+
+    # 按模型和语言在线校准 Claude token 修正系数（对比 tiktoken 估算与上游 contextUsagePercentage），
+    # 用于 /v1/messages/count_tokens、响应 usage 和自动分片阈值；关闭时固定使用 1.15
+    token_calibration_enabled: bool = Field(default=True, alias="TOKEN_CALIBRATION_ENABLED")
+
+    # ==================================================================================================
+    # 请求转换设置
+    # ==================================================================================================
+
+    # 多轮对话 history 转换缓存内存上限（MB）- 按消息前缀哈希缓存已构建的 Kiro history，
+    # 每轮只转换新增的消息；0 表示禁用（默认：哈希每条消息比直接转换更慢）
+    history_cache_mb: float = Field(default=0.0, alias="HISTORY_CACHE_MB")
+
+    # 工具定义转换缓存内存上限（MB）- 按工具数组哈希缓存转换后的 toolSpecification
+    # 和工具文档；0 表示禁用（默认：哈希工具 schema 比直接转换更慢）
+    tool_spec_cache_mb: float = Field(default=0.0, alias="TOOL_SPEC_CACHE_MB")
+
+    # 请求体快速解析 - /v1/chat/completions、/v1/messages、/v1/messages/count_tokens(/batch)
+    # 用 model_validate_json 一次完成 JSON 解码和校验，Anthropic 内容块保持 dict
+    raw_body_fast_path: bool = Field(default=False, alias="RAW_BODY_FAST_PATH")
+
+    # 服务端上下文压缩 - 对话超出模型输入窗口时，发送前裁剪最早的历史和超长工具结果，
+    # 裁剪情况通过 X-Context-Compaction 响应头返回
+    context_compaction_enabled: bool = Field(default=False, alias="CONTEXT_COMPACTION_ENABLED")
+
+    # 上下文压缩目标 - 压缩后的 token 数不超过 maxInputTokens × 该比例
+    context_compaction_target: float = Field(default=0.9, alias="CONTEXT_COMPACTION_TARGET")
+
+    # 压缩时历史工具结果保留的最大字符数（保留首尾），超出部分优先截断
+    context_compaction_tool_result_chars: int = Field(default=20000, alias="CONTEXT_COMPACTION_TOOL_RESULT_CHARS")
+
     # ==================================================================================================
     # 超时设置
     # ==================================================================================================
@@ -295,6 +384,12 @@ class Settings(BaseSettings):
     # 用户 Session SameSite 策略: lax/strict/none
     user_cookie_samesite: str = Field(default="lax", alias="USER_COOKIE_SAMESITE")
 
+    # 用户 Session 验证缓存有效期（秒），0 表示禁用缓存
+    user_session_cache_ttl: float = Field(default=60.0, alias="USER_SESSION_CACHE_TTL")
+
+    # 用户 Session 验证缓存最大条目数
+    user_session_cache_size: int = Field(default=10000, alias="USER_SESSION_CACHE_SIZE")
+
     # Token 加密密钥（32字节）
     token_encrypt_key: str = Field(default="kirogate_token_encrypt_key_32b!", alias="TOKEN_ENCRYPT_KEY")
 
@@ -304,6 +399,12 @@ class Settings(BaseSettings):
     # Token 最低成功率阈值
     token_min_success_rate: float = Field(default=0.7, alias="TOKEN_MIN_SUCCESS_RATE")
 
+    # API Key 认证缓存有效期（秒），0 表示禁用缓存
+    api_key_cache_ttl: float = Field(default=60.0, alias="API_KEY_CACHE_TTL")
+
+    # API Key 认证缓存最大条目数
+    api_key_cache_size: int = Field(default=10000, alias="API_KEY_CACHE_SIZE")
+
     # 静态资源代理配置
     static_assets_proxy_enabled: bool = Field(default=True, alias="STATIC_ASSETS_PROXY_ENABLED")
     static_assets_proxy_base: str = Field(default="https://proxy.jhun.edu.kg", alias="STATIC_ASSETS_PROXY_BASE")
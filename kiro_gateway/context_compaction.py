@@ -0,0 +1,369 @@
+# -*- coding: utf-8 -*-
+
+"""
+KiroGate 超长对话的服务端上下文压缩（可选，CONTEXT_COMPACTION_ENABLED）。
+
+对话超出模型输入窗口时，Kiro 要等完整上传并往返一次后才拒绝，客户端只能重试。
+开启后 build_kiro_payload 在发送前估算 payload 的 token 数，超出预算
+（maxInputTokens × CONTEXT_COMPACTION_TARGET）时按以下顺序裁剪，直到满足预算：
+
+1. 从最早的消息开始，截断超长的历史工具结果（保留首尾）
+2. 按轮次丢弃最早的历史消息；新的第一条 user 消息去掉已失去对应 toolUse 的
+   toolResults，并重新带上 system prompt 和省略说明
+3. 当前消息：截断超长工具结果、去掉图片，最后截断剩余最长的文本
+
+历史消息中的图片在转换时已替换为占位符，不计入预算。
+当前消息带 toolResults 时，始终保留包含对应 toolUses 的最后一轮历史。
+裁剪结果通过 X-Context-Compaction 响应头返回给客户端。
+"""
+
+import copy
+import json
+from typing import Any, Dict, List, Optional, Tuple
+
+from loguru import logger
+
+from kiro_gateway.config import settings
+from kiro_gateway.token_calibration import language_bucket, token_calibrator
+from kiro_gateway.tokenizer import count_tokens
+
+# 截断后至少保留的字符数（首尾各一半）
+MIN_KEPT_CHARS = 200
+
+
+class ContextCompactor:
+    """Trims one Kiro payload to a token budget and records what was removed."""
+
+    # 单张图片的估算 token 数（Claude 最大尺寸图片约 1600 token）
+    IMAGE_TOKENS = 1600
+    # 每条消息的结构开销
+    MESSAGE_OVERHEAD_TOKENS = 4
+    # 兜底截断的最大轮数（每轮截断当前最长的文本）
+    MAX_SHRINK_ROUNDS = 32
+
+    TRUNCATION_MARKER = "\n\n[... {count} characters omitted by KiroGate to fit the context window ...]\n\n"
+    OMITTED_NOTE = "[KiroGate: {count} earlier messages were omitted to fit the context window]"
+
+    def __init__(
+        self,
+        max_input_tokens: int,
+        model: str,
+        target: Optional[float] = None,
+        tool_result_max_chars: Optional[int] = None
+    ):
+        """
+        Args:
+            max_input_tokens: Model input window (ModelInfoCache.get_max_input_tokens)
+            model: Model name (selects the calibrated token correction factor)
+            target: Share of the window to fill (CONTEXT_COMPACTION_TARGET by default)
+            tool_result_max_chars: Length above which historical tool results are
+                truncated first (CONTEXT_COMPACTION_TOOL_RESULT_CHARS by default)
+        """
+        if target is None:
+            target = settings.context_compaction_target
+        if tool_result_max_chars is None:
+            tool_result_max_chars = settings.context_compaction_tool_result_chars
+        self.budget = int(max_input_tokens * target)
+        self.model = model
+        self.tool_result_max_chars = max(tool_result_max_chars, MIN_KEPT_CHARS)
+        self._factor = 1.0
+        self.tokens_before = 0
+        self.tokens_after = 0
+        self.dropped_messages = 0
+        self.truncated_tool_results = 0
+        self.truncated_messages = 0
+        self.dropped_images = 0
+
+    @property
+    def trimmed(self) -> bool:
+        """True if anything was removed from the payload."""
+        return bool(
+            self.dropped_messages or self.truncated_tool_results
+            or self.truncated_messages or self.dropped_images
+        )
+
+    def header_value(self) -> str:
+        """Format the report for the X-Context-Compaction response header."""
+        return (
+            f"tokens_before={self.tokens_before}, tokens_after={self.tokens_after}, "
+            f"budget={self.budget}, dropped_messages={self.dropped_messages}, "
+            f"truncated_tool_results={self.truncated_tool_results}, "
+            f"truncated_messages={self.truncated_messages}, dropped_images={self.dropped_images}"
+        )
+
+    # ------------------------------------------------------------------
+    # Token estimation
+    # ------------------------------------------------------------------
+
+    def _text_tokens(self, text: str) -> int:
+        return int(count_tokens(text, apply_claude_correction=False) * self._factor) if text else 0
+
+    @staticmethod
+    def _entry_texts(entry: Dict[str, Any]) -> List[str]:
+        """Texts of a history entry or userInputMessage that count toward the budget."""
+        message = ContextCompactor._message_of(entry) or entry
+        texts = [message.get("content") or ""]
+        for result in message.get("userInputMessageContext", {}).get("toolResults", ()):
+            texts.extend(item.get("text") or "" for item in result.get("content", ()))
+        for tool_use in message.get("toolUses", ()):
+            texts.append(tool_use.get("name") or "")
+            texts.append(json.dumps(tool_use.get("input") or {}, ensure_ascii=False))
+        return texts
+
+    def _entry_tokens(self, entry: Dict[str, Any]) -> int:
+        tokens = self.MESSAGE_OVERHEAD_TOKENS + sum(self._text_tokens(text) for text in self._entry_texts(entry))
+        message = entry.get("userInputMessage") or entry
+        return tokens + self.IMAGE_TOKENS * len(message.get("images", ()))
+
+    # ------------------------------------------------------------------
+    # Truncation helpers
+    # ------------------------------------------------------------------
+
+    def _truncate(self, text: str, max_chars: int) -> str:
+        """Keep the head and tail of text, replacing the middle with a marker."""
+        max_chars = max(max_chars, MIN_KEPT_CHARS)
+        if len(text) <= max_chars:
+            return text
+        head = max_chars // 2
+        tail = max_chars - head
+        return text[:head] + self.TRUNCATION_MARKER.format(count=len(text) - max_chars) + text[-tail:]
+
+    def _chars_for_tokens(self, text: str, tokens: int, target_tokens: int) -> int:
+        """Approximate number of characters of text that fit in target_tokens."""
+        if tokens <= 0:
+            return len(text)
+        return int(len(text) * max(target_tokens, 0) / tokens)
+
+    @staticmethod
+    def _tool_result_items(message: Dict[str, Any]) -> List[Dict[str, Any]]:
+        items = []
+        for result in message.get("userInputMessageContext", {}).get("toolResults", ()):
+            items.extend(item for item in result.get("content", ()) if item.get("text"))
+        return items
+
+    # ------------------------------------------------------------------
+    # Compaction
+    # ------------------------------------------------------------------
+
+    def compact(
+        self,
+        history: List[Dict[str, Any]],
+        user_input_message: Dict[str, Any],
+        system_prompt: str
+    ) -> List[Dict[str, Any]]:
+        """
+        Trim history and the current message to the budget.
+
+        History entries may be shared with the history cache and are copied
+        before modification; user_input_message is modified in place.
+
+        Args:
+            history: Kiro history entries
+            user_input_message: Current userInputMessage
+            system_prompt: System prompt merged into the first user message
+
+        Returns:
+            The (possibly shortened) history
+        """
+        texts = [text for entry in history for text in self._entry_texts(entry)]
+        texts += self._entry_texts(user_input_message)
+        tools = user_input_message.get("userInputMessageContext", {}).get("tools", ())
+        tool_texts = [json.dumps(tool, ensure_ascii=False) for tool in tools]
+        images = len(user_input_message.get("images", ()))
+
+        # token 数不超过 UTF-8 字节数：按字节估算的上界不超预算时无需分词
+        factor = token_calibrator.factor(self.model, language_bucket(texts))
+        upper_bound = sum(len(text.encode("utf-8", "surrogatepass")) for text in texts + tool_texts)
+        upper_bound = int(upper_bound * factor) + self.IMAGE_TOKENS * images
+        upper_bound += self.MESSAGE_OVERHEAD_TOKENS * (len(history) + 1)
+        if upper_bound <= self.budget:
+            return history
+
+        self._factor = factor
+        entry_tokens = [self._entry_tokens(entry) for entry in history]
+        tools_tokens = sum(self._text_tokens(text) for text in tool_texts)
+        current_tokens = self._entry_tokens(user_input_message)
+        total = sum(entry_tokens) + tools_tokens + current_tokens
+        self.tokens_before = self.tokens_after = total
+        if total <= self.budget:
+            return history
+
+        history = list(history)
+
+        # 1. 截断最早的超长历史工具结果
+        for index, entry in enumerate(history):
+            if total <= self.budget:
+                break
+            message = entry.get("userInputMessage")
+            if not message or not any(
+                len(item["text"]) > self.tool_result_max_chars for item in self._tool_result_items(message)
+            ):
+                continue
+            entry = history[index] = copy.deepcopy(entry)
+            for item in self._tool_result_items(entry["userInputMessage"]):
+                if len(item["text"]) > self.tool_result_max_chars:
+                    item["text"] = self._truncate(item["text"], self.tool_result_max_chars)
+                    self.truncated_tool_results += 1
+            tokens = self._entry_tokens(entry)
+            total += tokens - entry_tokens[index]
+            entry_tokens[index] = tokens
+
+        # 2. 按轮次丢弃最早的历史
+        if total > self.budget and history:
+            history, total = self._drop_oldest_turns(
+                history, entry_tokens, total, user_input_message, system_prompt
+            )
+
+        # 3. 当前消息及剩余文本
+        if total > self.budget:
+            total = self._shrink_current(history, user_input_message, total)
+
+        self.tokens_after = total
+        if self.trimmed:
+            logger.warning(
+                f"Context compaction for {self.model}: {self.tokens_before} -> {total} tokens "
+                f"(budget {self.budget}): dropped {self.dropped_messages} messages, "
+                f"truncated {self.truncated_tool_results} tool results and {self.truncated_messages} messages, "
+                f"dropped {self.dropped_images} images"
+            )
+        return history
+
+    def _drop_oldest_turns(
+        self,
+        history: List[Dict[str, Any]],
+        entry_tokens: List[int],
+        total: int,
+        user_input_message: Dict[str, Any],
+        system_prompt: str
+    ) -> Tuple[List[Dict[str, Any]], int]:
+        """Drop whole turns (a user entry and its replies) from the front of history."""
+        turn_starts = [index for index, entry in enumerate(history) if "userInputMessage" in entry]
+        turn_starts.append(len(history))
+        # 当前消息的 toolResults 对应最后一条 assistant 的 toolUses，该轮必须保留
+        has_tool_results = bool(user_input_message.get("userInputMessageContext", {}).get("toolResults"))
+        limit = len(history)
+        if has_tool_results and any("assistantResponseMessage" in entry for entry in history):
+            limit = max(start for start in turn_starts if start < len(history)) if len(turn_starts) > 1 else 0
+
+        # system prompt 在原第一条 user 消息中，丢弃后需要重新加上
+        carried_prompt = ""
+        if system_prompt and "userInputMessage" in history[0]:
+            first_content = history[0]["userInputMessage"].get("content") or ""
+            if first_content.startswith(system_prompt):
+                carried_prompt = system_prompt
+        prefix_tokens = self._text_tokens(carried_prompt) + 32  # 省略说明
+
+        cut = 0
+        dropped_tokens = 0
+        for start in turn_starts:
+            if start == 0 or start > limit:
+                continue
+            dropped_tokens = sum(entry_tokens[:start])
+            cut = start
+            if total - dropped_tokens + prefix_tokens <= self.budget:
+                break
+        if cut == 0:
+            return history, total
+
+        self.dropped_messages = cut
+        note = self.OMITTED_NOTE.format(count=cut)
+        history = history[cut:]
+        total -= dropped_tokens
+        if history:
+            entry = history[0] = copy.deepcopy(history[0])
+            message = entry["userInputMessage"]
+            # 对应的 toolUses 已被丢弃
+            context = message.pop("userInputMessageContext", None)
+            if context:
+                context.pop("toolResults", None)
+                if context:
+                    message["userInputMessageContext"] = context
+            message["content"] = "\n\n".join(
+                part for part in (carried_prompt, note, message.get("content") or "") if part
+            )
+            tokens = self._entry_tokens(entry)
+            total += tokens - entry_tokens[cut]
+        else:
+            old_tokens = self._entry_tokens(user_input_message)
+            user_input_message["content"] = "\n\n".join(
+                part for part in (carried_prompt, note, user_input_message.get("content") or "") if part
+            )
+            total += self._entry_tokens(user_input_message) - old_tokens
+        return history, total
+
+    def _shrink_current(
+        self,
+        history: List[Dict[str, Any]],
+        user_input_message: Dict[str, Any],
+        total: int
+    ) -> int:
+        """Last resort: trim the current message, then the longest remaining texts."""
+        # (history 下标，None 为当前消息；工具结果序号，None 为消息内容)，同一文本只计数一次
+        truncated = set()
+        old_tokens = self._entry_tokens(user_input_message)
+        for position, item in enumerate(self._tool_result_items(user_input_message)):
+            if len(item["text"]) > self.tool_result_max_chars:
+                item["text"] = self._truncate(item["text"], self.tool_result_max_chars)
+                truncated.add((None, position))
+                self.truncated_tool_results += 1
+        if user_input_message.get("images"):
+            tokens = self._entry_tokens(user_input_message)
+            if total + tokens - old_tokens > self.budget:
+                self.dropped_images += len(user_input_message.pop("images"))
+        tokens = self._entry_tokens(user_input_message)
+        total += tokens - old_tokens
+
+        # 每轮截断当前最长的文本（当前消息内容、工具结果或保留的历史）
+        for _ in range(self.MAX_SHRINK_ROUNDS):
+            if total <= self.budget:
+                break
+            slots = [(None, None)] + [(None, n) for n in range(len(self._tool_result_items(user_input_message)))]
+            for index, entry in enumerate(history):
+                message = self._message_of(entry)
+                slots.append((index, None))
+                slots.extend((index, n) for n in range(len(self._tool_result_items(message))))
+            index, position = max(slots, key=lambda slot: len(self._slot_text(history, user_input_message, *slot)))
+            text = self._slot_text(history, user_input_message, index, position)
+            if len(text) <= MIN_KEPT_CHARS:
+                break
+            if index is None:
+                message = user_input_message
+            else:
+                # 历史条目可能与缓存共享，先复制再修改
+                history[index] = copy.deepcopy(history[index])
+                message = self._message_of(history[index])
+            tokens = self._text_tokens(text)
+            # 目标长度需扣除截断标记本身的 token 数，否则截断后可能反而变长
+            marker_tokens = self._text_tokens(self.TRUNCATION_MARKER.format(count=len(text)))
+            target_tokens = tokens - (total - self.budget) - marker_tokens - 16
+            new_text = self._truncate(text, self._chars_for_tokens(text, tokens, target_tokens))
+            if len(new_text) >= len(text):
+                break
+            if position is None:
+                message["content"] = new_text
+            else:
+                self._tool_result_items(message)[position]["text"] = new_text
+            if (index, position) not in truncated:
+                truncated.add((index, position))
+                if position is None:
+                    self.truncated_messages += 1
+                else:
+                    self.truncated_tool_results += 1
+            total += self._text_tokens(new_text) - tokens
+        return total
+
+    @staticmethod
+    def _message_of(entry: Dict[str, Any]) -> Dict[str, Any]:
+        return entry.get("userInputMessage") or entry.get("assistantResponseMessage") or {}
+
+    def _slot_text(
+        self,
+        history: List[Dict[str, Any]],
+        user_input_message: Dict[str, Any],
+        index: Optional[int],
+        position: Optional[int]
+    ) -> str:
+        message = user_input_message if index is None else self._message_of(history[index])
+        if position is None:
+            return message.get("content") or ""
+        return self._tool_result_items(message)[position]["text"]
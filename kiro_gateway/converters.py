@@ -27,13 +27,18 @@ OpenAI <-> Kiro 格式转换器。
 - Сборки полного payload для запроса
 """
 
+import hashlib
 import json
 import uuid
-from typing import Any, Dict, List, Optional, Tuple, Union
+from functools import partial
+from typing import Any, Dict, Iterator, List, Optional, Sequence, Tuple, Union
 
 from loguru import logger
 
 from kiro_gateway.config import get_internal_model_id, TOOL_DESCRIPTION_MAX_LENGTH
+from kiro_gateway.context_compaction import ContextCompactor
+from kiro_gateway.history_cache import history_cache, message_digest
+from kiro_gateway.tool_spec_cache import ToolSpecs, tool_spec_cache
 from kiro_gateway.models import (
     ChatMessage,
     ChatCompletionRequest,
@@ -586,10 +591,87 @@ def _extract_tool_uses(msg: ChatMessage) -> List[Dict[str, Any]]:
     return tool_uses
 
 
+def _build_tool_specifications(tools: Optional[List[Tool]]) -> List[Dict[str, Any]]:
+    """
+    Строит список toolSpecification для Kiro API.
+
+    Args:
+        tools: Список инструментов в формате OpenAI
+
+    Returns:
+        Список toolSpecification (только tools с type == "function")
+    """
+    tools_list = []
+    for tool in tools or ():
+        if tool.type == "function":
+            tools_list.append({
+                "toolSpecification": {
+                    "name": tool.function.name,
+                    "description": tool.function.description or "",
+                    "inputSchema": {"json": tool.function.parameters or {}}
+                }
+            })
+    return tools_list
+
+
+def _convert_tool_specs(tools: List[Tool], size: int = 0) -> ToolSpecs:
+    """
+    Полностью конвертирует tools: длинные descriptions, документация, toolSpecification.
+
+    Args:
+        tools: Список инструментов в формате OpenAI
+        size: Размер сериализованных tools в байтах (для учёта памяти кэша)
+
+    Returns:
+        ToolSpecs с результатами конвертации
+    """
+    processed_tools, tool_documentation = process_tools_with_long_descriptions(tools)
+    return ToolSpecs(
+        tuple(tools),
+        tuple(processed_tools) if processed_tools is not None else None,
+        tool_documentation,
+        tuple(_build_tool_specifications(processed_tools)),
+        size,
+    )
+
+
+def _get_tool_specs(tools: Optional[List[Tool]]) -> Optional[ToolSpecs]:
+    """
+    Возвращает сконвертированные tools, по возможности из кэша.
+
+    Tools, полученные из convert_anthropic_tools_to_openai, находятся по
+    идентичности объектов без повторного хеширования; остальные - по хешу
+    канонического JSON.
+
+    Args:
+        tools: Список инструментов в формате OpenAI
+
+    Returns:
+        ToolSpecs или None если tools пуст
+    """
+    if not tools:
+        return None
+    if not tool_spec_cache.enabled:
+        return _convert_tool_specs(tools)
+
+    specs = tool_spec_cache.get_by_identity(tools)
+    if specs is not None:
+        return specs
+    cache_key = tool_spec_cache.key("openai", tools)
+    if cache_key is None:
+        return _convert_tool_specs(tools)
+    key, size = cache_key
+    specs = tool_spec_cache.get(key)
+    if specs is None:
+        specs = _convert_tool_specs(tools, size)
+        tool_spec_cache.put(key, specs)
+    return specs
+
+
 def _extract_system_and_tool_docs(
     messages: List[ChatMessage],
     tools: Optional[List[Tool]]
-) -> Tuple[str, List[ChatMessage], Optional[List[Tool]]]:
+) -> Tuple[str, List[ChatMessage], Optional[ToolSpecs]]:
     """
     提取 system prompt 和 tool 文档。
 
@@ -598,10 +680,11 @@ def _extract_system_and_tool_docs(
         tools: 工具列表
 
     Returns:
-        (system_prompt, non_system_messages, processed_tools)
+        (system_prompt, non_system_messages, tool_specs)
     """
-    # 处理 tools 中的长 descriptions
-    processed_tools, tool_documentation = process_tools_with_long_descriptions(tools)
+    # 处理 tools 中的长 descriptions（相同工具集的转换结果来自缓存）
+    tool_specs = _get_tool_specs(tools)
+    tool_documentation = tool_specs.documentation if tool_specs else ""
 
     # 提取 system prompt
     system_prompt = ""
@@ -617,14 +700,15 @@ def _extract_system_and_tool_docs(
     if tool_documentation:
         system_prompt = system_prompt + tool_documentation if system_prompt else tool_documentation.strip()
 
-    return system_prompt, non_system_messages, processed_tools
+    return system_prompt, non_system_messages, tool_specs
 
 
 def build_kiro_payload(
     request_data: ChatCompletionRequest,
     conversation_id: str,
     profile_arn: str,
-    thinking_config: Optional[Union[Dict[str, Any], bool, str]] = None
+    thinking_config: Optional[Union[Dict[str, Any], bool, str]] = None,
+    compactor: Optional[ContextCompactor] = None
 ) -> dict:
     """
     Строит полный payload для Kiro API.
@@ -644,6 +728,7 @@ def build_kiro_payload(
         conversation_id: Уникальный ID разговора
         profile_arn: ARN профиля AWS CodeWhisperer
         thinking_config: Thinking 模式配置（可选）
+        compactor: 上下文压缩器（可选，超出模型窗口时裁剪 history）
 
     Returns:
         Словарь payload для POST запроса к Kiro API
@@ -651,39 +736,106 @@ def build_kiro_payload(
     Raises:
         ValueError: Если нет сообщений для отправки
     """
-    messages = list(request_data.messages)
+    return _build_payload(
+        list(request_data.messages),
+        request_data.tools,
+        request_data.model,
+        conversation_id,
+        profile_arn,
+        thinking_config,
+        compactor
+    )
 
+
+def build_kiro_payload_from_anthropic(
+    anthropic_request: AnthropicMessagesRequest,
+    conversation_id: str,
+    profile_arn: str,
+    thinking_config: Optional[Union[Dict[str, Any], bool, str]] = None,
+    compactor: Optional[ContextCompactor] = None
+) -> Tuple[dict, List[Dict[str, Any]], Optional[List[Tool]]]:
+    """
+    Строит payload для Kiro API напрямую из запроса Anthropic.
+
+    Результат совпадает с build_kiro_payload(convert_anthropic_to_openai_request(...)),
+    но ChatCompletionRequest не создаётся, а для подсчёта токенов возвращаются
+    те же словари полей, из которых созданы сообщения (вместо model_dump каждого
+    сообщения).
+
+    Args:
+        anthropic_request: Запрос в формате Anthropic
+        conversation_id: Уникальный ID разговора
+        profile_arn: ARN профиля AWS CodeWhisperer
+        thinking_config: Thinking 模式配置（可选）
+        compactor: 上下文压缩器（可选，超出模型窗口时裁剪 history）
+
+    Returns:
+        Tuple из (payload, сообщения в формате OpenAI как словари, tools в формате OpenAI);
+        сообщения и tools нужны для подсчёта токенов
+
+    Raises:
+        ValueError: Если нет сообщений для отправки
+    """
+    message_fields = list(_iter_anthropic_message_fields(anthropic_request.messages, anthropic_request.system))
+    tools = convert_anthropic_tools_to_openai(anthropic_request.tools)
+    payload = _build_payload(
+        [ChatMessage(**fields) for fields in message_fields],
+        tools,
+        anthropic_request.model,
+        conversation_id,
+        profile_arn,
+        thinking_config,
+        compactor
+    )
+    return payload, message_fields, tools
+
+
+def _build_payload(
+    messages: List[ChatMessage],
+    tools: Optional[List[Tool]],
+    model: str,
+    conversation_id: str,
+    profile_arn: str,
+    thinking_config: Optional[Union[Dict[str, Any], bool, str]],
+    compactor: Optional[ContextCompactor] = None
+) -> dict:
+    """
+    Общая часть build_kiro_payload и build_kiro_payload_from_anthropic.
+
+    Args:
+        messages: Сообщения в формате OpenAI
+        tools: Инструменты в формате OpenAI
+        model: Имя модели из запроса
+        conversation_id: Уникальный ID разговора
+        profile_arn: ARN профиля AWS CodeWhisperer
+        thinking_config: Thinking 模式配置
+        compactor: 上下文压缩器（可选）
+
+    Returns:
+        Словарь payload для POST запроса к Kiro API
+    """
     # 使用辅助函数提取 system prompt 和处理 tools（代码简化）
-    system_prompt, non_system_messages, processed_tools = _extract_system_and_tool_docs(
-        messages, request_data.tools
+    system_prompt, non_system_messages, tool_specs = _extract_system_and_tool_docs(
+        messages, tools
     )
 
     # 注入 thinking 标签到 system prompt（如果启用）
     system_prompt = inject_thinking_hint(system_prompt, thinking_config)
 
-    # Объединяем соседние сообщения с одинаковой ролью
-    merged_messages = merge_adjacent_messages(non_system_messages)
+    # Соседние сообщения с одинаковой ролью объединяются (см. merge_adjacent_messages)
+    runs = _merge_runs(non_system_messages)
     
-    if not merged_messages:
+    if not runs:
         raise ValueError("没有可发送的消息")
     
     # Получаем внутренний ID модели
-    model_id = get_internal_model_id(request_data.model)
-    
-    # Строим историю (все сообщения кроме последнего)
-    history_messages = merged_messages[:-1] if len(merged_messages) > 1 else []
-    
-    # Если есть system prompt, добавляем его к первому user сообщению в истории
-    if system_prompt and history_messages:
-        first_msg = history_messages[0]
-        if first_msg.role == "user":
-            original_content = extract_text_content(first_msg.content)
-            first_msg.content = f"{system_prompt}\n\n{original_content}"
+    model_id = get_internal_model_id(model)
     
-    history = build_kiro_history(history_messages, model_id)
+    # Строим историю (все сообщения кроме последнего); уже построенный префикс берётся из кэша
+    history = _build_history_incremental(non_system_messages, runs[:-1], system_prompt, model_id)
     
     # Текущее сообщение (последнее)
-    current_message = merged_messages[-1]
+    current_message = _merge_run(non_system_messages, runs[-1])
     current_content = extract_text_content(current_message.content)
     
     # Если system prompt есть, но история пуста - добавляем к текущему сообщению
@@ -720,9 +872,15 @@ def build_kiro_payload(
 
     # Добавляем tools и tool_results если есть
     # Используем обработанные tools (с короткими descriptions)
-    user_input_context = _build_user_input_context(request_data, current_message, processed_tools)
+    user_input_context = _build_user_input_context(
+        tools, current_message, tool_specs.kiro_tools if tool_specs else None
+    )
     if user_input_context:
         user_input_message["userInputMessageContext"] = user_input_context
+
+    # 超出模型上下文窗口时裁剪最早的历史（CONTEXT_COMPACTION_ENABLED）
+    if compactor is not None:
+        history = compactor.compact(history, user_input_message, system_prompt)
     
     # Собираем финальный payload
     payload = {
@@ -748,10 +906,121 @@ def build_kiro_payload(
     return payload
 
 
+def _merge_runs(messages: List[ChatMessage]) -> List[Tuple[int, int]]:
+    """
+    Разбивает сообщения на группы, которые merge_adjacent_messages объединит в одно.
+
+    Tool messages становятся user сообщениями с tool_results, поэтому группа -
+    это максимальная последовательность сообщений с одинаковой ролью, где
+    "tool" считается как "user".
+
+    Returns:
+        Список диапазонов (start, end) индексов сообщений
+    """
+    runs = []
+    start = 0
+    previous_role = None
+    for index, msg in enumerate(messages):
+        role = "user" if msg.role == "tool" else msg.role
+        if index and role != previous_role:
+            runs.append((start, index))
+            start = index
+        previous_role = role
+    if messages:
+        runs.append((start, len(messages)))
+    return runs
+
+
+def _merge_run(messages: List[ChatMessage], run: Tuple[int, int]) -> ChatMessage:
+    """
+    Объединяет одну группу сообщений.
+
+    merge_adjacent_messages изменяет первое сообщение группы на месте,
+    поэтому объединяется его копия: исходный запрос не меняется.
+    """
+    start, end = run
+    return merge_adjacent_messages([messages[start].model_copy()] + list(messages[start + 1:end]))[0]
+
+
+def _convert_history_runs(
+    messages: List[ChatMessage],
+    runs: List[Tuple[int, int]],
+    system_prompt: str,
+    model_id: str
+) -> List[Dict[str, Any]]:
+    """
+    Строит history для групп сообщений.
+
+    system_prompt добавляется к первой группе, если это user сообщение
+    (передаётся только при построении истории с начала).
+    """
+    history = []
+    for index, run in enumerate(runs):
+        msg = _merge_run(messages, run)
+        if index == 0 and system_prompt and msg.role == "user":
+            msg.content = f"{system_prompt}\n\n{extract_text_content(msg.content)}"
+        history.extend(build_kiro_history([msg], model_id))
+    return history
+
+
+def _build_history_incremental(
+    messages: List[ChatMessage],
+    runs: List[Tuple[int, int]],
+    system_prompt: str,
+    model_id: str
+) -> List[Dict[str, Any]]:
+    """
+    Строит history, переиспользуя закэшированный префикс разговора.
+
+    Префикс ищется по скользящему хэшу сообщений (с моделью и system prompt
+    в качестве начального значения) на границах групп, от самой длинной.
+    Конвертируются только группы после найденного префикса; результат
+    совпадает с построением всей истории заново.
+    """
+    if not runs:
+        return []
+    if not history_cache.enabled:
+        return _convert_history_runs(messages, runs, system_prompt, model_id)
+
+    running = hashlib.blake2b(digest_size=16)
+    running.update(f"{model_id}\x00{system_prompt}".encode("utf-8", "surrogatepass"))
+    boundaries: List[Tuple[bytes, int]] = []  # (хэш префикса, размер) на конце каждой группы
+    size = 0
+    for start, end in runs:
+        for msg in messages[start:end]:
+            digest = message_digest(msg)
+            if digest is None:
+                # Содержимое нельзя однозначно сериализовать - строим без кэша
+                return _convert_history_runs(messages, runs, system_prompt, model_id)
+            running.update(digest[0])
+            size += digest[1]
+        boundaries.append((running.copy().digest(), size))
+
+    history: List[Dict[str, Any]] = []
+    cached_runs = 0
+    for index in range(len(boundaries) - 1, -1, -1):
+        entries = history_cache.get(boundaries[index][0])
+        if entries is not None:
+            history = list(entries)
+            cached_runs = index + 1
+            break
+    if cached_runs == 0:
+        history_cache.record_miss()
+    elif cached_runs == len(runs):
+        return history
+
+    history.extend(_convert_history_runs(
+        messages, runs[cached_runs:], system_prompt if cached_runs == 0 else "", model_id
+    ))
+    key, size = boundaries[-1]
+    history_cache.put(key, tuple(history), size)
+    return history
+
+
 def _build_user_input_context(
-    request_data: ChatCompletionRequest,
+    tools: Optional[List[Tool]],
     current_message: ChatMessage,
-    processed_tools: Optional[List[Tool]] = None
+    tool_specifications: Optional[Sequence[Dict[str, Any]]] = None
 ) -> Dict[str, Any]:
     """
     Строит userInputMessageContext для текущего сообщения.
@@ -759,33 +1028,22 @@ def _build_user_input_context(
     Включает tools definitions и tool_results.
     
     Args:
-        request_data: Запрос с tools
+        tools: Инструменты запроса
         current_message: Текущее сообщение
-        processed_tools: Обработанные tools с короткими descriptions (опционально).
-                        Если None, используются tools из request_data.
+        tool_specifications: Готовые toolSpecification (опционально, см. _get_tool_specs).
+                             Если None, строятся из tools.
     
     Returns:
         Словарь с контекстом или пустой словарь
     """
     context = {}
     
-    # Используем обработанные tools если переданы, иначе оригинальные
-    tools_to_use = processed_tools if processed_tools is not None else request_data.tools
+    if tool_specifications is None:
+        tool_specifications = _build_tool_specifications(tools)
     
-    # Добавляем tools если есть
-    if tools_to_use:
-        tools_list = []
-        for tool in tools_to_use:
-            if tool.type == "function":
-                tools_list.append({
-                    "toolSpecification": {
-                        "name": tool.function.name,
-                        "description": tool.function.description or "",
-                        "inputSchema": {"json": tool.function.parameters or {}}
-                    }
-                })
-        if tools_list:
-            context["tools"] = tools_list
+    # Добавляем tools если есть (список общий для запросов с теми же tools - копируем)
+    if tool_specifications:
+        context["tools"] = list(tool_specifications)
     
     # Обработка tool_results в текущем сообщении
     tool_results = _extract_tool_results(current_message.content)
@@ -814,6 +1072,13 @@ def convert_anthropic_tools_to_openai(tools: Optional[List[AnthropicTool]]) -> O
     if not tools:
         return None
 
+    # Клиенты присылают один и тот же набор tools в каждом запросе
+    cache_key = tool_spec_cache.key("anthropic", tools) if tool_spec_cache.enabled else None
+    if cache_key is not None:
+        specs = tool_spec_cache.get(cache_key[0])
+        if specs is not None:
+            return list(specs.tools)
+
     openai_tools = []
     for tool in tools:
         openai_tool = Tool(
@@ -826,6 +1091,10 @@ def convert_anthropic_tools_to_openai(tools: Optional[List[AnthropicTool]]) -> O
         )
         openai_tools.append(openai_tool)
 
+    if cache_key is not None:
+        # build_kiro_payload найдёт эту запись по идентичности объектов Tool
+        tool_spec_cache.put(cache_key[0], _convert_tool_specs(openai_tools, cache_key[1]))
+
     return openai_tools
 
 
@@ -855,6 +1124,40 @@ def _extract_anthropic_system_prompt(system: Optional[Any]) -> str:
     return str(system)
 
 
+_CONTENT_BLOCK_STR_FIELDS = ("text", "id", "name", "tool_use_id", "thinking")
+_CONTENT_BLOCK_DICT_FIELDS = ("source", "input")
+
+
+def _validates_as_content_blocks(content: List[Any]) -> bool:
+    """
+    Проверяет, что список dict прошёл бы строгую валидацию как List[AnthropicContentBlock].
+
+    Для AnthropicMessage.content pydantic (smart union) выбирает
+    List[AnthropicContentBlock], только если все блоки проходят строгую
+    валидацию (без приведения типов), иначе оставляет блоки как dict.
+    В режиме RAW_BODY_FAST_PATH блоки всегда dict, и эта проверка выбирает
+    ту же ветку обработки.
+    """
+    for block in content:
+        if not isinstance(block, dict) or not isinstance(block.get("type"), str):
+            return False
+        for name in _CONTENT_BLOCK_STR_FIELDS:
+            value = block.get(name)
+            if value is not None and not isinstance(value, str):
+                return False
+        for name in _CONTENT_BLOCK_DICT_FIELDS:
+            value = block.get(name)
+            if value is not None and not isinstance(value, dict):
+                return False
+        value = block.get("content")
+        if value is not None and not isinstance(value, (str, list)):
+            return False
+        value = block.get("is_error")
+        if value is not None and not isinstance(value, bool):
+            return False
+    return True
+
+
 def _convert_anthropic_content_to_openai(
     content: Any,
     _role: str  # noqa: ARG001 - 保留参数以备将来使用
@@ -882,8 +1185,12 @@ def _convert_anthropic_content_to_openai(
     has_images = False
     content_blocks = []  # 保留原始内容块（用于图片）
 
+    # Список dict, который прошёл бы валидацию AnthropicContentBlock, обрабатывается
+    # так же, как модели (режим RAW_BODY_FAST_PATH не меняет результат)
+    blocks_as_models = _validates_as_content_blocks(content)
+
     for block in content:
-        if isinstance(block, dict):
+        if isinstance(block, dict) and not blocks_as_models:
             block_type = block.get("type")
 
             if block_type == "text":
@@ -925,34 +1232,36 @@ def _convert_anthropic_content_to_openai(
                     text_parts.append(f"<thinking>{thinking_text}</thinking>")
                     content_blocks.append({"type": "text", "text": f"<thinking>{thinking_text}</thinking>"})
 
-        elif isinstance(block, AnthropicContentBlock):
-            # Pydantic model
-            if block.type == "text":
-                text_parts.append(block.text or "")
-                content_blocks.append({"type": "text", "text": block.text or ""})
-            elif block.type == "image":
+        elif isinstance(block, (dict, AnthropicContentBlock)):
+            # Pydantic model (или эквивалентный ей dict)
+            field = block.get if isinstance(block, dict) else partial(getattr, block)
+            block_type = field("type")
+            if block_type == "text":
+                text_parts.append(field("text") or "")
+                content_blocks.append({"type": "text", "text": field("text") or ""})
+            elif block_type == "image":
                 # 保留图片数据
                 has_images = True
                 content_blocks.append({
                     "type": "image",
-                    "source": block.source
+                    "source": field("source")
                 })
-            elif block.type == "tool_use":
+            elif block_type == "tool_use":
                 tool_call = {
-                    "id": block.id or "",
+                    "id": field("id") or "",
                     "type": "function",
                     "function": {
-                        "name": block.name or "",
-                        "arguments": json.dumps(block.input or {})
+                        "name": field("name") or "",
+                        "arguments": json.dumps(field("input") or {})
                     }
                 }
                 tool_calls.append(tool_call)
-            elif block.type == "tool_result":
+            elif block_type == "tool_result":
                 tool_result = {
                     "type": "tool_result",
-                    "tool_use_id": block.tool_use_id or "",
-                    "content": _extract_tool_result_content(block.content),
-                    "is_error": block.is_error or False
+                    "tool_use_id": field("tool_use_id") or "",
+                    "content": _extract_tool_result_content(field("content")),
+                    "is_error": field("is_error") or False
                 }
                 tool_results.append(tool_result)
 
@@ -1001,26 +1310,24 @@ def _extract_tool_result_content(content: Any) -> str:
     return str(content)
 
 
-def convert_anthropic_messages_to_openai(
+def _iter_anthropic_message_fields(
     messages: List[AnthropicMessage],
     system: Optional[Any] = None
-) -> List[ChatMessage]:
+) -> Iterator[Dict[str, Any]]:
     """
-    Преобразует Anthropic messages в формат OpenAI.
+    Преобразует Anthropic messages в поля сообщений OpenAI.
 
     Args:
         messages: Список сообщений в формате Anthropic
         system: Системный промпт (опционально)
 
-    Returns:
-        Список сообщений в формате OpenAI
+    Yields:
+        Словари с полями ChatMessage (role, content, tool_calls)
     """
-    openai_messages = []
-
     # Добавляем системный промпт если есть
     system_prompt = _extract_anthropic_system_prompt(system)
     if system_prompt:
-        openai_messages.append(ChatMessage(role="system", content=system_prompt))
+        yield {"role": "system", "content": system_prompt}
 
     for msg in messages:
         role = msg.role
@@ -1030,23 +1337,28 @@ def convert_anthropic_messages_to_openai(
         if isinstance(content, list) and content and any(
             isinstance(c, dict) and c.get("type") == "tool_result" for c in content
         ):
-            openai_messages.append(ChatMessage(
-                role="user",
-                content=content
-            ))
+            yield {"role": "user", "content": content}
         elif role == "assistant":
-            openai_messages.append(ChatMessage(
-                role="assistant",
-                content=content or "",
-                tool_calls=tool_calls
-            ))
+            yield {"role": "assistant", "content": content or "", "tool_calls": tool_calls}
         else:
-            openai_messages.append(ChatMessage(
-                role="user",
-                content=content or ""
-            ))
+            yield {"role": "user", "content": content or ""}
+
+
+def convert_anthropic_messages_to_openai(
+    messages: List[AnthropicMessage],
+    system: Optional[Any] = None
+) -> List[ChatMessage]:
+    """
+    Преобразует Anthropic messages в формат OpenAI.
+
+    Args:
+        messages: Список сообщений в формате Anthropic
+        system: Системный промпт (опционально)
 
-    return openai_messages
+    Returns:
+        Список сообщений в формате OpenAI
+    """
+    return [ChatMessage(**fields) for fields in _iter_anthropic_message_fields(messages, system)]
 
 
 def convert_anthropic_to_openai_request(
@@ -6,20 +6,26 @@ KiroGate 用户系统数据库模块。
 管理用户、Token、API Key 等数据的 SQLite 存储。
 """
 
+import base64
+import binascii
 import hashlib
+import json
 import os
 import secrets
 import sqlite3
 import time
+from collections import OrderedDict
 from contextlib import contextmanager
 from dataclasses import dataclass
-from threading import Lock
-from typing import Dict, List, Optional, Tuple
+from queue import Empty, LifoQueue
+from threading import Condition, Lock, RLock, local
+from typing import Callable, Dict, List, Optional, Tuple
 
 from cryptography.fernet import Fernet
 from loguru import logger
 
 from kiro_gateway.config import settings
+from kiro_gateway.db_executor import DatabaseExecutor
 
 # Database file path
 USER_DB_FILE = os.getenv("USER_DB_FILE", "data/users.db")
@@ -37,6 +43,158 @@ def _get_fernet() -> Fernet:
     return Fernet(base64.urlsafe_b64encode(key))
 
 
+class _PooledConnection(sqlite3.Connection):
+    """SQLite connection tagged with the pool generation it was opened in."""
+    generation: int = 0
+
+
+class SQLiteConnectionPool:
+    """
+    Bounded pool of long-lived SQLite connections.
+
+    Connections are opened lazily up to max_size and shared across threads.
+    Each connection runs in WAL mode with synchronous=NORMAL, so readers never
+    block the writer, and keeps its prepared-statement cache between calls.
+    """
+
+    CACHED_STATEMENTS = 256
+
+    def __init__(self, db_path: str, max_size: int = 8, busy_timeout: float = 30.0):
+        self._db_path = db_path
+        self._max_size = max(1, max_size)
+        self._busy_timeout = busy_timeout
+        self._idle: LifoQueue = LifoQueue()
+        self._lock = Lock()
+        # 借出/归还和暂停状态的通知
+        self._cond = Condition(self._lock)
+        self._created = 0
+        self._borrowed = 0
+        self._paused = 0
+        self._generation = 0
+
+    def _connect(self) -> _PooledConnection:
+        """Open and configure a new connection."""
+        conn = sqlite3.connect(
+            self._db_path,
+            timeout=self._busy_timeout,
+            check_same_thread=False,
+            cached_statements=self.CACHED_STATEMENTS,
+            factory=_PooledConnection,
+        )
+        conn.row_factory = sqlite3.Row
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute(f"PRAGMA busy_timeout={int(self._busy_timeout * 1000)}")
+        conn.execute("PRAGMA temp_store=MEMORY")
+        conn.generation = self._generation
+        return conn
+
+    def acquire(self) -> _PooledConnection:
+        """
+        Borrow a connection.
+
+        Reuses an idle connection if one exists, opens a new one while under
+        max_size, otherwise waits up to busy_timeout for one to be released.
+
+        Waits while the pool is drained (see drained()).
+
+        Raises:
+            sqlite3.OperationalError: If no connection became available in time
+        """
+        with self._cond:
+            if self._paused and not self._cond.wait_for(lambda: not self._paused, self._busy_timeout):
+                raise sqlite3.OperationalError("database is being replaced")
+            self._borrowed += 1
+        try:
+            return self._borrow()
+        except BaseException:
+            with self._cond:
+                self._borrowed -= 1
+                self._cond.notify_all()
+            raise
+
+    def _borrow(self) -> _PooledConnection:
+        try:
+            return self._idle.get_nowait()
+        except Empty:
+            pass
+
+        with self._lock:
+            can_create = self._created < self._max_size
+            if can_create:
+                self._created += 1
+        if can_create:
+            try:
+                return self._connect()
+            except Exception:
+                with self._lock:
+                    self._created -= 1
+                raise
+
+        try:
+            return self._idle.get(timeout=self._busy_timeout)
+        except Empty:
+            raise sqlite3.OperationalError("database connection pool exhausted")
+
+    def release(self, conn: _PooledConnection, discard: bool = False) -> None:
+        """Return a connection to the pool, closing it if stale or broken."""
+        if discard or conn.generation != self._generation:
+            self._close(conn)
+        else:
+            self._idle.put(conn)
+        with self._cond:
+            self._borrowed -= 1
+            self._cond.notify_all()
+
+    def _close(self, conn: _PooledConnection) -> None:
+        try:
+            conn.close()
+        except sqlite3.Error:
+            pass
+        with self._lock:
+            self._created = max(0, self._created - 1)
+
+    def close_all(self) -> None:
+        """
+        Close idle connections and retire those currently borrowed.
+
+        Borrowed connections are closed when released. Used before the
+        database file is replaced on disk.
+        """
+        with self._lock:
+            self._generation += 1
+        while True:
+            try:
+                conn = self._idle.get_nowait()
+            except Empty:
+                break
+            self._close(conn)
+
+    @contextmanager
+    def drained(self, timeout: float):
+        """
+        Close every connection and keep the pool empty for the duration of the block.
+
+        New acquire() calls wait until the block exits; borrowed connections
+        are waited for (up to timeout) and closed when released.
+
+        Raises:
+            sqlite3.OperationalError: If borrowed connections were not released in time
+        """
+        with self._cond:
+            self._paused += 1
+        try:
+            self.close_all()
+            with self._cond:
+                if not self._cond.wait_for(lambda: self._borrowed == 0, timeout):
+                    raise sqlite3.OperationalError("timed out waiting for borrowed database connections")
+            yield
+        finally:
+            with self._cond:
+                self._paused -= 1
+                self._cond.notify_all()
+
+
 @dataclass
 class User:
     """User data model."""
@@ -109,19 +267,232 @@ class ImportKey:
     created_at: int
 
 
+class PrincipalCache:
+    """
+    Bounded TTL cache: credential -> (User, extra).
+
+    Used for API key principals (extra = APIKey) and verified sessions
+    (extra = session_version). Entries are dropped on expiry, LRU eviction or
+    explicit invalidation. A generation counter prevents a lookup that raced
+    with an invalidation from re-inserting stale data.
+    """
+
+    def __init__(self, max_size: int = 10000, ttl: float = 60.0):
+        self._max_size = max(1, max_size)
+        self._ttl = ttl
+        self._entries: OrderedDict[str, tuple] = OrderedDict()  # key -> (expires_at, user, extra)
+        self._lock = Lock()
+        self._generation = 0
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    @property
+    def generation(self) -> int:
+        return self._generation
+
+    def get(self, key: str) -> Optional[tuple]:
+        """Return the cached (user, extra), or None on miss/expiry."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] < time.time():
+                if entry is not None:
+                    del self._entries[key]
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1], entry[2]
+
+    def put(
+        self,
+        key: str,
+        user: User,
+        extra,
+        generation: int,
+        expires_at: Optional[float] = None
+    ) -> None:
+        """
+        Cache a principal loaded while the cache was at `generation`.
+
+        Args:
+            expires_at: Optional hard expiry (unix time), e.g. session max_age
+        """
+        if self._ttl <= 0:
+            return
+        deadline = time.time() + self._ttl
+        if expires_at is not None:
+            deadline = min(deadline, expires_at)
+        with self._lock:
+            if generation != self._generation:
+                return
+            self._entries[key] = (deadline, user, extra)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self._max_size:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, match: Callable[[User, object], bool]) -> None:
+        """Drop every entry for which match(user, extra) is true."""
+        with self._lock:
+            self._generation += 1
+            self.invalidations += 1
+            stale = [key for key, (_, user, extra) in self._entries.items() if match(user, extra)]
+            for key in stale:
+                del self._entries[key]
+
+    def invalidate_user(self, user_id: int) -> None:
+        """Drop all entries belonging to a user."""
+        self.invalidate(lambda user, _extra: user.id == user_id)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._generation += 1
+            self.invalidations += 1
+            self._entries.clear()
+
+    def get_stats(self) -> Dict:
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "size": len(self._entries),
+                "hits": self.hits,
+                "misses": self.misses,
+                "invalidations": self.invalidations,
+                "hitRate": round(self.hits / total, 4) if total else 0.0,
+            }
+
+
+class AggregateCache:
+    """
+    TTL cache for COUNT/AVG aggregates used by admin list pages.
+
+    Entries are grouped by table and dropped when that table is written;
+    the TTL bounds staleness for high-frequency writes that are not hooked
+    (e.g. per-request token usage counters).
+    """
+
+    def __init__(self, ttl: float = 30.0):
+        self._ttl = ttl
+        self._entries: Dict[tuple, Tuple[float, object]] = {}
+        self._versions: Dict[str, int] = {}
+        self._lock = Lock()
+
+    def get_or_compute(self, table: str, key: tuple, compute: Callable[[], object]):
+        """Return the cached value for (table, key), computing it on miss."""
+        cache_key = (table, key)
+        with self._lock:
+            entry = self._entries.get(cache_key)
+            if entry and entry[0] > time.time():
+                return entry[1]
+            version = self._versions.get(table, 0)
+        value = compute()
+        if self._ttl > 0:
+            with self._lock:
+                # Skip if the table was written while computing
+                if self._versions.get(table, 0) == version:
+                    self._entries[cache_key] = (time.time() + self._ttl, value)
+        return value
+
+    def invalidate(self, *tables: str) -> None:
+        with self._lock:
+            for table in tables:
+                self._versions[table] = self._versions.get(table, 0) + 1
+            self._entries = {k: v for k, v in self._entries.items() if k[0] not in tables}
+
+    def clear(self) -> None:
+        with self._lock:
+            for table in {k[0] for k in self._entries}:
+                self._versions[table] = self._versions.get(table, 0) + 1
+            self._entries.clear()
+
+
+def _encode_cursor(sort_field: str, order: str, sort_value, row_id: int) -> str:
+    """Encode a keyset pagination cursor (opaque to clients)."""
+    raw = json.dumps([sort_field, order, sort_value, row_id], separators=(",", ":"))
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+
+def _decode_cursor(cursor: str, sort_field: str, order: str) -> Tuple[object, int]:
+    """
+    Decode a keyset cursor into (sort_value, id).
+
+    Raises:
+        ValueError: If the cursor is malformed or was issued for another sort
+    """
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        field, cursor_order, sort_value, row_id = json.loads(base64.urlsafe_b64decode(padded))
+    except (binascii.Error, ValueError, TypeError) as e:
+        raise ValueError("分页游标无效") from e
+    if field != sort_field or cursor_order != order or not isinstance(row_id, int):
+        raise ValueError("分页游标与排序条件不匹配")
+    return sort_value, row_id
+
+
+# Keyset 分页排序表达式，须与 _init_db 中的表达式索引保持一致
+TOKEN_SUCCESS_RATE_SQL = (
+    "CASE WHEN (success_count + fail_count) > 0 "
+    "THEN CAST(success_count AS REAL) / (success_count + fail_count) "
+    "ELSE 1.0 END"
+)
+
+USER_SORT_EXPRESSIONS = {
+    "id": "users.id",
+    "username": "users.username",
+    "created_at": "users.created_at",
+    "last_login": "COALESCE(users.last_login, 0)",
+    "trust_level": "COALESCE(users.trust_level, 0)",
+    "token_count": "(SELECT COUNT(*) FROM tokens t WHERE t.user_id = users.id)",
+    "api_key_count": "(SELECT COUNT(*) FROM api_keys k WHERE k.user_id = users.id AND k.is_active = 1)",
+    "is_banned": "COALESCE(users.is_banned, 0)",
+    "approval_status": "COALESCE(users.approval_status, 'approved')",
+}
+
+# 关联子查询排序没有索引可用，只按 LIMIT/OFFSET 分页，不签发游标
+USER_OFFSET_ONLY_SORTS = {"token_count", "api_key_count"}
+
+TOKEN_SORT_EXPRESSIONS = {
+    "id": "t.id",
+    "username": "COALESCE(u.username, '')",
+    "created_at": "t.created_at",
+    "last_used": "COALESCE(t.last_used, 0)",
+    "success_rate": TOKEN_SUCCESS_RATE_SQL.replace("success_count", "t.success_count").replace("fail_count", "t.fail_count"),
+    "use_count": "(t.success_count + t.fail_count)",
+}
+
+
 class UserDatabase:
     """User system database manager."""
 
     def __init__(self):
-        self._lock = Lock()
+        # 写锁，可重入：数据库执行线程在整个写批次期间持有该锁。
+        # 事件循环上的写操作都经 user_db_executor 执行，不会在这里等待批次
+        self._lock = RLock()
+        self._local = local()
         self._db_path = USER_DB_FILE
         self._fernet = _get_fernet()
         self._init_db()
+        self._pool = SQLiteConnectionPool(
+            self._db_path,
+            max_size=settings.user_db_pool_size,
+            busy_timeout=settings.db_busy_timeout,
+        )
+        self.api_key_cache = PrincipalCache(
+            max_size=settings.api_key_cache_size,
+            ttl=settings.api_key_cache_ttl,
+        )
+        self.session_cache = PrincipalCache(
+            max_size=settings.user_session_cache_size,
+            ttl=settings.user_session_cache_ttl,
+        )
+        self._aggregates = AggregateCache(ttl=settings.admin_count_cache_ttl)
 
     def _init_db(self) -> None:
         """Initialize database schema."""
         os.makedirs(os.path.dirname(self._db_path) or ".", exist_ok=True)
         with sqlite3.connect(self._db_path) as conn:
+            # WAL is persistent in the database file; readers no longer block writers
+            conn.execute("PRAGMA journal_mode=WAL")
             conn.executescript('''
                 -- Users table
                 CREATE TABLE IF NOT EXISTS users (
@@ -271,22 +642,125 @@ class UserDatabase:
                 conn.execute("ALTER TABLE tokens ADD COLUMN client_id_encrypted TEXT")
             if "client_secret_encrypted" not in token_columns:
                 conn.execute("ALTER TABLE tokens ADD COLUMN client_secret_encrypted TEXT")
+            # Keyset 分页与列表筛选用的覆盖索引（在字段迁移之后创建）
+            conn.executescript(f'''
+                CREATE INDEX IF NOT EXISTS idx_users_created ON users(created_at, id);
+                CREATE INDEX IF NOT EXISTS idx_users_username ON users(username, id);
+                CREATE INDEX IF NOT EXISTS idx_users_last_login ON users(COALESCE(last_login, 0), id);
+                CREATE INDEX IF NOT EXISTS idx_users_trust_level ON users(COALESCE(trust_level, 0), id);
+                CREATE INDEX IF NOT EXISTS idx_users_banned_sort ON users(COALESCE(is_banned, 0), id);
+                CREATE INDEX IF NOT EXISTS idx_users_approval_sort ON users(COALESCE(approval_status, 'approved'), id);
+                CREATE INDEX IF NOT EXISTS idx_users_approval ON users(approval_status, created_at, id);
+                CREATE INDEX IF NOT EXISTS idx_users_banned ON users(is_banned, created_at, id);
+                CREATE INDEX IF NOT EXISTS idx_tokens_created ON tokens(created_at, id);
+                CREATE INDEX IF NOT EXISTS idx_tokens_last_used ON tokens(COALESCE(last_used, 0), id);
+                CREATE INDEX IF NOT EXISTS idx_tokens_use_count ON tokens((success_count + fail_count), id);
+                CREATE INDEX IF NOT EXISTS idx_tokens_success_rate ON tokens(({TOKEN_SUCCESS_RATE_SQL}), id);
+                CREATE INDEX IF NOT EXISTS idx_tokens_status_created ON tokens(status, created_at, id);
+                CREATE INDEX IF NOT EXISTS idx_tokens_public_rank ON tokens(visibility, status, success_count, id);
+                CREATE INDEX IF NOT EXISTS idx_apikeys_user_active ON api_keys(user_id, is_active);
+            ''')
             conn.commit()
         logger.info(f"User database initialized: {self._db_path}")
 
     @contextmanager
     def _get_conn(self):
-        """Get database connection with context manager."""
-        conn = sqlite3.connect(self._db_path, timeout=30.0)
-        conn.row_factory = sqlite3.Row
+        """Borrow a pooled connection; commit on success, rollback on error."""
+        batch_conn = getattr(self._local, "conn", None)
+        if batch_conn is not None:
+            # Inside batch(): the batch owner commits
+            yield batch_conn
+            return
+        conn = self._pool.acquire()
+        outer_callbacks = getattr(self._local, "after_commit", None)
+        callbacks = self._local.after_commit = []
+        discard = False
         try:
             yield conn
             conn.commit()
         except Exception:
-            conn.rollback()
+            try:
+                conn.rollback()
+            except sqlite3.Error:
+                discard = True
             raise
         finally:
-            conn.close()
+            self._local.after_commit = outer_callbacks
+            self._pool.release(conn, discard=discard)
+            # 提交（或回滚）之后再失效缓存：并发读取在此之前读到的旧行无法再写回缓存
+            for callback in callbacks:
+                callback()
+
+    def _after_commit(self, callback: Callable[[], None]) -> None:
+        """
+        Run callback once the current transaction ends (the whole batch inside
+        batch()), or immediately if no transaction is open on this thread.
+        """
+        callbacks = getattr(self._local, "after_commit", None)
+        if callbacks is None:
+            callback()
+        else:
+            callbacks.append(callback)
+
+    @contextmanager
+    def batch(self):
+        """
+        Run several calls in a single transaction on the current thread.
+
+        Calls made inside the block reuse the batch connection and do not
+        commit on their own. Used by the database executor thread for writes;
+        reads go through user_db_executor.read() on pooled connections.
+        """
+        with self._lock:
+            with self._get_conn() as conn:
+                conn.execute("BEGIN")
+                self._local.conn = conn
+                try:
+                    yield conn
+                finally:
+                    self._local.conn = None
+
+    def reset_connections(self) -> None:
+        """Close pooled connections and drop cached principals."""
+        self._pool.close_all()
+        self.api_key_cache.clear()
+        self.session_cache.clear()
+        self._aggregates.clear()
+
+    @contextmanager
+    def exclusive(self):
+        """
+        Quiesce the database for copying or replacing the file on disk.
+
+        Takes the write lock (waits for the running executor batch), waits
+        for borrowed connections, and checkpoints the WAL into the main file
+        so a copy of it is complete. No connection is open inside the block;
+        cached principals are dropped on exit.
+        """
+        with self._lock:
+            with self._pool.drained(settings.db_busy_timeout):
+                conn = sqlite3.connect(self._db_path, timeout=settings.db_busy_timeout)
+                try:
+                    conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+                finally:
+                    conn.close()
+                try:
+                    yield
+                finally:
+                    self.reset_connections()
+
+    def _invalidate_user_caches(self, user_id: int) -> None:
+        """Drop cached API key principals and sessions of a user once its row change commits."""
+        self._after_commit(lambda: self.api_key_cache.invalidate_user(user_id))
+        self._after_commit(lambda: self.session_cache.invalidate_user(user_id))
+
+    def _invalidate_aggregates(self, *tables: str) -> None:
+        """Drop cached admin counts of tables once the write commits."""
+        self._after_commit(lambda: self._aggregates.invalidate(*tables))
+
+    def _invalidate_api_key(self, key_id: int) -> None:
+        """Drop the cached principal of an API key once its row change commits."""
+        self._after_commit(lambda: self.api_key_cache.invalidate(lambda _user, api_key: api_key.id == key_id))
 
     # ==================== User Methods ====================
 
@@ -328,6 +802,7 @@ class UserDatabase:
                     )
                 )
                 user_id = cursor.lastrowid
+                self._invalidate_aggregates("users")
                 return User(
                     id=user_id,
                     linuxdo_id=linuxdo_id,
@@ -515,6 +990,7 @@ class UserDatabase:
                     (linuxdo_id, username, avatar_url, trust_level, now, now)
                 )
                 user_id = cursor.lastrowid
+                self._invalidate_aggregates("users")
                 return User(
                     id=user_id,
                     linuxdo_id=linuxdo_id,
@@ -562,6 +1038,7 @@ class UserDatabase:
                     (github_id, username, avatar_url, trust_level, now, now)
                 )
                 user_id = cursor.lastrowid
+                self._invalidate_aggregates("users")
                 return User(
                     id=user_id,
                     linuxdo_id=None,
@@ -584,18 +1061,28 @@ class UserDatabase:
         with self._lock:
             with self._get_conn() as conn:
                 conn.execute("UPDATE users SET last_login = ? WHERE id = ?", (now, user_id))
+        self._invalidate_user_caches(user_id)
 
     def set_user_admin(self, user_id: int, is_admin: bool) -> None:
         """Set user admin status."""
         with self._lock:
             with self._get_conn() as conn:
                 conn.execute("UPDATE users SET is_admin = ? WHERE id = ?", (1 if is_admin else 0, user_id))
+        self._invalidate_aggregates("users")
+        self._invalidate_user_caches(user_id)
 
-    def set_user_banned(self, user_id: int, is_banned: bool) -> None:
+    def set_user_banned(self, user_id: int, is_banned: bool) -> bool:
         """Set user banned status."""
         with self._lock:
             with self._get_conn() as conn:
-                conn.execute("UPDATE users SET is_banned = ? WHERE id = ?", (1 if is_banned else 0, user_id))
+                cursor = conn.execute(
+                    "UPDATE users SET is_banned = ? WHERE id = ?",
+                    (1 if is_banned else 0, user_id)
+                )
+        self._invalidate_aggregates("users")
+        # 立即失效该用户所有 API Key 和会话的缓存
+        self._invalidate_user_caches(user_id)
+        return cursor.rowcount > 0
 
     def set_user_approval_status(self, user_id: int, status: str) -> None:
         """Set user approval status."""
@@ -605,20 +1092,18 @@ class UserDatabase:
         with self._lock:
             with self._get_conn() as conn:
                 conn.execute("UPDATE users SET approval_status = ? WHERE id = ?", (status, user_id))
+        self._invalidate_aggregates("users")
+        self._invalidate_user_caches(user_id)
 
-    def get_all_users(
+    def _user_filters(
         self,
-        limit: int = 100,
-        offset: int = 0,
         search: str = "",
         is_admin: Optional[bool] = None,
         is_banned: Optional[bool] = None,
         approval_status: Optional[str] = None,
-        trust_level: Optional[int] = None,
-        sort_field: str = "created_at",
-        sort_order: str = "desc"
-    ) -> List[User]:
-        """Get users with pagination, filters, and sorting."""
+        trust_level: Optional[int] = None
+    ) -> Tuple[List[str], list]:
+        """Build WHERE clauses for user list queries."""
         where: list[str] = []
         params: list = []
         if search:
@@ -639,30 +1124,91 @@ class UserDatabase:
         if trust_level is not None:
             where.append("trust_level = ?")
             params.append(trust_level)
+        return where, params
 
-        allowed_sort = {
-            "id": "id",
-            "username": "username",
-            "created_at": "created_at",
-            "last_login": "last_login",
-            "trust_level": "trust_level",
-            "token_count": "(SELECT COUNT(*) FROM tokens t WHERE t.user_id = users.id)",
-            "api_key_count": "(SELECT COUNT(*) FROM api_keys k WHERE k.user_id = users.id AND k.is_active = 1)",
-            "is_banned": "is_banned",
-            "approval_status": "approval_status",
-        }
-        sort_column = allowed_sort.get(sort_field, "created_at")
+    def get_all_users(
+        self,
+        limit: int = 100,
+        offset: int = 0,
+        search: str = "",
+        is_admin: Optional[bool] = None,
+        is_banned: Optional[bool] = None,
+        approval_status: Optional[str] = None,
+        trust_level: Optional[int] = None,
+        sort_field: str = "created_at",
+        sort_order: str = "desc"
+    ) -> List[User]:
+        """Get users with pagination, filters, and sorting."""
+        users, _ = self.get_users_page(
+            limit=limit,
+            offset=offset,
+            search=search,
+            is_admin=is_admin,
+            is_banned=is_banned,
+            approval_status=approval_status,
+            trust_level=trust_level,
+            sort_field=sort_field,
+            sort_order=sort_order
+        )
+        return users
+
+    def get_users_page(
+        self,
+        limit: int = 100,
+        offset: int = 0,
+        cursor: Optional[str] = None,
+        search: str = "",
+        is_admin: Optional[bool] = None,
+        is_banned: Optional[bool] = None,
+        approval_status: Optional[str] = None,
+        trust_level: Optional[int] = None,
+        sort_field: str = "created_at",
+        sort_order: str = "desc"
+    ) -> Tuple[List[User], Optional[str]]:
+        """
+        Get one page of users.
+
+        With a cursor (next_cursor of the previous page) the page is read by
+        keyset seek on (sort expression, id) and offset is ignored; without one
+        it falls back to LIMIT/OFFSET. Sorts in USER_OFFSET_ONLY_SORTS always
+        use LIMIT/OFFSET and return no cursor.
+
+        Returns:
+            (users, next_cursor) - next_cursor is None on the last page
+
+        Raises:
+            ValueError: If the cursor is invalid for this sort
+        """
+        if sort_field not in USER_SORT_EXPRESSIONS:
+            sort_field = "created_at"
+        sort_expr = USER_SORT_EXPRESSIONS[sort_field]
         order = "ASC" if sort_order.lower() == "asc" else "DESC"
 
-        query = "SELECT * FROM users"
+        keyset = sort_field not in USER_OFFSET_ONLY_SORTS
+        where, params = self._user_filters(search, is_admin, is_banned, approval_status, trust_level)
+        if cursor and keyset:
+            sort_value, last_id = _decode_cursor(cursor, sort_field, order)
+            # 首列单独给出范围条件，表达式索引才能直接定位（行值比较只对普通列生效）
+            where.append(f"{sort_expr} {'>=' if order == 'ASC' else '<='} ?")
+            where.append(f"({sort_expr}, users.id) {'>' if order == 'ASC' else '<'} (?, ?)")
+            params.extend([sort_value, sort_value, last_id])
+
+        query = f"SELECT users.*, {sort_expr} AS _sort_key FROM users"
         if where:
             query += " WHERE " + " AND ".join(where)
-        query += f" ORDER BY {sort_column} {order} LIMIT ? OFFSET ?"
-        params.extend([limit, offset])
+        query += f" ORDER BY {sort_expr} {order}, users.id {order} LIMIT ?"
+        params.append(limit)
+        if not (cursor and keyset) and offset:
+            query += " OFFSET ?"
+            params.append(offset)
 
         with self._get_conn() as conn:
             rows = conn.execute(query, params).fetchall()
-            return [self._row_to_user(r) for r in rows]
+        users = [self._row_to_user(r) for r in rows]
+        next_cursor = None
+        if keyset and rows and len(rows) == limit:
+            next_cursor = _encode_cursor(sort_field, order, rows[-1]["_sort_key"], rows[-1]["id"])
+        return users, next_cursor
 
     def get_user_count(
         self,
@@ -672,34 +1218,18 @@ class UserDatabase:
         approval_status: Optional[str] = None,
         trust_level: Optional[int] = None
     ) -> int:
-        """Get total user count with optional filters."""
-        where: list[str] = []
-        params: list = []
-        if search:
-            like = f"%{search}%"
-            where.append(
-                "(username LIKE ? OR CAST(id AS TEXT) LIKE ? OR linuxdo_id LIKE ? OR github_id LIKE ? OR email LIKE ?)"
-            )
-            params.extend([like, like, like, like, like])
-        if is_admin is not None:
-            where.append("is_admin = ?")
-            params.append(1 if is_admin else 0)
-        if is_banned is not None:
-            where.append("is_banned = ?")
-            params.append(1 if is_banned else 0)
-        if approval_status:
-            where.append("approval_status = ?")
-            params.append(approval_status)
-        if trust_level is not None:
-            where.append("trust_level = ?")
-            params.append(trust_level)
-
+        """Get total user count with optional filters (cached until users change)."""
+        where, params = self._user_filters(search, is_admin, is_banned, approval_status, trust_level)
         query = "SELECT COUNT(*) FROM users"
         if where:
             query += " WHERE " + " AND ".join(where)
-        with self._get_conn() as conn:
-            result = conn.execute(query, params).fetchone()
-            return result[0] if result else 0
+
+        def _count() -> int:
+            with self._get_conn() as conn:
+                result = conn.execute(query, params).fetchone()
+                return result[0] if result else 0
+
+        return self._aggregates.get_or_compute("users", (query, tuple(params)), _count)
 
     def _row_to_user(self, row: sqlite3.Row) -> User:
         """Convert database row to User object."""
@@ -752,7 +1282,8 @@ class UserDatabase:
                     "SELECT session_version FROM users WHERE id = ?",
                     (user_id,)
                 ).fetchone()
-                return row["session_version"] if row else 1
+        self._invalidate_user_caches(user_id)
+        return row["session_version"] if row else 1
 
     # ==================== Token Methods ====================
 
@@ -824,6 +1355,7 @@ class UserDatabase:
                      client_id_enc, client_secret_enc,
                      visibility, is_anonymous, now)
                 )
+                self._invalidate_aggregates("tokens")
                 return True, "Token 添加成功"
 
     def token_exists(self, refresh_token: str) -> bool:
@@ -952,6 +1484,7 @@ class UserDatabase:
                     "UPDATE tokens SET visibility = ? WHERE id = ?",
                     (visibility, token_id)
                 )
+                self._invalidate_aggregates("tokens")
                 return True
 
     def set_token_status(self, token_id: int, status: str) -> bool:
@@ -964,6 +1497,7 @@ class UserDatabase:
                     "UPDATE tokens SET status = ? WHERE id = ?",
                     (status, token_id)
                 )
+                self._invalidate_aggregates("tokens")
                 return True
 
     def delete_token(self, token_id: int, user_id: Optional[int] = None) -> bool:
@@ -977,6 +1511,7 @@ class UserDatabase:
                     )
                 else:
                     conn.execute("DELETE FROM tokens WHERE id = ?", (token_id,))
+                self._invalidate_aggregates("tokens")
                 return True
 
     def record_token_usage(self, token_id: int, success: bool) -> None:
@@ -1017,9 +1552,9 @@ class UserDatabase:
                 )
 
     def get_token_count(self, user_id: Optional[int] = None) -> Dict[str, int]:
-        """Get token counts."""
-        with self._get_conn() as conn:
-            if user_id:
+        """Get token counts (global counts are cached until tokens change)."""
+        if user_id:
+            with self._get_conn() as conn:
                 total = conn.execute("SELECT COUNT(*) FROM tokens WHERE user_id = ?", (user_id,)).fetchone()[0]
                 public = conn.execute(
                     "SELECT COUNT(*) FROM tokens WHERE user_id = ? AND visibility = 'public'", (user_id,)
@@ -1027,11 +1562,19 @@ class UserDatabase:
                 active = conn.execute(
                     "SELECT COUNT(*) FROM tokens WHERE user_id = ? AND status = 'active'", (user_id,)
                 ).fetchone()[0]
-            else:
-                total = conn.execute("SELECT COUNT(*) FROM tokens").fetchone()[0]
-                public = conn.execute("SELECT COUNT(*) FROM tokens WHERE visibility = 'public'").fetchone()[0]
-                active = conn.execute("SELECT COUNT(*) FROM tokens WHERE status = 'active'").fetchone()[0]
-            return {"total": total, "public": public, "active": active}
+                return {"total": total, "public": public, "active": active}
+
+        def _global_counts() -> Dict[str, int]:
+            with self._get_conn() as conn:
+                row = conn.execute(
+                    """SELECT COUNT(*),
+                              COALESCE(SUM(visibility = 'public'), 0),
+                              COALESCE(SUM(status = 'active'), 0)
+                       FROM tokens"""
+                ).fetchone()
+                return {"total": row[0], "public": row[1], "active": row[2]}
+
+        return dict(self._aggregates.get_or_compute("tokens", ("token_count",), _global_counts))
 
     def _row_to_token(self, row: sqlite3.Row) -> DonatedToken:
         """Convert database row to DonatedToken object."""
@@ -1066,7 +1609,7 @@ class UserDatabase:
         import time
         with self._lock:
             with self._get_conn() as conn:
-                conn.execute(
+                cursor = conn.execute(
                     """UPDATE tokens SET
                        account_email = ?,
                        account_status = ?,
@@ -1076,7 +1619,7 @@ class UserDatabase:
                        WHERE id = ?""",
                     (email, status, usage, limit, int(time.time()), token_id)
                 )
-                return conn.total_changes > 0
+                return cursor.rowcount > 0
 
     def get_token_credentials(self, token_id: int) -> Optional[dict]:
         """
@@ -1209,6 +1752,47 @@ class UserDatabase:
                 return api_key.user_id, api_key
         return None
 
+    def get_cached_api_key_principal(self, plain_key: str) -> Optional[Tuple[User, APIKey]]:
+        """Look up an API key in the principal cache only (no database access)."""
+        if not plain_key.startswith("sk-"):
+            return None
+        key_hash = hashlib.sha256(plain_key.encode()).hexdigest()
+        return self.api_key_cache.get(key_hash)
+
+    def get_api_key_principal(
+        self,
+        plain_key: str,
+        check_cache: bool = True
+    ) -> Optional[Tuple[Optional[User], APIKey]]:
+        """
+        Resolve an API key to its owner and fill the principal cache.
+
+        Args:
+            plain_key: sk-xxx key
+            check_cache: False if the caller already missed the cache
+
+        Returns:
+            (User or None if the owner no longer exists, APIKey) if the key is
+            valid, None otherwise
+        """
+        if not plain_key.startswith("sk-"):
+            return None
+        key_hash = hashlib.sha256(plain_key.encode()).hexdigest()
+        if check_cache:
+            cached = self.api_key_cache.get(key_hash)
+            if cached:
+                return cached
+
+        generation = self.api_key_cache.generation
+        result = self.verify_api_key(plain_key)
+        if not result:
+            return None
+        user_id, api_key = result
+        user = self.get_user(user_id)
+        if user:
+            self.api_key_cache.put(key_hash, user, api_key, generation)
+        return user, api_key
+
     def verify_import_key(self, plain_key: str) -> Optional[Tuple[int, ImportKey]]:
         """
         Verify an import key.
@@ -1311,7 +1895,10 @@ class UserDatabase:
                         "UPDATE api_keys SET is_active = ? WHERE id = ?",
                         (value, key_id)
                     )
-                return cursor.rowcount > 0
+                updated = cursor.rowcount > 0
+        if updated:
+            self._invalidate_api_key(key_id)
+        return updated
 
     def revoke_api_key(self, key_id: int, user_id: Optional[int] = None) -> bool:
         """Revoke an API key. If user_id provided, verify ownership."""
@@ -1328,7 +1915,8 @@ class UserDatabase:
                     )
                 else:
                     conn.execute("DELETE FROM api_keys WHERE id = ?", (key_id,))
-                return True
+        self._invalidate_api_key(key_id)
+        return True
 
     def delete_import_key(self, key_id: int) -> bool:
         """Delete an import key."""
@@ -1419,42 +2007,68 @@ class UserDatabase:
 
     # ==================== Admin Management Methods ====================
 
-    def get_public_tokens_with_users(self, status: str = "active") -> List[Dict]:
-        """Get public tokens with user information for user page."""
-        with self._get_conn() as conn:
-            rows = conn.execute(
-                """SELECT t.*, u.username
-                   FROM tokens t
-                   LEFT JOIN users u ON t.user_id = u.id
-                   WHERE t.visibility = 'public' AND t.status = ?
-                   ORDER BY t.success_count DESC""",
-                (status,)
-            ).fetchall()
-            return [
-                {
-                    "id": r["id"],
-                    "username": "匿名" if r["is_anonymous"] else (r["username"] or "匿名"),
-                    "status": r["status"],
-                    "success_count": r["success_count"],
-                    "fail_count": r["fail_count"],
-                    "success_rate": r["success_count"] / max(r["success_count"] + r["fail_count"], 1),
-                    "last_used": r["last_used"],
-                }
-                for r in rows
-            ]
+    def get_public_tokens_with_users(
+        self,
+        status: str = "active",
+        limit: Optional[int] = None,
+        cursor: Optional[str] = None
+    ) -> Tuple[List[Dict], Optional[str]]:
+        """
+        Get public tokens with user information for user page.
 
-    def get_all_tokens_with_users(
+        Ordered by success_count DESC (keyset on success_count, id when a
+        limit is given, served by idx_tokens_public_rank).
+
+        Returns:
+            (tokens, next_cursor) - next_cursor is None on the last page
+
+        Raises:
+            ValueError: If the cursor is invalid
+        """
+        where = ["t.visibility = 'public'", "t.status = ?"]
+        params: list = [status]
+        if cursor:
+            sort_value, last_id = _decode_cursor(cursor, "success_count", "DESC")
+            where.append("t.success_count <= ?")
+            where.append("(t.success_count, t.id) < (?, ?)")
+            params.extend([sort_value, sort_value, last_id])
+        query = (
+            "SELECT t.*, u.username FROM tokens t "
+            "LEFT JOIN users u ON t.user_id = u.id "
+            "WHERE " + " AND ".join(where) +
+            " ORDER BY t.success_count DESC, t.id DESC"
+        )
+        if limit:
+            query += " LIMIT ?"
+            params.append(limit)
+
+        with self._get_conn() as conn:
+            rows = conn.execute(query, params).fetchall()
+        tokens = [
+            {
+                "id": r["id"],
+                "username": "匿名" if r["is_anonymous"] else (r["username"] or "匿名"),
+                "status": r["status"],
+                "success_count": r["success_count"],
+                "fail_count": r["fail_count"],
+                "success_rate": r["success_count"] / max(r["success_count"] + r["fail_count"], 1),
+                "last_used": r["last_used"],
+            }
+            for r in rows
+        ]
+        next_cursor = None
+        if limit and len(rows) == limit:
+            next_cursor = _encode_cursor("success_count", "DESC", rows[-1]["success_count"], rows[-1]["id"])
+        return tokens, next_cursor
+
+    def _token_filters(
         self,
-        limit: int = 100,
-        offset: int = 0,
         search: str = "",
         visibility: Optional[str] = None,
         status: Optional[str] = None,
-        user_id: Optional[int] = None,
-        sort_field: str = "created_at",
-        sort_order: str = "desc"
-    ) -> List[Dict]:
-        """Get tokens with user info for admin panel (pagination + filters)."""
+        user_id: Optional[int] = None
+    ) -> Tuple[List[str], list]:
+        """Build WHERE clauses for admin token list queries."""
         where: list[str] = []
         params: list = []
         if search:
@@ -1470,49 +2084,102 @@ class UserDatabase:
         if user_id is not None:
             where.append("t.user_id = ?")
             params.append(user_id)
+        return where, params
 
-        allowed_sort = {
-            "id": "t.id",
-            "username": "u.username",
-            "created_at": "t.created_at",
-            "last_used": "t.last_used",
-            "success_rate": (
-                "CASE WHEN (t.success_count + t.fail_count) > 0 "
-                "THEN CAST(t.success_count AS REAL) / (t.success_count + t.fail_count) "
-                "ELSE 1.0 END"
-            ),
-            "use_count": "(t.success_count + t.fail_count)",
-        }
-        sort_column = allowed_sort.get(sort_field, "t.created_at")
+    def get_all_tokens_with_users(
+        self,
+        limit: int = 100,
+        offset: int = 0,
+        search: str = "",
+        visibility: Optional[str] = None,
+        status: Optional[str] = None,
+        user_id: Optional[int] = None,
+        sort_field: str = "created_at",
+        sort_order: str = "desc"
+    ) -> List[Dict]:
+        """Get tokens with user info for admin panel (pagination + filters)."""
+        tokens, _ = self.get_tokens_page(
+            limit=limit,
+            offset=offset,
+            search=search,
+            visibility=visibility,
+            status=status,
+            user_id=user_id,
+            sort_field=sort_field,
+            sort_order=sort_order
+        )
+        return tokens
+
+    def get_tokens_page(
+        self,
+        limit: int = 100,
+        offset: int = 0,
+        cursor: Optional[str] = None,
+        search: str = "",
+        visibility: Optional[str] = None,
+        status: Optional[str] = None,
+        user_id: Optional[int] = None,
+        sort_field: str = "created_at",
+        sort_order: str = "desc"
+    ) -> Tuple[List[Dict], Optional[str]]:
+        """
+        Get one page of tokens with user info for admin panel.
+
+        Same cursor semantics as get_users_page.
+
+        Returns:
+            (tokens, next_cursor) - next_cursor is None on the last page
+
+        Raises:
+            ValueError: If the cursor is invalid for this sort
+        """
+        if sort_field not in TOKEN_SORT_EXPRESSIONS:
+            sort_field = "created_at"
+        sort_expr = TOKEN_SORT_EXPRESSIONS[sort_field]
         order = "ASC" if sort_order.lower() == "asc" else "DESC"
 
+        where, params = self._token_filters(search, visibility, status, user_id)
+        if cursor:
+            sort_value, last_id = _decode_cursor(cursor, sort_field, order)
+            # 首列单独给出范围条件，表达式索引才能直接定位（行值比较只对普通列生效）
+            where.append(f"{sort_expr} {'>=' if order == 'ASC' else '<='} ?")
+            where.append(f"({sort_expr}, t.id) {'>' if order == 'ASC' else '<'} (?, ?)")
+            params.extend([sort_value, sort_value, last_id])
+
         query = (
-            "SELECT t.*, u.username "
+            f"SELECT t.*, u.username, {sort_expr} AS _sort_key "
             "FROM tokens t "
             "LEFT JOIN users u ON t.user_id = u.id"
         )
         if where:
             query += " WHERE " + " AND ".join(where)
-        query += f" ORDER BY {sort_column} {order} LIMIT ? OFFSET ?"
-        params.extend([limit, offset])
+        query += f" ORDER BY {sort_expr} {order}, t.id {order} LIMIT ?"
+        params.append(limit)
+        if not cursor and offset:
+            query += " OFFSET ?"
+            params.append(offset)
 
         with self._get_conn() as conn:
             rows = conn.execute(query, params).fetchall()
-            return [
-                {
-                    "id": r["id"],
-                    "user_id": r["user_id"],
-                    "username": r["username"],
-                    "visibility": r["visibility"],
-                    "status": r["status"],
-                    "success_count": r["success_count"],
-                    "fail_count": r["fail_count"],
-                    "success_rate": r["success_count"] / max(r["success_count"] + r["fail_count"], 1),
-                    "last_used": r["last_used"],
-                    "created_at": r["created_at"]
-                }
-                for r in rows
-            ]
+        tokens = [
+            {
+                "id": r["id"],
+                "user_id": r["user_id"],
+                "username": r["username"],
+                "visibility": r["visibility"],
+                "status": r["status"],
+                "success_count": r["success_count"],
+                "fail_count": r["fail_count"],
+                "success_rate": r["success_count"] / max(r["success_count"] + r["fail_count"], 1),
+                "last_used": r["last_used"],
+                "created_at": r["created_at"]
+            }
+            for r in rows
+        ]
+        next_cursor = None
+        if rows and len(rows) == limit:
+            next_cursor = _encode_cursor(sort_field, order, rows[-1]["_sort_key"], rows[-1]["id"])
+        return tokens, next_cursor
 
     def get_tokens_count(
         self,
@@ -1521,51 +2188,74 @@ class UserDatabase:
         status: Optional[str] = None,
         user_id: Optional[int] = None
     ) -> int:
-        """Get token count with optional filters."""
-        where: list[str] = []
-        params: list = []
+        """Get token count with optional filters (cached until tokens change)."""
+        where, params = self._token_filters(search, visibility, status, user_id)
+        query = "SELECT COUNT(*) FROM tokens t"
         if search:
-            like = f"%{search}%"
-            where.append("(u.username LIKE ? OR CAST(t.user_id AS TEXT) LIKE ? OR CAST(t.id AS TEXT) LIKE ?)")
-            params.extend([like, like, like])
-        if visibility:
-            where.append("t.visibility = ?")
-            params.append(visibility)
-        if status:
-            where.append("t.status = ?")
-            params.append(status)
-        if user_id is not None:
-            where.append("t.user_id = ?")
-            params.append(user_id)
-
-        query = (
-            "SELECT COUNT(*) "
-            "FROM tokens t "
-            "LEFT JOIN users u ON t.user_id = u.id"
-        )
+            # 仅搜索用户名时才需要关联 users 表
+            query += " LEFT JOIN users u ON t.user_id = u.id"
         if where:
             query += " WHERE " + " AND ".join(where)
-        with self._get_conn() as conn:
-            return conn.execute(query, params).fetchone()[0]
+
+        def _count() -> int:
+            with self._get_conn() as conn:
+                return conn.execute(query, params).fetchone()[0]
+
+        return self._aggregates.get_or_compute("tokens", (query, tuple(params)), _count)
 
     def get_tokens_success_rate_avg(self) -> float:
-        """Get average success rate across all tokens."""
-        query = (
-            "SELECT AVG(CASE WHEN (success_count + fail_count) > 0 "
-            "THEN CAST(success_count AS REAL) / (success_count + fail_count) "
-            "ELSE 1.0 END) FROM tokens"
-        )
+        """Get average success rate across all tokens (cached, bounded by TTL)."""
+        query = f"SELECT AVG({TOKEN_SUCCESS_RATE_SQL}) FROM tokens"
+
+        def _avg() -> float:
+            with self._get_conn() as conn:
+                result = conn.execute(query).fetchone()[0]
+                return float(result) if result is not None else 0.0
+
+        return self._aggregates.get_or_compute("tokens", ("success_rate_avg",), _avg)
+
+    def get_user_token_counts(self, user_ids: List[int]) -> Dict[int, int]:
+        """Get token counts for a page of users in one query."""
+        if not user_ids:
+            return {}
+        placeholders = ",".join("?" * len(user_ids))
         with self._get_conn() as conn:
-            result = conn.execute(query).fetchone()[0]
-            return float(result) if result is not None else 0.0
+            rows = conn.execute(
+                f"SELECT user_id, COUNT(*) FROM tokens WHERE user_id IN ({placeholders}) GROUP BY user_id",
+                list(user_ids)
+            ).fetchall()
+        return {row[0]: row[1] for row in rows}
+
+    def get_user_api_key_counts(self, user_ids: List[int]) -> Dict[int, int]:
+        """Get active API key counts for a page of users in one query."""
+        if not user_ids:
+            return {}
+        placeholders = ",".join("?" * len(user_ids))
+        with self._get_conn() as conn:
+            rows = conn.execute(
+                f"SELECT user_id, COUNT(*) FROM api_keys WHERE is_active = 1 AND user_id IN ({placeholders}) "
+                "GROUP BY user_id",
+                list(user_ids)
+            ).fetchall()
+        return {row[0]: row[1] for row in rows}
 
     def admin_delete_token(self, token_id: int) -> bool:
         """Admin: delete any token regardless of ownership."""
         with self._lock:
             with self._get_conn() as conn:
                 conn.execute("DELETE FROM tokens WHERE id = ?", (token_id,))
+                self._invalidate_aggregates("tokens")
                 return True
 
 
 # Global database instance
 user_db = UserDatabase()
+
+# Async facade: writes from the event loop run in batches on the executor thread,
+# reads run on reader threads with their own pooled connections (one connection
+# is left for the write batch)
+user_db_executor = DatabaseExecutor(
+    "user-db",
+    batch=user_db.batch,
+    readers=max(1, settings.user_db_pool_size - 1),
+)
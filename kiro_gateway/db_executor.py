@@ -0,0 +1,203 @@
+# -*- coding: utf-8 -*-
+
+"""
+KiroGate 异步数据库执行器。
+
+SQLite 调用在专用线程上执行，事件循环只等待 Future，不会被 fsync 或锁等待阻塞。
+排队的操作按批次在同一个事务中提交；只读操作在读线程池中使用各自的连接并发执行
+（WAL 模式下读不阻塞写），不进入写批次。
+"""
+
+import asyncio
+import queue
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from contextlib import nullcontext
+from functools import partial
+from typing import Any, Callable, ContextManager, Optional
+
+from loguru import logger
+
+from kiro_gateway.config import settings
+
+
+class DatabaseExecutor:
+    """
+    Single-thread executor for SQLite work.
+
+    Jobs are queued and run in order on a dedicated thread. The worker drains
+    up to batch_size queued jobs at a time and runs them inside one batch
+    context (one transaction); each job gets its own SAVEPOINT so a failing
+    job does not roll back the others.
+    """
+
+    _STOP = object()
+
+    def __init__(
+        self,
+        name: str,
+        batch: Optional[Callable[[], ContextManager]] = None,
+        batch_size: Optional[int] = None,
+        readers: int = 0,
+    ):
+        """
+        Args:
+            name: Thread name
+            batch: Factory returning a context manager that wraps one batch.
+                   It may yield a sqlite3 connection used for per-job savepoints.
+            batch_size: Max jobs per batch (default: settings.db_write_batch_size)
+            readers: Reader threads for read() (0: reads run on the batch thread)
+        """
+        self._name = name
+        self._batch = batch or nullcontext
+        self._batch_size = max(1, batch_size or settings.db_write_batch_size)
+        self._queue: queue.Queue = queue.Queue()
+        self._thread: Optional[threading.Thread] = None
+        self._start_lock = threading.Lock()
+        self._readers: Optional[ThreadPoolExecutor] = None
+        if readers > 0:
+            self._readers = ThreadPoolExecutor(max_workers=readers, thread_name_prefix=f"{name}-read")
+        self._batches = 0
+        self._jobs = 0
+        self._reads = 0
+
+    @property
+    def queue_depth(self) -> int:
+        """Number of jobs waiting to run."""
+        return self._queue.qsize()
+
+    def get_stats(self) -> dict:
+        """Return executor counters."""
+        return {
+            "queueDepth": self.queue_depth,
+            "batches": self._batches,
+            "jobs": self._jobs,
+            "reads": self._reads,
+        }
+
+    def _ensure_started(self) -> None:
+        if self._thread is not None and self._thread.is_alive():
+            return
+        with self._start_lock:
+            if self._thread is not None and self._thread.is_alive():
+                return
+            self._thread = threading.Thread(target=self._worker, name=self._name, daemon=True)
+            self._thread.start()
+
+    async def run(self, fn: Callable, *args, **kwargs) -> Any:
+        """
+        Run fn on the executor thread and await its result.
+
+        Exceptions raised by fn are re-raised in the caller.
+        """
+        return await asyncio.wrap_future(self.call(fn, *args, **kwargs))
+
+    def call(self, fn: Callable, *args, **kwargs) -> Future:
+        """
+        Queue fn and return a Future for threads outside the event loop.
+
+        The Future completes after the batch containing fn is committed; it
+        raises if fn or the batch commit failed.
+        """
+        self._ensure_started()
+        future: Future = Future()
+        self._queue.put((fn, args, kwargs, future))
+        return future
+
+    async def read(self, fn: Callable, *args, **kwargs) -> Any:
+        """
+        Run a read-only fn on the reader pool and await its result.
+
+        fn runs outside any batch, so it borrows its own connection and does
+        not wait for queued writes. Must not write.
+        """
+        if self._readers is None:
+            return await self.run(fn, *args, **kwargs)
+        self._reads += 1
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._readers, partial(fn, *args, **kwargs))
+
+    def submit(self, fn: Callable, *args, **kwargs) -> None:
+        """Queue fn without waiting for it (fire-and-forget writes)."""
+        self._ensure_started()
+        self._queue.put((fn, args, kwargs, None))
+
+    def stop(self, timeout: float = 10.0) -> None:
+        """Run all queued jobs, then stop the worker thread."""
+        if self._readers is not None:
+            self._readers.shutdown(wait=False)
+            self._readers = None
+        thread = self._thread
+        if thread is None or not thread.is_alive():
+            return
+        self._queue.put(self._STOP)
+        thread.join(timeout)
+        if thread.is_alive():
+            logger.warning(f"DB executor {self._name} did not stop within {timeout}s")
+        self._thread = None
+
+    def _worker(self) -> None:
+        while True:
+            item = self._queue.get()
+            if item is self._STOP:
+                return
+            jobs = [item]
+            stop = False
+            while len(jobs) < self._batch_size:
+                try:
+                    item = self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                if item is self._STOP:
+                    stop = True
+                    break
+                jobs.append(item)
+
+            self._run_batch(jobs)
+            if stop:
+                return
+
+    def _run_batch(self, jobs: list) -> None:
+        # 调用方已取消的任务直接跳过
+        jobs = [
+            job for job in jobs
+            if job[3] is None or job[3].set_running_or_notify_cancel()
+        ]
+        if not jobs:
+            return
+
+        results = []
+        try:
+            with self._batch() as conn:
+                for fn, args, kwargs, future in jobs:
+                    if conn is not None:
+                        conn.execute("SAVEPOINT job")
+                    try:
+                        value = fn(*args, **kwargs)
+                    except Exception as e:
+                        if conn is not None:
+                            conn.execute("ROLLBACK TO job")
+                            conn.execute("RELEASE job")
+                        results.append((future, None, e))
+                        continue
+                    if conn is not None:
+                        conn.execute("RELEASE job")
+                    results.append((future, value, None))
+        except Exception as e:
+            # 批次提交失败：已执行的操作全部回滚
+            logger.error(f"DB executor {self._name} batch failed: {e}")
+            results = [(future, None, e) for _, _, _, future in jobs]
+
+        self._batches += 1
+        self._jobs += len(jobs)
+
+        # Futures 在提交之后才完成，调用方看到的结果已持久化
+        for future, value, error in results:
+            if future is None:
+                if error is not None:
+                    logger.warning(f"DB executor {self._name} job failed: {error}")
+                continue
+            if error is not None:
+                future.set_exception(error)
+            else:
+                future.set_result(value)
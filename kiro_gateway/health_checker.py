@@ -12,7 +12,7 @@ from typing import Optional
 from loguru import logger
 
 from kiro_gateway.config import settings
-from kiro_gateway.database import user_db
+from kiro_gateway.database import user_db, user_db_executor
 from kiro_gateway.auth import KiroAuthManager
 
 
@@ -65,7 +65,7 @@ class TokenHealthChecker:
         Returns:
             Summary of check results
         """
-        tokens = user_db.get_all_active_tokens()
+        tokens = await user_db_executor.read(user_db.get_all_active_tokens)
         if not tokens:
             logger.debug("No active tokens to check")
             return {"checked": 0, "valid": 0, "invalid": 0}
@@ -83,7 +83,7 @@ class TokenHealthChecker:
                 else:
                     invalid_count += 1
                     # Mark token as invalid if it fails
-                    user_db.set_token_status(token.id, "invalid")
+                    await user_db_executor.run(user_db.set_token_status, token.id, "invalid")
                     logger.warning(f"Token {token.id} marked as invalid")
             except Exception as e:
                 logger.error(f"Failed to check token {token.id}: {e}")
@@ -110,9 +110,9 @@ class TokenHealthChecker:
             True if token is valid, False otherwise
         """
         # Get decrypted token
-        refresh_token = user_db.get_decrypted_token(token_id)
+        refresh_token = await user_db_executor.read(user_db.get_decrypted_token, token_id)
         if not refresh_token:
-            user_db.record_health_check(token_id, False, "Failed to decrypt token")
+            await user_db_executor.run(user_db.record_health_check, token_id, False, "Failed to decrypt token")
             return False
 
         # Try to get access token
@@ -125,15 +125,15 @@ class TokenHealthChecker:
             access_token = await manager.get_access_token()
 
             if access_token:
-                user_db.record_health_check(token_id, True)
+                await user_db_executor.run(user_db.record_health_check, token_id, True)
                 return True
             else:
-                user_db.record_health_check(token_id, False, "No access token returned")
+                await user_db_executor.run(user_db.record_health_check, token_id, False, "No access token returned")
                 return False
 
         except Exception as e:
             error_msg = str(e)[:200]  # Truncate long error messages
-            user_db.record_health_check(token_id, False, error_msg)
+            await user_db_executor.run(user_db.record_health_check, token_id, False, error_msg)
             return False
 
 
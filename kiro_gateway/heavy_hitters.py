@@ -0,0 +1,401 @@
+# -*- coding: utf-8 -*-
+
+"""
+KiroGate 高频 Key 计数器（Space-Saving 算法）。
+
+有容量上限时只保留请求最多的 capacity 个 Key：新 Key 到来且已满时，
+替换当前计数最小的 Key，并继承其计数 + 1（记录为误差上界）。
+计数按桶组织，增量、插入和淘汰均为 O(1)，内存上限固定。
+被固定（pinned，如已封禁 IP）的 Key 不占容量、不会被淘汰，计数精确。
+
+另外维护三种顺序供分页查询，翻页只访问所需的条目，不复制、不排序全部 Key：
+按计数（计数桶 + 有序的不同计数值）、按最近访问（_last_seen 的插入顺序）、
+按 Key（分块有序列表，同时用于前缀搜索）。
+"""
+
+import heapq
+from bisect import bisect_left, insort
+from itertools import islice
+from typing import Dict, List, Optional, Set, Tuple
+
+
+class _SortedKeys:
+    """
+    Sorted keys stored in blocks of bounded size.
+
+    Insert and remove cost O(log n + block size); positional access skips
+    whole blocks, O(n / block size).
+    """
+
+    BLOCK_SIZE = 512
+
+    def __init__(self):
+        self._blocks: List[List[str]] = []
+        self._maxes: List[str] = []  # 每块的最大 Key
+        self._len = 0
+
+    def __len__(self) -> int:
+        return self._len
+
+    def add(self, key: str) -> None:
+        if not self._blocks:
+            self._blocks.append([key])
+            self._maxes.append(key)
+            self._len = 1
+            return
+        index = bisect_left(self._maxes, key)
+        if index == len(self._maxes):
+            index -= 1
+            self._blocks[index].append(key)
+            self._maxes[index] = key
+        else:
+            insort(self._blocks[index], key)
+        self._len += 1
+        block = self._blocks[index]
+        if len(block) > 2 * self.BLOCK_SIZE:
+            self._blocks[index:index + 1] = [block[:self.BLOCK_SIZE], block[self.BLOCK_SIZE:]]
+            self._maxes[index:index + 1] = [block[self.BLOCK_SIZE - 1], block[-1]]
+
+    def remove(self, key: str) -> None:
+        index = bisect_left(self._maxes, key)
+        if index == len(self._maxes):
+            return
+        block = self._blocks[index]
+        position = bisect_left(block, key)
+        if position == len(block) or block[position] != key:
+            return
+        del block[position]
+        self._len -= 1
+        if not block:
+            del self._blocks[index]
+            del self._maxes[index]
+        elif position == len(block):
+            self._maxes[index] = block[-1]
+
+    def position(self, key: str) -> int:
+        """Number of stored keys smaller than key."""
+        index = bisect_left(self._maxes, key)
+        if index == len(self._maxes):
+            return self._len
+        return sum(len(block) for block in self._blocks[:index]) + bisect_left(self._blocks[index], key)
+
+    def range(self, start: int, stop: int) -> List[str]:
+        """Keys at sorted positions start..stop-1."""
+        keys: List[str] = []
+        start = max(start, 0)
+        if start >= stop:
+            return keys
+        for block in self._blocks:
+            if start >= len(block):
+                start -= len(block)
+                stop -= len(block)
+                continue
+            keys.extend(block[start:stop])
+            stop -= len(block)
+            start = 0
+            if stop <= 0:
+                break
+        return keys
+
+
+class SpaceSavingCounter:
+    """
+    Per-key counter with an optional Space-Saving memory bound.
+
+    Without a capacity every key is counted exactly. With a capacity, the
+    reported count of a key overestimates its true count by at most its
+    error; any key whose true count exceeds total / capacity is guaranteed
+    to be tracked.
+    """
+
+    def __init__(self, capacity: Optional[int] = None):
+        """
+        Args:
+            capacity: Max tracked (non-pinned) keys, None for exact/unbounded
+        """
+        self.capacity = capacity if capacity and capacity > 0 else None
+        self._counts: Dict[str, int] = {}
+        self._errors: Dict[str, int] = {}
+        self._last_seen: Dict[str, int] = {}
+        self._pinned: Set[str] = set()
+        # {count: keys}，仅有容量上限时维护，用于 O(1) 找到最小计数
+        self._buckets: Dict[int, Set[str]] = {}
+        self._bucketed = 0
+        self._min = 0
+        self._evictions = 0
+        # 分页用的顺序（含 pinned Key）：{count: {key: None}} 与升序的不同计数值
+        self._by_count: Dict[int, Dict[str, None]] = {}
+        self._levels: List[int] = []
+        self._sorted_keys = _SortedKeys()
+
+    def __len__(self) -> int:
+        return len(self._counts)
+
+    def __contains__(self, key: str) -> bool:
+        return key in self._counts
+
+    def get(self, key: str) -> Optional[Tuple[int, int, int]]:
+        """Return (count, last_seen, error) for key, or None if not tracked."""
+        count = self._counts.get(key)
+        if count is None:
+            return None
+        return count, self._last_seen.get(key, 0), self._errors.get(key, 0)
+
+    def _bucket_add(self, key: str, count: int) -> None:
+        bucket = self._buckets.get(count)
+        if bucket is None:
+            bucket = self._buckets[count] = set()
+        bucket.add(key)
+        if self._bucketed == 0 or count < self._min:
+            self._min = count
+        self._bucketed += 1
+
+    def _bucket_remove(self, key: str, count: int) -> None:
+        bucket = self._buckets[count]
+        bucket.discard(key)
+        self._bucketed -= 1
+        if not bucket:
+            del self._buckets[count]
+            if count == self._min:
+                self._min = min(self._buckets) if self._buckets else 0
+
+    def _index_add(self, key: str, count: int) -> None:
+        bucket = self._by_count.get(count)
+        if bucket is None:
+            bucket = self._by_count[count] = {}
+            insort(self._levels, count)
+        bucket[key] = None
+        self._sorted_keys.add(key)
+
+    def _index_remove(self, key: str, count: int) -> None:
+        bucket = self._by_count[count]
+        del bucket[key]
+        if not bucket:
+            del self._by_count[count]
+            del self._levels[bisect_left(self._levels, count)]
+        self._sorted_keys.remove(key)
+
+    def _index_increment(self, key: str, count: int) -> None:
+        bucket = self._by_count[count]
+        del bucket[key]
+        target = self._by_count.get(count + 1)
+        if target is None:
+            target = self._by_count[count + 1] = {}
+            level = bisect_left(self._levels, count)
+            if bucket:
+                self._levels.insert(level + 1, count + 1)
+            else:
+                # 原计数值不再出现，直接替换，顺序不变
+                self._levels[level] = count + 1
+        elif not bucket:
+            del self._levels[bisect_left(self._levels, count)]
+        if not bucket:
+            del self._by_count[count]
+        target[key] = None
+
+    def _evict_min(self) -> str:
+        """Drop one key with the smallest count and return it."""
+        count = self._min
+        bucket = self._buckets[count]
+        victim = bucket.pop()
+        self._bucketed -= 1
+        if not bucket:
+            del self._buckets[count]
+            self._min = min(self._buckets) if self._buckets else 0
+        self._index_remove(victim, self._counts.pop(victim))
+        self._errors.pop(victim, None)
+        self._last_seen.pop(victim, None)
+        self._evictions += 1
+        return victim
+
+    def add(self, key: str, now: int, pinned: bool = False) -> Tuple[int, Optional[str]]:
+        """
+        Count one hit for key.
+
+        Args:
+            key: Key to count
+            now: Timestamp (ms) stored as last seen
+            pinned: Keep the key exact and never evict it
+
+        Returns:
+            (new_count, evicted_key) - evicted_key is None unless a key was replaced
+        """
+        # 移到末尾：_last_seen 的顺序即最近访问顺序
+        self._last_seen.pop(key, None)
+        self._last_seen[key] = now
+        count = self._counts.get(key)
+
+        if count is not None:
+            self._counts[key] = count + 1
+            self._index_increment(key, count)
+            if self.capacity and key not in self._pinned:
+                # 计数 +1 只会移动到相邻桶，最小值最多前移一位
+                bucket = self._buckets[count]
+                bucket.discard(key)
+                if not bucket:
+                    del self._buckets[count]
+                    if count == self._min:
+                        self._min = count + 1
+                self._buckets.setdefault(count + 1, set()).add(key)
+            return count + 1, None
+
+        if pinned:
+            self._pinned.add(key)
+            self._counts[key] = 1
+            self._index_add(key, 1)
+            return 1, None
+
+        evicted = None
+        new_count = 1
+        if self.capacity and self._bucketed >= self.capacity:
+            base = self._min
+            evicted = self._evict_min()
+            new_count = base + 1
+            self._errors[key] = base
+        self._counts[key] = new_count
+        self._index_add(key, new_count)
+        if self.capacity:
+            self._bucket_add(key, new_count)
+        return new_count, evicted
+
+    def load(self, key: str, count: int, last_seen: int, error: int = 0, pinned: bool = False) -> Optional[str]:
+        """
+        Restore a persisted entry, evicting the smallest one if the table is full.
+
+        Entries should be loaded in ascending last_seen order to restore the
+        recency order.
+        """
+        if key in self._counts:
+            return None
+        self._counts[key] = count
+        self._last_seen[key] = last_seen
+        self._index_add(key, count)
+        if error:
+            self._errors[key] = error
+        if pinned:
+            self._pinned.add(key)
+            return None
+        if self.capacity:
+            self._bucket_add(key, count)
+            if self._bucketed > self.capacity:
+                return self._evict_min()
+        return None
+
+    def pin(self, key: str) -> None:
+        """Stop evicting key (counts stay exact from now on)."""
+        if key in self._pinned:
+            return
+        if key in self._counts:
+            self._pinned.add(key)
+            if self.capacity:
+                self._bucket_remove(key, self._counts[key])
+
+    def unpin(self, key: str) -> Optional[str]:
+        """Make key evictable again; returns a key evicted to stay within capacity."""
+        if key not in self._pinned:
+            return None
+        self._pinned.discard(key)
+        if not self.capacity:
+            return None
+        self._bucket_add(key, self._counts[key])
+        if self._bucketed > self.capacity:
+            return self._evict_min()
+        return None
+
+    def keys(self) -> List[str]:
+        """Return every tracked key."""
+        return list(self._counts)
+
+    def pinned_keys(self) -> List[str]:
+        """Return every pinned key."""
+        return list(self._pinned)
+
+    def items(self) -> List[Tuple[str, int, int, int]]:
+        """Return (key, count, last_seen, error) for every tracked key."""
+        errors = self._errors
+        last_seen = self._last_seen
+        return [
+            (key, count, last_seen.get(key, 0), errors.get(key, 0))
+            for key, count in self._counts.items()
+        ]
+
+    def page(
+        self,
+        order: str = "count",
+        descending: bool = True,
+        offset: int = 0,
+        limit: int = 100,
+        prefix: str = ""
+    ) -> Tuple[List[Tuple[str, int, int, int]], int]:
+        """
+        Return one page of (key, count, last_seen, error) and the total.
+
+        Without a prefix only the returned rows are visited (plus one step per
+        distinct count or key block skipped). With a prefix the matching keys
+        are located in the sorted key index and only they are ranked.
+
+        Args:
+            order: "count", "last_seen" or "key"
+            descending: Largest first
+            offset: Rows to skip
+            limit: Max rows to return
+            prefix: Only keys starting with prefix
+        """
+        offset = max(offset, 0)
+        limit = max(limit, 0)
+        if prefix:
+            start = self._sorted_keys.position(prefix)
+            stop = self._sorted_keys.position(prefix + "\U0010ffff")
+            total = stop - start
+            if order == "key":
+                keys = self._key_range(start, stop, descending, offset, limit)
+            else:
+                values = self._counts if order == "count" else self._last_seen
+                select = heapq.nlargest if descending else heapq.nsmallest
+                ranked = select(offset + limit, self._sorted_keys.range(start, stop), key=values.__getitem__)
+                keys = ranked[offset:]
+        else:
+            total = len(self._counts)
+            if order == "key":
+                keys = self._key_range(0, total, descending, offset, limit)
+            elif order == "last_seen":
+                recent = reversed(self._last_seen) if descending else iter(self._last_seen)
+                keys = list(islice(recent, offset, offset + limit))
+            else:
+                keys = self._count_range(descending, offset, limit)
+        return [self._row(key) for key in keys], total
+
+    def _row(self, key: str) -> Tuple[str, int, int, int]:
+        return key, self._counts[key], self._last_seen.get(key, 0), self._errors.get(key, 0)
+
+    def _key_range(self, start: int, stop: int, descending: bool, offset: int, limit: int) -> List[str]:
+        if not descending:
+            return self._sorted_keys.range(start + offset, min(start + offset + limit, stop))
+        end = stop - offset
+        keys = self._sorted_keys.range(max(end - limit, start), end)
+        keys.reverse()
+        return keys
+
+    def _count_range(self, descending: bool, offset: int, limit: int) -> List[str]:
+        keys: List[str] = []
+        levels = reversed(self._levels) if descending else iter(self._levels)
+        for count in levels:
+            if len(keys) >= limit:
+                break
+            bucket = self._by_count[count]
+            if offset >= len(bucket):
+                offset -= len(bucket)
+                continue
+            keys.extend(islice(bucket, offset, offset + limit - len(keys)))
+            offset = 0
+        return keys
+
+    def get_stats(self) -> Dict:
+        """Return sketch size counters."""
+        return {
+            "capacity": self.capacity or 0,
+            "size": len(self._counts),
+            "pinned": len(self._pinned),
+            "minCount": self._min if self.capacity else 0,
+            "evictions": self._evictions,
+        }
@@ -0,0 +1,138 @@
+# -*- coding: utf-8 -*-
+
+"""
+KiroGate 多轮对话 history 增量转换缓存。
+
+客户端每轮都会发送完整对话，而与上一轮相比通常只多了最后一两条消息。
+build_kiro_payload 按消息前缀的滚动哈希（种子为模型 ID 和 system prompt）
+缓存已构建好的 Kiro history 条目：命中时只需转换新增的尾部消息。
+
+每条消息仍要序列化并哈希一次，在 benchmarks/bench_anthropic_payload.py 的
+负载上（每条消息几百字节文本）这比直接转换还慢，因此默认关闭（HISTORY_CACHE_MB=0）。
+只有单条消息转换明显比序列化昂贵时才值得开启，开启后以实测延迟为准。
+
+缓存按估算内存（前缀消息的文本长度）做 LRU 淘汰。缓存的条目会被多个
+payload 共享，调用方不得原地修改。
+"""
+
+import hashlib
+import json
+from collections import OrderedDict
+from threading import Lock
+from typing import Any, Dict, Optional, Tuple
+
+from kiro_gateway.config import settings
+
+# 每条缓存记录的固定开销估算（key、tuple、OrderedDict 节点）
+ENTRY_OVERHEAD_BYTES = 256
+
+
+def message_digest(msg: Any) -> Optional[Tuple[bytes, int]]:
+    """
+    Hash the fields of a ChatMessage that history conversion reads.
+
+    Returns:
+        (16-byte digest, approximate size in bytes), or None if the content
+        cannot be serialized deterministically (such messages are not cached)
+    """
+    h = hashlib.blake2b(digest_size=16)
+    h.update(str(msg.role).encode("utf-8", "surrogatepass"))
+    size = 0
+    content = msg.content
+    try:
+        if isinstance(content, str):
+            data = content.encode("utf-8", "surrogatepass")
+            h.update(b"\x00s")
+        else:
+            data = json.dumps(content, ensure_ascii=False, sort_keys=True).encode("utf-8", "surrogatepass")
+            h.update(b"\x00j")
+        h.update(data)
+        size += len(data)
+        if msg.tool_calls:
+            data = json.dumps(msg.tool_calls, ensure_ascii=False, sort_keys=True).encode("utf-8", "surrogatepass")
+            h.update(b"\x00t")
+            h.update(data)
+            size += len(data)
+    except (TypeError, ValueError):
+        return None
+    if msg.tool_call_id:
+        h.update(b"\x00i")
+        h.update(str(msg.tool_call_id).encode("utf-8", "surrogatepass"))
+    return h.digest(), size
+
+
+class HistoryCache:
+    """Memory-bounded LRU of built Kiro history entries keyed by message-prefix hash."""
+
+    def __init__(self, max_bytes: int):
+        """
+        Args:
+            max_bytes: Memory budget (0 disables the cache)
+        """
+        self.max_bytes = max(0, max_bytes)
+        self._entries: "OrderedDict[bytes, Tuple[tuple, int]]" = OrderedDict()
+        self._bytes = 0
+        self._lock = Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.reused_entries = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_bytes > 0
+
+    def get(self, key: bytes) -> Optional[tuple]:
+        """Return cached history entries for a prefix hash (None on miss)."""
+        with self._lock:
+            item = self._entries.get(key)
+            if item is None:
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            self.reused_entries += len(item[0])
+            return item[0]
+
+    def record_miss(self) -> None:
+        """Count a request whose history had no cached prefix."""
+        with self._lock:
+            self.misses += 1
+
+    def put(self, key: bytes, entries: tuple, size: int) -> None:
+        """Store history entries for a prefix hash, evicting least recently used ones."""
+        size += ENTRY_OVERHEAD_BYTES
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self._bytes -= previous[1]
+            self._entries[key] = (entries, size)
+            self._bytes += size
+            while self._bytes > self.max_bytes:
+                _, (_, evicted_size) = self._entries.popitem(last=False)
+                self._bytes -= evicted_size
+                self.evictions += 1
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "size": len(self._entries),
+                "bytes": self._bytes,
+                "maxBytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "reusedEntries": self.reused_entries,
+                "hitRate": round(self.hits / total, 4) if total else 0.0,
+            }
+
+
+# Global history cache instance
+history_cache = HistoryCache(int(settings.history_cache_mb * 1024 * 1024))
@@ -35,6 +35,7 @@ from loguru import logger
 
 from kiro_gateway.auth import KiroAuthManager
 from kiro_gateway.config import settings, get_adaptive_timeout
+from kiro_gateway.tracing import span
 from kiro_gateway.utils import get_kiro_headers
 
 
@@ -245,7 +246,8 @@ class KiroHttpClient:
 
         for attempt in range(max_retries):
             try:
-                token = await self.auth_manager.get_access_token()
+                with span("token_refresh"):
+                    token = await self.auth_manager.get_access_token()
                 headers = self._get_headers(token)
 
                 # Set timeout per-request
@@ -255,11 +257,14 @@ class KiroHttpClient:
                     req = client.build_request(
                         method, url, json=json_data, headers=headers, timeout=request_timeout
                     )
-                    response = await client.send(req, stream=True)
+                    # 流式请求只计到响应头返回，之后的 ttft/stream 阶段由 streaming.py 记录
+                    with span("upstream"):
+                        response = await client.send(req, stream=True)
                 else:
-                    response = await client.request(
-                        method, url, json=json_data, headers=headers, timeout=request_timeout
-                    )
+                    with span("upstream"):
+                        response = await client.request(
+                            method, url, json=json_data, headers=headers, timeout=request_timeout
+                        )
 
                 if response.status_code == 200:
                     return response
@@ -269,7 +274,8 @@ class KiroHttpClient:
                     logger.warning(f"Received 403, refreshing token (attempt {attempt + 1}/{max_retries})")
                     await response.aclose()
                     # 传递当前使用的 token，让 force_refresh 判断是否需要刷新
-                    await self.auth_manager.force_refresh(old_token=token)
+                    with span("token_refresh"):
+                        await self.auth_manager.force_refresh(old_token=token)
                     continue
 
                 # 429 - Rate limited, wait and retry
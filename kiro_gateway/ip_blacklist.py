@@ -0,0 +1,118 @@
+# -*- coding: utf-8 -*-
+
+"""
+KiroGate IP 黑名单匹配器。
+
+黑名单规则可以是单个 IP 或 CIDR 网段（如 203.0.113.0/24、2001:db8::/64）。
+规则编译为不可变的前缀表：每个前缀长度一张哈希表，查找时按出现过的前缀长度
+截取地址高位逐一比对，复杂度只与不同前缀长度的个数有关。
+规则变化时整体重建并原子替换引用，请求路径上的查找无需加锁。
+"""
+
+import ipaddress
+import socket
+from typing import Dict, FrozenSet, Iterable, Optional, Set, Tuple
+
+
+def normalize_ip_rule(value: str) -> Optional[str]:
+    """
+    Normalize a blacklist rule.
+
+    Single addresses are returned in canonical form ("1.2.3.4", "2001:db8::1"),
+    ranges as their network ("1.2.3.4/24" -> "1.2.3.0/24").
+
+    Returns:
+        Normalized rule, or None if value is not an IP address or CIDR range
+    """
+    value = (value or "").strip()
+    if not value:
+        return None
+    try:
+        network = ipaddress.ip_network(value, strict=False)
+    except ValueError:
+        return None
+    if network.prefixlen == network.max_prefixlen:
+        return str(network.network_address)
+    return str(network)
+
+
+_IPV4_MAPPED_PREFIX = b"\x00" * 10 + b"\xff\xff"
+
+
+def _parse_ip(ip: str) -> Optional[Tuple[int, int]]:
+    """
+    Parse a client address into (version, int), unwrapping IPv4-mapped IPv6.
+
+    inet_pton is several times faster than ipaddress.ip_address on the request path.
+    """
+    try:
+        if ":" not in ip:
+            return 4, int.from_bytes(socket.inet_pton(socket.AF_INET, ip), "big")
+        packed = socket.inet_pton(socket.AF_INET6, ip.split("%", 1)[0])
+    except (OSError, ValueError):
+        return None
+    if packed[:12] == _IPV4_MAPPED_PREFIX:
+        return 4, int.from_bytes(packed[12:], "big")
+    return 6, int.from_bytes(packed, "big")
+
+
+class IPBlacklistMatcher:
+    """Immutable compiled blacklist (single IPs + CIDR ranges)."""
+
+    __slots__ = ("_exact", "_exact_ints", "_prefixes", "_size")
+
+    def __init__(self, rules: Iterable[str] = ()):
+        exact: Set[str] = set()
+        exact_ints: Set[Tuple[int, int]] = set()
+        prefixes: Dict[Tuple[int, int], Set[int]] = {}
+        size = 0
+        for rule in rules:
+            try:
+                network = ipaddress.ip_network(rule, strict=False)
+            except ValueError:
+                continue
+            size += 1
+            if network.prefixlen == network.max_prefixlen:
+                exact.add(str(network.network_address))
+                exact_ints.add((network.version, int(network.network_address)))
+                continue
+            shift = network.max_prefixlen - network.prefixlen
+            prefixes.setdefault((network.version, shift), set()).add(
+                int(network.network_address) >> shift
+            )
+
+        self._exact: FrozenSet[str] = frozenset(exact)
+        self._exact_ints: FrozenSet[Tuple[int, int]] = frozenset(exact_ints)
+        # {version: ((shift, prefixes), ...)}，长前缀（shift 小）在前
+        self._prefixes: Dict[int, Tuple[Tuple[int, FrozenSet[int]], ...]] = {
+            version: tuple(
+                (shift, frozenset(values))
+                for (v, shift), values in sorted(prefixes.items(), key=lambda item: item[0][1])
+                if v == version
+            )
+            for version in (4, 6)
+        }
+        self._size = size
+
+    def __len__(self) -> int:
+        return self._size
+
+    def contains(self, ip: str) -> bool:
+        """Check whether ip is banned by any rule."""
+        if not ip:
+            return False
+        if ip in self._exact:
+            return True
+        if not self._size:
+            return False
+        parsed = _parse_ip(ip)
+        if parsed is None:
+            return False
+        # 非规范写法的单个 IP（如大写 IPv6、IPv4-mapped）
+        if parsed in self._exact_ints:
+            return True
+        version, value = parsed
+        for shift, values in self._prefixes[version]:
+            if value >> shift in values:
+                return True
+        return False
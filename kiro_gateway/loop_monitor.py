@@ -0,0 +1,182 @@
+# -*- coding: utf-8 -*-
+
+"""
+KiroGate 事件循环延迟监控与阻塞调用检测。
+
+后台任务定期休眠固定间隔，实际唤醒时间超出预期的部分即为事件循环延迟，
+反映同步调用（如 SQLite 写入、大文本 tiktoken 编码、PBKDF2）阻塞事件循环的程度。
+
+看门狗线程在事件循环之外检查采样任务是否按时唤醒：超时超过阈值时说明
+事件循环线程正卡在某个同步调用里，此时抓取该线程的调用栈（即阻塞现场），
+事件循环恢复后补记实际阻塞时长，写入 metrics 并在管理后台展示。
+"""
+
+import asyncio
+import os
+import sys
+import threading
+import time
+import traceback
+from collections import deque
+from typing import Deque, Dict, List, Optional
+
+from loguru import logger
+
+from kiro_gateway.config import settings
+
+# 调用栈中优先定位到本项目代码
+_PROJECT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def _blocking_site(stack: traceback.StackSummary) -> str:
+    """Return "file:line function" of the innermost project frame (or innermost frame)."""
+    for frame in reversed(stack):
+        if frame.filename.startswith(_PROJECT_DIR) and "site-packages" not in frame.filename:
+            filename = os.path.relpath(frame.filename, _PROJECT_DIR)
+            return f"{filename}:{frame.lineno} {frame.name}"
+    if stack:
+        frame = stack[-1]
+        return f"{os.path.basename(frame.filename)}:{frame.lineno} {frame.name}"
+    return "unknown"
+
+
+class EventLoopLagMonitor:
+    """事件循环延迟采样后台任务 + 阻塞调用看门狗线程。"""
+
+    MAX_BLOCK_EVENTS = 20
+    MAX_STACK_DEPTH = 40
+
+    def __init__(self):
+        self._running = False
+        self._task: Optional[asyncio.Task] = None
+        self._interval = settings.event_loop_lag_interval
+        self._block_threshold = settings.event_loop_block_threshold
+
+        # 看门狗状态（跨线程读写的都是单个引用赋值，无需加锁）
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._loop_thread_id: Optional[int] = None
+        self._expected_wake: Optional[float] = None  # time.monotonic()
+        self._pending: Optional[Dict] = None
+        self._watchdog: Optional[threading.Thread] = None
+        self._watchdog_stop = threading.Event()
+        self._events_lock = threading.Lock()
+        self._block_events: Deque[Dict] = deque(maxlen=self.MAX_BLOCK_EVENTS)
+
+    async def start(self) -> None:
+        """Start the lag sampling task and the blocking-call watchdog."""
+        if self._running:
+            return
+        self._running = True
+        self._loop = asyncio.get_running_loop()
+        self._loop_thread_id = threading.get_ident()
+        self._task = asyncio.create_task(self._run_loop())
+        if self._block_threshold and self._block_threshold > 0:
+            self._watchdog_stop.clear()
+            self._watchdog = threading.Thread(target=self._watch, name="loop-watchdog", daemon=True)
+            self._watchdog.start()
+        logger.info(
+            f"Event loop lag monitor started (interval: {self._interval}s, "
+            f"block threshold: {self._block_threshold or 'disabled'}s)"
+        )
+
+    async def stop(self) -> None:
+        """Stop the lag sampling task and the watchdog."""
+        self._running = False
+        self._watchdog_stop.set()
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        if self._watchdog:
+            await asyncio.to_thread(self._watchdog.join, 2.0)
+            self._watchdog = None
+
+    async def _run_loop(self) -> None:
+        """Sample loop lag every interval."""
+        from kiro_gateway.metrics import metrics
+
+        loop = asyncio.get_running_loop()
+        while self._running:
+            expected = loop.time() + self._interval
+            self._expected_wake = time.monotonic() + self._interval
+            await asyncio.sleep(self._interval)
+            lag = max(0.0, loop.time() - expected)
+            self._expected_wake = None
+            metrics.observe_event_loop_lag(lag)
+
+            pending = self._pending
+            if pending is not None:
+                # 看门狗已抓到阻塞现场，循环恢复后补记实际阻塞时长
+                self._pending = None
+                with self._events_lock:
+                    pending["duration"] = round(lag, 4)
+                metrics.observe_event_loop_block(pending["site"], lag)
+                logger.warning(
+                    f"Event loop blocked for {lag:.3f}s at {pending['site']} "
+                    f"(task: {pending['task']})\n" + "".join(pending["stack"])
+                )
+
+    def _watch(self) -> None:
+        """Watchdog thread: capture the loop thread's stack when a wake-up is overdue."""
+        threshold = self._block_threshold
+        check_interval = min(max(threshold / 4, 0.01), 1.0)
+        while not self._watchdog_stop.wait(check_interval):
+            expected = self._expected_wake
+            if expected is None or self._pending is not None:
+                continue
+            overdue = time.monotonic() - expected
+            if overdue < threshold:
+                continue
+            event = self._capture(overdue)
+            if event is not None and self._expected_wake == expected:
+                with self._events_lock:
+                    self._block_events.append(event)
+                self._pending = event
+
+    def _capture(self, overdue: float) -> Optional[Dict]:
+        """Snapshot the event loop thread's current stack."""
+        frame = sys._current_frames().get(self._loop_thread_id)
+        if frame is None:
+            return None
+        stack = traceback.extract_stack(frame, limit=self.MAX_STACK_DEPTH)
+        del frame
+
+        task_name = "-"
+        try:
+            task = asyncio.current_task(self._loop)
+            if task is not None:
+                task_name = task.get_name()
+                coro = task.get_coro()
+                qualname = getattr(coro, "__qualname__", None)
+                if qualname:
+                    task_name = f"{task_name} ({qualname})"
+        except Exception:
+            pass
+
+        return {
+            "time": time.time(),
+            "site": _blocking_site(stack),
+            "task": task_name,
+            # 看门狗发现时已阻塞的时长；循环恢复后更新为实际时长
+            "duration": round(overdue, 4),
+            "stack": traceback.format_list(stack),
+        }
+
+    def get_stats(self) -> Dict:
+        """Return monitor settings and recent blocking events (newest first)."""
+        with self._events_lock:
+            events: List[Dict] = [dict(event) for event in reversed(self._block_events)]
+        return {
+            "interval": self._interval,
+            "blockThreshold": self._block_threshold,
+            "watchdogRunning": self._watchdog is not None and self._watchdog.is_alive(),
+            "blockedNow": self._pending is not None,
+            "recentBlocks": events,
+        }
+
+
+# Global loop monitor instance
+loop_monitor = EventLoopLagMonitor()
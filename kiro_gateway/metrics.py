@@ -23,20 +23,52 @@ Prometheus metrics module.
 Provides structured application metrics collection and export.
 """
 
+import asyncio
+import hashlib
+import json
 import os
+import socket
 import sqlite3
 import time
-from collections import defaultdict
-from typing import Dict, List, Tuple
+from collections import defaultdict, deque
+from contextlib import contextmanager
+from typing import Any, Callable, Deque, Dict, List, Optional, Tuple
 from dataclasses import dataclass
-from threading import Lock
+from threading import Event, Lock, Thread
 
 from loguru import logger
 
-from kiro_gateway.config import APP_VERSION, settings
+from kiro_gateway.config import APP_VERSION, MODEL_MAPPING, settings
+from kiro_gateway.db_executor import DatabaseExecutor
+from kiro_gateway.heavy_hitters import SpaceSavingCounter
+from kiro_gateway.ip_blacklist import IPBlacklistMatcher, normalize_ip_rule
+from kiro_gateway.sketches import DDSketch
+from kiro_gateway.tracing import record_span
 
 METRICS_DB_FILE = os.getenv("METRICS_DB_FILE", "data/metrics.db")
 
+# 统计接口响应快照有效期（秒），轮询请求在此期间复用同一份序列化结果
+METRICS_SNAPSHOT_TTL = 1.0
+
+# 多进程模式下超过该时长（秒）未上报的 worker 视为已退出
+SHARED_WORKER_STALE_AFTER = 30.0
+
+# Counter key prefixes -> PrometheusMetrics attribute holding the counters
+COUNTER_PREFIXES = (
+    ("req:", "_request_total"),
+    ("err:", "_error_total"),
+    ("retry:", "_retry_total"),
+    ("api:", "_api_type_usage"),
+    ("in_tok:", "_input_tokens_total"),
+    ("out_tok:", "_output_tokens_total"),
+)
+
+
+
+def _escape_label(value: str) -> str:
+    """Escape a Prometheus label value."""
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
 
 @dataclass
 class MetricsBucket:
@@ -45,6 +77,142 @@ class MetricsBucket:
     count: int = 0
 
 
+class SnapshotCache:
+    """
+    Serialized response snapshots rebuilt at most once per TTL.
+
+    Each snapshot carries a content hash ETag, so pollers revalidating with
+    If-None-Match get a 304 without a body while nothing has changed.
+    """
+
+    def __init__(self, ttl: float = METRICS_SNAPSHOT_TTL):
+        self._ttl = ttl
+        self._entries: Dict[str, Tuple[float, bytes, str]] = {}
+        self._lock = Lock()
+        # 每次 invalidate 递增；构建期间发生失效时丢弃旧数据构建出的结果
+        self._generation = 0
+        self._hits = 0
+        self._builds = 0
+
+    def get(self, name: str, build: Callable[[], Any]) -> Tuple[bytes, str]:
+        """
+        Return (body, etag) for a snapshot, rebuilding it when expired.
+
+        Args:
+            name: Snapshot name
+            build: Returns the payload; str is used as-is, anything else is JSON-encoded
+
+        Returns:
+            (UTF-8 body, quoted ETag)
+        """
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(name)
+            if entry and now - entry[0] < self._ttl:
+                self._hits += 1
+                return entry[1], entry[2]
+            generation = self._generation
+        payload = build()
+        if isinstance(payload, str):
+            body = payload.encode("utf-8")
+        else:
+            body = json.dumps(payload, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+        etag = f'"{hashlib.blake2b(body, digest_size=12).hexdigest()}"'
+        with self._lock:
+            self._builds += 1
+            if generation == self._generation:
+                self._entries[name] = (now, body, etag)
+        return body, etag
+
+    def invalidate(self, *names: str) -> None:
+        """Drop the given snapshots (all if none given) so the next read rebuilds them."""
+        with self._lock:
+            self._generation += 1
+            if not names:
+                self._entries.clear()
+            for name in names:
+                self._entries.pop(name, None)
+
+    def get_stats(self) -> Dict:
+        """Return hit/build counters."""
+        with self._lock:
+            return {"hits": self._hits, "builds": self._builds, "entries": len(self._entries)}
+
+
+class StreamObserver:
+    """
+    Per-response timing probe fed by the streaming generators.
+
+    Chunk timings are accumulated locally without locking and merged into
+    the collector once, when the response completes.
+    """
+
+    __slots__ = (
+        "_collector", "model", "api_type", "mode", "_start", "_opened", "_first", "_last", "_gaps", "_done"
+    )
+
+    def __init__(
+        self,
+        collector: "PrometheusMetrics",
+        model: str,
+        api_type: str,
+        mode: str,
+        request_start: Optional[float] = None
+    ):
+        """
+        Args:
+            collector: Metrics collector receiving the observations
+            model: Model name
+            api_type: API type (openai/anthropic)
+            mode: "stream" or "non_stream"
+            request_start: time.time() when the request arrived (defaults to now)
+        """
+        self._collector = collector
+        self.model = model
+        self.api_type = api_type
+        self.mode = mode
+        now = time.monotonic()
+        # 请求开始时间换算到单调时钟，TTFT 包含上游建连和排队时间
+        self._start = now - max(0.0, time.time() - request_start) if request_start else now
+        # 观察器在上游响应头返回后创建，用于 ttft/stream 阶段 span
+        self._opened = now
+        self._first: Optional[float] = None
+        self._last = 0.0
+        self._gaps = DDSketch()
+        self._done = False
+
+    def on_chunk(self) -> None:
+        """Record that a content chunk was received from upstream."""
+        now = time.monotonic()
+        if self._first is None:
+            self._first = now
+        else:
+            self._gaps.add(now - self._last)
+        self._last = now
+
+    def finish(self, output_tokens: int = 0) -> None:
+        """Publish the observations (only the first call has an effect)."""
+        if self._done:
+            return
+        self._done = True
+        duration = time.monotonic() - self._start
+        ttft = None
+        tokens_per_second = None
+        if self._first is not None:
+            ttft = self._first - self._start
+            # 生成速率按首个到最后一个 chunk 的区间计算，不含首 token 等待
+            if output_tokens > 0 and self._last > self._first:
+                tokens_per_second = output_tokens / (self._last - self._first)
+        self._collector.observe_stream(
+            self.model, self.api_type, self.mode, duration, ttft, tokens_per_second, self._gaps
+        )
+        if self._first is not None:
+            # 换算到 perf_counter 时钟后记入当前请求的阶段 span
+            offset = time.perf_counter() - time.monotonic()
+            record_span("ttft", self._first - self._opened, self._opened + offset)
+            record_span("stream", self._last - self._first, self._first + offset)
+
+
 class PrometheusMetrics:
     """
     Prometheus-style metrics collector.
@@ -60,8 +228,25 @@ class PrometheusMetrics:
 
     # Latency histogram bucket boundaries (seconds)
     LATENCY_BUCKETS = [0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0, float('inf')]
+    # Event loop lag histogram bucket boundaries (seconds)
+    LOOP_LAG_BUCKETS = [0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, float('inf')]
+    # Request phase histogram bucket boundaries (seconds)
+    PHASE_BUCKETS = [0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, float('inf')]
     MAX_RECENT_REQUESTS = 50
     MAX_RESPONSE_TIMES = 100
+    # Streaming quantile sketches: {metric: help}
+    STREAM_SKETCH_METRICS = {
+        "ttft_seconds": "Time to first upstream content chunk",
+        "response_duration_seconds": "Time until the full response was produced",
+        "inter_chunk_gap_seconds": "Gap between consecutive upstream content chunks",
+        "output_tokens_per_second": "Output token generation rate",
+    }
+    STREAM_QUANTILES = (0.5, 0.9, 0.95, 0.99)
+    # 模型名来自客户端：已知模型之外最多单独统计这么多个，其余归入 "other"
+    MAX_STREAM_SKETCH_MODELS = 32
+    STREAM_SKETCH_KNOWN_MODELS = frozenset(MODEL_MAPPING) | frozenset(MODEL_MAPPING.values())
+    # recent_requests 表保留的记录数
+    MAX_PERSISTED_RECENT_REQUESTS = 100
 
     def __init__(self):
         """Initialize metrics collector."""
@@ -69,6 +254,34 @@ class PrometheusMetrics:
         self._db_path = METRICS_DB_FILE
         self._init_db()
 
+        # Writes run on a dedicated thread, never under self._lock on the event loop
+        self._writer_conn = None  # Only touched by the executor thread
+        self._writer_stale = False
+        self._db_executor = DatabaseExecutor("metrics-db", batch=self._write_batch)
+
+        # Write-behind: 内存状态为准，脏数据由后台线程定期合并写入
+        self._dirty_counters: Dict[str, int] = {}  # {counter_key: value}
+        self._dirty_hourly: Dict[int, int] = {}  # {hour_ts: count}
+        self._dirty_ips: set[str] = set()
+        self._evicted_ips: set[str] = set()  # 被 Space-Saving 淘汰、待从 ip_stats 删除
+        self._pending_recent: List[Dict] = []
+        self._flush_interval = max(0.1, settings.metrics_flush_interval)
+        self._flush_stop = Event()
+        self._flush_lock = Lock()  # 同一时间只有一次写入在途，基准值在提交成功后才推进
+        self._flusher: Thread | None = None
+        self._flushes = 0
+        self._flushed_rows = 0
+
+        # 多进程模式：计数以增量累加到共享库，定期合并其他 worker 的数据
+        self._shared = settings.metrics_multiprocess
+        self._worker_id = f"{socket.gethostname()}:{os.getpid()}"
+        self._counter_base: Dict[str, int] = {}  # {counter_key: 已计入共享库的值}
+        self._hourly_base: Dict[int, int] = {}  # {hour_ts: 已计入共享库的值}
+        self._ip_base: Dict[str, int] = {}  # {ip: 已计入共享库的计数}
+        self._peer_workers = 0
+        self._peer_active_connections = 0
+        self._peer_sketches: Dict[Tuple[str, str, str, str], DDSketch] = {}
+
         # Counters
         self._request_total: Dict[str, int] = defaultdict(int)  # {endpoint:status:model: count}
         self._error_total: Dict[str, int] = defaultdict(int)  # {error_type: count}
@@ -85,33 +298,62 @@ class PrometheusMetrics:
         self._latency_sum: Dict[str, float] = defaultdict(float)  # {endpoint: sum}
         self._latency_count: Dict[str, int] = defaultdict(int)  # {endpoint: count}
 
+        # Request phases (see tracing.py): {phase: [bucket_counts]}
+        self._phase_histogram: Dict[str, List[int]] = defaultdict(
+            lambda: [0] * len(self.PHASE_BUCKETS)
+        )
+        self._phase_sum: Dict[str, float] = defaultdict(float)
+        self._phase_count: Dict[str, int] = defaultdict(int)
+
+        # Quantile sketches: {(metric, model, api_type, mode): sketch}
+        self._stream_sketches: Dict[Tuple[str, str, str, str], DDSketch] = {}
+        self._stream_sketch_models: set[str] = set()  # 已分配独立 sketch 的未知模型
+
         # Gauges
         self._active_connections = 0
         self._cache_size = 0
         self._token_valid = False
 
+        # Event loop lag
+        self._loop_lag_histogram: List[int] = [0] * len(self.LOOP_LAG_BUCKETS)
+        self._loop_lag_sum = 0.0
+        self._loop_lag_count = 0
+        self._loop_lag_last = 0.0
+        self._loop_lag_max = 0.0
+        # Event loop blocking calls: {site: [count, total_seconds]}
+        self._loop_blocks: Dict[str, List[float]] = {}
+        self._loop_block_total = 0
+
         # Start time
         self._start_time = time.time()
 
         # Deno-compatible fields
         self._stream_requests = 0
         self._non_stream_requests = 0
-        self._response_times: List[float] = []
+        self._response_times: Deque[float] = deque(maxlen=self.MAX_RESPONSE_TIMES)
         self._recent_requests: List[Dict] = []
         self._api_type_usage: Dict[str, int] = defaultdict(int)  # {openai/anthropic: count}
         self._hourly_requests: Dict[int, int] = defaultdict(int)  # {hour_timestamp: count}
 
         # IP statistics and blacklist
-        self._ip_requests: Dict[str, int] = defaultdict(int)  # {ip: count}
-        self._ip_last_seen: Dict[str, int] = {}  # {ip: timestamp_ms}
-        self._ip_blacklist: Dict[str, Dict] = {}  # {ip: {banned_at, reason}}
+        # {ip: count, last_seen}，IP_STATS_MAX_ENTRIES > 0 时只保留请求最多的 N 个 IP
+        self._ip_counter = SpaceSavingCounter(settings.ip_stats_max_entries)
+        self._ip_blacklist: Dict[str, Dict] = {}  # {ip or cidr: {banned_at, reason}}
+        # 编译后的黑名单，变更时整体替换，is_ip_banned 无锁读取
+        self._ip_matcher = IPBlacklistMatcher()
         self._site_enabled: bool = True  # Site on/off switch
         self._self_use_enabled: bool = False  # Self-use mode toggle
         self._require_approval: bool = True  # Registration approval toggle
         self._proxy_api_key: str = settings.proxy_api_key
 
+        # Serialized /metrics, /api/metrics, /admin/api/stats responses
+        self.snapshots = SnapshotCache()
+
         # Load persisted data
         self._load_from_db()
+        if self._shared:
+            # 无请求时也要定期上报心跳并合并其他 worker 的数据
+            self._ensure_flusher()
 
     def _init_db(self) -> None:
         """Initialize SQLite database and create tables."""
@@ -141,6 +383,7 @@ class PrometheusMetrics:
                     count INTEGER DEFAULT 0,
                     last_seen INTEGER
                 );
+                CREATE INDEX IF NOT EXISTS idx_ip_stats_count ON ip_stats(count);
                 CREATE TABLE IF NOT EXISTS ip_blacklist (
                     ip TEXT PRIMARY KEY,
                     banned_at INTEGER,
@@ -150,7 +393,28 @@ class PrometheusMetrics:
                     key TEXT PRIMARY KEY,
                     value TEXT
                 );
+                CREATE TABLE IF NOT EXISTS worker_state (
+                    worker TEXT PRIMARY KEY,
+                    updated_at INTEGER,
+                    active_connections INTEGER DEFAULT 0,
+                    sketches TEXT
+                );
+                CREATE TABLE IF NOT EXISTS token_calibration (
+                    model TEXT,
+                    bucket TEXT,
+                    samples INTEGER DEFAULT 0,
+                    log_ratio REAL,
+                    ratio_dev REAL,
+                    log_chars_per_token REAL,
+                    chars_per_token_dev REAL,
+                    updated_at INTEGER,
+                    PRIMARY KEY (model, bucket)
+                );
             ''')
+            ip_columns = {row[1] for row in conn.execute("PRAGMA table_info(ip_stats)")}
+            if "error" not in ip_columns:
+                # Space-Saving 模式下计数的误差上界
+                conn.execute("ALTER TABLE ip_stats ADD COLUMN error INTEGER DEFAULT 0")
             conn.commit()
 
     def _load_from_db(self) -> None:
@@ -160,27 +424,16 @@ class PrometheusMetrics:
                 # Load counters
                 cursor = conn.execute("SELECT key, value FROM counters")
                 for key, value in cursor:
-                    if key.startswith("req:"):
-                        self._request_total[key[4:]] = value
-                    elif key.startswith("err:"):
-                        self._error_total[key[4:]] = value
-                    elif key.startswith("retry:"):
-                        self._retry_total[key[6:]] = value
-                    elif key.startswith("api:"):
-                        self._api_type_usage[key[4:]] = value
-                    elif key.startswith("in_tok:"):
-                        self._input_tokens_total[key[7:]] = value
-                    elif key.startswith("out_tok:"):
-                        self._output_tokens_total[key[8:]] = value
-                    elif key == "stream_requests":
-                        self._stream_requests = value
-                    elif key == "non_stream_requests":
-                        self._non_stream_requests = value
+                    self._set_counter(key, value)
+                    if self._shared:
+                        self._counter_base[key] = value
 
                 # Load hourly requests
                 cursor = conn.execute("SELECT hour_ts, count FROM hourly_requests")
                 for hour_ts, count in cursor:
                     self._hourly_requests[hour_ts] = count
+                if self._shared:
+                    self._hourly_base = dict(self._hourly_requests)
 
                 # Load recent requests (last 50)
                 cursor = conn.execute(
@@ -194,16 +447,14 @@ class PrometheusMetrics:
                     for r in reversed(rows)
                 ]
 
-                # Load IP stats
-                cursor = conn.execute("SELECT ip, count, last_seen FROM ip_stats")
-                for ip, count, last_seen in cursor:
-                    self._ip_requests[ip] = count
-                    self._ip_last_seen[ip] = last_seen
-
                 # Load IP blacklist
                 cursor = conn.execute("SELECT ip, banned_at, reason FROM ip_blacklist")
                 for ip, banned_at, reason in cursor:
                     self._ip_blacklist[ip] = {"banned_at": banned_at, "reason": reason}
+                self._ip_matcher = IPBlacklistMatcher(self._ip_blacklist)
+
+                # Load IP stats (bounded mode: only the top N plus banned IPs)
+                self._load_ip_stats(conn)
 
                 # Load site config
                 cursor = conn.execute("SELECT key, value FROM site_config WHERE key = 'site_enabled'")
@@ -230,51 +481,435 @@ class PrometheusMetrics:
         except Exception as e:
             logger.warning(f"Failed to load metrics from DB: {e}")
 
-    def _save_counter(self, key: str, value: int) -> None:
-        """Save a single counter to database."""
+    def _get_counter(self, key: str) -> int:
+        """Return the in-memory value of a persisted counter key."""
+        for prefix, attr in COUNTER_PREFIXES:
+            if key.startswith(prefix):
+                return getattr(self, attr).get(key[len(prefix):], 0)
+        if key == "stream_requests":
+            return self._stream_requests
+        if key == "non_stream_requests":
+            return self._non_stream_requests
+        return 0
+
+    def _set_counter(self, key: str, value: int) -> None:
+        """Set the in-memory value of a persisted counter key."""
+        for prefix, attr in COUNTER_PREFIXES:
+            if key.startswith(prefix):
+                getattr(self, attr)[key[len(prefix):]] = value
+                return
+        if key == "stream_requests":
+            self._stream_requests = value
+        elif key == "non_stream_requests":
+            self._non_stream_requests = value
+
+    def _load_ip_stats(self, conn: sqlite3.Connection) -> None:
+        """Load persisted IP stats into the IP counter."""
+        capacity = self._ip_counter.capacity
+        query = "SELECT ip, count, last_seen, error FROM ip_stats"
+        if capacity:
+            query += f" ORDER BY count DESC LIMIT {int(capacity)}"
+        rows = {row[0]: row for row in conn.execute(query)}
+        if capacity:
+            for ip in self._ip_blacklist:
+                if ip in rows:
+                    continue
+                row = conn.execute(
+                    "SELECT ip, count, last_seen, error FROM ip_stats WHERE ip = ?", (ip,)
+                ).fetchone()
+                if row:
+                    rows[ip] = row
+
+        # 按 last_seen 升序载入，恢复最近访问顺序
+        for ip, count, last_seen, error in sorted(rows.values(), key=lambda row: row[2] or 0):
+            self._ip_counter.load(ip, count or 0, last_seen or 0, error or 0, pinned=self._ip_matcher.contains(ip))
+            if self._shared:
+                self._ip_base[ip] = count or 0
+        if not capacity:
+            return
+
+        # 启动时裁剪超出上限的旧数据（按计数淘汰，已封禁 IP 保留）
+        # 多进程模式下其他 worker 仍在累加这些行，不裁剪
+        stats = self._ip_counter.get_stats()
+        if not self._shared and stats["size"] - stats["pinned"] >= capacity:
+            deleted = conn.execute(
+                "DELETE FROM ip_stats WHERE count < ? AND ip NOT IN (SELECT ip FROM ip_blacklist)",
+                (stats["minCount"],)
+            ).rowcount
+            if deleted:
+                logger.info(f"Trimmed {deleted} IP stats rows beyond IP_STATS_MAX_ENTRIES={capacity}")
+
+    @contextmanager
+    def _write_batch(self):
+        """One write transaction on the executor thread's connection."""
+        if self._writer_stale and self._writer_conn is not None:
+            self._writer_conn.close()
+            self._writer_conn = None
+        self._writer_stale = False
+        if self._writer_conn is None:
+            self._writer_conn = sqlite3.connect(
+                self._db_path,
+                timeout=settings.db_busy_timeout,
+                check_same_thread=False,
+            )
+        conn = self._writer_conn
+        conn.execute("BEGIN")
         try:
-            with sqlite3.connect(self._db_path) as conn:
-                conn.execute(
+            yield conn
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+
+    def reset_writer(self) -> None:
+        """Reopen the writer connection before the next batch (e.g. after DB import)."""
+        self._writer_stale = True
+
+    def _ensure_flusher(self) -> None:
+        """Start the write-behind flusher thread (caller holds self._lock)."""
+        if self._flusher is None and not self._flush_stop.is_set():
+            self._flusher = Thread(target=self._flush_loop, name="metrics-flush", daemon=True)
+            self._flusher.start()
+
+    def _flush_loop(self) -> None:
+        while not self._flush_stop.wait(self._flush_interval):
+            try:
+                self.flush()
+                if self._shared:
+                    # 在本次写入提交之后执行，读到的共享数据已包含本进程的增量；
+                    # 持有 _flush_lock，基准值的重设不会与在途的写入交错
+                    with self._flush_lock:
+                        self._db_executor.call(self._sync_shared, *self._worker_state()).result()
+            except Exception as e:
+                logger.error(f"Metrics flush failed: {e}")
+
+    def flush(self) -> None:
+        """
+        Persist all dirty metrics as one transaction and wait for the commit.
+
+        If the write fails (database locked, disk full) the taken state is
+        merged back into the dirty set and retried on the next flush; in
+        multiprocess mode the shared-DB bases only advance after the commit.
+        """
+        with self._flush_lock:
+            with self._lock:
+                if not (
+                    self._dirty_counters or self._dirty_hourly or self._dirty_ips
+                    or self._evicted_ips or self._pending_recent
+                ):
+                    return
+                counters, self._dirty_counters = self._dirty_counters, {}
+                hourly, self._dirty_hourly = self._dirty_hourly, {}
+                ips = {}
+                for ip in self._dirty_ips:
+                    entry = self._ip_counter.get(ip)
+                    if entry is not None:
+                        ips[ip] = entry
+                self._dirty_ips = set()
+                evicted, self._evicted_ips = self._evicted_ips, set()
+                recent, self._pending_recent = self._pending_recent, []
+                if self._shared:
+                    # 共享行仍由其他 worker 累加，淘汰只影响本进程内存
+                    for ip in evicted:
+                        self._ip_base.pop(ip, None)
+                    rows = (
+                        self._deltas(counters, self._counter_base),
+                        self._deltas(hourly, self._hourly_base),
+                        self._ip_deltas(ips),
+                        recent,
+                        set(),
+                    )
+                else:
+                    rows = (counters, hourly, ips, recent, evicted)
+
+            try:
+                self._db_executor.call(self._write_dirty, *rows).result()
+            except Exception:
+                with self._lock:
+                    self._restore_dirty(counters, hourly, ips, recent, evicted)
+                raise
+
+            if self._shared:
+                with self._lock:
+                    self._counter_base.update(counters)
+                    self._hourly_base.update(hourly)
+                    for ip, (count, _last_seen, _error) in ips.items():
+                        self._ip_base[ip] = count
+
+    @staticmethod
+    def _deltas(values: Dict, base: Dict) -> Dict:
+        """Non-zero differences between absolute values and base (caller holds self._lock)."""
+        deltas = {}
+        for key, value in values.items():
+            delta = value - base.get(key, 0)
+            if delta:
+                deltas[key] = delta
+        return deltas
+
+    def _ip_deltas(self, ips: Dict[str, Tuple[int, int, int]]) -> Dict[str, Tuple[int, int, int]]:
+        """IP count deltas against the shared-DB base (caller holds self._lock)."""
+        deltas = {}
+        for ip, (count, last_seen, error) in ips.items():
+            # 新跟踪的 IP 继承的计数（error）来自被淘汰的 IP，不计入增量
+            delta = count - self._ip_base.get(ip, error)
+            if delta:
+                deltas[ip] = (delta, last_seen, error)
+        return deltas
+
+    def _restore_dirty(
+        self,
+        counters: Dict[str, int],
+        hourly: Dict[int, int],
+        ips: Dict[str, Tuple[int, int, int]],
+        recent: List[Dict],
+        evicted: set[str]
+    ) -> None:
+        """Merge state taken by a failed flush back into the dirty set (caller holds self._lock)."""
+        # 失败期间又变脏的键保留更新的值
+        for key, value in counters.items():
+            self._dirty_counters.setdefault(key, value)
+        for hour_ts, count in hourly.items():
+            self._dirty_hourly.setdefault(hour_ts, count)
+        self._dirty_ips.update(ip for ip in ips if self._ip_counter.get(ip) is not None)
+        self._evicted_ips.update(ip for ip in evicted if self._ip_counter.get(ip) is None)
+        self._pending_recent[:0] = recent
+        del self._pending_recent[:-self.MAX_PERSISTED_RECENT_REQUESTS]
+
+    def _write_dirty(
+        self,
+        counters: Dict[str, int],
+        hourly: Dict[int, int],
+        ips: Dict[str, Tuple[int, int, int]],
+        recent: List[Dict],
+        evicted: set[str] = frozenset()
+    ) -> None:
+        """Upsert one flush worth of dirty state (runs on the executor thread)."""
+        conn = self._writer_conn
+        if counters:
+            if self._shared:
+                conn.executemany(
+                    "INSERT INTO counters (key, value) VALUES (?, ?) "
+                    "ON CONFLICT(key) DO UPDATE SET value = value + excluded.value",
+                    counters.items()
+                )
+            else:
+                conn.executemany(
                     "INSERT OR REPLACE INTO counters (key, value) VALUES (?, ?)",
-                    (key, value)
+                    counters.items()
                 )
-                conn.commit()
-        except Exception as e:
-            logger.debug(f"Failed to save counter: {e}")
+        if hourly:
+            if self._shared:
+                conn.executemany(
+                    "INSERT INTO hourly_requests (hour_ts, count) VALUES (?, ?) "
+                    "ON CONFLICT(hour_ts) DO UPDATE SET count = count + excluded.count",
+                    hourly.items()
+                )
+            else:
+                conn.executemany(
+                    "INSERT OR REPLACE INTO hourly_requests (hour_ts, count) VALUES (?, ?)",
+                    hourly.items()
+                )
+            # Clean old data (> 24h)
+            conn.execute("DELETE FROM hourly_requests WHERE hour_ts < ?", (max(hourly) - 24 * 3600000,))
+        if evicted:
+            conn.executemany("DELETE FROM ip_stats WHERE ip = ?", [(ip,) for ip in evicted])
+        if ips:
+            if self._shared:
+                sql = (
+                    "INSERT INTO ip_stats (ip, count, last_seen, error) VALUES (?, ?, ?, ?) "
+                    "ON CONFLICT(ip) DO UPDATE SET count = count + excluded.count, "
+                    "last_seen = MAX(last_seen, excluded.last_seen), error = MAX(error, excluded.error)"
+                )
+            else:
+                sql = "INSERT OR REPLACE INTO ip_stats (ip, count, last_seen, error) VALUES (?, ?, ?, ?)"
+            conn.executemany(
+                sql,
+                [(ip, count, last_seen, error) for ip, (count, last_seen, error) in ips.items()]
+            )
+        if recent:
+            conn.executemany(
+                "INSERT INTO recent_requests (timestamp, api_type, path, status, duration, model) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                [(r["timestamp"], r["apiType"], r["path"], r["status"], r["duration"], r["model"]) for r in recent]
+            )
+            # Keep only the newest records (rowid range delete, no full-table NOT IN)
+            conn.execute(
+                "DELETE FROM recent_requests WHERE id <= (SELECT MAX(id) FROM recent_requests) - ?",
+                (self.MAX_PERSISTED_RECENT_REQUESTS,)
+            )
+        self._flushes += 1
+        self._flushed_rows += len(counters) + len(hourly) + len(ips) + len(recent) + len(evicted)
 
-    def _save_hourly(self, hour_ts: int, count: int) -> None:
-        """Save hourly request count."""
+    def load_token_calibration(self) -> List[Tuple]:
+        """Return persisted token calibration rows (see token_calibration.py)."""
         try:
             with sqlite3.connect(self._db_path) as conn:
-                conn.execute(
-                    "INSERT OR REPLACE INTO hourly_requests (hour_ts, count) VALUES (?, ?)",
-                    (hour_ts, count)
-                )
-                # Clean old data (> 24h)
-                cutoff = hour_ts - 24 * 3600000
-                conn.execute("DELETE FROM hourly_requests WHERE hour_ts < ?", (cutoff,))
-                conn.commit()
+                return conn.execute(
+                    "SELECT model, bucket, samples, log_ratio, ratio_dev, log_chars_per_token, "
+                    "chars_per_token_dev, updated_at FROM token_calibration"
+                ).fetchall()
         except Exception as e:
-            logger.debug(f"Failed to save hourly: {e}")
+            logger.warning(f"Failed to load token calibration from DB: {e}")
+            return []
+
+    def save_token_calibration(self, rows: List[Tuple]) -> None:
+        """Queue an upsert of token calibration rows."""
+        if rows:
+            self._db_executor.submit(self._write_token_calibration, rows)
+
+    def _write_token_calibration(self, rows: List[Tuple]) -> None:
+        self._writer_conn.executemany(
+            "INSERT OR REPLACE INTO token_calibration (model, bucket, samples, log_ratio, ratio_dev, "
+            "log_chars_per_token, chars_per_token_dev, updated_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+            rows
+        )
+
+    def _worker_state(self) -> Tuple[int, str]:
+        """Snapshot this worker's gauges and sketches for publishing."""
+        with self._lock:
+            sketches = [[*key, sketch.to_dict()] for key, sketch in self._stream_sketches.items()]
+            return self._active_connections, json.dumps(sketches)
 
-    def _save_recent_request(self, req: Dict) -> None:
-        """Save a recent request to database."""
+    def _sync_shared(self, active_connections: int, sketches: str) -> None:
+        """
+        Publish this worker's state and merge totals of all workers (executor thread).
+
+        Shared counters already contain every worker's flushed deltas; local
+        values are rebased onto them, keeping increments not yet flushed.
+        """
+        conn = self._writer_conn
+        now = int(time.time() * 1000)
+        conn.execute(
+            "INSERT OR REPLACE INTO worker_state (worker, updated_at, active_connections, sketches) "
+            "VALUES (?, ?, ?, ?)",
+            (self._worker_id, now, active_connections, sketches)
+        )
+        stale_after = max(SHARED_WORKER_STALE_AFTER, self._flush_interval * 3)
+        conn.execute("DELETE FROM worker_state WHERE updated_at < ?", (now - int(stale_after * 1000),))
+
+        counters = dict(conn.execute("SELECT key, value FROM counters"))
+        hour_cutoff = (now // 3600000) * 3600000 - 24 * 3600000
+        hourly = dict(conn.execute(
+            "SELECT hour_ts, count FROM hourly_requests WHERE hour_ts >= ?", (hour_cutoff,)
+        ))
+        recent_rows = conn.execute(
+            "SELECT timestamp, api_type, path, status, duration, model "
+            "FROM recent_requests ORDER BY id DESC LIMIT ?",
+            (self.MAX_RECENT_REQUESTS,)
+        ).fetchall()
+        peers = conn.execute(
+            "SELECT active_connections, sketches FROM worker_state WHERE worker != ?",
+            (self._worker_id,)
+        ).fetchall()
+
+        peer_sketches: Dict[Tuple[str, str, str, str], DDSketch] = {}
+        for _active, blob in peers:
+            try:
+                entries = json.loads(blob or "[]")
+            except ValueError:
+                continue
+            for metric, model, api_type, mode, data in entries:
+                key = (metric, model, api_type, mode)
+                sketch = peer_sketches.get(key)
+                if sketch is None:
+                    sketch = peer_sketches[key] = DDSketch()
+                sketch.merge(DDSketch.from_dict(data))
+
+        with self._lock:
+            # 脏值是旧基准下的绝对值，随基准一起平移，下次 flush 的增量保持不变
+            for key, value in counters.items():
+                shift = value - self._counter_base.get(key, 0)
+                self._set_counter(key, self._get_counter(key) + shift)
+                if key in self._dirty_counters:
+                    self._dirty_counters[key] += shift
+                self._counter_base[key] = value
+            for hour_ts, value in hourly.items():
+                shift = value - self._hourly_base.get(hour_ts, 0)
+                self._hourly_requests[hour_ts] = self._hourly_requests.get(hour_ts, 0) + shift
+                if hour_ts in self._dirty_hourly:
+                    self._dirty_hourly[hour_ts] += shift
+            self._hourly_base = {h: v for h, v in self._hourly_base.items() if h >= hour_cutoff}
+            self._hourly_base.update(hourly)
+            self._recent_requests = [
+                {"timestamp": r[0], "apiType": r[1], "path": r[2],
+                 "status": r[3], "duration": r[4], "model": r[5]}
+                for r in reversed(recent_rows)
+            ] + list(self._pending_recent)
+            del self._recent_requests[:-self.MAX_RECENT_REQUESTS]
+            self._peer_workers = len(peers)
+            self._peer_active_connections = sum(active or 0 for active, _blob in peers)
+            self._peer_sketches = peer_sketches
+
+    def _leave_shared(self) -> None:
+        """Remove this worker's published state on shutdown (executor thread)."""
+        self._writer_conn.execute("DELETE FROM worker_state WHERE worker = ?", (self._worker_id,))
+
+    def _merged_stream_sketches(self) -> Dict[Tuple[str, str, str, str], DDSketch]:
+        """Local quantile sketches merged with other workers' (caller holds self._lock)."""
+        if not self._peer_sketches:
+            return self._stream_sketches
+        merged: Dict[Tuple[str, str, str, str], DDSketch] = {}
+        for sketches in (self._stream_sketches, self._peer_sketches):
+            for key, sketch in sketches.items():
+                target = merged.get(key)
+                if target is None:
+                    target = merged[key] = DDSketch()
+                target.merge(sketch)
+        return merged
+
+    def _total_active_connections(self) -> int:
+        """Active connections across all workers (caller holds self._lock)."""
+        return self._active_connections + self._peer_active_connections
+
+    def close(self) -> None:
+        """Stop the flusher, persist pending metrics and close the writer connection."""
+        self._flush_stop.set()
+        flusher = self._flusher
+        if flusher is not None:
+            flusher.join(timeout=self._flush_interval + 5)
         try:
-            with sqlite3.connect(self._db_path) as conn:
-                conn.execute(
-                    "INSERT INTO recent_requests (timestamp, api_type, path, status, duration, model) "
-                    "VALUES (?, ?, ?, ?, ?, ?)",
-                    (req["timestamp"], req["apiType"], req["path"],
-                     req["status"], req["duration"], req["model"])
-                )
-                # Keep only last 100 records
-                conn.execute(
-                    "DELETE FROM recent_requests WHERE id NOT IN "
-                    "(SELECT id FROM recent_requests ORDER BY id DESC LIMIT 100)"
-                )
-                conn.commit()
+            self.flush()
         except Exception as e:
-            logger.debug(f"Failed to save recent request: {e}")
+            logger.error(f"Final metrics flush failed: {e}")
+        if self._shared:
+            self._db_executor.submit(self._leave_shared)
+        self._db_executor.stop()
+        if self._writer_conn is not None:
+            self._writer_conn.close()
+            self._writer_conn = None
+
+    def get_db_executor_stats(self) -> Dict:
+        """Return metrics DB executor and write-behind counters."""
+        stats = self._db_executor.get_stats()
+        with self._lock:
+            stats["pendingRows"] = (
+                len(self._dirty_counters) + len(self._dirty_hourly)
+                + len(self._dirty_ips) + len(self._evicted_ips) + len(self._pending_recent)
+            )
+        stats["flushes"] = self._flushes
+        stats["flushedRows"] = self._flushed_rows
+        stats["flushInterval"] = self._flush_interval
+        stats["multiprocess"] = self._shared
+        stats["workers"] = 1 + self._peer_workers
+        return stats
+
+    def _save_counter(self, key: str, value: int) -> None:
+        """Mark a counter dirty (caller holds self._lock)."""
+        self._dirty_counters[key] = value
+        self._ensure_flusher()
+
+    def _save_hourly(self, hour_ts: int, count: int) -> None:
+        """Mark an hourly bucket dirty (caller holds self._lock)."""
+        self._dirty_hourly[hour_ts] = count
+        self._ensure_flusher()
+
+    def _save_recent_request(self, req: Dict) -> None:
+        """Queue a recent request for persistence (caller holds self._lock)."""
+        self._pending_recent.append(req)
+        if len(self._pending_recent) > self.MAX_PERSISTED_RECENT_REQUESTS:
+            # 超出表保留上限的部分写入后也会被删除
+            del self._pending_recent[0]
+        self._ensure_flusher()
 
     def inc_request(self, endpoint: str, status_code: int, model: str = "unknown") -> None:
         """
@@ -351,6 +986,121 @@ class PrometheusMetrics:
             self._latency_sum[endpoint] += latency
             self._latency_count[endpoint] += 1
 
+    def observe_phases(self, phases: Dict[str, float]) -> None:
+        """
+        Record the phase durations of one request.
+
+        Args:
+            phases: {phase: seconds}
+        """
+        if not phases:
+            return
+        buckets = self.PHASE_BUCKETS
+        with self._lock:
+            for phase, duration in phases.items():
+                for i, le in enumerate(buckets):
+                    if duration <= le:
+                        self._phase_histogram[phase][i] += 1
+                        break
+                self._phase_sum[phase] += duration
+                self._phase_count[phase] += 1
+
+    def _phase_stats(self) -> Dict[str, Dict]:
+        """Average duration and count per request phase (lock must be held)."""
+        return {
+            phase: {
+                "avg": round(self._phase_sum[phase] / count, 4),
+                "count": count,
+            }
+            for phase, count in self._phase_count.items()
+            if count
+        }
+
+    def stream_observer(
+        self,
+        model: str,
+        api_type: str,
+        streaming: bool,
+        request_start: Optional[float] = None
+    ) -> StreamObserver:
+        """
+        Create a timing probe for one upstream response.
+
+        Args:
+            model: Model name
+            api_type: API type (openai/anthropic)
+            streaming: Whether the client receives a streaming response
+            request_start: time.time() when the request arrived
+
+        Returns:
+            StreamObserver whose finish() feeds the quantile sketches
+        """
+        return StreamObserver(self, model, api_type, "stream" if streaming else "non_stream", request_start)
+
+    def _stream_model_label(self, model: str) -> str:
+        """Model label of the quantile sketches, bounding client-supplied names (lock held)."""
+        if model in self.STREAM_SKETCH_KNOWN_MODELS or model in self._stream_sketch_models:
+            return model
+        if len(self._stream_sketch_models) < self.MAX_STREAM_SKETCH_MODELS:
+            self._stream_sketch_models.add(model)
+            return model
+        return "other"
+
+    def _stream_sketch(self, metric: str, model: str, api_type: str, mode: str) -> DDSketch:
+        key = (metric, model, api_type, mode)
+        sketch = self._stream_sketches.get(key)
+        if sketch is None:
+            sketch = self._stream_sketches[key] = DDSketch()
+        return sketch
+
+    def observe_stream(
+        self,
+        model: str,
+        api_type: str,
+        mode: str,
+        duration: float,
+        ttft: Optional[float] = None,
+        tokens_per_second: Optional[float] = None,
+        gaps: Optional[DDSketch] = None
+    ) -> None:
+        """
+        Record timings of one completed upstream response.
+
+        Args:
+            model: Model name
+            api_type: API type (openai/anthropic)
+            mode: "stream" or "non_stream"
+            duration: Total response time in seconds
+            ttft: Time to first content chunk in seconds
+            tokens_per_second: Output token generation rate
+            gaps: Sketch of inter-chunk gaps of this response
+        """
+        with self._lock:
+            model = self._stream_model_label(model)
+            self._stream_sketch("response_duration_seconds", model, api_type, mode).add(duration)
+            if ttft is not None:
+                self._stream_sketch("ttft_seconds", model, api_type, mode).add(ttft)
+            if tokens_per_second is not None:
+                self._stream_sketch("output_tokens_per_second", model, api_type, mode).add(tokens_per_second)
+            if gaps is not None and gaps.count:
+                self._stream_sketch("inter_chunk_gap_seconds", model, api_type, mode).merge(gaps)
+
+    def _stream_quantile_stats(self) -> Dict[str, List[Dict]]:
+        """Summarize quantile sketches as {metric: [{model, api, mode, count, avg, p50...}]} (lock held)."""
+        result: Dict[str, List[Dict]] = {metric: [] for metric in self.STREAM_SKETCH_METRICS}
+        for (metric, model, api_type, mode), sketch in self._merged_stream_sketches().items():
+            entry = {
+                "model": model,
+                "api": api_type,
+                "mode": mode,
+                "count": sketch.count,
+                "avg": round(sketch.sum / sketch.count, 4) if sketch.count else 0.0,
+            }
+            for q, value in zip(self.STREAM_QUANTILES, sketch.quantiles(self.STREAM_QUANTILES)):
+                entry[f"p{int(q * 100)}"] = round(value, 4) if value is not None else None
+            result[metric].append(entry)
+        return result
+
     def add_tokens(self, model: str, input_tokens: int, output_tokens: int) -> None:
         """
         Add token usage.
@@ -366,6 +1116,57 @@ class PrometheusMetrics:
             self._save_counter(f"in_tok:{model}", self._input_tokens_total[model])
             self._save_counter(f"out_tok:{model}", self._output_tokens_total[model])
 
+    def observe_event_loop_lag(self, lag: float) -> None:
+        """
+        Record event loop scheduling lag.
+
+        Args:
+            lag: Delay beyond the expected wake-up time, in seconds
+        """
+        with self._lock:
+            for i, le in enumerate(self.LOOP_LAG_BUCKETS):
+                if lag <= le:
+                    self._loop_lag_histogram[i] += 1
+                    break
+            self._loop_lag_sum += lag
+            self._loop_lag_count += 1
+            self._loop_lag_last = lag
+            self._loop_lag_max = max(self._loop_lag_max, lag)
+
+    def observe_event_loop_block(self, site: str, duration: float) -> None:
+        """
+        Record a call that blocked the event loop beyond the threshold.
+
+        Args:
+            site: Blocking call site ("file:line function")
+            duration: Blocked time in seconds
+        """
+        with self._lock:
+            entry = self._loop_blocks.get(site)
+            if entry is None:
+                entry = self._loop_blocks[site] = [0, 0.0]
+            entry[0] += 1
+            entry[1] += duration
+            self._loop_block_total += 1
+
+    def get_event_loop_stats(self) -> Dict:
+        """Event loop lag summary and blocking call sites (sorted by total blocked time)."""
+        with self._lock:
+            sites = [
+                {"site": site, "count": int(count), "seconds": round(seconds, 4)}
+                for site, (count, seconds) in self._loop_blocks.items()
+            ]
+            stats = {
+                "last": round(self._loop_lag_last, 4),
+                "max": round(self._loop_lag_max, 4),
+                "avg": round(self._loop_lag_sum / self._loop_lag_count, 4) if self._loop_lag_count else 0.0,
+                "count": self._loop_lag_count,
+                "blocks": self._loop_block_total,
+            }
+        sites.sort(key=lambda item: item["seconds"], reverse=True)
+        stats["sites"] = sites
+        return stats
+
     def set_active_connections(self, count: int) -> None:
         """Set active connection count."""
         with self._lock:
@@ -424,10 +1225,8 @@ class PrometheusMetrics:
             self._api_type_usage[api_type] += 1
             self._save_counter(f"api:{api_type}", self._api_type_usage[api_type])
 
-            # Add to response times (keep last N)
+            # Add to response times (deque keeps last N)
             self._response_times.append(duration_ms)
-            if len(self._response_times) > self.MAX_RESPONSE_TIMES:
-                self._response_times.pop(0)
 
             # Add to recent requests (keep last N)
             now = int(time.time() * 1000)
@@ -446,14 +1245,15 @@ class PrometheusMetrics:
 
             # Track hourly requests
             hour_ts = (now // 3600000) * 3600000
+            if hour_ts not in self._hourly_requests:
+                # Clean up old hourly data (keep only last 24 hours) once per new hour
+                cutoff = hour_ts - 24 * 3600000
+                self._hourly_requests = defaultdict(
+                    int,
+                    {k: v for k, v in self._hourly_requests.items() if k >= cutoff}
+                )
             self._hourly_requests[hour_ts] += 1
             self._save_hourly(hour_ts, self._hourly_requests[hour_ts])
-            # Clean up old hourly data (keep only last 24 hours)
-            cutoff = hour_ts - 24 * 3600000
-            self._hourly_requests = defaultdict(
-                int,
-                {k: v for k, v in self._hourly_requests.items() if k >= cutoff}
-            )
 
     def get_deno_compatible_metrics(self) -> Dict:
         """
@@ -521,7 +1321,8 @@ class PrometheusMetrics:
                 "apiTypeUsage": dict(self._api_type_usage),
                 "recentRequests": list(self._recent_requests),
                 "startTime": int(self._start_time * 1000),
-                "hourlyRequests": hourly_data
+                "hourlyRequests": hourly_data,
+                "streamQuantiles": self._stream_quantile_stats()
             }
 
     def get_metrics(self) -> Dict:
@@ -531,6 +1332,11 @@ class PrometheusMetrics:
         Returns:
             Metrics dictionary
         """
+        from kiro_gateway.history_cache import history_cache
+        from kiro_gateway.token_calibration import token_calibrator
+        from kiro_gateway.tokenizer import token_count_cache
+        from kiro_gateway.tool_spec_cache import tool_spec_cache
+
         with self._lock:
             # Calculate average latency and percentiles
             latency_stats = {}
@@ -564,6 +1370,12 @@ class PrometheusMetrics:
                 "errors": dict(self._error_total),
                 "retries": dict(self._retry_total),
                 "latency": latency_stats,
+                "stream_quantiles": self._stream_quantile_stats(),
+                "phases": self._phase_stats(),
+                "token_count_cache": token_count_cache.get_stats(),
+                "token_calibration": token_calibrator.get_stats(),
+                "history_cache": history_cache.get_stats(),
+                "tool_spec_cache": tool_spec_cache.get_stats(),
                 "tokens": {
                     "input": dict(self._input_tokens_total),
                     "output": dict(self._output_tokens_total),
@@ -571,9 +1383,16 @@ class PrometheusMetrics:
                     "total_output": sum(self._output_tokens_total.values())
                 },
                 "gauges": {
-                    "active_connections": self._active_connections,
+                    "active_connections": self._total_active_connections(),
                     "cache_size": self._cache_size,
                     "token_valid": self._token_valid
+                },
+                "event_loop_lag": {
+                    "last": round(self._loop_lag_last, 4),
+                    "max": round(self._loop_lag_max, 4),
+                    "avg": round(self._loop_lag_sum / self._loop_lag_count, 4) if self._loop_lag_count else 0.0,
+                    "count": self._loop_lag_count,
+                    "blocks": self._loop_block_total
                 }
             }
 
@@ -690,10 +1509,41 @@ class PrometheusMetrics:
                     f'kirogate_request_duration_seconds_count{{endpoint="{endpoint}"}} {self._latency_count[endpoint]}'
                 )
 
+            # Request phase histogram
+            lines.append("# HELP kirogate_request_phase_seconds Request phase duration histogram")
+            lines.append("# TYPE kirogate_request_phase_seconds histogram")
+            for phase, counts in self._phase_histogram.items():
+                cumulative = 0
+                for i, count in enumerate(counts):
+                    cumulative += count
+                    le = self.PHASE_BUCKETS[i]
+                    le_str = "+Inf" if le == float('inf') else str(le)
+                    lines.append(
+                        f'kirogate_request_phase_seconds_bucket{{phase="{phase}",le="{le_str}"}} {cumulative}'
+                    )
+                lines.append(f'kirogate_request_phase_seconds_sum{{phase="{phase}"}} {self._phase_sum[phase]}')
+                lines.append(f'kirogate_request_phase_seconds_count{{phase="{phase}"}} {self._phase_count[phase]}')
+
+            # Streaming quantile sketches (summaries, per model/api/mode)
+            stream_sketches = self._merged_stream_sketches()
+            for metric, help_text in self.STREAM_SKETCH_METRICS.items():
+                name = f"kirogate_{metric}"
+                lines.append(f"# HELP {name} {help_text}")
+                lines.append(f"# TYPE {name} summary")
+                for (sketch_metric, model, api_type, mode), sketch in stream_sketches.items():
+                    if sketch_metric != metric:
+                        continue
+                    labels = f'model="{_escape_label(model)}",api="{api_type}",mode="{mode}"'
+                    values = sketch.quantiles(self.STREAM_QUANTILES)
+                    for q, value in zip(self.STREAM_QUANTILES, values):
+                        lines.append(f'{name}{{{labels},quantile="{q}"}} {value}')
+                    lines.append(f"{name}_sum{{{labels}}} {sketch.sum}")
+                    lines.append(f"{name}_count{{{labels}}} {sketch.count}")
+
             # Gauges
             lines.append("# HELP kirogate_active_connections Current active connections")
             lines.append("# TYPE kirogate_active_connections gauge")
-            lines.append(f"kirogate_active_connections {self._active_connections}")
+            lines.append(f"kirogate_active_connections {self._total_active_connections()}")
 
             lines.append("# HELP kirogate_cache_size Current cache size")
             lines.append("# TYPE kirogate_cache_size gauge")
@@ -703,10 +1553,125 @@ class PrometheusMetrics:
             lines.append("# TYPE kirogate_token_valid gauge")
             lines.append(f"kirogate_token_valid {1 if self._token_valid else 0}")
 
+            lines.append("# HELP kirogate_event_loop_lag_seconds Event loop scheduling lag histogram")
+            lines.append("# TYPE kirogate_event_loop_lag_seconds histogram")
+            cumulative = 0
+            for i, count in enumerate(self._loop_lag_histogram):
+                cumulative += count
+                le = self.LOOP_LAG_BUCKETS[i]
+                le_str = "+Inf" if le == float('inf') else str(le)
+                lines.append(f'kirogate_event_loop_lag_seconds_bucket{{le="{le_str}"}} {cumulative}')
+            lines.append(f"kirogate_event_loop_lag_seconds_sum {self._loop_lag_sum}")
+            lines.append(f"kirogate_event_loop_lag_seconds_count {self._loop_lag_count}")
+
+            lines.append("# HELP kirogate_event_loop_lag_max_seconds Max event loop lag since start")
+            lines.append("# TYPE kirogate_event_loop_lag_max_seconds gauge")
+            lines.append(f"kirogate_event_loop_lag_max_seconds {self._loop_lag_max}")
+
+            lines.append("# HELP kirogate_event_loop_blocks_total Calls that blocked the event loop beyond the threshold")
+            lines.append("# TYPE kirogate_event_loop_blocks_total counter")
+            for site, (count, _seconds) in self._loop_blocks.items():
+                lines.append(f'kirogate_event_loop_blocks_total{{site="{_escape_label(site)}"}} {int(count)}')
+            lines.append("# HELP kirogate_event_loop_blocked_seconds_total Time the event loop was blocked, by call site")
+            lines.append("# TYPE kirogate_event_loop_blocked_seconds_total counter")
+            for site, (_count, seconds) in self._loop_blocks.items():
+                lines.append(f'kirogate_event_loop_blocked_seconds_total{{site="{_escape_label(site)}"}} {seconds}')
+
             lines.append("# HELP kirogate_uptime_seconds Uptime in seconds")
             lines.append("# TYPE kirogate_uptime_seconds gauge")
             lines.append(f"kirogate_uptime_seconds {round(time.time() - self._start_time, 2)}")
 
+        from kiro_gateway.database import user_db, user_db_executor
+        lines.append("# HELP kirogate_db_queue_depth Pending jobs on the database executor threads")
+        lines.append("# TYPE kirogate_db_queue_depth gauge")
+        lines.append(f'kirogate_db_queue_depth{{db="users"}} {user_db_executor.queue_depth}')
+        lines.append(f'kirogate_db_queue_depth{{db="metrics"}} {self._db_executor.queue_depth}')
+
+        flush_stats = self.get_db_executor_stats()
+        lines.append("# HELP kirogate_metrics_pending_rows Metrics rows waiting for the next write-behind flush")
+        lines.append("# TYPE kirogate_metrics_pending_rows gauge")
+        lines.append(f"kirogate_metrics_pending_rows {flush_stats['pendingRows']}")
+        lines.append("# HELP kirogate_metrics_flushes_total Write-behind flushes persisted to the metrics database")
+        lines.append("# TYPE kirogate_metrics_flushes_total counter")
+        lines.append(f"kirogate_metrics_flushes_total {flush_stats['flushes']}")
+        lines.append("# HELP kirogate_metrics_workers Worker processes merged into these metrics")
+        lines.append("# TYPE kirogate_metrics_workers gauge")
+        lines.append(f"kirogate_metrics_workers {flush_stats['workers']}")
+
+        auth_caches = {
+            "api_key": user_db.api_key_cache.get_stats(),
+            "session": user_db.session_cache.get_stats(),
+        }
+        lines.append("# HELP kirogate_auth_cache_requests_total Principal cache lookups (API keys, user sessions)")
+        lines.append("# TYPE kirogate_auth_cache_requests_total counter")
+        for name, stats in auth_caches.items():
+            lines.append(f'kirogate_auth_cache_requests_total{{cache="{name}",result="hit"}} {stats["hits"]}')
+            lines.append(f'kirogate_auth_cache_requests_total{{cache="{name}",result="miss"}} {stats["misses"]}')
+        lines.append("# HELP kirogate_auth_cache_invalidations_total Principal cache invalidations")
+        lines.append("# TYPE kirogate_auth_cache_invalidations_total counter")
+        for name, stats in auth_caches.items():
+            lines.append(f'kirogate_auth_cache_invalidations_total{{cache="{name}"}} {stats["invalidations"]}')
+        lines.append("# HELP kirogate_auth_cache_hit_ratio Principal cache hit ratio")
+        lines.append("# TYPE kirogate_auth_cache_hit_ratio gauge")
+        for name, stats in auth_caches.items():
+            lines.append(f'kirogate_auth_cache_hit_ratio{{cache="{name}"}} {stats["hitRate"]}')
+        lines.append("# HELP kirogate_auth_cache_size Cached principals")
+        lines.append("# TYPE kirogate_auth_cache_size gauge")
+        for name, stats in auth_caches.items():
+            lines.append(f'kirogate_auth_cache_size{{cache="{name}"}} {stats["size"]}')
+
+        from kiro_gateway.tokenizer import token_count_cache
+        token_cache = token_count_cache.get_stats()
+        lines.append("# HELP kirogate_token_count_cache_requests_total Token count cache lookups")
+        lines.append("# TYPE kirogate_token_count_cache_requests_total counter")
+        lines.append(f'kirogate_token_count_cache_requests_total{{result="hit"}} {token_cache["hits"]}')
+        lines.append(f'kirogate_token_count_cache_requests_total{{result="miss"}} {token_cache["misses"]}')
+        lines.append("# HELP kirogate_token_count_cache_evictions_total Token count cache LRU evictions")
+        lines.append("# TYPE kirogate_token_count_cache_evictions_total counter")
+        lines.append(f"kirogate_token_count_cache_evictions_total {token_cache['evictions']}")
+        lines.append("# HELP kirogate_token_count_cache_hit_ratio Token count cache hit ratio")
+        lines.append("# TYPE kirogate_token_count_cache_hit_ratio gauge")
+        lines.append(f"kirogate_token_count_cache_hit_ratio {token_cache['hitRate']}")
+        lines.append("# HELP kirogate_token_count_cache_bytes Estimated token count cache memory")
+        lines.append("# TYPE kirogate_token_count_cache_bytes gauge")
+        lines.append(f"kirogate_token_count_cache_bytes {token_cache['bytes']}")
+
+        from kiro_gateway.history_cache import history_cache
+        conversion_cache = history_cache.get_stats()
+        lines.append("# HELP kirogate_history_cache_requests_total History conversion cache lookups")
+        lines.append("# TYPE kirogate_history_cache_requests_total counter")
+        lines.append(f'kirogate_history_cache_requests_total{{result="hit"}} {conversion_cache["hits"]}')
+        lines.append(f'kirogate_history_cache_requests_total{{result="miss"}} {conversion_cache["misses"]}')
+        lines.append("# HELP kirogate_history_cache_reused_entries_total History entries served from cache")
+        lines.append("# TYPE kirogate_history_cache_reused_entries_total counter")
+        lines.append(f"kirogate_history_cache_reused_entries_total {conversion_cache['reusedEntries']}")
+        lines.append("# HELP kirogate_history_cache_bytes Estimated history conversion cache memory")
+        lines.append("# TYPE kirogate_history_cache_bytes gauge")
+        lines.append(f"kirogate_history_cache_bytes {conversion_cache['bytes']}")
+
+        from kiro_gateway.tool_spec_cache import tool_spec_cache
+        tool_cache = tool_spec_cache.get_stats()
+        lines.append("# HELP kirogate_tool_spec_cache_requests_total Tool definition conversion cache lookups")
+        lines.append("# TYPE kirogate_tool_spec_cache_requests_total counter")
+        lines.append(f'kirogate_tool_spec_cache_requests_total{{result="hit"}} {tool_cache["hits"]}')
+        lines.append(f'kirogate_tool_spec_cache_requests_total{{result="miss"}} {tool_cache["misses"]}')
+        lines.append("# HELP kirogate_tool_spec_cache_bytes Estimated tool definition conversion cache memory")
+        lines.append("# TYPE kirogate_tool_spec_cache_bytes gauge")
+        lines.append(f"kirogate_tool_spec_cache_bytes {tool_cache['bytes']}")
+
+        from kiro_gateway.token_calibration import token_calibrator
+        calibration = token_calibrator.get_stats()
+        lines.append("# HELP kirogate_token_correction_factor Calibrated Claude/cl100k token ratio")
+        lines.append("# TYPE kirogate_token_correction_factor gauge")
+        for entry in calibration["entries"]:
+            labels = f'model="{_escape_label(entry["model"])}",bucket="{entry["bucket"]}"'
+            lines.append(f"kirogate_token_correction_factor{{{labels}}} {entry['factor']}")
+        lines.append("# HELP kirogate_token_calibration_samples_total Usage reports used for token calibration")
+        lines.append("# TYPE kirogate_token_calibration_samples_total counter")
+        for entry in calibration["entries"]:
+            labels = f'model="{_escape_label(entry["model"])}",bucket="{entry["bucket"]}"'
+            lines.append(f"kirogate_token_calibration_samples_total{{{labels}}} {entry['samples']}")
+
         return "\n".join(lines) + "\n"
 
     # ==================== IP Statistics & Admin Methods ====================
@@ -715,20 +1680,17 @@ class PrometheusMetrics:
         """Record IP request."""
         if not ip:
             return
+        now = int(time.time() * 1000)
         with self._lock:
-            self._ip_requests[ip] += 1
-            now = int(time.time() * 1000)
-            self._ip_last_seen[ip] = now
-            # Save to DB
-            try:
-                with sqlite3.connect(self._db_path) as conn:
-                    conn.execute(
-                        "INSERT OR REPLACE INTO ip_stats (ip, count, last_seen) VALUES (?, ?, ?)",
-                        (ip, self._ip_requests[ip], now)
-                    )
-                    conn.commit()
-            except Exception as e:
-                logger.debug(f"Failed to save IP stats: {e}")
+            # 仅新 IP 需要判断是否命中黑名单（含 CIDR），已跟踪的 IP 在封禁时已固定
+            pinned = ip not in self._ip_counter and self._ip_matcher.contains(ip)
+            _count, evicted = self._ip_counter.add(ip, now, pinned=pinned)
+            self._dirty_ips.add(ip)
+            if evicted is not None:
+                self._dirty_ips.discard(evicted)
+                self._evicted_ips.add(evicted)
+                self._evicted_ips.discard(ip)
+            self._ensure_flusher()
 
     def get_ip_stats(
         self,
@@ -738,62 +1700,96 @@ class PrometheusMetrics:
         sort_field: str = "count",
         sort_order: str = "desc"
     ) -> Tuple[List[Dict], int]:
-        """Get IP statistics sorted by request count with pagination."""
+        """
+        Get IP statistics sorted by request count with pagination.
+
+        Pages are read from the IP counter's maintained orderings, so only the
+        returned rows are visited; search matches IP prefixes.
+        """
+        sort_map = {"count": "count", "last_seen": "last_seen", "ip": "key"}
+        order = sort_map.get(sort_field, "count")
         with self._lock:
-            stats = [
-                {"ip": ip, "count": count, "lastSeen": self._ip_last_seen.get(ip, 0)}
-                for ip, count in self._ip_requests.items()
-            ]
-            if search:
-                stats = [item for item in stats if search in item["ip"]]
-            sort_map = {"count": "count", "last_seen": "lastSeen", "ip": "ip"}
-            key_name = sort_map.get(sort_field, "count")
-            reverse = sort_order.lower() != "asc"
-            stats.sort(key=lambda x: x.get(key_name, 0), reverse=reverse)
-            total = len(stats)
-            return stats[offset:offset + limit], total
+            rows, total = self._ip_counter.page(
+                order, sort_order.lower() != "asc", offset, limit, prefix=search.strip()
+            )
+        return [
+            {"ip": ip, "count": count, "lastSeen": last_seen, "error": error}
+            for ip, count, last_seen, error in rows
+        ], total
 
     def is_ip_banned(self, ip: str) -> bool:
-        """Check if IP is banned."""
-        with self._lock:
-            return ip in self._ip_blacklist
+        """Check if IP is banned (single IP or CIDR range, lock-free)."""
+        return self._ip_matcher.contains(ip)
 
-    def ban_ip(self, ip: str, reason: str = "") -> bool:
-        """Ban an IP address."""
+    async def ban_ip(self, ip: str, reason: str = "") -> bool:
+        """Ban an IP address or CIDR range (e.g. 203.0.113.0/24, 2001:db8::/64)."""
+        ip = normalize_ip_rule(ip)
         if not ip:
             return False
         with self._lock:
             now = int(time.time() * 1000)
             self._ip_blacklist[ip] = {"banned_at": now, "reason": reason}
-            try:
-                with sqlite3.connect(self._db_path) as conn:
-                    conn.execute(
-                        "INSERT OR REPLACE INTO ip_blacklist (ip, banned_at, reason) VALUES (?, ?, ?)",
-                        (ip, now, reason)
-                    )
-                    conn.commit()
-                logger.info(f"Banned IP: {ip}, reason: {reason}")
-                return True
-            except Exception as e:
-                logger.error(f"Failed to ban IP: {e}")
-                return False
+            self._ip_matcher = IPBlacklistMatcher(self._ip_blacklist)
+            # 固定该规则命中的所有已跟踪 IP（CIDR 规则本身不是计数 Key）
+            rule = IPBlacklistMatcher([ip])
+            for tracked in self._ip_counter.keys():
+                if rule.contains(tracked):
+                    self._ip_counter.pin(tracked)
+            self.snapshots.invalidate("admin_stats")
+            # 在锁内入队保证写入顺序与内存变更一致，提交在锁外等待
+            future = self._db_executor.call(self._write_blacklist_rule, ip, now, reason)
+        try:
+            await asyncio.wrap_future(future)
+            logger.info(f"Banned IP: {ip}, reason: {reason}")
+            return True
+        except Exception as e:
+            logger.error(f"Failed to ban IP: {e}")
+            return False
 
-    def unban_ip(self, ip: str) -> bool:
-        """Unban an IP address."""
+    async def unban_ip(self, ip: str) -> bool:
+        """Unban an IP address or CIDR range."""
+        ip = (ip or "").strip()
         if not ip:
             return False
         with self._lock:
-            if ip in self._ip_blacklist:
-                del self._ip_blacklist[ip]
-            try:
-                with sqlite3.connect(self._db_path) as conn:
-                    conn.execute("DELETE FROM ip_blacklist WHERE ip = ?", (ip,))
-                    conn.commit()
-                logger.info(f"Unbanned IP: {ip}")
-                return True
-            except Exception as e:
-                logger.error(f"Failed to unban IP: {e}")
+            if ip not in self._ip_blacklist:
+                ip = normalize_ip_rule(ip) or ip
+            if ip not in self._ip_blacklist:
                 return False
+            del self._ip_blacklist[ip]
+            self._ip_matcher = IPBlacklistMatcher(self._ip_blacklist)
+            # 取消固定该规则命中、且不再被其他规则覆盖的 IP
+            rule = IPBlacklistMatcher([ip])
+            for pinned in self._ip_counter.pinned_keys():
+                if not rule.contains(pinned) or self._ip_matcher.contains(pinned):
+                    continue
+                evicted = self._ip_counter.unpin(pinned)
+                if evicted is not None:
+                    self._dirty_ips.discard(evicted)
+                    self._evicted_ips.add(evicted)
+            self.snapshots.invalidate("admin_stats")
+            future = self._db_executor.call(self._delete_blacklist_rule, ip)
+        try:
+            await asyncio.wrap_future(future)
+            logger.info(f"Unbanned IP: {ip}")
+            return True
+        except Exception as e:
+            logger.error(f"Failed to unban IP: {e}")
+            return False
+
+    def _write_blacklist_rule(self, ip: str, banned_at: int, reason: str) -> None:
+        self._writer_conn.execute(
+            "INSERT OR REPLACE INTO ip_blacklist (ip, banned_at, reason) VALUES (?, ?, ?)",
+            (ip, banned_at, reason)
+        )
+
+    def _delete_blacklist_rule(self, ip: str) -> None:
+        self._writer_conn.execute("DELETE FROM ip_blacklist WHERE ip = ?", (ip,))
+
+    def _write_site_config(self, key: str, value: str) -> None:
+        self._writer_conn.execute(
+            "INSERT OR REPLACE INTO site_config (key, value) VALUES (?, ?)", (key, value)
+        )
 
     def get_blacklist(
         self,
@@ -826,22 +1822,19 @@ class PrometheusMetrics:
         with self._lock:
             return self._site_enabled
 
-    def set_site_enabled(self, enabled: bool) -> bool:
+    async def set_site_enabled(self, enabled: bool) -> bool:
         """Enable or disable site."""
         with self._lock:
             self._site_enabled = enabled
-            try:
-                with sqlite3.connect(self._db_path) as conn:
-                    conn.execute(
-                        "INSERT OR REPLACE INTO site_config (key, value) VALUES (?, ?)",
-                        ("site_enabled", "true" if enabled else "false")
-                    )
-                    conn.commit()
-                logger.info(f"Site enabled: {enabled}")
-                return True
-            except Exception as e:
-                logger.error(f"Failed to set site status: {e}")
-                return False
+            self.snapshots.invalidate("admin_stats")
+            future = self._db_executor.call(self._write_site_config, "site_enabled", "true" if enabled else "false")
+        try:
+            await asyncio.wrap_future(future)
+            logger.info(f"Site enabled: {enabled}")
+            return True
+        except Exception as e:
+            logger.error(f"Failed to set site status: {e}")
+            return False
 
     def is_self_use_enabled(self) -> bool:
         """Check if self-use mode is enabled."""
@@ -853,64 +1846,54 @@ class PrometheusMetrics:
         with self._lock:
             return self._require_approval
 
-    def set_self_use_enabled(self, enabled: bool) -> bool:
+    async def set_self_use_enabled(self, enabled: bool) -> bool:
         """Enable or disable self-use mode."""
         with self._lock:
             self._self_use_enabled = enabled
-            try:
-                with sqlite3.connect(self._db_path) as conn:
-                    conn.execute(
-                        "INSERT OR REPLACE INTO site_config (key, value) VALUES (?, ?)",
-                        ("self_use_enabled", "true" if enabled else "false")
-                    )
-                    conn.commit()
-                logger.info(f"Self-use enabled: {enabled}")
-                return True
-            except Exception as e:
-                logger.error(f"Failed to set self-use status: {e}")
-                return False
+            self.snapshots.invalidate("admin_stats")
+            future = self._db_executor.call(self._write_site_config, "self_use_enabled", "true" if enabled else "false")
+        try:
+            await asyncio.wrap_future(future)
+            logger.info(f"Self-use enabled: {enabled}")
+            return True
+        except Exception as e:
+            logger.error(f"Failed to set self-use status: {e}")
+            return False
 
-    def set_require_approval(self, enabled: bool) -> bool:
+    async def set_require_approval(self, enabled: bool) -> bool:
         """Enable or disable registration approval requirement."""
         with self._lock:
             self._require_approval = enabled
-            try:
-                with sqlite3.connect(self._db_path) as conn:
-                    conn.execute(
-                        "INSERT OR REPLACE INTO site_config (key, value) VALUES (?, ?)",
-                        ("require_approval", "true" if enabled else "false")
-                    )
-                    conn.commit()
-                logger.info(f"Require approval enabled: {enabled}")
-                return True
-            except Exception as e:
-                logger.error(f"Failed to set require approval: {e}")
-                return False
+            self.snapshots.invalidate("admin_stats")
+            future = self._db_executor.call(self._write_site_config, "require_approval", "true" if enabled else "false")
+        try:
+            await asyncio.wrap_future(future)
+            logger.info(f"Require approval enabled: {enabled}")
+            return True
+        except Exception as e:
+            logger.error(f"Failed to set require approval: {e}")
+            return False
 
     def get_proxy_api_key(self) -> str:
         """Get current proxy API key."""
         with self._lock:
             return self._proxy_api_key
 
-    def set_proxy_api_key(self, api_key: str) -> bool:
+    async def set_proxy_api_key(self, api_key: str) -> bool:
         """Update proxy API key."""
         api_key = api_key.strip()
         if not api_key:
             return False
         with self._lock:
             self._proxy_api_key = api_key
-            try:
-                with sqlite3.connect(self._db_path) as conn:
-                    conn.execute(
-                        "INSERT OR REPLACE INTO site_config (key, value) VALUES (?, ?)",
-                        ("proxy_api_key", api_key)
-                    )
-                    conn.commit()
-                logger.info("Proxy API key updated")
-                return True
-            except Exception as e:
-                logger.error(f"Failed to set proxy API key: {e}")
-                return False
+            future = self._db_executor.call(self._write_site_config, "proxy_api_key", api_key)
+        try:
+            await asyncio.wrap_future(future)
+            logger.info("Proxy API key updated")
+            return True
+        except Exception as e:
+            logger.error(f"Failed to set proxy API key: {e}")
+            return False
 
     def get_admin_stats(self) -> Dict:
         """Get statistics for admin dashboard."""
@@ -926,14 +1909,15 @@ class PrometheusMetrics:
                 "failedRequests": total_requests - success_requests,
                 "streamRequests": self._stream_requests,
                 "nonStreamRequests": self._non_stream_requests,
-                "activeConnections": self._active_connections,
+                "activeConnections": self._total_active_connections(),
                 "tokenValid": self._token_valid,
                 "siteEnabled": self._site_enabled,
                 "selfUseEnabled": self._self_use_enabled,
                 "requireApproval": self._require_approval,
                 "uptimeSeconds": round(time.time() - self._start_time, 2),
-                "totalIPs": len(self._ip_requests),
+                "totalIPs": len(self._ip_counter),
                 "bannedIPs": len(self._ip_blacklist),
+                "ipTracking": self._ip_counter.get_stats(),
             }
 
 
@@ -20,20 +20,26 @@
 """
 Request tracking middleware.
 
-Adds unique ID to each request for log correlation and debugging.
+Site guard, metrics and request tracking (unique ID per request for log
+correlation and debugging) fused into one raw ASGI middleware.
 """
 
+import asyncio
 import time
 import uuid
 from datetime import datetime
-from typing import Callable, Optional
+from typing import Optional
 from urllib.parse import urlsplit
 
 from fastapi import Request, Response
-from starlette.middleware.base import BaseHTTPMiddleware
-from starlette.responses import JSONResponse
+from starlette.datastructures import MutableHeaders
+from starlette.requests import ClientDisconnect
+from starlette.responses import HTMLResponse, JSONResponse
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
 from loguru import logger
 
+from kiro_gateway.tracing import end_trace, span_exporter, start_trace
+
 
 def get_timestamp() -> str:
     """获取格式化的时间戳。"""
@@ -75,170 +81,26 @@ def normalize_endpoint_path(raw_path: str) -> str:
     return raw_path
 
 
-class RequestTrackingMiddleware(BaseHTTPMiddleware):
-    """
-    Request tracking middleware.
-
-    For each request:
-    - Generates unique request ID
-    - Records request start and end time
-    - Calculates request processing time
-    - Adds request ID context to logs
-    """
-
-    async def dispatch(self, request: Request, call_next: Callable) -> Response:
-        """
-        Process request and add tracking info.
-
-        Args:
-            request: HTTP request
-            call_next: Next middleware or route handler
-
-        Returns:
-            HTTP response
-        """
-        # Get from header or generate new request ID
-        request_id = request.headers.get("X-Request-ID")
-        if not request_id:
-            request_id = str(uuid.uuid4())
-
-        # Record request start time
-        start_time = time.time()
-
-        # Add request ID to request state
-        request.state.request_id = request_id
-
-        # Use loguru context to bind request ID
-        with logger.contextualize(request_id=request_id):
-            client_ip = get_client_ip(request)
-            logger.info(
-                f"[{get_timestamp()}] [IP: {client_ip}] 请求开始: {request.method} {request.url.path}"
-                + (f" 参数: {request.url.query}" if request.url.query else "")
-            )
-
-            try:
-                response = await call_next(request)
-
-                # Calculate processing time
-                process_time = time.time() - start_time
-                user_info = get_user_info(request)
-
-                # Add response headers
-                response.headers["X-Request-ID"] = request_id
-                response.headers["X-Process-Time"] = str(round(process_time, 4))
-
-                status_text = "成功" if 200 <= response.status_code < 400 else "失败"
-                logger.info(
-                    f"[{get_timestamp()}] [用户: {user_info}] [IP: {client_ip}] "
-                    f"请求{status_text}: {request.method} {request.url.path} "
-                    f"状态码={response.status_code} 耗时={process_time:.4f}秒"
-                )
-
-                return response
-
-            except Exception as e:
-                process_time = time.time() - start_time
-                user_info = get_user_info(request)
-                logger.error(
-                    f"[{get_timestamp()}] [用户: {user_info}] [IP: {client_ip}] "
-                    f"请求异常: {request.method} {request.url.path} "
-                    f"错误={str(e)} 耗时={process_time:.4f}秒"
-                )
-                raise
-
-
-class MetricsMiddleware(BaseHTTPMiddleware):
+class GatewayMiddleware:
     """
-    Metrics collection middleware.
-
-    Collects basic request metrics and sends to Prometheus collector:
-    - Total request count (by endpoint, status code, model)
-    - Response time
-    - Active connection count
+    Fused raw-ASGI middleware.
+
+    Replaces the former SiteGuard / Metrics / RequestTracking
+    BaseHTTPMiddleware stack with a single layer, in the same order:
+    - Site status and IP blacklist check (blocked requests stop here)
+    - Client IP and active connection metrics
+    - Request ID, start/end logs and X-Request-ID / X-Process-Time headers
+    - Phase timing spans (Server-Timing header on non-streaming responses)
+    - Request count, latency and error metrics
     - API Key and Token usage tracking
-    """
-
-    async def dispatch(self, request: Request, call_next: Callable) -> Response:
-        """
-        Collect request metrics.
-
-        Args:
-            request: HTTP request
-            call_next: Next middleware or route handler
-
-        Returns:
-            HTTP response
-        """
-        from kiro_gateway.metrics import metrics
-
-        start_time = time.time()
-        endpoint = normalize_endpoint_path(request.url.path)
-        model = "unknown"
-
-        # Record client IP
-        metrics.record_ip(get_client_ip(request))
-
-        # Increment active connections
-        metrics.inc_active_connections()
-
-        try:
-            response = await call_next(request)
-
-            # Calculate processing time
-            process_time = time.time() - start_time
-
-            # Try to get model name from request state
-            if hasattr(request.state, "model"):
-                model = request.state.model
-
-            # Record metrics
-            metrics.inc_request(endpoint, response.status_code, model)
-            metrics.observe_latency(endpoint, process_time)
-
-            # Track API key and token usage for sk-xxx keys
-            is_success = 200 <= response.status_code < 400
-            self._track_token_usage(request, is_success)
-
-            return response
-
-        except Exception as e:
-            process_time = time.time() - start_time
-            metrics.inc_request(endpoint, 500, model)
-            metrics.inc_error(type(e).__name__)
-            metrics.observe_latency(endpoint, process_time)
-
-            # Track failed request
-            self._track_token_usage(request, success=False)
-            raise
-
-        finally:
-            # Decrement active connections
-            metrics.dec_active_connections()
-
-    def _track_token_usage(self, request: Request, success: bool) -> None:
-        """Track usage for sk-xxx API keys."""
-        try:
-            # Check if request used a user API key
-            if hasattr(request.state, "donated_token_id"):
-                from kiro_gateway.database import user_db
-                from kiro_gateway.token_allocator import token_allocator
-
-                token_id = request.state.donated_token_id
-                api_key_id = getattr(request.state, "api_key_id", None)
-
-                # Record token usage
-                token_allocator.record_usage(token_id, success)
-
-                # Record API key usage
-                if api_key_id:
-                    user_db.record_api_key_usage(api_key_id)
-
-        except Exception as e:
-            logger.debug(f"[{get_timestamp()}] Token 使用追踪失败: {e}")
 
+    Status is taken from the http.response.start message and duration from
+    the end of the response body, so streaming responses are measured in
+    full and pass through without extra tasks or queues.
+    """
 
-class SiteGuardMiddleware(BaseHTTPMiddleware):
-    """Check site status and IP blacklist."""
+    # Routes not affected by maintenance mode / IP blacklist
+    EXEMPT_PREFIXES = ("/admin", "/login", "/oauth", "/user", "/static", "/docs", "/openapi.json")
 
     MAINTENANCE_HTML = '''<!DOCTYPE html>
 <html lang="zh">
@@ -286,34 +148,98 @@ class SiteGuardMiddleware(BaseHTTPMiddleware):
 </body>
 </html>'''
 
-    async def dispatch(self, request: Request, call_next: Callable) -> Response:
-        """
-        Check site status and IP blacklist.
+    def __init__(self, app: ASGIApp):
+        self.app = app
 
-        Args:
-            request: HTTP request
-            call_next: Next middleware or route handler
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
 
-        Returns:
-            HTTP response
-        """
         from kiro_gateway.metrics import metrics
-        from starlette.responses import HTMLResponse
 
-        path = request.url.path
+        request = Request(scope)
+        path = scope["path"]
+        client_ip = get_client_ip(request)
+
+        if not path.startswith(self.EXEMPT_PREFIXES):
+            blocked = self._check_site_guard(request, path, client_ip, metrics)
+            if blocked is not None:
+                await blocked(scope, receive, send)
+                return
+
+        # Get from header or generate new request ID
+        request_id = request.headers.get("X-Request-ID") or str(uuid.uuid4())
+        request.state.request_id = request_id
+
+        endpoint = normalize_endpoint_path(path)
+        spans, trace_token = start_trace(f"{request.method} {endpoint}")
+        request.state.spans = spans
 
-        # Allow admin, auth and static routes
-        exempt_prefixes = ("/admin", "/login", "/oauth", "/user", "/static", "/docs", "/openapi.json")
-        if any(path.startswith(p) for p in exempt_prefixes):
-            return await call_next(request)
+        start_time = time.time()
+        status_code = 500
+        response_started = False
+        disconnected = False
+
+        async def receive_wrapper() -> Message:
+            nonlocal disconnected
+            message = await receive()
+            if message["type"] == "http.disconnect":
+                disconnected = True
+            return message
+
+        async def send_wrapper(message: Message) -> None:
+            nonlocal status_code, response_started
+            if message["type"] == "http.response.start":
+                response_started = True
+                status_code = message["status"]
+                headers = MutableHeaders(scope=message)
+                headers["X-Request-ID"] = request_id
+                headers["X-Process-Time"] = str(round(time.time() - start_time, 4))
+                # 流式响应的头在首个 chunk 之前发出，阶段耗时不完整，不附带
+                if not headers.get("content-type", "").startswith("text/event-stream"):
+                    headers["Server-Timing"] = spans.server_timing()
+                # 上下文压缩报告（见 context_compaction）
+                compaction = getattr(request.state, "context_compaction", None)
+                if compaction:
+                    headers["X-Context-Compaction"] = compaction
+            await send(message)
+
+        metrics.record_ip(client_ip)
+        metrics.inc_active_connections()
 
+        # Use loguru context to bind request ID
+        with logger.contextualize(request_id=request_id):
+            logger.info(
+                f"[{get_timestamp()}] [IP: {client_ip}] 请求开始: {request.method} {path}"
+                + (f" 参数: {request.url.query}" if scope.get("query_string") else "")
+            )
+            error: Optional[BaseException] = None
+            try:
+                await self.app(scope, receive_wrapper, send_wrapper)
+            except BaseException as e:
+                error = e
+                raise
+            finally:
+                try:
+                    self._finish(
+                        request, metrics, endpoint, client_ip, start_time,
+                        status_code, response_started, disconnected, error
+                    )
+                    self._finish_trace(spans, metrics, status_code if error is None else 500, request)
+                finally:
+                    metrics.dec_active_connections()
+                    end_trace(trace_token)
+
+    def _check_site_guard(self, request: Request, path: str, client_ip: str, metrics) -> Optional[Response]:
+        """Return a blocking response for maintenance mode or banned IPs, else None."""
         # Check site status
         if not metrics.is_site_enabled():
             # Check if API request
             accept = request.headers.get("accept", "")
             is_api = (
-                request.url.path.startswith("/v1/") or
-                request.url.path.startswith("/api/") or
+                path.startswith("/v1/") or
+                path.startswith("/api/") or
                 "application/json" in accept
             )
             if is_api:
@@ -328,15 +254,101 @@ class SiteGuardMiddleware(BaseHTTPMiddleware):
             )
 
         # Check IP blacklist
-        client_ip = get_client_ip(request)
         if metrics.is_ip_banned(client_ip):
             return JSONResponse(
                 status_code=403,
                 content={"error": "访问被拒绝"}
             )
+        return None
+
+    def _finish(
+        self,
+        request: Request,
+        metrics,
+        endpoint: str,
+        client_ip: str,
+        start_time: float,
+        status_code: int,
+        response_started: bool,
+        disconnected: bool,
+        error: Optional[BaseException],
+    ) -> None:
+        """Log and record metrics once the response has completed or failed."""
+        process_time = time.time() - start_time
+        user_info = get_user_info(request)
+        model = getattr(request.state, "model", "unknown")
+
+        # 客户端断开（取消或写入失败）不算服务端错误，按已发送的状态码统计
+        client_gone = disconnected or isinstance(error, (asyncio.CancelledError, ClientDisconnect))
+        if error is not None and not client_gone:
+            metrics.inc_request(endpoint, 500, model)
+            metrics.inc_error(type(error).__name__)
+            metrics.observe_latency(endpoint, process_time)
+            self._track_token_usage(request, success=False)
+            logger.error(
+                f"[{get_timestamp()}] [用户: {user_info}] [IP: {client_ip}] "
+                f"请求异常: {request.method} {request.url.path} "
+                f"错误={str(error)} 耗时={process_time:.4f}秒"
+            )
+            return
+
+        if client_gone:
+            metrics.inc_error("ClientDisconnect")
+            if not response_started:
+                # 响应头都未发出，记为 499（客户端关闭请求）
+                status_code = 499
+
+        metrics.inc_request(endpoint, status_code, model)
+        metrics.observe_latency(endpoint, process_time)
+
+        # Track API key and token usage for sk-xxx keys
+        is_success = 200 <= status_code < 400
+        self._track_token_usage(request, is_success)
+
+        status_text = "成功" if is_success else "失败"
+        if client_gone:
+            status_text += "（客户端已断开）"
+        logger.info(
+            f"[{get_timestamp()}] [用户: {user_info}] [IP: {client_ip}] "
+            f"请求{status_text}: {request.method} {request.url.path} "
+            f"状态码={status_code} 耗时={process_time:.4f}秒"
+        )
+
+    def _finish_trace(self, spans, metrics, status_code: int, request: Request) -> None:
+        """Record phase histograms and export the request's spans."""
+        try:
+            metrics.observe_phases(spans.phase_totals())
+            if span_exporter.enabled:
+                span_exporter.export(spans.to_otlp(status_code, {
+                    "http.request.method": request.method,
+                    "url.path": request.url.path,
+                    "kirogate.request_id": getattr(request.state, "request_id", None),
+                    "kirogate.model": getattr(request.state, "model", None),
+                }))
+        except Exception as e:
+            logger.debug(f"[{get_timestamp()}] 阶段耗时记录失败: {e}")
+
+    def _track_token_usage(self, request: Request, success: bool) -> None:
+        """Track usage for sk-xxx API keys."""
+        try:
+            # Check if request used a user API key
+            if hasattr(request.state, "donated_token_id"):
+                from kiro_gateway.database import user_db, user_db_executor
+                from kiro_gateway.token_allocator import token_allocator
+
+                token_id = request.state.donated_token_id
+                api_key_id = getattr(request.state, "api_key_id", None)
+
+                # Record token usage
+                token_allocator.record_usage(token_id, success)
 
-        return await call_next(request)
+                # Record API key usage
+                if api_key_id:
+                    user_db_executor.submit(user_db.record_api_key_usage, api_key_id)
+
+        except Exception as e:
+            logger.debug(f"[{get_timestamp()}] Token 使用追踪失败: {e}")
 
 
 # Global metrics middleware instance
-metrics_middleware = MetricsMiddleware
+metrics_middleware = GatewayMiddleware
@@ -378,6 +378,70 @@ class AnthropicMessagesRequest(BaseModel):
     model_config = {"extra": "allow"}
 
 
+class AnthropicRawMessage(BaseModel):
+    """
+    RAW_BODY_FAST_PATH 模式下的 Anthropic 消息。
+
+    内容块保持原始 dict，不逐个构建 AnthropicContentBlock；
+    转换器对能通过 AnthropicContentBlock 校验的 dict 按相同规则处理。
+
+    Attributes:
+        role: 角色（user 或 assistant）
+        content: 内容（字符串或内容块 dict 列表）
+    """
+    role: str
+    content: Union[str, List[Dict[str, Any]]]
+
+    model_config = {"extra": "allow"}
+
+
+class AnthropicMessagesRawRequest(AnthropicMessagesRequest):
+    """
+    RAW_BODY_FAST_PATH 模式下的 /v1/messages 请求。
+
+    请求体由 model_validate_json 一次解析（JSON 解码与校验都在 pydantic-core 中完成），
+    只校验转换器需要的字段。
+    """
+    messages: Annotated[List[AnthropicRawMessage], Field(min_length=1)]
+
+
+# 单次批量 count_tokens 请求允许的最大条目数
+COUNT_TOKENS_BATCH_MAX_ITEMS = 256
+
+
+class AnthropicCountTokensRequest(BaseModel):
+    """
+    批量 count_tokens 中的单个请求。
+
+    只校验计数需要的字段，消息和工具保持原始 dict，不逐个内容块构建模型。
+
+    Attributes:
+        model: 模型 ID（用于选择校准后的修正系数）
+        messages: 消息列表
+        system: 系统提示词
+        tools: 工具列表
+    """
+    model: str
+    messages: Annotated[List[Dict[str, Any]], Field(min_length=1)]
+    system: Optional[Union[str, List[Dict[str, Any]]]] = None
+    tools: Optional[List[Dict[str, Any]]] = None
+
+    model_config = {"extra": "allow"}
+
+
+class AnthropicCountTokensBatchRequest(BaseModel):
+    """
+    /v1/messages/count_tokens/batch 请求。
+
+    Attributes:
+        requests: 待计数的请求列表（结果按相同顺序返回）
+    """
+    requests: Annotated[
+        List[AnthropicCountTokensRequest],
+        Field(min_length=1, max_length=COUNT_TOKENS_BATCH_MAX_ITEMS)
+    ]
+
+
 class AnthropicUsage(BaseModel):
     """
     Anthropic 格式的 token 使用信息。
@@ -1910,6 +1910,33 @@ def render_dashboard_page() -> str:
       </div>
     </div>
 
+    <!-- Latency Quantiles -->
+    <div class="chart-card mb-8">
+      <h2 class="chart-title">
+        <span class="w-8 h-8 rounded-lg flex items-center justify-center text-sm" style="background: linear-gradient(135deg, var(--primary), var(--accent));">⏱️</span>
+        模型延迟分位数
+      </h2>
+      <div class="table-responsive">
+        <table class="w-full text-sm data-table">
+          <thead>
+            <tr class="text-left" style="color:var(--text-muted);border-bottom:1px solid var(--border)">
+              <th class="py-3 px-3">模型</th>
+              <th class="py-3 px-3">API</th>
+              <th class="py-3 px-3">模式</th>
+              <th class="py-3 px-3">样本</th>
+              <th class="py-3 px-3">首字 P50</th>
+              <th class="py-3 px-3">首字 P99</th>
+              <th class="py-3 px-3">总耗时 P99</th>
+              <th class="py-3 px-3">输出 tok/s P50</th>
+            </tr>
+          </thead>
+          <tbody id="quantilesTable">
+            <tr><td colspan="8" class="py-6 text-center" style="color:var(--text-muted)">加载中...</td></tr>
+          </tbody>
+        </table>
+      </div>
+    </div>
+
     <!-- Recent Requests -->
     <div class="chart-card">
       <h2 class="chart-title">
@@ -1985,6 +2012,25 @@ async function refreshData(){{
     sc.data.datasets[0].data=[d.successRequests||0,d.failedRequests||0];
     sc.update();
 
+    const sq=d.streamQuantiles||{{}},qrows={{}};
+    const qkey=e=>e.model+'|'+e.api+'|'+e.mode;
+    (sq.response_duration_seconds||[]).forEach(e=>{{qrows[qkey(e)]={{model:e.model,api:e.api,mode:e.mode,count:e.count,dur:e}}}});
+    (sq.ttft_seconds||[]).forEach(e=>{{if(qrows[qkey(e)])qrows[qkey(e)].ttft=e}});
+    (sq.output_tokens_per_second||[]).forEach(e=>{{if(qrows[qkey(e)])qrows[qkey(e)].tps=e}});
+    const fmtS=v=>v==null?'-':(v<1?(v*1000).toFixed(0)+'ms':v.toFixed(2)+'s');
+    const qr=Object.values(qrows).sort((a,b)=>b.count-a.count);
+    document.getElementById('quantilesTable').innerHTML=qr.length?qr.map(q=>`
+      <tr class="table-row">
+        <td class="py-3 px-3">${{q.model}}</td>
+        <td class="py-3 px-3">${{q.api}}</td>
+        <td class="py-3 px-3">${{q.mode==='stream'?'流式':'非流式'}}</td>
+        <td class="py-3 px-3">${{q.count}}</td>
+        <td class="py-3 px-3">${{fmtS(q.ttft&&q.ttft.p50)}}</td>
+        <td class="py-3 px-3">${{fmtS(q.ttft&&q.ttft.p99)}}</td>
+        <td class="py-3 px-3">${{fmtS(q.dur.p99)}}</td>
+        <td class="py-3 px-3">${{q.tps&&q.tps.p50!=null?q.tps.p50.toFixed(1):'-'}}</td>
+      </tr>`).join(''):'<tr><td colspan="8" class="py-6 text-center" style="color:var(--text-muted)">暂无数据</td></tr>';
+
     const rq=(d.recentRequests||[]).slice(-10).reverse();
     const tb=document.getElementById('recentRequestsTable');
     tb.innerHTML=rq.length?rq.map(q=>`
@@ -2371,6 +2417,37 @@ def render_admin_page() -> str:
           </div>
         </div>
       </div>
+      <div class="card">
+        <div class="flex justify-between items-center mb-4">
+          <h2 class="text-lg font-semibold">⏱️ 事件循环</h2>
+          <span class="text-xs" style="color: var(--text-muted);" id="loopThreshold">-</span>
+        </div>
+        <div class="grid md:grid-cols-4 gap-4 mb-4">
+          <div style="background: var(--bg-input);" class="p-4 rounded-lg">
+            <div class="text-sm" style="color: var(--text-muted);">当前延迟</div>
+            <div class="text-2xl font-bold" id="loopLagLast">-</div>
+          </div>
+          <div style="background: var(--bg-input);" class="p-4 rounded-lg">
+            <div class="text-sm" style="color: var(--text-muted);">平均延迟</div>
+            <div class="text-2xl font-bold" id="loopLagAvg">-</div>
+          </div>
+          <div style="background: var(--bg-input);" class="p-4 rounded-lg">
+            <div class="text-sm" style="color: var(--text-muted);">最大延迟</div>
+            <div class="text-2xl font-bold text-yellow-400" id="loopLagMax">-</div>
+          </div>
+          <div style="background: var(--bg-input);" class="p-4 rounded-lg">
+            <div class="text-sm" style="color: var(--text-muted);">阻塞次数</div>
+            <div class="text-2xl font-bold text-red-400" id="loopBlocks">-</div>
+          </div>
+        </div>
+        <div class="overflow-x-auto mb-4">
+          <table class="w-full text-sm data-table">
+            <thead><tr><th class="text-left py-2 px-3">阻塞位置</th><th class="text-right py-2 px-3">次数</th><th class="text-right py-2 px-3">累计阻塞</th></tr></thead>
+            <tbody id="loopSitesTable"><tr><td colspan="3" class="py-4 text-center" style="color: var(--text-muted);">暂无阻塞记录</td></tr></tbody>
+          </table>
+        </div>
+        <div id="loopRecentBlocks" class="space-y-2"></div>
+      </div>
     </div>
 
     <!-- Tab Content: Users -->
@@ -2518,7 +2595,7 @@ def render_admin_page() -> str:
         <div class="flex flex-wrap justify-between items-center gap-4 mb-4 toolbar">
           <h2 class="text-lg font-semibold">🌐 IP 请求统计</h2>
           <div class="flex items-center gap-2">
-            <input type="text" id="ipStatsSearch" placeholder="搜索IP..." oninput="filterIpStats()"
+            <input type="text" id="ipStatsSearch" placeholder="按 IP 前缀搜索..." oninput="filterIpStats()"
               class="px-3 py-2 rounded-lg text-sm w-40" style="background: var(--bg-input); border: 1px solid var(--border); color: var(--text);">
             <select id="ipStatsPageSize" onchange="filterIpStats()" class="px-3 py-2 rounded-lg text-sm" style="background: var(--bg-input); border: 1px solid var(--border); color: var(--text);">
               <option value="10">10/页</option>
@@ -2568,7 +2645,7 @@ def render_admin_page() -> str:
               <option value="50">50/页</option>
             </select>
             <button onclick="refreshBlacklist()" class="btn btn-primary text-sm">刷新</button>
-            <input type="text" id="banIpInput" placeholder="输入 IP 地址"
+            <input type="text" id="banIpInput" placeholder="IP 或网段，如 1.2.3.0/24"
               class="px-3 py-2 rounded-lg text-sm" style="background: var(--bg-input); border: 1px solid var(--border); color: var(--text);">
             <button onclick="banIp()" class="btn btn-danger text-sm">封禁</button>
           </div>
@@ -2794,6 +2871,25 @@ def render_admin_page() -> str:
         </div>
       </div>
 
+      <div class="card mt-6">
+        <h2 class="text-lg font-semibold mb-4">🔬 性能分析</h2>
+        <div class="flex flex-wrap items-end gap-3">
+          <label class="text-sm">
+            <div style="color: var(--text-muted);">时长（秒，最长 60）</div>
+            <input id="profileDuration" type="number" min="1" max="60" value="10" class="rounded px-3 py-2 w-32"
+              style="background: var(--bg-input); border: 1px solid var(--border); color: var(--text);">
+          </label>
+          <button onclick="runProfile('cpu')" class="btn btn-primary">CPU 采样（火焰图）</button>
+          <button onclick="runProfile('memory')" class="btn"
+            style="background: var(--bg-input); border: 1px solid var(--border);">内存分配快照</button>
+          <button onclick="cancelProfile()" class="btn"
+            style="background: var(--bg-input); border: 1px solid var(--border);">提前结束</button>
+        </div>
+        <p id="profileStatus" class="text-xs mt-3" style="color: var(--text-muted);">
+          CPU 采样输出 collapsed-stack 文件，可用 speedscope 或 flamegraph.pl 查看；内存快照开启期间分配开销会增加。
+        </p>
+      </div>
+
       <div class="card mt-6">
         <h2 class="text-lg font-semibold mb-4">📋 系统信息</h2>
         <div class="grid md:grid-cols-2 gap-4 text-sm">
@@ -3135,6 +3231,7 @@ def render_admin_page() -> str:
       document.querySelector(`.tab:nth-child(${{allTabs.indexOf(tab)+1}})`).classList.add('active');
       document.getElementById('tab-' + tab).classList.remove('hidden');
       currentTab = tab;
+      if (tab === 'overview') refreshLoopMonitor();
       if (tab === 'users') refreshUsers();
       if (tab === 'donated-tokens') refreshDonatedTokens();
       if (tab === 'ip-stats') refreshIpStats();
@@ -3170,6 +3267,36 @@ def render_admin_page() -> str:
       }} catch (e) {{ console.error(e); }}
     }}
 
+    function formatSeconds(value) {{
+      const v = Number(value || 0);
+      return v >= 1 ? v.toFixed(2) + 's' : (v * 1000).toFixed(1) + 'ms';
+    }}
+
+    async function refreshLoopMonitor() {{
+      try {{
+        const d = await fetchJson('/admin/api/loop-monitor');
+        document.getElementById('loopLagLast').textContent = formatSeconds(d.last);
+        document.getElementById('loopLagAvg').textContent = formatSeconds(d.avg);
+        document.getElementById('loopLagMax').textContent = formatSeconds(d.max);
+        document.getElementById('loopBlocks').textContent = d.blocks || 0;
+        document.getElementById('loopThreshold').textContent = d.blockThreshold > 0
+          ? `采样间隔 ${{d.interval}}s · 阻塞阈值 ${{d.blockThreshold}}s` + (d.blockedNow ? ' · ⚠️ 当前阻塞中' : '')
+          : `采样间隔 ${{d.interval}}s · 阻塞检测已禁用`;
+        const sites = d.sites || [];
+        document.getElementById('loopSitesTable').innerHTML = sites.length
+          ? sites.map(s => `<tr><td class="py-2 px-3 font-mono text-xs">${{escapeHtml(s.site)}}</td><td class="py-2 px-3 text-right">${{s.count}}</td><td class="py-2 px-3 text-right">${{formatSeconds(s.seconds)}}</td></tr>`).join('')
+          : '<tr><td colspan="3" class="py-4 text-center" style="color: var(--text-muted);">暂无阻塞记录</td></tr>';
+        document.getElementById('loopRecentBlocks').innerHTML = (d.recentBlocks || []).map(b => `
+          <details class="rounded-lg p-3" style="background: var(--bg-input);">
+            <summary class="cursor-pointer text-sm">
+              ${{new Date(b.time * 1000).toLocaleString()}} · <span class="text-red-400">${{formatSeconds(b.duration)}}</span> ·
+              <span class="font-mono text-xs">${{escapeHtml(b.site)}}</span> · ${{escapeHtml(b.task)}}
+            </summary>
+            <pre class="text-xs mt-2 overflow-x-auto" style="color: var(--text-muted);">${{escapeHtml((b.stack || []).join(''))}}</pre>
+          </details>`).join('');
+      }} catch (e) {{ console.error(e); }}
+    }}
+
     // IP Stats 数据和状态
     let allIpStats = [];
     let ipStatsCurrentPage = 1;
@@ -3264,7 +3391,7 @@ def render_admin_page() -> str:
             <input type="checkbox" value="${{ip.ip}}" ${{selectedIps.has(ip.ip) ? 'checked' : ''}} onchange="toggleIpSelection('${{ip.ip}}', this.checked)">
           </td>
           <td class="py-3 px-3 font-mono">${{ip.ip}}</td>
-          <td class="py-3 px-3">${{ip.count}}</td>
+          <td class="py-3 px-3" title="${{ip.error ? `近似计数，误差不超过 ${{ip.error}}` : ''}}">${{ip.error ? '≤' : ''}}${{ip.count}}</td>
           <td class="py-3 px-3">${{lastSeen ? new Date(lastSeen).toLocaleString() : '-'}}</td>
           <td class="py-3 px-3">
             <button onclick="banIpDirect('${{ip.ip}}')" class="text-xs px-2 py-1 rounded bg-red-500/20 text-red-400 hover:bg-red-500/30">封禁</button>
@@ -3491,7 +3618,11 @@ def render_admin_page() -> str:
       const fd = new FormData();
       fd.append('ip', ip);
       fd.append('reason', '管理员手动封禁');
-      await fetch('/admin/api/ban-ip', {{ method: 'POST', body: fd }});
+      const r = await fetch('/admin/api/ban-ip', {{ method: 'POST', body: fd }});
+      if (!r.ok) {{
+        const d = await r.json().catch(() => ({{}}));
+        return alert(d.error || '封禁失败');
+      }}
       document.getElementById('banIpInput').value = '';
       refreshBlacklist();
       refreshStats();
@@ -3540,6 +3671,38 @@ def render_admin_page() -> str:
       alert(d.message || (d.success ? '清除成功' : '清除失败'));
     }}
 
+    async function runProfile(kind) {{
+      const status = document.getElementById('profileStatus');
+      const duration = Math.min(60, Math.max(1, parseFloat(document.getElementById('profileDuration').value) || 10));
+      const fd = new FormData();
+      fd.append('duration', duration);
+      status.textContent = `${{kind === 'cpu' ? 'CPU 采样' : '内存快照'}}进行中（${{duration}} 秒）...`;
+      try {{
+        const r = await fetch(`/admin/api/profile/${{kind}}`, {{ method: 'POST', body: fd }});
+        if (!r.ok) {{
+          const d = await r.json().catch(() => ({{}}));
+          status.textContent = d.error || '性能分析失败';
+          return;
+        }}
+        const blob = await r.blob();
+        const match = /filename="([^"]+)"/.exec(r.headers.get('Content-Disposition') || '');
+        const link = document.createElement('a');
+        link.href = URL.createObjectURL(blob);
+        link.download = match ? match[1] : `kirogate-${{kind}}.txt`;
+        link.click();
+        URL.revokeObjectURL(link.href);
+        status.textContent = kind === 'cpu'
+          ? `完成：${{r.headers.get('X-Profile-Samples')}} 次采样，采样开销 ${{(parseFloat(r.headers.get('X-Profile-Overhead') || 0) * 100).toFixed(2)}}%`
+          : `完成：${{r.headers.get('X-Profile-Duration')}} 秒内存分配差异已下载`;
+      }} catch (e) {{
+        status.textContent = '性能分析失败';
+      }}
+    }}
+
+    async function cancelProfile() {{
+      await fetch('/admin/api/profile/cancel', {{ method: 'POST' }});
+    }}
+
     // 缓存 Token 列表数据和状态
     let allCachedTokens = [];
     let tokensCurrentPage = 1;
@@ -3719,6 +3882,9 @@ def render_admin_page() -> str:
     let usersSortField = 'id';
     let usersSortAsc = false;
     let selectedUsers = new Set();
+    // Keyset 分页游标 {{页码: cursor}}，筛选/排序/每页数量变化时重置
+    let usersCursors = {{}};
+    let usersCursorKey = '';
 
     async function refreshUsers() {{
       try {{
@@ -3728,8 +3894,7 @@ def render_admin_page() -> str:
         const approvalValue = document.getElementById('usersApprovalFilter')?.value ?? '';
         const trustLevelRaw = document.getElementById('usersTrustLevel')?.value ?? '';
         const trustLevel = trustLevelRaw === '' ? undefined : parseInt(trustLevelRaw, 10);
-        const d = await fetchJson('/admin/api/users' + buildQuery({{
-          page: usersCurrentPage,
+        const params = {{
           page_size: pageSize,
           search,
           is_banned: statusValue === '' ? undefined : statusValue,
@@ -3737,7 +3902,18 @@ def render_admin_page() -> str:
           trust_level: Number.isFinite(trustLevel) ? trustLevel : undefined,
           sort_field: usersSortField,
           sort_order: usersSortAsc ? 'asc' : 'desc'
+        }};
+        const cursorKey = JSON.stringify(params);
+        if (cursorKey !== usersCursorKey) {{
+          usersCursors = {{}};
+          usersCursorKey = cursorKey;
+        }}
+        const d = await fetchJson('/admin/api/users' + buildQuery({{
+          ...params,
+          page: usersCurrentPage,
+          cursor: usersCursors[usersCurrentPage]
         }}));
+        if (d.pagination?.next_cursor) usersCursors[usersCurrentPage + 1] = d.pagination.next_cursor;
         allUsers = d.users || [];
         const total = d.pagination?.total ?? allUsers.length;
         const totalPages = Math.ceil(total / pageSize) || 1;
@@ -3990,6 +4166,8 @@ def render_admin_page() -> str:
     let poolSortAsc = false;
     let selectedPoolTokens = new Set();
     let poolStatsData = {{}};
+    let poolCursors = {{}};
+    let poolCursorKey = '';
 
     async function refreshDonatedTokens() {{
       try {{
@@ -3997,15 +4175,25 @@ def render_admin_page() -> str:
         const search = document.getElementById('poolSearch').value.trim();
         const visibility = document.getElementById('poolVisibilityFilter').value;
         const status = document.getElementById('poolStatusFilter').value;
-        const d = await fetchJson('/admin/api/donated-tokens' + buildQuery({{
-          page: poolCurrentPage,
+        const params = {{
           page_size: pageSize,
           search,
           visibility,
           status,
           sort_field: poolSortField,
           sort_order: poolSortAsc ? 'asc' : 'desc'
+        }};
+        const cursorKey = JSON.stringify(params);
+        if (cursorKey !== poolCursorKey) {{
+          poolCursors = {{}};
+          poolCursorKey = cursorKey;
+        }}
+        const d = await fetchJson('/admin/api/donated-tokens' + buildQuery({{
+          ...params,
+          page: poolCurrentPage,
+          cursor: poolCursors[poolCurrentPage]
         }}));
+        if (d.pagination?.next_cursor) poolCursors[poolCurrentPage + 1] = d.pagination.next_cursor;
         poolStatsData = d;
         document.getElementById('poolTotalTokens').textContent = d.total || 0;
         document.getElementById('poolActiveTokens').textContent = d.active || 0;
@@ -4182,6 +4370,8 @@ def render_admin_page() -> str:
       }});
     }}
     setInterval(refreshStats, 10000);
+    refreshLoopMonitor();
+    setInterval(() => {{ if (currentTab === 'overview') refreshLoopMonitor(); }}, 10000);
 
     // Theme management
     function initTheme() {{
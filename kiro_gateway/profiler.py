@@ -0,0 +1,209 @@
+# -*- coding: utf-8 -*-
+
+"""
+KiroGate 进程内性能分析（管理后台触发）。
+
+- CPU：后台线程按固定间隔读取 sys._current_frames()，统计各线程调用栈，
+  输出 collapsed-stack 格式（flamegraph.pl / speedscope / Pyroscope 可直接导入）。
+  采样开销超过墙钟时间的 MAX_OVERHEAD 时自动拉长采样间隔。
+- 内存：tracemalloc 在时间窗口首尾各取一次快照，按分配位置输出增长最多的条目。
+
+两种分析都有时长上限，同一时间只允许一个分析任务，均在工作线程中运行，
+不阻塞事件循环。
+"""
+
+import os
+import sys
+import threading
+import time
+import tracemalloc
+from collections import Counter
+from typing import Dict, List, Optional
+
+from loguru import logger
+
+
+class ProfilerBusy(Exception):
+    """Another profiling session is already running."""
+
+
+class Profiler:
+    """Time-boxed sampling profiler and tracemalloc snapshot diff."""
+
+    MAX_DURATION = 60.0
+    MIN_INTERVAL = 0.001
+    MAX_INTERVAL = 1.0
+    # 采样耗时占墙钟时间的上限，超出时拉长间隔
+    MAX_OVERHEAD = 0.05
+    MAX_STACK_DEPTH = 128
+    MAX_TRACEMALLOC_FRAMES = 25
+    MAX_TOP_ALLOCATIONS = 200
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._current: Optional[Dict] = None
+
+    def _acquire(self, kind: str, duration: float) -> None:
+        if not self._lock.acquire(blocking=False):
+            raise ProfilerBusy(f"{self._current['kind'] if self._current else 'profile'} already running")
+        self._stop.clear()
+        self._current = {"kind": kind, "started": time.time(), "duration": duration}
+
+    def _release(self) -> None:
+        self._current = None
+        self._lock.release()
+
+    def cancel(self) -> bool:
+        """Stop the running session early (its partial result is still returned)."""
+        if self._current is None:
+            return False
+        self._stop.set()
+        return True
+
+    def status(self) -> Optional[Dict]:
+        """Return the running session, if any."""
+        current = self._current
+        return dict(current) if current else None
+
+    @staticmethod
+    def _frame_label(code) -> str:
+        return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+    def profile_cpu(self, duration: float = 10.0, interval: float = 0.01) -> Dict:
+        """
+        Sample every thread's stack for duration seconds (blocking; run in a worker thread).
+
+        Args:
+            duration: Sampling window in seconds (capped at MAX_DURATION)
+            interval: Target interval between samples in seconds
+
+        Returns:
+            Dict with "folded" (collapsed stacks, one "a;b;c count" line per stack)
+            and sampling statistics
+
+        Raises:
+            ProfilerBusy: If another session is running
+        """
+        duration = min(max(duration, 0.1), self.MAX_DURATION)
+        interval = min(max(interval, self.MIN_INTERVAL), self.MAX_INTERVAL)
+        self._acquire("cpu", duration)
+        try:
+            own_id = threading.get_ident()
+            stacks: Counter = Counter()
+            labels: Dict[object, str] = {}
+            samples = 0
+            sampling_cost = 0.0
+            start = time.perf_counter()
+            deadline = start + duration
+            while True:
+                t0 = time.perf_counter()
+                if t0 >= deadline or self._stop.is_set():
+                    break
+                names = {thread.ident: thread.name for thread in threading.enumerate()}
+                for thread_id, frame in sys._current_frames().items():
+                    if thread_id == own_id:
+                        continue
+                    parts: List[str] = []
+                    depth = 0
+                    while frame is not None and depth < self.MAX_STACK_DEPTH:
+                        code = frame.f_code
+                        label = labels.get(code)
+                        if label is None:
+                            label = labels[code] = self._frame_label(code)
+                        parts.append(label)
+                        frame = frame.f_back
+                        depth += 1
+                    parts.append(names.get(thread_id, f"thread-{thread_id}"))
+                    parts.reverse()
+                    stacks[";".join(parts)] += 1
+                frame = None
+                samples += 1
+                cost = time.perf_counter() - t0
+                sampling_cost += cost
+                # 保证采样耗时不超过 MAX_OVERHEAD
+                wait = max(interval - cost, cost / self.MAX_OVERHEAD - cost)
+                if self._stop.wait(min(wait, max(0.0, deadline - time.perf_counter()))):
+                    break
+            elapsed = time.perf_counter() - start
+        finally:
+            self._release()
+
+        folded = "\n".join(f"{stack} {count}" for stack, count in stacks.most_common())
+        logger.info(f"CPU profile finished: {samples} samples in {elapsed:.1f}s")
+        return {
+            "folded": folded + "\n" if folded else "",
+            "samples": samples,
+            "stacks": len(stacks),
+            "duration": round(elapsed, 3),
+            "overhead": round(sampling_cost / elapsed, 4) if elapsed else 0.0,
+        }
+
+    def profile_memory(self, duration: float = 10.0, top: int = 50, frames: int = 10) -> Dict:
+        """
+        Diff two tracemalloc snapshots taken duration seconds apart (blocking; run in a worker thread).
+
+        Args:
+            duration: Window in seconds (capped at MAX_DURATION)
+            top: Number of allocation sites to report
+            frames: Traceback depth recorded per allocation
+
+        Returns:
+            Dict with "report" (text) and traced memory totals
+
+        Raises:
+            ProfilerBusy: If another session is running
+        """
+        duration = min(max(duration, 0.1), self.MAX_DURATION)
+        top = min(max(top, 1), self.MAX_TOP_ALLOCATIONS)
+        frames = min(max(frames, 1), self.MAX_TRACEMALLOC_FRAMES)
+        self._acquire("memory", duration)
+        # 外部已开启 tracemalloc（如 PYTHONTRACEMALLOC）时沿用，结束后不关闭
+        started_here = not tracemalloc.is_tracing()
+        try:
+            if started_here:
+                tracemalloc.start(frames)
+            tracemalloc.reset_peak()
+            ignore = (
+                tracemalloc.Filter(False, tracemalloc.__file__),
+                tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+                tracemalloc.Filter(False, "<unknown>"),
+            )
+            before = tracemalloc.take_snapshot().filter_traces(ignore)
+            start = time.perf_counter()
+            self._stop.wait(duration)
+            after = tracemalloc.take_snapshot().filter_traces(ignore)
+            elapsed = time.perf_counter() - start
+            current, peak = tracemalloc.get_traced_memory()
+            stats = after.compare_to(before, "traceback")
+        finally:
+            if started_here:
+                tracemalloc.stop()
+            self._release()
+
+        growth = sum(stat.size_diff for stat in stats)
+        lines = [
+            f"# KiroGate allocation diff over {elapsed:.1f}s",
+            f"# traced now: {current / 1024:.1f} KiB, peak: {peak / 1024:.1f} KiB, "
+            f"net growth: {growth / 1024:+.1f} KiB",
+            "",
+        ]
+        for index, stat in enumerate(stats[:top], 1):
+            lines.append(
+                f"#{index}: {stat.size_diff / 1024:+.1f} KiB ({stat.count_diff:+d} blocks), "
+                f"now {stat.size / 1024:.1f} KiB in {stat.count} blocks"
+            )
+            lines.extend(stat.traceback.format(most_recent_first=True))
+            lines.append("")
+        logger.info(f"Memory profile finished: net growth {growth / 1024:+.1f} KiB in {elapsed:.1f}s")
+        return {
+            "report": "\n".join(lines),
+            "duration": round(elapsed, 3),
+            "traced": current,
+            "peak": peak,
+            "growth": growth,
+        }
+
+
+# Global profiler instance
+profiler = Profiler()
@@ -24,6 +24,8 @@
 减少代码重复，提高可维护性。
 """
 
+import asyncio
+import functools
 import json
 import time
 from typing import Any, Callable, Dict, List, Optional, Union
@@ -34,11 +36,14 @@ from loguru import logger
 
 from kiro_gateway.auth import KiroAuthManager
 from kiro_gateway.cache import ModelInfoCache
-from kiro_gateway.converters import build_kiro_payload, convert_anthropic_to_openai_request, is_thinking_enabled
+from kiro_gateway.context_compaction import ContextCompactor
+from kiro_gateway.converters import build_kiro_payload, build_kiro_payload_from_anthropic, is_thinking_enabled
 from kiro_gateway.config import settings
 from kiro_gateway.http_client import KiroHttpClient
 from kiro_gateway.models import (
     ChatCompletionRequest,
+    ChatMessage,
+    Tool,
     AnthropicMessagesRequest,
 )
 from kiro_gateway.streaming import (
@@ -50,6 +55,9 @@ from kiro_gateway.streaming import (
 from kiro_gateway.utils import generate_conversation_id, get_kiro_headers
 from kiro_gateway.config import settings, AUTO_CHUNKING_ENABLED, AUTO_CHUNK_THRESHOLD
 from kiro_gateway.metrics import metrics
+from kiro_gateway.chunked_processor import CHARS_PER_TOKEN_ESTIMATE
+from kiro_gateway.token_calibration import token_calibrator
+from kiro_gateway.tracing import span
 
 
 # 导入可选的自动分片处理器
@@ -168,9 +176,9 @@ class RequestHandler:
             reason_text = error_reason or error_message
             if "MONTHLY_REQUEST_COUNT" in reason_text:
                 try:
-                    from kiro_gateway.database import user_db
+                    from kiro_gateway.database import user_db, user_db_executor
                     token_id = request.state.donated_token_id
-                    user_db.set_token_status(token_id, "expired")
+                    await user_db_executor.run(user_db.set_token_status, token_id, "expired")
                     logger.warning(f"Token {token_id} marked expired due to monthly limit")
                 except Exception as e:
                     logger.warning(f"Failed to mark token expired: {e}")
@@ -244,18 +252,31 @@ class RequestHandler:
         return error_msg
 
     @staticmethod
-    def prepare_tokenizer_data(request_data: ChatCompletionRequest) -> tuple:
+    def prepare_tokenizer_data(
+        messages: List[Union[ChatMessage, Dict[str, Any]]],
+        tools: Optional[List[Tool]]
+    ) -> tuple:
         """
         准备用于 token 计数的数据。
 
         Args:
-            request_data: 请求数据
+            messages: OpenAI 格式的消息（模型或已是 dict）
+            tools: OpenAI 格式的工具
 
         Returns:
             (messages_for_tokenizer, tools_for_tokenizer)
         """
-        messages_for_tokenizer = [msg.model_dump() for msg in request_data.messages]
-        tools_for_tokenizer = [tool.model_dump() for tool in request_data.tools] if request_data.tools else None
+        # 计数只读取这几个字段；不用 model_dump，避免深拷贝整个对话内容
+        messages_for_tokenizer = [
+            msg if isinstance(msg, dict) else {
+                "role": msg.role,
+                "content": msg.content,
+                "tool_calls": msg.tool_calls,
+                "tool_call_id": msg.tool_call_id,
+            }
+            for msg in messages
+        ]
+        tools_for_tokenizer = [tool.model_dump() for tool in tools] if tools else None
         return messages_for_tokenizer, tools_for_tokenizer
 
     @staticmethod
@@ -322,12 +343,13 @@ class RequestHandler:
         return StreamingResponse(stream_wrapper(), media_type="text/event-stream")
 
     @staticmethod
-    def should_enable_auto_chunking(messages: List) -> bool:
+    def should_enable_auto_chunking(messages: List, model: Optional[str] = None) -> bool:
         """
         检查是否应该启用自动分片功能。
 
         Args:
             messages: 消息列表
+            model: 模型名称（用于按校准后的每 token 字符数换算阈值）
 
         Returns:
             是否启用自动分片
@@ -336,7 +358,7 @@ class RequestHandler:
             return False
 
         # 检查消息内容是否超过阈值
-        total_chars = 0
+        texts = []
         for msg in messages:
             if hasattr(msg, 'content'):
                 content = msg.content
@@ -346,13 +368,16 @@ class RequestHandler:
                 continue
 
             if isinstance(content, str):
-                total_chars += len(content)
+                texts.append(content)
             elif isinstance(content, list):
                 for block in content:
                     if isinstance(block, dict) and block.get("type") == "text":
-                        total_chars += len(block.get("text", ""))
+                        texts.append(block.get("text", ""))
 
-        return total_chars > AUTO_CHUNK_THRESHOLD
+        total_chars = sum(len(text) for text in texts)
+        # 阈值按英文约 4 字符/token 设定，中文等语言按校准结果收紧
+        threshold = token_calibrator.char_limit(AUTO_CHUNK_THRESHOLD, texts, CHARS_PER_TOKEN_ESTIMATE, model)
+        return total_chars > threshold
 
     @staticmethod
     async def create_non_stream_response(
@@ -419,7 +444,7 @@ class RequestHandler:
             request: FastAPI Request
             request_data: 请求数据
             endpoint_name: 端点名称
-            convert_to_openai: 是否需要将 Anthropic 请求转换为 OpenAI 格式
+            convert_to_openai: 是否为 Anthropic 请求（直接转换为 Kiro payload）
             response_format: 响应格式（"openai" 或 "anthropic"）
 
         Returns:
@@ -436,16 +461,6 @@ class RequestHandler:
         # 准备日志
         RequestHandler.prepare_request_logging(request_data)
 
-        # 如果需要，转换 Anthropic 请求为 OpenAI 格式
-        if convert_to_openai:
-            try:
-                openai_request = convert_anthropic_to_openai_request(request_data)
-            except Exception as e:
-                logger.error(f"Failed to convert Anthropic request: {e}")
-                raise HTTPException(status_code=400, detail=f"请求格式无效: {str(e)}")
-        else:
-            openai_request = request_data
-
         # 生成会话 ID
         conversation_id = generate_conversation_id()
 
@@ -453,16 +468,42 @@ class RequestHandler:
         thinking_config = getattr(request_data, 'thinking', None)
         thinking_enabled = is_thinking_enabled(thinking_config)
 
-        # 构建 Kiro payload
+        # 超出模型上下文窗口时裁剪历史（可选）
+        compactor = None
+        if settings.context_compaction_enabled:
+            compactor = ContextCompactor(model_cache.get_max_input_tokens(request_data.model), request_data.model)
+
+        # 构建 Kiro payload（Anthropic 请求直接转换，不经过 OpenAI 请求模型）
+        build = functools.partial(
+            build_kiro_payload_from_anthropic if convert_to_openai else build_kiro_payload,
+            request_data,
+            conversation_id,
+            auth_manager.profile_arn or "",
+            thinking_config=thinking_config,
+            compactor=compactor
+        )
         try:
-            kiro_payload = build_kiro_payload(
-                openai_request,
-                conversation_id,
-                auth_manager.profile_arn or "",
-                thinking_config=thinking_config
-            )
+            with span("build_payload"):
+                # 上下文压缩需要同步分词（超长对话可能多次），放到线程中执行以免阻塞事件循环
+                if compactor is not None:
+                    result = await asyncio.to_thread(build)
+                else:
+                    result = build()
+                if convert_to_openai:
+                    kiro_payload, request_messages, request_tools = result
+                else:
+                    kiro_payload = result
+                    request_messages, request_tools = request_data.messages, request_data.tools
         except ValueError as e:
             raise HTTPException(status_code=400, detail=str(e))
+        except Exception as e:
+            if not convert_to_openai:
+                raise
+            logger.error(f"Failed to convert Anthropic request: {e}")
+            raise HTTPException(status_code=400, detail=f"请求格式无效: {str(e)}")
+
+        if compactor is not None and compactor.trimmed:
+            request.state.context_compaction = compactor.header_value()
 
         # 记录 Kiro 请求
         RequestHandler.log_kiro_request(kiro_payload)
@@ -500,7 +541,7 @@ class RequestHandler:
                 )
 
             # 准备 token 计数数据
-            messages_for_tokenizer, tools_for_tokenizer = RequestHandler.prepare_tokenizer_data(openai_request)
+            messages_for_tokenizer, tools_for_tokenizer = RequestHandler.prepare_tokenizer_data(request_messages, request_tools)
 
             # 记录成功请求
             duration_ms = (time.time() - start_time) * 1000
@@ -526,7 +567,8 @@ class RequestHandler:
                         endpoint_name,
                         messages_for_tokenizer,
                         tools_for_tokenizer,
-                        thinking_enabled=thinking_enabled
+                        thinking_enabled=thinking_enabled,
+                        request_start=start_time
                     )
                 else:
                     return await RequestHandler.create_stream_response(
@@ -538,7 +580,8 @@ class RequestHandler:
                         stream_kiro_to_openai,
                         endpoint_name,
                         messages_for_tokenizer,
-                        tools_for_tokenizer
+                        tools_for_tokenizer,
+                        request_start=start_time
                     )
             else:
                 if response_format == "anthropic":
@@ -552,7 +595,8 @@ class RequestHandler:
                         endpoint_name,
                         messages_for_tokenizer,
                         tools_for_tokenizer,
-                        thinking_enabled=thinking_enabled
+                        thinking_enabled=thinking_enabled,
+                        request_start=start_time
                     )
                 else:
                     return await RequestHandler.create_non_stream_response(
@@ -564,7 +608,8 @@ class RequestHandler:
                         collect_stream_response,
                         endpoint_name,
                         messages_for_tokenizer,
-                        tools_for_tokenizer
+                        tools_for_tokenizer,
+                        request_start=start_time
                     )
 
         except HTTPException as e:
@@ -43,13 +43,15 @@ from typing import Optional
 from urllib.parse import urlparse
 
 import httpx
-from fastapi import APIRouter, Depends, HTTPException, Request, Response, Security, Header, Form, Query, File, UploadFile
+from fastapi import APIRouter, Body, Depends, HTTPException, Request, Response, Security, Header, Form, Query, File, UploadFile
+from fastapi.exceptions import RequestValidationError
 from fastapi.responses import JSONResponse, StreamingResponse, HTMLResponse, RedirectResponse
 from fastapi.security import APIKeyHeader
 from slowapi import Limiter
 from slowapi.util import get_remote_address
 from slowapi.errors import RateLimitExceeded
 from loguru import logger
+from pydantic import BaseModel, ValidationError
 
 from kiro_gateway.middleware import get_timestamp
 from kiro_gateway.config import (
@@ -63,12 +65,22 @@ from kiro_gateway.models import (
     ModelList,
     ChatCompletionRequest,
     AnthropicMessagesRequest,
+    AnthropicMessagesRawRequest,
+    AnthropicCountTokensBatchRequest,
 )
 from kiro_gateway.auth import KiroAuthManager
 from kiro_gateway.auth_cache import auth_cache
-from kiro_gateway.tokenizer import count_message_tokens, count_tools_tokens, count_tokens
+from kiro_gateway.tokenizer import (
+    count_message_tokens_async,
+    count_text_list_async,
+    count_texts_async,
+    count_tools_tokens_async,
+    request_segments,
+)
+from kiro_gateway.token_calibration import language_bucket, token_calibrator
 from kiro_gateway.cache import ModelInfoCache
 from kiro_gateway.request_handler import RequestHandler
+from kiro_gateway.tracing import span
 from kiro_gateway.utils import get_kiro_headers
 from kiro_gateway.config import settings
 from kiro_gateway.pages import (
@@ -139,6 +151,37 @@ except ImportError:
 api_key_header = APIKeyHeader(name="Authorization", auto_error=False)
 
 
+def _json_body(model: type[BaseModel]):
+    """
+    Build a dependency that parses the raw request body with model.model_validate_json.
+
+    Used when RAW_BODY_FAST_PATH is on: JSON decoding and validation run in one
+    pass inside pydantic-core instead of json.loads followed by model validation.
+    Errors are reported like FastAPI's own body validation (422).
+    """
+    async def parse_body(request: Request) -> BaseModel:
+        body = await request.body()
+        try:
+            return model.model_validate_json(body)
+        except ValidationError as e:
+            raise RequestValidationError(
+                [{**error, "loc": ("body", *error["loc"])} for error in e.errors(include_url=False)],
+                body=body
+            )
+    return parse_body
+
+
+# 请求体解析方式：默认由 FastAPI 校验；RAW_BODY_FAST_PATH 时在认证之后一次解析
+if settings.raw_body_fast_path:
+    _chat_completion_body = Depends(_json_body(ChatCompletionRequest))
+    _anthropic_messages_body = Depends(_json_body(AnthropicMessagesRawRequest))
+    _count_tokens_batch_body = Depends(_json_body(AnthropicCountTokensBatchRequest))
+else:
+    _chat_completion_body = Body(...)
+    _anthropic_messages_body = Body(...)
+    _count_tokens_batch_body = Body(...)
+
+
 def _mask_token(token: str) -> str:
     """
     Mask token for logging (show only first and last 4 chars).
@@ -228,6 +271,22 @@ def require_same_origin(request: Request) -> None:
     raise HTTPException(status_code=403, detail="跨站请求被拒绝")
 
 
+async def _resolve_api_key_principal(plain_key: str):
+    """
+    Resolve a sk-xxx key to (User or None, APIKey).
+
+    Hot keys are served from the principal cache without touching SQLite;
+    misses are loaded on a database reader thread.
+    """
+    from kiro_gateway.database import user_db, user_db_executor
+
+    with span("auth"):
+        principal = user_db.get_cached_api_key_principal(plain_key)
+        if principal is None:
+            principal = await user_db_executor.read(user_db.get_api_key_principal, plain_key, False)
+    return principal
+
+
 async def _parse_auth_header(auth_header: str, request: Request = None) -> tuple[str, KiroAuthManager, int | None, int | None]:
     """
     Parse Authorization header and return proxy key, AuthManager, and optional user/key IDs.
@@ -283,25 +342,25 @@ async def _parse_auth_header(auth_header: str, request: Request = None) -> tuple
 
     # Check if it's a user API key (sk-xxx format)
     if token.startswith("sk-"):
-        from kiro_gateway.database import user_db
         from kiro_gateway.token_allocator import token_allocator, NoTokenAvailable
 
-        result = user_db.verify_api_key(token)
+        result = await _resolve_api_key_principal(token)
         if not result:
             logger.warning(f"[{get_timestamp()}] 用户 API Key 无效: {_mask_token(token)}")
             raise HTTPException(status_code=401, detail="API Key 无效或缺失")
 
-        user_id, api_key = result
+        user, api_key = result
+        user_id = api_key.user_id
 
         # Check if user is banned
-        user = user_db.get_user(user_id)
         if not user or user.is_banned:
             logger.warning(f"[{get_timestamp()}] 被封禁用户尝试使用 API Key: 用户ID={user_id}")
             raise HTTPException(status_code=403, detail="用户已被封禁")
 
         # Get best token for this user
         try:
-            donated_token, auth_manager = await token_allocator.get_best_token(user_id)
+            with span("token_select"):
+                donated_token, auth_manager = await token_allocator.get_best_token(user_id)
             logger.debug(f"[{get_timestamp()}] 用户 API Key 模式: 用户ID={user_id}, Token ID={donated_token.id}")
 
             # Store token_id in request state for usage tracking
@@ -408,24 +467,24 @@ async def verify_anthropic_api_key(
 
         # Check if it's a user API key (sk-xxx format)
         if x_api_key.startswith("sk-"):
-            from kiro_gateway.database import user_db
             from kiro_gateway.token_allocator import token_allocator, NoTokenAvailable
 
-            result = user_db.verify_api_key(x_api_key)
+            result = await _resolve_api_key_principal(x_api_key)
             if not result:
                 logger.warning(f"[{get_timestamp()}] x-api-key 中的用户 API Key 无效: {_mask_token(x_api_key)}")
                 raise HTTPException(status_code=401, detail="API Key 无效或缺失")
 
-            user_id, api_key = result
+            user, api_key = result
+            user_id = api_key.user_id
 
             # Check if user is banned
-            user = user_db.get_user(user_id)
             if not user or user.is_banned:
                 logger.warning(f"[{get_timestamp()}] 被封禁用户尝试使用 API Key: 用户ID={user_id}")
                 raise HTTPException(status_code=403, detail="用户已被封禁")
 
             try:
-                donated_token, auth_manager = await token_allocator.get_best_token(user_id)
+                with span("token_select"):
+                    donated_token, auth_manager = await token_allocator.get_best_token(user_id)
                 logger.debug(f"[{get_timestamp()}] x-api-key 用户 API Key 模式: 用户ID={user_id}, Token ID={donated_token.id}")
 
                 request.state.donated_token_id = donated_token.id
@@ -624,8 +683,34 @@ async def get_site_mode():
     }
 
 
+def _etag_matches(if_none_match: str | None, etag: str) -> bool:
+    """Check an If-None-Match header against an ETag (weak comparison)."""
+    if not if_none_match:
+        return False
+    for candidate in if_none_match.split(","):
+        candidate = candidate.strip()
+        if candidate == "*" or candidate.removeprefix("W/") == etag:
+            return True
+    return False
+
+
+def _snapshot_response(request: Request, name: str, build, media_type: str = "application/json") -> Response:
+    """
+    Serve a cached metrics snapshot with ETag / If-None-Match support.
+
+    Snapshots are rebuilt at most once per METRICS_SNAPSHOT_TTL; clients
+    revalidating an unchanged snapshot get an empty 304.
+    """
+    from kiro_gateway.metrics import metrics
+    body, etag = metrics.snapshots.get(name, build)
+    headers = {"ETag": etag, "Cache-Control": "no-cache"}
+    if _etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=304, headers=headers)
+    return Response(content=body, media_type=media_type, headers=headers)
+
+
 @router.get("/metrics")
-async def get_metrics():
+async def get_metrics(request: Request):
     """
     Get application metrics in JSON format.
 
@@ -633,11 +718,11 @@ async def get_metrics():
         Metrics data dictionary
     """
     from kiro_gateway.metrics import metrics
-    return metrics.get_metrics()
+    return _snapshot_response(request, "metrics", metrics.get_metrics)
 
 
 @router.get("/api/metrics")
-async def get_api_metrics():
+async def get_api_metrics(request: Request):
     """
     Get application metrics in Deno-compatible format for dashboard.
 
@@ -645,7 +730,7 @@ async def get_api_metrics():
         Deno-compatible metrics data dictionary
     """
     from kiro_gateway.metrics import metrics
-    return metrics.get_deno_compatible_metrics()
+    return _snapshot_response(request, "dashboard", metrics.get_deno_compatible_metrics)
 
 
 # ============================================================================
@@ -859,7 +944,7 @@ async def get_kiro_account_info(access_token: str, idp: str = "BuilderId") -> di
 
 
 @router.get("/metrics/prometheus")
-async def get_prometheus_metrics():
+async def get_prometheus_metrics(request: Request):
     """
     Get application metrics in Prometheus format.
 
@@ -867,9 +952,8 @@ async def get_prometheus_metrics():
         Prometheus text format metrics
     """
     from kiro_gateway.metrics import metrics
-    return Response(
-        content=metrics.export_prometheus(),
-        media_type="text/plain; charset=utf-8"
+    return _snapshot_response(
+        request, "prometheus", metrics.export_prometheus, media_type="text/plain; charset=utf-8"
     )
 
 
@@ -922,8 +1006,8 @@ async def get_models(
 @rate_limit_decorator()
 async def chat_completions(
     request: Request,
-    request_data: ChatCompletionRequest,
-    auth_manager: KiroAuthManager = Depends(verify_api_key)
+    auth_manager: KiroAuthManager = Depends(verify_api_key),
+    request_data: ChatCompletionRequest = _chat_completion_body
 ):
     """
     Chat completions endpoint - OpenAI API compatible.
@@ -966,8 +1050,8 @@ async def chat_completions(
 @rate_limit_decorator()
 async def anthropic_messages(
     request: Request,
-    request_data: AnthropicMessagesRequest,
-    auth_manager: KiroAuthManager = Depends(verify_anthropic_api_key)
+    auth_manager: KiroAuthManager = Depends(verify_anthropic_api_key),
+    request_data: AnthropicMessagesRequest = _anthropic_messages_body
 ):
     """
     Anthropic Messages API endpoint - Anthropic SDK compatible.
@@ -1016,10 +1100,25 @@ async def anthropic_messages(
 # Count Tokens API Endpoint (/v1/messages/count_tokens)
 # ==================================================================================================
 
+def _system_prompt_texts(system) -> list[str]:
+    """Extract the texts of an Anthropic system prompt (string or list of blocks)."""
+    if not system:
+        return []
+    if isinstance(system, str):
+        return [system]
+    texts = []
+    for item in system:
+        if hasattr(item, 'text'):
+            texts.append(item.text)
+        elif isinstance(item, dict) and 'text' in item:
+            texts.append(item['text'])
+    return texts
+
+
 @router.post("/v1/messages/count_tokens")
 async def count_tokens_endpoint(
     request: Request,
-    request_data: AnthropicMessagesRequest,
+    request_data: AnthropicMessagesRequest = _anthropic_messages_body,
 ):
     """
     Count tokens in a messages request without making an API call.
@@ -1036,38 +1135,86 @@ async def count_tokens_endpoint(
     """
     logger.info(f"[{get_timestamp()}] 收到 /v1/messages/count_tokens 请求")
     
-    # Count message tokens
+    # 各部分先不加修正系数计数，校准后的系数统一作用于总和
+    messages_list = []
     messages_tokens = 0
     if request_data.messages:
         # Convert to list of dicts for tokenizer
         messages_list = [msg.model_dump() if hasattr(msg, 'model_dump') else msg for msg in request_data.messages]
-        messages_tokens = count_message_tokens(messages_list)
+        messages_tokens = await count_message_tokens_async(messages_list, apply_claude_correction=False)
     
     # Count system prompt tokens
-    system_tokens = 0
-    if request_data.system:
-        if isinstance(request_data.system, str):
-            system_tokens = count_tokens(request_data.system)
-        elif isinstance(request_data.system, list):
-            for item in request_data.system:
-                if hasattr(item, 'text'):
-                    system_tokens += count_tokens(item.text)
-                elif isinstance(item, dict) and 'text' in item:
-                    system_tokens += count_tokens(item['text'])
+    system_texts = _system_prompt_texts(request_data.system)
+    system_tokens = await count_texts_async(system_texts) if system_texts else 0
     
     # Count tools tokens
+    tools_list = None
     tools_tokens = 0
     if request_data.tools:
         tools_list = [tool.model_dump() if hasattr(tool, 'model_dump') else tool for tool in request_data.tools]
-        tools_tokens = count_tools_tokens(tools_list)
+        tools_tokens = await count_tools_tokens_async(tools_list, apply_claude_correction=False)
     
-    total_tokens = messages_tokens + system_tokens + tools_tokens
+    # 按模型和语言使用在线校准的修正系数（样本不足时为默认 1.15）
+    _, texts = request_segments(messages_list, tools_list)
+    factor = token_calibrator.factor(request_data.model, language_bucket(texts + system_texts))
+    total_tokens = int((messages_tokens + system_tokens + tools_tokens) * factor)
     
-    logger.info(f"[{get_timestamp()}] Token 统计: messages={messages_tokens}, system={system_tokens}, tools={tools_tokens}, total={total_tokens}")
+    logger.info(
+        f"[{get_timestamp()}] Token 统计: messages={messages_tokens}, system={system_tokens}, "
+        f"tools={tools_tokens}, factor={factor:.3f}, total={total_tokens}"
+    )
     
     return JSONResponse(content={"input_tokens": total_tokens})
 
 
+@router.post("/v1/messages/count_tokens/batch")
+@rate_limit_decorator()
+async def count_tokens_batch_endpoint(
+    request: Request,
+    _auth: KiroAuthManager = Depends(verify_anthropic_api_key),
+    request_data: AnthropicCountTokensBatchRequest = _count_tokens_batch_body,
+):
+    """
+    Count tokens for several messages requests in one call.
+
+    Segments shared between requests (system prompts, tool definitions,
+    common history) are tokenized once per batch; large texts are encoded
+    together in the tokenizer thread pool. Requires the same API key as
+    /v1/messages, since one call can carry a lot of tokenizer work.
+
+    Args:
+        request: FastAPI Request
+        _auth: Verified API key (same as /v1/messages)
+        request_data: Requests to count (Anthropic format, max_tokens not required)
+
+    Returns:
+        JSONResponse with {"results": [{"input_tokens": N}, ...]} in request order
+    """
+    items = []
+    unique_texts: dict[str, int] = {}
+    for item in request_data.requests:
+        fixed_tokens, texts = request_segments(item.messages, item.tools)
+        texts.extend(_system_prompt_texts(item.system))
+        items.append((item.model, fixed_tokens, texts))
+        for text in texts:
+            if text and text not in unique_texts:
+                unique_texts[text] = len(unique_texts)
+
+    counts = await count_text_list_async(list(unique_texts))
+
+    results = []
+    for model, fixed_tokens, texts in items:
+        base_tokens = fixed_tokens + sum(counts[unique_texts[text]] for text in texts if text)
+        factor = token_calibrator.factor(model, language_bucket(texts))
+        results.append({"input_tokens": int(base_tokens * factor)})
+
+    logger.info(
+        f"[{get_timestamp()}] 批量 Token 统计: {len(results)} 个请求, "
+        f"{len(unique_texts)} 个不重复文本段, total={sum(r['input_tokens'] for r in results)}"
+    )
+    return JSONResponse(content={"results": results})
+
+
 # --- Rate limit error handler ---
 async def rate_limit_handler(request: Request, exc: RateLimitExceeded):
     """Handle rate limit errors."""
@@ -1229,11 +1376,29 @@ def _stream_file(path: Path, chunk_size: int = 1024 * 1024):
 
 
 def _replace_db_file(target: Path, new_file: Path) -> None:
+    from kiro_gateway.database import user_db
+    from kiro_gateway.metrics import metrics
+    db_paths = _get_db_paths()
+    if target == db_paths["users"]:
+        # 等待写批次和借出的连接结束并 checkpoint WAL，替换期间连接池不再打开连接
+        with user_db.exclusive():
+            _swap_db_file(target, new_file)
+        return
+    if target == db_paths["metrics"]:
+        # 统计写入线程在下一批次重新打开连接
+        metrics.reset_writer()
+    _swap_db_file(target, new_file)
+
+
+def _swap_db_file(target: Path, new_file: Path) -> None:
     target.parent.mkdir(parents=True, exist_ok=True)
     if target.exists():
         timestamp = datetime.now().strftime("%Y%m%d%H%M%S")
         backup = target.with_name(f"{target.stem}.bak-{timestamp}{target.suffix}")
         shutil.copy2(target, backup)
+    # 旧库残留的 WAL/SHM 文件不能套用到新库上
+    for suffix in ("-wal", "-shm"):
+        Path(f"{target}{suffix}").unlink(missing_ok=True)
     shutil.move(str(new_file), str(target))
 
 
@@ -1311,8 +1476,101 @@ async def admin_get_stats(request: Request):
     session = request.cookies.get("admin_session")
     if not verify_admin_session(session):
         return JSONResponse(status_code=401, content={"error": "未授权"})
+    from kiro_gateway.database import user_db
     from kiro_gateway.metrics import metrics
 
+    return _snapshot_response(request, "admin_stats", lambda: _build_admin_stats(metrics, user_db))
+
+
+@router.get("/admin/api/loop-monitor", include_in_schema=False)
+async def admin_get_loop_monitor(request: Request):
+    """Get event loop lag and recent blocking calls."""
+    session = request.cookies.get("admin_session")
+    if not verify_admin_session(session):
+        return JSONResponse(status_code=401, content={"error": "未授权"})
+    from kiro_gateway.loop_monitor import loop_monitor
+    from kiro_gateway.metrics import metrics
+
+    return {**metrics.get_event_loop_stats(), **loop_monitor.get_stats()}
+
+
+@router.post("/admin/api/profile/cpu", include_in_schema=False)
+async def admin_profile_cpu(
+    request: Request,
+    duration: float = Form(10.0),
+    interval_ms: float = Form(10.0),
+    _csrf: None = Depends(require_same_origin)
+):
+    """Sample all thread stacks for a time-boxed window and download collapsed stacks."""
+    session = request.cookies.get("admin_session")
+    if not verify_admin_session(session):
+        return JSONResponse(status_code=401, content={"error": "未授权"})
+    from kiro_gateway.profiler import ProfilerBusy, profiler
+
+    try:
+        result = await asyncio.to_thread(profiler.profile_cpu, duration, interval_ms / 1000)
+    except ProfilerBusy:
+        return JSONResponse(status_code=409, content={"error": "已有性能分析任务在运行"})
+
+    timestamp = datetime.now().strftime("%Y%m%d-%H%M%S")
+    return Response(
+        content=result["folded"],
+        media_type="text/plain; charset=utf-8",
+        headers={
+            "Content-Disposition": f'attachment; filename="kirogate-cpu-{timestamp}.folded"',
+            "X-Profile-Samples": str(result["samples"]),
+            "X-Profile-Duration": str(result["duration"]),
+            "X-Profile-Overhead": str(result["overhead"]),
+        }
+    )
+
+
+@router.post("/admin/api/profile/memory", include_in_schema=False)
+async def admin_profile_memory(
+    request: Request,
+    duration: float = Form(10.0),
+    top: int = Form(50),
+    frames: int = Form(10),
+    _csrf: None = Depends(require_same_origin)
+):
+    """Diff tracemalloc snapshots over a time-boxed window and download the report."""
+    session = request.cookies.get("admin_session")
+    if not verify_admin_session(session):
+        return JSONResponse(status_code=401, content={"error": "未授权"})
+    from kiro_gateway.profiler import ProfilerBusy, profiler
+
+    try:
+        result = await asyncio.to_thread(profiler.profile_memory, duration, top, frames)
+    except ProfilerBusy:
+        return JSONResponse(status_code=409, content={"error": "已有性能分析任务在运行"})
+
+    timestamp = datetime.now().strftime("%Y%m%d-%H%M%S")
+    return Response(
+        content=result["report"],
+        media_type="text/plain; charset=utf-8",
+        headers={
+            "Content-Disposition": f'attachment; filename="kirogate-memory-{timestamp}.txt"',
+            "X-Profile-Duration": str(result["duration"]),
+        }
+    )
+
+
+@router.post("/admin/api/profile/cancel", include_in_schema=False)
+async def admin_profile_cancel(
+    request: Request,
+    _csrf: None = Depends(require_same_origin)
+):
+    """Stop the running profiling session early."""
+    session = request.cookies.get("admin_session")
+    if not verify_admin_session(session):
+        return JSONResponse(status_code=401, content={"error": "未授权"})
+    from kiro_gateway.profiler import profiler
+
+    return {"success": profiler.cancel()}
+
+
+def _build_admin_stats(metrics, user_db) -> dict:
+    """Build the /admin/api/stats payload."""
     stats = metrics.get_admin_stats()
     # Add cached tokens count
     stats["cached_tokens"] = auth_cache.size
@@ -1330,6 +1588,8 @@ async def admin_get_stats(request: Request):
         "cached_tokens": stats.get("cached_tokens", 0),
         "cache_size": stats.get("cacheSize", 0),
         "avg_latency": stats.get("avgLatency", 0),
+        "api_key_cache": user_db.api_key_cache.get_stats(),
+        "session_cache": user_db.session_cache.get_stats(),
     }
 
 
@@ -1360,6 +1620,7 @@ async def admin_get_ip_stats(
         {
             "ip": item.get("ip"),
             "count": item.get("count", 0),
+            "error": item.get("error", 0),
             "last_seen": item.get("last_seen", item.get("lastSeen", 0)),
         }
         for item in items
@@ -1414,12 +1675,15 @@ async def admin_ban_ip(
     reason: str = Form(""),
     _csrf: None = Depends(require_same_origin)
 ):
-    """Ban an IP address."""
+    """Ban an IP address or CIDR range (e.g. 203.0.113.0/24, 2001:db8::/64)."""
     session = request.cookies.get("admin_session")
     if not verify_admin_session(session):
         return JSONResponse(status_code=401, content={"error": "未授权"})
+    from kiro_gateway.ip_blacklist import normalize_ip_rule
     from kiro_gateway.metrics import metrics
-    success = metrics.ban_ip(ip, reason)
+    if not normalize_ip_rule(ip):
+        return JSONResponse(status_code=400, content={"error": "无效的 IP 地址或 CIDR 网段"})
+    success = await metrics.ban_ip(ip, reason)
     return {"success": success}
 
 
@@ -1429,12 +1693,12 @@ async def admin_unban_ip(
     ip: str = Form(...),
     _csrf: None = Depends(require_same_origin)
 ):
-    """Unban an IP address."""
+    """Unban an IP address or CIDR range."""
     session = request.cookies.get("admin_session")
     if not verify_admin_session(session):
         return JSONResponse(status_code=401, content={"error": "未授权"})
     from kiro_gateway.metrics import metrics
-    success = metrics.unban_ip(ip)
+    success = await metrics.unban_ip(ip)
     return {"success": success}
 
 
@@ -1449,7 +1713,7 @@ async def admin_toggle_site(
     if not verify_admin_session(session):
         return JSONResponse(status_code=401, content={"error": "未授权"})
     from kiro_gateway.metrics import metrics
-    success = metrics.set_site_enabled(enabled)
+    success = await metrics.set_site_enabled(enabled)
     return {"success": success, "enabled": enabled}
 
 
@@ -1464,7 +1728,7 @@ async def admin_toggle_self_use(
     if not verify_admin_session(session):
         return JSONResponse(status_code=401, content={"error": "未授权"})
     from kiro_gateway.metrics import metrics
-    success = metrics.set_self_use_enabled(enabled)
+    success = await metrics.set_self_use_enabled(enabled)
     return {"success": success, "enabled": enabled}
 
 
@@ -1479,7 +1743,7 @@ async def admin_toggle_approval(
     if not verify_admin_session(session):
         return JSONResponse(status_code=401, content={"error": "未授权"})
     from kiro_gateway.metrics import metrics
-    success = metrics.set_require_approval(enabled)
+    success = await metrics.set_require_approval(enabled)
     return {"success": success, "enabled": enabled}
 
 @router.get("/admin/api/proxy-key", include_in_schema=False)
@@ -1506,7 +1770,7 @@ async def admin_set_proxy_key(
     if not proxy_api_key:
         return JSONResponse(status_code=400, content={"error": "API Key 不能为空"})
     from kiro_gateway.metrics import metrics
-    success = metrics.set_proxy_api_key(proxy_api_key)
+    success = await metrics.set_proxy_api_key(proxy_api_key)
     if not success:
         return JSONResponse(status_code=500, content={"error": "更新失败"})
     return {"success": True}
@@ -1968,14 +2232,14 @@ async def admin_create_import_key(
     if not verify_admin_session(session):
         return JSONResponse(status_code=401, content={"error": "未授权"})
 
-    from kiro_gateway.database import user_db
+    from kiro_gateway.database import user_db, user_db_executor
     user = user_db.get_user(user_id)
     if not user:
         return JSONResponse(status_code=404, content={"error": "用户不存在"})
     if user.is_banned:
         return JSONResponse(status_code=403, content={"error": "用户已被封禁"})
 
-    plain_key, import_key = user_db.generate_import_key(user_id, name or None)
+    plain_key, import_key = await user_db_executor.run(user_db.generate_import_key, user_id, name or None)
     return {
         "success": True,
         "key": plain_key,
@@ -1996,8 +2260,8 @@ async def admin_delete_import_key(
     if not verify_admin_session(session):
         return JSONResponse(status_code=401, content={"error": "未授权"})
 
-    from kiro_gateway.database import user_db
-    success = user_db.delete_import_key(key_id)
+    from kiro_gateway.database import user_db, user_db_executor
+    success = await user_db_executor.run(user_db.delete_import_key, key_id)
     return {"success": success}
 
 
@@ -2027,10 +2291,11 @@ async def admin_get_users(
     trust_level: int | None = Query(None),
     sort_field: str = Query("created_at"),
     sort_order: str = Query("desc"),
+    cursor: str | None = Query(None),
     include_details: bool = Query(True),
     details_limit: int | None = Query(None)
 ):
-    """Get all registered users."""
+    """Get all registered users (cursor = pagination.next_cursor of the previous page)."""
     session = request.cookies.get("admin_session")
     if not verify_admin_session(session):
         return JSONResponse(status_code=401, content={"error": "未授权"})
@@ -2038,17 +2303,21 @@ async def admin_get_users(
     from kiro_gateway.database import user_db
     search = search.strip()
     offset = (page - 1) * page_size
-    users = user_db.get_all_users(
-        limit=page_size,
-        offset=offset,
-        search=search,
-        is_admin=is_admin,
-        is_banned=is_banned,
-        approval_status=approval_status,
-        trust_level=trust_level,
-        sort_field=sort_field,
-        sort_order=sort_order
-    )
+    try:
+        users, next_cursor = user_db.get_users_page(
+            limit=page_size,
+            offset=offset,
+            cursor=cursor,
+            search=search,
+            is_admin=is_admin,
+            is_banned=is_banned,
+            approval_status=approval_status,
+            trust_level=trust_level,
+            sort_field=sort_field,
+            sort_order=sort_order
+        )
+    except ValueError as e:
+        return JSONResponse(status_code=400, content={"error": str(e)})
     total = user_db.get_user_count(
         search=search,
         is_admin=is_admin,
@@ -2057,6 +2326,10 @@ async def admin_get_users(
         trust_level=trust_level
     )
 
+    user_ids = [u.id for u in users]
+    token_counts = user_db.get_user_token_counts(user_ids)
+    api_key_counts = user_db.get_user_api_key_counts(user_ids)
+
     def _serialize_user(user):
         payload = {
             "id": user.id,
@@ -2071,8 +2344,8 @@ async def admin_get_users(
             "approval_status": user.approval_status,
             "created_at": user.created_at,
             "last_login": user.last_login,
-            "token_count": user_db.get_token_count(user.id)["total"],
-            "api_key_count": user_db.get_api_key_count(user.id),
+            "token_count": token_counts.get(user.id, 0),
+            "api_key_count": api_key_counts.get(user.id, 0),
         }
         if include_details:
             limit = details_limit if details_limit and details_limit > 0 else None
@@ -2109,7 +2382,7 @@ async def admin_get_users(
 
     return {
         "users": [_serialize_user(u) for u in users],
-        "pagination": {"page": page, "page_size": page_size, "total": total}
+        "pagination": {"page": page, "page_size": page_size, "total": total, "next_cursor": next_cursor}
     }
 
 
@@ -2124,8 +2397,8 @@ async def admin_ban_user(
     if not verify_admin_session(session):
         return JSONResponse(status_code=401, content={"error": "未授权"})
 
-    from kiro_gateway.database import user_db
-    success = user_db.set_user_banned(user_id, True)
+    from kiro_gateway.database import user_db, user_db_executor
+    success = await user_db_executor.run(user_db.set_user_banned, user_id, True)
     return {"success": success}
 
 
@@ -2140,8 +2413,8 @@ async def admin_unban_user(
     if not verify_admin_session(session):
         return JSONResponse(status_code=401, content={"error": "未授权"})
 
-    from kiro_gateway.database import user_db
-    success = user_db.set_user_banned(user_id, False)
+    from kiro_gateway.database import user_db, user_db_executor
+    success = await user_db_executor.run(user_db.set_user_banned, user_id, False)
     return {"success": success}
 
 
@@ -2155,8 +2428,8 @@ async def admin_approve_user(
     session = request.cookies.get("admin_session")
     if not verify_admin_session(session):
         return JSONResponse(status_code=401, content={"error": "未授权"})
-    from kiro_gateway.database import user_db
-    user_db.set_user_approval_status(user_id, "approved")
+    from kiro_gateway.database import user_db, user_db_executor
+    await user_db_executor.run(user_db.set_user_approval_status, user_id, "approved")
     return {"success": True}
 
 
@@ -2170,8 +2443,8 @@ async def admin_reject_user(
     session = request.cookies.get("admin_session")
     if not verify_admin_session(session):
         return JSONResponse(status_code=401, content={"error": "未授权"})
-    from kiro_gateway.database import user_db
-    user_db.set_user_approval_status(user_id, "rejected")
+    from kiro_gateway.database import user_db, user_db_executor
+    await user_db_executor.run(user_db.set_user_approval_status, user_id, "rejected")
     return {"success": True}
 
 
@@ -2185,7 +2458,8 @@ async def admin_get_donated_tokens(
     status: str | None = Query(None),
     user_id: int | None = Query(None),
     sort_field: str = Query("created_at"),
-    sort_order: str = Query("desc")
+    sort_order: str = Query("desc"),
+    cursor: str | None = Query(None)
 ):
     """Get all donated tokens with statistics."""
     session = request.cookies.get("admin_session")
@@ -2194,16 +2468,20 @@ async def admin_get_donated_tokens(
 
     from kiro_gateway.database import user_db
     offset = (page - 1) * page_size
-    tokens = user_db.get_all_tokens_with_users(
-        limit=page_size,
-        offset=offset,
-        search=search,
-        visibility=visibility,
-        status=status,
-        user_id=user_id,
-        sort_field=sort_field,
-        sort_order=sort_order
-    )
+    try:
+        tokens, next_cursor = user_db.get_tokens_page(
+            limit=page_size,
+            offset=offset,
+            cursor=cursor,
+            search=search,
+            visibility=visibility,
+            status=status,
+            user_id=user_id,
+            sort_field=sort_field,
+            sort_order=sort_order
+        )
+    except ValueError as e:
+        return JSONResponse(status_code=400, content={"error": str(e)})
     total_filtered = user_db.get_tokens_count(
         search=search,
         visibility=visibility,
@@ -2219,7 +2497,7 @@ async def admin_get_donated_tokens(
         "public": token_counts["public"],
         "avg_success_rate": avg_success * 100,
         "tokens": tokens,
-        "pagination": {"page": page, "page_size": page_size, "total": total_filtered}
+        "pagination": {"page": page, "page_size": page_size, "total": total_filtered, "next_cursor": next_cursor}
     }
 
 
@@ -2239,8 +2517,8 @@ async def admin_toggle_token_visibility(
     if metrics.is_self_use_enabled() and visibility == "public":
         return JSONResponse(status_code=403, content={"error": "自用模式下禁止公开 Token"})
 
-    from kiro_gateway.database import user_db
-    success = user_db.set_token_visibility(token_id, visibility)
+    from kiro_gateway.database import user_db, user_db_executor
+    success = await user_db_executor.run(user_db.set_token_visibility, token_id, visibility)
     return {"success": success}
 
 
@@ -2255,8 +2533,8 @@ async def admin_delete_donated_token(
     if not verify_admin_session(session):
         return JSONResponse(status_code=401, content={"error": "未授权"})
 
-    from kiro_gateway.database import user_db
-    success = user_db.admin_delete_token(token_id)
+    from kiro_gateway.database import user_db, user_db_executor
+    success = await user_db_executor.run(user_db.admin_delete_token, token_id)
     return {"success": success}
 
 
@@ -2293,18 +2571,18 @@ async def admin_update_announcement(
     content = content.strip()
     active = str(is_active).lower() in ("1", "true", "on", "yes")
     allow_guest_flag = str(allow_guest).lower() in ("1", "true", "on", "yes")
-    from kiro_gateway.database import user_db
+    from kiro_gateway.database import user_db, user_db_executor
 
     if active:
         if not content:
             return JSONResponse(status_code=400, content={"error": "公告内容不能为空"})
-        user_db.deactivate_announcements()
-        announcement_id = user_db.create_announcement(content, True, allow_guest_flag)
+        await user_db_executor.run(user_db.deactivate_announcements)
+        announcement_id = await user_db_executor.run(user_db.create_announcement, content, True, allow_guest_flag)
         return {"success": True, "id": announcement_id}
 
-    user_db.deactivate_announcements()
+    await user_db_executor.run(user_db.deactivate_announcements)
     if content:
-        announcement_id = user_db.create_announcement(content, False, allow_guest_flag)
+        announcement_id = await user_db_executor.run(user_db.create_announcement, content, False, allow_guest_flag)
         return {"success": True, "id": announcement_id, "active": False}
     return {"success": True, "active": False}
 
@@ -2377,10 +2655,10 @@ async def oauth2_logout(request: Request):
     from kiro_gateway.user_manager import user_manager
 
     # Get current user before clearing cookie
-    user = get_current_user(request)
+    user = await get_current_user(request)
     if user:
         # Increment session version to invalidate all existing tokens
-        user_manager.logout(user.id)
+        await user_manager.logout(user.id)
 
     response = RedirectResponse(url="/", status_code=303)
     response.delete_cookie(key="user_session")
@@ -2392,7 +2670,7 @@ async def oauth2_logout(request: Request):
 @router.get("/login", response_class=HTMLResponse, include_in_schema=False)
 async def login_page(request: Request):
     """Login selection page with multiple OAuth2 providers."""
-    user = get_current_user(request)
+    user = await get_current_user(request)
     if user:
         redirect_url = f"{_request_origin(request)}/user"
         return RedirectResponse(url=redirect_url, status_code=303)
@@ -2403,7 +2681,7 @@ async def login_page(request: Request):
 @router.get("/register", response_class=HTMLResponse, include_in_schema=False)
 async def register_page(request: Request):
     """Register page."""
-    user = get_current_user(request)
+    user = await get_current_user(request)
     if user:
         redirect_url = f"{_request_origin(request)}/user"
         return RedirectResponse(url=redirect_url, status_code=303)
@@ -2414,7 +2692,7 @@ async def register_page(request: Request):
 async def password_login(request: Request, email: str = Form(...), password: str = Form(...)):
     """Handle email/password login."""
     from kiro_gateway.user_manager import user_manager
-    user, result = user_manager.login_with_email(email=email, password=password)
+    user, result = await user_manager.login_with_email(email=email, password=password)
     if not user:
         from kiro_gateway.pages import render_login_page
         return HTMLResponse(content=render_login_page(error=result or "登录失败", email=email))
@@ -2439,7 +2717,7 @@ async def password_register(
 ):
     """Handle email/password registration."""
     from kiro_gateway.user_manager import user_manager
-    user, result = user_manager.register_with_email(email=email, password=password, username=username)
+    user, result = await user_manager.register_with_email(email=email, password=password, username=username)
     if not user:
         from kiro_gateway.pages import render_register_page
         info = result if result == "注册成功，等待审核" else ""
@@ -2521,17 +2799,17 @@ async def github_oauth2_callback(request: Request, code: str = None, state: str
 
 # ==================== User Routes (Hidden from Swagger) ====================
 
-def get_current_user(request: Request):
+async def get_current_user(request: Request):
     """Get current logged-in user from session."""
     from kiro_gateway.user_manager import user_manager
     session_token = request.cookies.get("user_session")
-    return user_manager.get_current_user(session_token) if session_token else None
+    return await user_manager.get_current_user(session_token) if session_token else None
 
 
 @router.get("/user", response_class=HTMLResponse, include_in_schema=False)
 async def user_page(request: Request):
     """User dashboard page."""
-    user = get_current_user(request)
+    user = await get_current_user(request)
     if not user:
         return RedirectResponse(url="/login", status_code=303)
     from kiro_gateway.pages import render_user_page
@@ -2541,7 +2819,7 @@ async def user_page(request: Request):
 @router.get("/user/api/profile", include_in_schema=False)
 async def user_get_profile(request: Request):
     """Get current user profile."""
-    user = get_current_user(request)
+    user = await get_current_user(request)
     if not user:
         return JSONResponse(status_code=401, content={"error": "未登录"})
     from kiro_gateway.database import user_db
@@ -2568,7 +2846,7 @@ async def user_get_announcement(request: Request):
     announcement = user_db.get_active_announcement()
     if not announcement:
         return {"active": False}
-    user = get_current_user(request)
+    user = await get_current_user(request)
     allow_guest = bool(announcement.get("allow_guest"))
     if not user:
         if not allow_guest:
@@ -2605,14 +2883,14 @@ async def user_mark_announcement_read(
     _csrf: None = Depends(require_same_origin)
 ):
     """Mark announcement as read."""
-    user = get_current_user(request)
+    user = await get_current_user(request)
     if not user:
         return JSONResponse(status_code=401, content={"error": "未登录"})
-    from kiro_gateway.database import user_db
+    from kiro_gateway.database import user_db, user_db_executor
     active = user_db.get_active_announcement()
     if not active or active["id"] != announcement_id:
         return JSONResponse(status_code=400, content={"error": "公告已更新，请刷新后再试"})
-    user_db.mark_announcement_read(user.id, announcement_id)
+    await user_db_executor.run(user_db.mark_announcement_read, user.id, announcement_id)
     return {"success": True}
 
 
@@ -2623,14 +2901,14 @@ async def user_mark_announcement_dismissed(
     _csrf: None = Depends(require_same_origin)
 ):
     """Dismiss announcement for current user."""
-    user = get_current_user(request)
+    user = await get_current_user(request)
     if not user:
         return JSONResponse(status_code=401, content={"error": "未登录"})
-    from kiro_gateway.database import user_db
+    from kiro_gateway.database import user_db, user_db_executor
     active = user_db.get_active_announcement()
     if not active or active["id"] != announcement_id:
         return JSONResponse(status_code=400, content={"error": "公告已更新，请刷新后再试"})
-    user_db.mark_announcement_dismissed(user.id, announcement_id)
+    await user_db_executor.run(user_db.mark_announcement_dismissed, user.id, announcement_id)
     return {"success": True}
 
 @router.get("/user/api/tokens", include_in_schema=False)
@@ -2645,7 +2923,7 @@ async def user_get_tokens(
     sort_order: str = Query("desc")
 ):
     """Get user's tokens."""
-    user = get_current_user(request)
+    user = await get_current_user(request)
     if not user:
         return JSONResponse(status_code=401, content={"error": "未登录"})
     from kiro_gateway.database import user_db
@@ -2692,16 +2970,23 @@ async def user_get_tokens(
 
 
 @router.get("/user/api/public-tokens", include_in_schema=False)
-async def user_get_public_tokens(request: Request):
-    """Get public tokens with contributor info for user page."""
-    user = get_current_user(request)
+async def user_get_public_tokens(
+    request: Request,
+    limit: int | None = Query(None, ge=1, le=500),
+    cursor: str | None = Query(None)
+):
+    """Get public tokens with contributor info for user page (optional keyset paging)."""
+    user = await get_current_user(request)
     if not user:
         return JSONResponse(status_code=401, content={"error": "未登录"})
     from kiro_gateway.metrics import metrics
     if metrics.is_self_use_enabled():
         return JSONResponse(status_code=403, content={"error": "自用模式下不开放公开 Token 池"})
     from kiro_gateway.database import user_db
-    tokens = user_db.get_public_tokens_with_users()
+    try:
+        tokens, next_cursor = user_db.get_public_tokens_with_users(limit=limit, cursor=cursor)
+    except ValueError as e:
+        return JSONResponse(status_code=400, content={"error": str(e)})
     avg_rate = sum(t["success_rate"] for t in tokens) / len(tokens) if tokens else 0
     return {
         "tokens": [
@@ -2717,6 +3002,7 @@ async def user_get_public_tokens(request: Request):
         ],
         "count": len(tokens),
         "avg_success_rate": round(avg_rate * 100, 1),
+        "next_cursor": next_cursor,
     }
 
 
@@ -2985,7 +3271,7 @@ async def _process_import_payload(
     if len(credentials) > IMPORT_TOKEN_MAX_COUNT:
         return {"error": f"导入数量过多（{len(credentials)}），请拆分后导入"}, 400
 
-    from kiro_gateway.database import user_db
+    from kiro_gateway.database import user_db, user_db_executor
 
     pending_credentials: list[TokenCredential] = []
     skipped = 0
@@ -3030,7 +3316,8 @@ async def _process_import_payload(
                 error_samples.append(f"{_mask_token(cred.refresh_token)}: {error}")
             continue
 
-        success, message = user_db.donate_token(
+        success, message = await user_db_executor.run(
+            user_db.donate_token,
             user_id=user_id,
             refresh_token=cred.refresh_token,
             visibility=visibility,
@@ -3087,7 +3374,7 @@ async def user_donate_token(
     _csrf: None = Depends(require_same_origin)
 ):
     """Donate a new token."""
-    user = get_current_user(request)
+    user = await get_current_user(request)
     if not user:
         return JSONResponse(status_code=401, content={"error": "未登录"})
 
@@ -3107,7 +3394,7 @@ async def user_donate_token(
     if auth_type == "idc" and (not client_id or not client_secret):
         return JSONResponse(status_code=400, content={"error": "IDC 模式需要提供 Client ID 和 Client Secret"})
 
-    from kiro_gateway.database import user_db
+    from kiro_gateway.database import user_db, user_db_executor
 
     # Validate token before saving
     from kiro_gateway.auth import KiroAuthManager
@@ -3127,7 +3414,8 @@ async def user_donate_token(
         return {"success": False, "message": f"Token 验证失败：{str(e)}"}
 
     # Save token
-    success, message = user_db.donate_token(
+    success, message = await user_db_executor.run(
+        user_db.donate_token,
         user_id=user.id,
         refresh_token=refresh_token,
         visibility=visibility,
@@ -3153,7 +3441,7 @@ async def user_import_tokens(
     _csrf: None = Depends(require_same_origin)
 ):
     """Import refresh tokens from a JSON file."""
-    user = get_current_user(request)
+    user = await get_current_user(request)
     if not user:
         return JSONResponse(status_code=401, content={"error": "未登录"})
 
@@ -3203,7 +3491,7 @@ async def api_import_tokens(
     if not import_key:
         return JSONResponse(status_code=401, content={"error": "Import Key 缺失"})
 
-    from kiro_gateway.database import user_db
+    from kiro_gateway.database import user_db, user_db_executor
     result = user_db.verify_import_key(import_key)
     if not result:
         return JSONResponse(status_code=401, content={"error": "Import Key 无效"})
@@ -3238,7 +3526,7 @@ async def api_import_tokens(
     )
     if status != 200:
         return JSONResponse(status_code=status, content=result)
-    user_db.record_import_key_usage(import_key_obj.id)
+    await user_db_executor.run(user_db.record_import_key_usage, import_key_obj.id)
     return result
 
 
@@ -3250,7 +3538,7 @@ async def user_update_token(
     _csrf: None = Depends(require_same_origin)
 ):
     """Update token visibility."""
-    user = get_current_user(request)
+    user = await get_current_user(request)
     if not user:
         return JSONResponse(status_code=401, content={"error": "未登录"})
 
@@ -3258,14 +3546,14 @@ async def user_update_token(
     if metrics.is_self_use_enabled() and visibility == "public":
         return JSONResponse(status_code=403, content={"error": "自用模式下禁止公开 Token"})
 
-    from kiro_gateway.database import user_db
+    from kiro_gateway.database import user_db, user_db_executor
 
     # Verify ownership
     token = user_db.get_token_by_id(token_id)
     if not token or token.user_id != user.id:
         return JSONResponse(status_code=404, content={"error": "Token 不存在"})
 
-    success = user_db.set_token_visibility(token_id, visibility)
+    success = await user_db_executor.run(user_db.set_token_visibility, token_id, visibility)
     return {"success": success}
 
 
@@ -3276,12 +3564,12 @@ async def user_delete_token(
     _csrf: None = Depends(require_same_origin)
 ):
     """Delete a token."""
-    user = get_current_user(request)
+    user = await get_current_user(request)
     if not user:
         return JSONResponse(status_code=401, content={"error": "未登录"})
 
-    from kiro_gateway.database import user_db
-    success = user_db.delete_token(token_id, user.id)
+    from kiro_gateway.database import user_db, user_db_executor
+    success = await user_db_executor.run(user_db.delete_token, token_id, user.id)
     return {"success": success}
 
 
@@ -3291,11 +3579,11 @@ async def user_get_token_account_info(
     token_id: int,
 ):
     """获取指定 Token 的账号信息（订阅、额度等）"""
-    user = get_current_user(request)
+    user = await get_current_user(request)
     if not user:
         return JSONResponse(status_code=401, content={"error": "未登录"})
 
-    from kiro_gateway.database import user_db
+    from kiro_gateway.database import user_db, user_db_executor
 
     # 验证 Token 所有权
     token = user_db.get_token_by_id(token_id)
@@ -3326,7 +3614,8 @@ async def user_get_token_account_info(
     try:
         account_info = await get_kiro_account_info(access_token)
         # 更新缓存
-        user_db.update_token_account_info(
+        await user_db_executor.run(
+            user_db.update_token_account_info,
             token_id,
             email=account_info.get("email"),
             status=account_info.get("status"),
@@ -3352,7 +3641,7 @@ async def user_get_keys(
     sort_order: str = Query("desc")
 ):
     """Get user's API keys."""
-    user = get_current_user(request)
+    user = await get_current_user(request)
     if not user:
         return JSONResponse(status_code=401, content={"error": "未登录"})
     from kiro_gateway.database import user_db
@@ -3392,11 +3681,11 @@ async def user_create_key(
     _csrf: None = Depends(require_same_origin)
 ):
     """Generate a new API key."""
-    user = get_current_user(request)
+    user = await get_current_user(request)
     if not user:
         return JSONResponse(status_code=401, content={"error": "未登录"})
 
-    from kiro_gateway.database import user_db
+    from kiro_gateway.database import user_db, user_db_executor
     from kiro_gateway.metrics import metrics
 
     # Check if user has any tokens (for info purposes only, not blocking)
@@ -3408,7 +3697,7 @@ async def user_create_key(
         if not active_private:
             return JSONResponse(status_code=400, content={"error": "自用模式下请先添加私有 Token"})
 
-    plain_key, api_key = user_db.generate_api_key(user.id, name or None)
+    plain_key, api_key = await user_db_executor.run(user_db.generate_api_key, user.id, name or None)
     return {
         "success": True,
         "key": plain_key,  # Only returned once!
@@ -3426,12 +3715,12 @@ async def user_update_key(
     _csrf: None = Depends(require_same_origin)
 ):
     """Enable or disable an API key."""
-    user = get_current_user(request)
+    user = await get_current_user(request)
     if not user:
         return JSONResponse(status_code=401, content={"error": "未登录"})
 
-    from kiro_gateway.database import user_db
-    success = user_db.set_api_key_active(key_id, user_id=user.id, is_active=is_active)
+    from kiro_gateway.database import user_db, user_db_executor
+    success = await user_db_executor.run(user_db.set_api_key_active, key_id, user_id=user.id, is_active=is_active)
     if not success:
         return JSONResponse(status_code=404, content={"error": "API Key 不存在"})
     return {"success": True}
@@ -3444,12 +3733,12 @@ async def user_delete_key(
     _csrf: None = Depends(require_same_origin)
 ):
     """Delete an API key."""
-    user = get_current_user(request)
+    user = await get_current_user(request)
     if not user:
         return JSONResponse(status_code=401, content={"error": "未登录"})
 
-    from kiro_gateway.database import user_db
-    success = user_db.delete_api_key(key_id, user.id)
+    from kiro_gateway.database import user_db, user_db_executor
+    success = await user_db_executor.run(user_db.delete_api_key, key_id, user.id)
     return {"success": success}
 
 
@@ -3459,18 +3748,24 @@ async def user_delete_key(
 async def public_tokens_page(request: Request):
     """Public token pool page."""
     from kiro_gateway.pages import render_tokens_page
-    user = get_current_user(request)
+    user = await get_current_user(request)
     return HTMLResponse(content=render_tokens_page(user))
 
 
 @router.get("/api/public-tokens", include_in_schema=False)
-async def get_public_tokens():
-    """Get public tokens list (masked)."""
+async def get_public_tokens(
+    limit: int | None = Query(None, ge=1, le=500),
+    cursor: str | None = Query(None)
+):
+    """Get public tokens list (masked, optional keyset paging)."""
     from kiro_gateway.metrics import metrics
     if metrics.is_self_use_enabled():
         return JSONResponse(status_code=403, content={"error": "自用模式下不开放公开 Token 池"})
     from kiro_gateway.database import user_db
-    tokens = user_db.get_public_tokens_with_users()
+    try:
+        tokens, next_cursor = user_db.get_public_tokens_with_users(limit=limit, cursor=cursor)
+    except ValueError as e:
+        return JSONResponse(status_code=400, content={"error": str(e)})
     return {
         "tokens": [
             {
@@ -3481,5 +3776,6 @@ async def get_public_tokens():
             }
             for t in tokens
         ],
-        "count": len(tokens)
+        "count": len(tokens),
+        "next_cursor": next_cursor
     }
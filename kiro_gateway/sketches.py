@@ -0,0 +1,165 @@
+# -*- coding: utf-8 -*-
+
+"""
+KiroGate 流式分位数草图（DDSketch）。
+
+数值按对数间隔分桶：桶 i 覆盖 (gamma^(i-1), gamma^i]，gamma = (1+α)/(1-α)，
+任意分位数的相对误差不超过 α。桶只存计数，内存与取值范围的对数成正比，
+与样本数无关；同参数的草图逐桶相加即可合并（多请求、多进程汇总）。
+"""
+
+import math
+from typing import Dict, List, Optional, Sequence
+
+
+class DDSketch:
+    """
+    Mergeable quantile sketch with relative-error guarantees.
+
+    Only non-negative values are supported (durations, rates); negative
+    values are clamped to zero.
+    """
+
+    __slots__ = (
+        "relative_accuracy", "max_bins", "_gamma", "_log_gamma", "_min_value",
+        "_bins", "_zero_count", "count", "sum", "min", "max",
+    )
+
+    # 小于该值的样本计入零桶（1 纳秒级别，对耗时/速率没有意义）
+    MIN_INDEXABLE_VALUE = 1e-9
+
+    def __init__(self, relative_accuracy: float = 0.01, max_bins: int = 2048):
+        """
+        Args:
+            relative_accuracy: Max relative error of reported quantiles (0 < α < 1)
+            max_bins: Bin limit; lowest bins are collapsed beyond it
+        """
+        if not 0 < relative_accuracy < 1:
+            raise ValueError("relative_accuracy must be between 0 and 1")
+        self.relative_accuracy = relative_accuracy
+        self.max_bins = max(16, max_bins)
+        self._gamma = (1 + relative_accuracy) / (1 - relative_accuracy)
+        self._log_gamma = math.log(self._gamma)
+        self._min_value = self.MIN_INDEXABLE_VALUE
+        self._bins: Dict[int, int] = {}
+        self._zero_count = 0
+        self.count = 0
+        self.sum = 0.0
+        self.min = math.inf
+        self.max = 0.0
+
+    def __len__(self) -> int:
+        return self.count
+
+    def add(self, value: float) -> None:
+        """Add one observation."""
+        if value < 0:
+            value = 0.0
+        self.count += 1
+        self.sum += value
+        if value < self.min:
+            self.min = value
+        if value > self.max:
+            self.max = value
+        if value <= self._min_value:
+            self._zero_count += 1
+            return
+        key = math.ceil(math.log(value) / self._log_gamma)
+        bins = self._bins
+        if key in bins:
+            bins[key] += 1
+        else:
+            bins[key] = 1
+            if len(bins) > self.max_bins:
+                self._collapse()
+
+    def merge(self, other: "DDSketch") -> None:
+        """Add every observation of other into this sketch."""
+        if other._gamma != self._gamma:
+            raise ValueError("Cannot merge sketches with different relative accuracy")
+        if not other.count:
+            return
+        bins = self._bins
+        for key, count in other._bins.items():
+            bins[key] = bins.get(key, 0) + count
+        self._zero_count += other._zero_count
+        self.count += other.count
+        self.sum += other.sum
+        self.min = min(self.min, other.min)
+        self.max = max(self.max, other.max)
+        if len(bins) > self.max_bins:
+            self._collapse()
+
+    def _collapse(self) -> None:
+        """Fold the lowest bins together so at most max_bins remain."""
+        keys = sorted(self._bins)
+        excess = len(keys) - self.max_bins
+        target = keys[excess]
+        for key in keys[:excess]:
+            self._bins[target] += self._bins.pop(key)
+
+    def quantiles(self, qs: Sequence[float]) -> List[Optional[float]]:
+        """
+        Estimate several quantiles in one pass over the bins.
+
+        Args:
+            qs: Quantiles in [0, 1]
+
+        Returns:
+            Estimates in the same order as qs (None for an empty sketch)
+        """
+        if not self.count:
+            return [None] * len(qs)
+
+        order = sorted(range(len(qs)), key=lambda i: qs[i])
+        results: List[Optional[float]] = [None] * len(qs)
+        pos = 0
+        cumulative = self._zero_count
+        # 零桶
+        while pos < len(order) and qs[order[pos]] * (self.count - 1) < cumulative:
+            results[order[pos]] = self.min
+            pos += 1
+
+        for key in sorted(self._bins):
+            if pos >= len(order):
+                break
+            cumulative += self._bins[key]
+            estimate = 2 * self._gamma ** key / (self._gamma + 1)
+            estimate = min(max(estimate, self.min), self.max)
+            while pos < len(order) and qs[order[pos]] * (self.count - 1) < cumulative:
+                results[order[pos]] = estimate
+                pos += 1
+
+        while pos < len(order):
+            results[order[pos]] = self.max
+            pos += 1
+        return results
+
+    def quantile(self, q: float) -> Optional[float]:
+        """Estimate a single quantile (None for an empty sketch)."""
+        return self.quantiles((q,))[0]
+
+    def to_dict(self) -> Dict:
+        """Serialize to a JSON-compatible dict (see from_dict)."""
+        return {
+            "alpha": self.relative_accuracy,
+            "bins": [[key, count] for key, count in self._bins.items()],
+            "zero": self._zero_count,
+            "count": self.count,
+            "sum": self.sum,
+            "min": self.min if self.count else None,
+            "max": self.max,
+        }
+
+    @classmethod
+    def from_dict(cls, data: Dict) -> "DDSketch":
+        """Restore a sketch serialized with to_dict."""
+        sketch = cls(relative_accuracy=data["alpha"])
+        sketch._bins = {int(key): int(count) for key, count in data.get("bins", ())}
+        sketch._zero_count = int(data.get("zero", 0))
+        sketch.count = int(data.get("count", 0))
+        sketch.sum = float(data.get("sum", 0.0))
+        if sketch.count:
+            sketch.min = float(data["min"])
+            sketch.max = float(data["max"])
+        return sketch
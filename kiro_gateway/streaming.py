@@ -39,7 +39,17 @@ from loguru import logger
 from kiro_gateway.parsers import AwsEventStreamParser, parse_bracket_tool_calls, deduplicate_tool_calls
 from kiro_gateway.utils import generate_completion_id
 from kiro_gateway.config import settings, get_adaptive_timeout
-from kiro_gateway.tokenizer import count_tokens, count_message_tokens, count_tools_tokens
+from kiro_gateway.metrics import StreamObserver, metrics
+from kiro_gateway.tracing import span
+from kiro_gateway.tokenizer import (
+    IncrementalTokenCounter,
+    count_message_tokens_async,
+    count_tokens_async,
+    count_texts_async,
+    count_tools_tokens_async,
+    request_segments,
+)
+from kiro_gateway.token_calibration import language_bucket, token_calibrator
 from kiro_gateway.thinking_parser import KiroThinkingTagParser, SegmentType, TextSegment
 
 if TYPE_CHECKING:
@@ -89,13 +99,19 @@ async def _read_chunk_with_timeout(
         raise StreamReadTimeoutError(f"流式读取在 {timeout}s 后超时")
 
 
-def _calculate_usage_tokens(
+def _completion_factor(model: str, content: str) -> float:
+    """Calibrated correction factor for completion text of model."""
+    return token_calibrator.factor(model, language_bucket([content]))
+
+
+async def _calculate_usage_tokens(
     full_content: str,
     context_usage_percentage: Optional[float],
     model_cache: "ModelInfoCache",
     model: str,
     request_messages: Optional[list],
-    request_tools: Optional[list]
+    request_tools: Optional[list],
+    completion_counter: Optional[IncrementalTokenCounter] = None
 ) -> Dict[str, Any]:
     """
     Calculate token usage from response.
@@ -107,31 +123,45 @@ def _calculate_usage_tokens(
         model: Model name
         request_messages: Request messages for fallback counting
         request_tools: Request tools for fallback counting
+        completion_counter: Counter fed with full_content while streaming
+            (only its unencoded tail is tokenized here)
 
     Returns:
         Dict with prompt_tokens, completion_tokens, total_tokens and source info
     """
-    completion_tokens = count_tokens(full_content)
-
-    total_tokens_from_api = 0
-    if context_usage_percentage is not None and context_usage_percentage > 0:
-        max_input_tokens = model_cache.get_max_input_tokens(model)
-        total_tokens_from_api = int((context_usage_percentage / 100) * max_input_tokens)
-
-    if total_tokens_from_api > 0:
-        prompt_tokens = max(0, total_tokens_from_api - completion_tokens)
-        total_tokens = total_tokens_from_api
-        prompt_source = "subtraction"
-        total_source = "API Kiro"
-    else:
-        prompt_tokens = 0
-        if request_messages:
-            prompt_tokens += count_message_tokens(request_messages, apply_claude_correction=False)
-        if request_tools:
-            prompt_tokens += count_tools_tokens(request_tools, apply_claude_correction=False)
-        total_tokens = prompt_tokens + completion_tokens
-        prompt_source = "tiktoken"
-        total_source = "tiktoken"
+    with span("usage"):
+        if completion_counter is not None:
+            base_completion_tokens = await completion_counter.finish(apply_claude_correction=False)
+        else:
+            base_completion_tokens = await count_tokens_async(full_content, apply_claude_correction=False)
+        completion_tokens = int(base_completion_tokens * _completion_factor(model, full_content))
+
+        total_tokens_from_api = 0
+        if context_usage_percentage is not None and context_usage_percentage > 0:
+            max_input_tokens = model_cache.get_max_input_tokens(model)
+            total_tokens_from_api = int((context_usage_percentage / 100) * max_input_tokens)
+
+        if total_tokens_from_api >= token_calibrator.MIN_API_TOKENS and token_calibrator.enabled and request_messages:
+            # 与上游实际用量比较，校准修正系数（文本计数大多命中 token_count_cache）
+            fixed_tokens, texts = request_segments(request_messages, request_tools)
+            estimated_tokens = fixed_tokens + await count_texts_async(texts) + base_completion_tokens
+            texts.append(full_content)
+            token_calibrator.observe(model, texts, estimated_tokens, total_tokens_from_api)
+
+        if total_tokens_from_api > 0:
+            prompt_tokens = max(0, total_tokens_from_api - completion_tokens)
+            total_tokens = total_tokens_from_api
+            prompt_source = "subtraction"
+            total_source = "API Kiro"
+        else:
+            prompt_tokens = 0
+            if request_messages:
+                prompt_tokens += await count_message_tokens_async(request_messages, apply_claude_correction=False)
+            if request_tools:
+                prompt_tokens += await count_tools_tokens_async(request_tools, apply_claude_correction=False)
+            total_tokens = prompt_tokens + completion_tokens
+            prompt_source = "tiktoken"
+            total_source = "tiktoken"
 
     return {
         "prompt_tokens": prompt_tokens,
@@ -209,7 +239,9 @@ async def stream_kiro_to_openai_internal(
     first_token_timeout: float = settings.first_token_timeout,
     stream_read_timeout: float = settings.stream_read_timeout,
     request_messages: Optional[list] = None,
-    request_tools: Optional[list] = None
+    request_tools: Optional[list] = None,
+    request_start: Optional[float] = None,
+    stream_observer: Optional[StreamObserver] = None
 ) -> AsyncGenerator[str, None]:
     """
     Internal generator for converting Kiro stream to OpenAI format.
@@ -230,6 +262,8 @@ async def stream_kiro_to_openai_internal(
         stream_read_timeout: Stream read timeout for subsequent chunks (seconds)
         request_messages: Original request messages (for fallback token counting)
         request_tools: Original request tools (for fallback token counting)
+        request_start: time.time() when the request arrived (for TTFT metrics)
+        stream_observer: Timing probe to feed (defaults to a streaming OpenAI one)
 
     Yields:
         Strings in SSE format: "data: {...}\\n\\n" or "data: [DONE]\\n\\n"
@@ -246,6 +280,8 @@ async def stream_kiro_to_openai_internal(
     metering_data = None
     context_usage_percentage = None
     content_parts: list[str] = []  # 使用 list 替代字符串拼接，提升性能
+    completion_counter = IncrementalTokenCounter()  # 边接收边计算 completion tokens
+    observer = stream_observer or metrics.stream_observer(model, "openai", True, request_start)
 
     # 根据模型自适应调整超时时间
     adaptive_first_token_timeout = get_adaptive_timeout(model, first_token_timeout)
@@ -277,6 +313,8 @@ async def stream_kiro_to_openai_internal(
             if event["type"] == "content":
                 content = event["data"]
                 content_parts.append(content)
+                completion_counter.feed(content)
+                observer.on_chunk()
 
                 delta = {"content": content}
                 if first_chunk:
@@ -337,6 +375,8 @@ async def stream_kiro_to_openai_internal(
                 if event["type"] == "content":
                     content = event["data"]
                     content_parts.append(content)
+                    completion_counter.feed(content)
+                    observer.on_chunk()
 
                     delta = {"content": content}
                     if first_chunk:
@@ -375,10 +415,11 @@ async def stream_kiro_to_openai_internal(
         finish_reason = "tool_calls" if all_tool_calls else "stop"
 
         # Calculate usage tokens using helper function
-        usage_info = _calculate_usage_tokens(
+        usage_info = await _calculate_usage_tokens(
             full_content, context_usage_percentage, model_cache, model,
-            request_messages, request_tools
+            request_messages, request_tools, completion_counter
         )
+        observer.finish(usage_info["completion_tokens"])
 
         # Send tool calls if any
         if all_tool_calls:
@@ -443,7 +484,9 @@ async def stream_kiro_to_openai(
     model_cache: "ModelInfoCache",
     auth_manager: "KiroAuthManager",
     request_messages: Optional[list] = None,
-    request_tools: Optional[list] = None
+    request_tools: Optional[list] = None,
+    request_start: Optional[float] = None,
+    stream_observer: Optional[StreamObserver] = None
 ) -> AsyncGenerator[str, None]:
     """
     Генератор для преобразования потока Kiro в OpenAI формат.
@@ -459,6 +502,8 @@ async def stream_kiro_to_openai(
         auth_manager: Менеджер аутентификации
         request_messages: Исходные сообщения запроса (для fallback подсчёта токенов)
         request_tools: Исходные инструменты запроса (для fallback подсчёта токенов)
+        request_start: time.time() начала запроса (для метрик TTFT)
+        stream_observer: Сборщик таймингов (по умолчанию - для streaming режима)
     
     Yields:
         Строки в формате SSE: "data: {...}\\n\\n" или "data: [DONE]\\n\\n"
@@ -466,7 +511,9 @@ async def stream_kiro_to_openai(
     async for chunk in stream_kiro_to_openai_internal(
         client, response, model, model_cache, auth_manager,
         request_messages=request_messages,
-        request_tools=request_tools
+        request_tools=request_tools,
+        request_start=request_start,
+        stream_observer=stream_observer
     ):
         yield chunk
 
@@ -599,7 +646,8 @@ async def collect_stream_response(
     model_cache: "ModelInfoCache",
     auth_manager: "KiroAuthManager",
     request_messages: Optional[list] = None,
-    request_tools: Optional[list] = None
+    request_tools: Optional[list] = None,
+    request_start: Optional[float] = None
 ) -> dict:
     """
     Собирает полный ответ из streaming потока.
@@ -615,6 +663,7 @@ async def collect_stream_response(
         auth_manager: Менеджер аутентификации
         request_messages: Исходные сообщения запроса (для fallback подсчёта токенов)
         request_tools: Исходные инструменты запроса (для fallback подсчёта токенов)
+        request_start: time.time() начала запроса (для метрик TTFT)
     
     Returns:
         Словарь с полным ответом в формате OpenAI chat.completion
@@ -631,7 +680,8 @@ async def collect_stream_response(
         model_cache,
         auth_manager,
         request_messages=request_messages,
-        request_tools=request_tools
+        request_tools=request_tools,
+        stream_observer=metrics.stream_observer(model, "openai", False, request_start)
     ):
         if not chunk_str.startswith("data:"):
             continue
@@ -720,7 +770,8 @@ async def stream_kiro_to_anthropic(
     request_messages: Optional[list] = None,
     request_tools: Optional[list] = None,
     thinking_enabled: bool = False,
-    stream_read_timeout: float = settings.stream_read_timeout
+    stream_read_timeout: float = settings.stream_read_timeout,
+    request_start: Optional[float] = None
 ) -> AsyncGenerator[str, None]:
     """
     Преобразует поток Kiro в формат Anthropic SSE.
@@ -746,6 +797,7 @@ async def stream_kiro_to_anthropic(
         request_tools: Инструменты запроса (для подсчёта токенов)
         thinking_enabled: Включен ли режим thinking
         stream_read_timeout: Stream read timeout for each chunk (seconds)
+        request_start: time.time() when the request arrived (for TTFT metrics)
 
     Yields:
         Строки в формате Anthropic SSE
@@ -755,11 +807,30 @@ async def stream_kiro_to_anthropic(
     metering_data = None
     context_usage_percentage = None
     content_parts: list[str] = []  # 用于 token 计算的完整内容
+    completion_counter = IncrementalTokenCounter()  # 边接收边计算 completion tokens
+    # 可选：流式过程中定期发送带当前 output_tokens 的 message_delta
+    usage_interval = settings.stream_usage_interval_tokens
+    next_usage_report = usage_interval
     thinking_parts: list[str] = []  # thinking 内容（用于 token 计算）
     text_parts: list[str] = []  # 普通文本内容（用于 token 计算）
     content_block_index = 0
     thinking_block_started = False
     text_block_started = False
+    observer = metrics.stream_observer(model, "anthropic", True, request_start)
+
+    def running_usage_event() -> Optional[str]:
+        """中间 usage：按已编码部分报告当前 output_tokens，只在内容块之间调用"""
+        nonlocal next_usage_report
+        if usage_interval <= 0 or completion_counter.running_tokens < next_usage_report:
+            return None
+        factor = _completion_factor(model, "".join(content_parts))
+        next_usage_report = completion_counter.running_tokens + usage_interval
+        running_delta = {
+            "type": "message_delta",
+            "delta": {"stop_reason": None, "stop_sequence": None},
+            "usage": {"output_tokens": int(completion_counter.running_tokens * factor)}
+        }
+        return f"event: message_delta\ndata: {json.dumps(running_delta, ensure_ascii=False)}\n\n"
 
     # Thinking 解析器（仅在 thinking_enabled 时使用）
     thinking_parser = KiroThinkingTagParser() if thinking_enabled else None
@@ -771,9 +842,9 @@ async def stream_kiro_to_anthropic(
     # This ensures message_start event contains real input_tokens value
     pre_calculated_input_tokens = 0
     if request_messages:
-        pre_calculated_input_tokens += count_message_tokens(request_messages, apply_claude_correction=False)
+        pre_calculated_input_tokens += await count_message_tokens_async(request_messages, apply_claude_correction=False)
     if request_tools:
-        pre_calculated_input_tokens += count_tools_tokens(request_tools, apply_claude_correction=False)
+        pre_calculated_input_tokens += await count_tools_tokens_async(request_tools, apply_claude_correction=False)
 
     async def emit_thinking_segment(content: str) -> AsyncGenerator[str, None]:
         """发送 thinking 内容的事件"""
@@ -786,6 +857,9 @@ async def stream_kiro_to_anthropic(
 
         # 如果 thinking block 还没开始，先发送 content_block_start
         if not thinking_block_started:
+            usage_event = running_usage_event()
+            if usage_event:
+                yield usage_event
             block_start = {
                 "type": "content_block_start",
                 "index": content_block_index,
@@ -829,6 +903,9 @@ async def stream_kiro_to_anthropic(
 
         # 如果 text block 还没开始，先发送 content_block_start
         if not text_block_started:
+            usage_event = running_usage_event()
+            if usage_event:
+                yield usage_event
             block_start = {
                 "type": "content_block_start",
                 "index": content_block_index,
@@ -917,6 +994,8 @@ async def stream_kiro_to_anthropic(
                 if event["type"] == "content":
                     content = event["data"]
                     content_parts.append(content)
+                    completion_counter.feed(content)
+                    observer.on_chunk()
 
                     if thinking_enabled and thinking_parser:
                         # 使用 thinking 解析器处理内容
@@ -989,6 +1068,10 @@ async def stream_kiro_to_anthropic(
             except json.JSONDecodeError:
                 tool_input = {}
 
+            usage_event = running_usage_event()
+            if usage_event:
+                yield usage_event
+
             # content_block_start for tool_use
             tool_block_start = {
                 "type": "content_block_start",
@@ -1027,12 +1110,13 @@ async def stream_kiro_to_anthropic(
         stop_reason = "tool_use" if all_tool_calls else "end_turn"
 
         # 计算 token 使用量
-        usage_info = _calculate_usage_tokens(
+        usage_info = await _calculate_usage_tokens(
             full_content, context_usage_percentage, model_cache, model,
-            request_messages, request_tools
+            request_messages, request_tools, completion_counter
         )
         input_tokens = usage_info["prompt_tokens"]
         completion_tokens = usage_info["completion_tokens"]
+        observer.finish(completion_tokens)
 
         # 发送 message_delta
         message_delta = {
@@ -1087,7 +1171,8 @@ async def collect_anthropic_response(
     request_messages: Optional[list] = None,
     request_tools: Optional[list] = None,
     thinking_enabled: bool = False,
-    stream_read_timeout: float = settings.stream_read_timeout
+    stream_read_timeout: float = settings.stream_read_timeout,
+    request_start: Optional[float] = None
 ) -> dict:
     """
     Собирает полный ответ из streaming потока и преобразует в формат Anthropic.
@@ -1105,6 +1190,7 @@ async def collect_anthropic_response(
         request_tools: Инструменты запроса
         thinking_enabled: Включен ли режим thinking
         stream_read_timeout: Stream read timeout for each chunk (seconds)
+        request_start: time.time() when the request arrived (for TTFT metrics)
 
     Returns:
         Словарь с ответом в формате Anthropic Messages API
@@ -1114,6 +1200,8 @@ async def collect_anthropic_response(
     metering_data = None
     context_usage_percentage = None
     content_parts: list[str] = []
+    completion_counter = IncrementalTokenCounter()
+    observer = metrics.stream_observer(model, "anthropic", False, request_start)
 
     # Thinking 解析器（仅在 thinking_enabled 时使用）
     thinking_parser = KiroThinkingTagParser() if thinking_enabled else None
@@ -1153,6 +1241,8 @@ async def collect_anthropic_response(
             for event in events:
                 if event["type"] == "content":
                     content_parts.append(event["data"])
+                    completion_counter.feed(event["data"])
+                    observer.on_chunk()
                 elif event["type"] == "usage":
                     metering_data = event["data"]
                 elif event["type"] == "context_usage":
@@ -1231,12 +1321,13 @@ async def collect_anthropic_response(
     stop_reason = "tool_use" if all_tool_calls else "end_turn"
 
     # 计算 token 使用量
-    usage_info = _calculate_usage_tokens(
+    usage_info = await _calculate_usage_tokens(
         full_content, context_usage_percentage, model_cache, model,
-        request_messages, request_tools
+        request_messages, request_tools, completion_counter
     )
     input_tokens = usage_info["prompt_tokens"]
     completion_tokens = usage_info["completion_tokens"]
+    observer.finish(completion_tokens)
 
     if thinking_content:
         logger.debug(
@@ -12,7 +12,7 @@ from typing import Optional, Tuple
 
 from loguru import logger
 
-from kiro_gateway.database import user_db, DonatedToken
+from kiro_gateway.database import user_db, user_db_executor, DonatedToken
 from kiro_gateway.auth import KiroAuthManager
 from kiro_gateway.config import settings
 
@@ -90,7 +90,7 @@ class SmartTokenAllocator:
 
         if user_id:
             # 用户请求: 优先使用用户自己的私有 Token
-            user_tokens = user_db.get_user_tokens(user_id)
+            user_tokens = await user_db_executor.read(user_db.get_user_tokens, user_id)
             active_tokens = [
                 t for t in user_tokens
                 if t.status == "active" and (not self_use_enabled or t.visibility == "private")
@@ -104,7 +104,7 @@ class SmartTokenAllocator:
             raise NoTokenAvailable("Self-use mode: public token pool is disabled")
 
         # 使用公共 Token 池
-        public_tokens = user_db.get_public_tokens()
+        public_tokens = await user_db_executor.read(user_db.get_public_tokens)
         if not public_tokens:
             raise NoTokenAvailable("No public tokens available")
 
@@ -130,7 +130,7 @@ class SmartTokenAllocator:
                 return self._token_managers[token.id]
 
             # 获取解密的 refresh token
-            refresh_token = user_db.get_decrypted_token(token.id)
+            refresh_token = await user_db_executor.read(user_db.get_decrypted_token, token.id)
             if not refresh_token:
                 raise NoTokenAvailable(f"Failed to decrypt token {token.id}")
 
@@ -144,8 +144,8 @@ class SmartTokenAllocator:
             return manager
 
     def record_usage(self, token_id: int, success: bool) -> None:
-        """记录 Token 使用结果。"""
-        user_db.record_token_usage(token_id, success)
+        """记录 Token 使用结果（异步写入，不阻塞事件循环）。"""
+        user_db_executor.submit(user_db.record_token_usage, token_id, success)
 
     def clear_manager(self, token_id: int) -> None:
         """清除缓存的 AuthManager。"""
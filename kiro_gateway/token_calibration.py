@@ -0,0 +1,281 @@
+# -*- coding: utf-8 -*-
+
+"""
+KiroGate Claude token 修正系数在线校准。
+
+tiktoken (cl100k_base) 计数乘以固定的 CLAUDE_CORRECTION_FACTOR 只是经验估计，
+不同模型、不同语言的实际偏差并不相同。Kiro 流式响应会返回 contextUsagePercentage，
+乘以模型上下文长度即为上游实际计入的 token 数；每次拿到该值时与 tiktoken 估算比较，
+按（模型，语言类别）维护对数比值的稳健滑动平均（残差按偏差截断，单个异常请求不会带偏），
+同时记录每个实际 token 对应的字符数。样本不足时向全部模型的汇总值收缩，再向默认值收缩。
+
+校准结果用于 /v1/messages/count_tokens 和自动分片阈值，定期写入 metrics.db。
+"""
+
+import math
+import re
+import time
+from threading import Lock
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from loguru import logger
+
+from kiro_gateway.config import settings
+from kiro_gateway.metrics import metrics
+from kiro_gateway.tokenizer import CLAUDE_CORRECTION_FACTOR
+
+# 汇总所有模型的条目使用的模型名
+ALL_MODELS = "*"
+
+# 平假名/片假名、CJK 统一汉字（含扩展 A、兼容汉字）、谚文、全角符号
+_CJK_RE = re.compile("[\u3040-\u30ff\u3400-\u4dbf\u4e00-\u9fff\uac00-\ud7af\uf900-\ufaff\uff00-\uffef]")
+
+# 判断语言类别时每段文本最多抽样的字符数
+LANGUAGE_SAMPLE_CHARS = 2048
+
+
+def language_bucket(texts: Iterable[str]) -> str:
+    """
+    Classify texts by their share of CJK characters.
+
+    Returns:
+        "cjk" (>= 30%), "mixed" (>= 5%) or "latin"
+    """
+    sampled = 0
+    cjk = 0
+    for text in texts:
+        if not text:
+            continue
+        if len(text) > LANGUAGE_SAMPLE_CHARS:
+            # 等间隔抽样，长文本不必全部扫描
+            text = text[::len(text) // LANGUAGE_SAMPLE_CHARS]
+        sampled += len(text)
+        cjk += len(_CJK_RE.findall(text))
+    share = cjk / sampled if sampled else 0.0
+    if share >= 0.3:
+        return "cjk"
+    if share >= 0.05:
+        return "mixed"
+    return "latin"
+
+
+class _CalibrationEntry:
+    """Robust running estimates for one (model, bucket)."""
+
+    __slots__ = ("samples", "log_ratio", "ratio_dev", "log_cpt", "cpt_dev", "updated_at")
+
+    def __init__(
+        self,
+        samples: int = 0,
+        log_ratio: float = 0.0,
+        ratio_dev: float = 0.0,
+        log_cpt: float = 0.0,
+        cpt_dev: float = 0.0,
+        updated_at: float = 0.0
+    ):
+        self.samples = samples
+        self.log_ratio = log_ratio
+        self.ratio_dev = ratio_dev
+        self.log_cpt = log_cpt
+        self.cpt_dev = cpt_dev
+        self.updated_at = updated_at
+
+
+class TokenCalibrator:
+    """Per-model, per-language calibration of tiktoken counts against upstream usage."""
+
+    # 上游 token 数低于该值时不参与校准（百分比精度有限，小请求误差大）
+    MIN_API_TOKENS = 1000
+    # 超出范围的比值视为异常数据（如模型上下文长度未知）直接丢弃
+    MIN_RATIO = 0.25
+    MAX_RATIO = 4.0
+    # 收缩强度：样本数达到该值时校准值与先验各占一半
+    PRIOR_SAMPLES = 20
+    # 滑动平均的最小权重（约等于最近 50 个样本）
+    MIN_ALPHA = 0.02
+    # 残差截断倍数（Huber）及偏差下限（对数空间）
+    HUBER_K = 2.5
+    MIN_DEV = 0.02
+    INITIAL_DEV = 0.1
+    MAX_MODELS = 64
+    SAVE_INTERVAL = 60.0
+
+    def __init__(self, enabled: bool = True):
+        """
+        Args:
+            enabled: False keeps the fixed CLAUDE_CORRECTION_FACTOR
+        """
+        self.enabled = enabled
+        self._lock = Lock()
+        self._entries: Dict[Tuple[str, str], _CalibrationEntry] = {}
+        self._dirty: set[Tuple[str, str]] = set()
+        self._last_save = time.monotonic()
+        self._observations = 0
+        self._rejected = 0
+        if enabled:
+            self._load()
+
+    def _load(self) -> None:
+        for model, bucket, samples, log_ratio, ratio_dev, log_cpt, cpt_dev, updated_at in metrics.load_token_calibration():
+            self._entries[(model, bucket)] = _CalibrationEntry(
+                int(samples), float(log_ratio), float(ratio_dev),
+                float(log_cpt), float(cpt_dev), float(updated_at or 0)
+            )
+        if self._entries:
+            logger.info(f"Loaded {len(self._entries)} token calibration entries")
+
+    def _robust_update(self, mean: float, dev: float, value: float, alpha: float) -> Tuple[float, float]:
+        """One Huber-clipped EWMA step in log space; returns (mean, mean absolute deviation)."""
+        limit = self.HUBER_K * max(dev, self.MIN_DEV)
+        residual = min(max(value - mean, -limit), limit)
+        return mean + alpha * residual, dev + alpha * (abs(residual) - dev)
+
+    def observe(self, model: str, texts: List[str], estimated_tokens: int, api_tokens: int) -> bool:
+        """
+        Record one request whose real token total is known.
+
+        Args:
+            model: Model name
+            texts: Prompt and completion texts (language bucket and character count)
+            estimated_tokens: Uncorrected tiktoken count of the same content
+            api_tokens: Total derived from contextUsagePercentage
+
+        Returns:
+            True if the observation was used
+        """
+        if not self.enabled or api_tokens < self.MIN_API_TOKENS or estimated_tokens <= 0:
+            return False
+        ratio = api_tokens / estimated_tokens
+        chars = sum(len(text) for text in texts if text)
+        if not self.MIN_RATIO <= ratio <= self.MAX_RATIO or chars <= 0:
+            self._rejected += 1
+            return False
+
+        bucket = language_bucket(texts)
+        log_ratio = math.log(ratio)
+        log_cpt = math.log(chars / api_tokens)
+        now = time.time()
+        with self._lock:
+            for key in ((model, bucket), (ALL_MODELS, bucket)):
+                entry = self._entries.get(key)
+                if entry is None:
+                    if len(self._entries) >= self.MAX_MODELS * 3:
+                        continue
+                    entry = self._entries[key] = _CalibrationEntry(
+                        1, log_ratio, self.INITIAL_DEV, log_cpt, self.INITIAL_DEV, now
+                    )
+                    self._dirty.add(key)
+                    continue
+                entry.samples += 1
+                alpha = max(1.0 / entry.samples, self.MIN_ALPHA)
+                entry.log_ratio, entry.ratio_dev = self._robust_update(
+                    entry.log_ratio, entry.ratio_dev, log_ratio, alpha
+                )
+                entry.log_cpt, entry.cpt_dev = self._robust_update(
+                    entry.log_cpt, entry.cpt_dev, log_cpt, alpha
+                )
+                entry.updated_at = now
+                self._dirty.add(key)
+            self._observations += 1
+            due = time.monotonic() - self._last_save >= self.SAVE_INTERVAL
+        if due:
+            self.save()
+        return True
+
+    def _shrunk(self, model: str, bucket: str, field: str, default_log: float) -> float:
+        """Model estimate shrunk toward the all-models estimate, shrunk toward the default (caller holds lock)."""
+        keys = [(ALL_MODELS, bucket)]
+        if model != ALL_MODELS:
+            keys.append((model, bucket))
+        value = default_log
+        for key in keys:
+            entry = self._entries.get(key)
+            if entry is None:
+                continue
+            n = entry.samples
+            value = (n * getattr(entry, field) + self.PRIOR_SAMPLES * value) / (n + self.PRIOR_SAMPLES)
+        return value
+
+    def factor(self, model: str, bucket: str = "latin") -> float:
+        """Return the calibrated correction factor (CLAUDE_CORRECTION_FACTOR until data accrues)."""
+        if not self.enabled:
+            return CLAUDE_CORRECTION_FACTOR
+        with self._lock:
+            return math.exp(self._shrunk(model, bucket, "log_ratio", math.log(CLAUDE_CORRECTION_FACTOR)))
+
+    def chars_per_token(self, model: str, bucket: str, default: float) -> float:
+        """Return the calibrated number of characters per real token (default until data accrues)."""
+        if not self.enabled:
+            return default
+        with self._lock:
+            return math.exp(self._shrunk(model, bucket, "log_cpt", math.log(default)))
+
+    def apply(self, tokens: int, model: str, texts: Iterable[str]) -> int:
+        """Scale an uncorrected tiktoken count by the factor for model and the texts' language."""
+        return int(tokens * self.factor(model, language_bucket(texts)))
+
+    def char_limit(
+        self,
+        limit: int,
+        texts: Iterable[str],
+        assumed_chars_per_token: float,
+        model: Optional[str] = None
+    ) -> int:
+        """
+        Rescale a character limit that was sized for assumed_chars_per_token.
+
+        E.g. a limit tuned for English (~4 chars/token) shrinks for CJK text,
+        which spends about one token per character.
+        """
+        if not self.enabled:
+            return limit
+        cpt = self.chars_per_token(model or ALL_MODELS, language_bucket(texts), assumed_chars_per_token)
+        return int(limit * cpt / assumed_chars_per_token)
+
+    def save(self) -> None:
+        """Queue changed entries for persistence in metrics.db."""
+        with self._lock:
+            self._last_save = time.monotonic()
+            if not self._dirty:
+                return
+            rows = []
+            for key in self._dirty:
+                entry = self._entries.get(key)
+                if entry is not None:
+                    rows.append((
+                        key[0], key[1], entry.samples, entry.log_ratio, entry.ratio_dev,
+                        entry.log_cpt, entry.cpt_dev, int(entry.updated_at)
+                    ))
+            self._dirty = set()
+        metrics.save_token_calibration(rows)
+
+    def get_stats(self) -> Dict:
+        """Return calibration state for /metrics and the admin API."""
+        with self._lock:
+            keys = sorted(self._entries)
+            entries = []
+            for model, bucket in keys:
+                entry = self._entries[(model, bucket)]
+                entries.append({
+                    "model": model,
+                    "bucket": bucket,
+                    "samples": entry.samples,
+                    "factor": round(math.exp(self._shrunk(
+                        model, bucket, "log_ratio", math.log(CLAUDE_CORRECTION_FACTOR)
+                    )), 4),
+                    "rawFactor": round(math.exp(entry.log_ratio), 4),
+                    "deviation": round(entry.ratio_dev, 4),
+                    "charsPerToken": round(math.exp(entry.log_cpt), 3),
+                    "updatedAt": int(entry.updated_at),
+                })
+            return {
+                "enabled": self.enabled,
+                "defaultFactor": CLAUDE_CORRECTION_FACTOR,
+                "observations": self._observations,
+                "rejected": self._rejected,
+                "entries": entries,
+            }
+
+
+# Global token calibrator instance
+token_calibrator = TokenCalibrator(settings.token_calibration_enabled)
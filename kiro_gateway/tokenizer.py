@@ -32,9 +32,17 @@ Claude не является публичным. Anthropic не публикуе
 больше чем GPT-4 (cl100k_base). Это связано с различиями в BPE словарях.
 """
 
-from typing import List, Dict, Any, Optional
+import asyncio
+import hashlib
+import json
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from threading import Lock
+from typing import List, Dict, Any, Optional, Tuple
 from loguru import logger
 
+from kiro_gateway.config import settings
+
 # Ленивая загрузка tiktoken для ускорения импорта
 _encoding = None
 
@@ -43,6 +51,87 @@ _encoding = None
 # Это эмпирическое значение, основанное на сравнении с context_usage от API
 CLAUDE_CORRECTION_FACTOR = 1.15
 
+# Минимальная длина текста для кэширования: короткие строки (role, имена,
+# tool_call_id) закодировать дешевле, чем хэшировать и искать в кэше
+TOKEN_CACHE_MIN_CHARS = 256
+
+
+class TokenCountCache:
+    """
+    LRU-кэш количества токенов, адресуемый содержимым текста.
+
+    Ключ - 128-битный blake2b хэш текста, значение - число токенов без
+    коррекции. Агентские клиенты присылают один и тот же системный промпт,
+    схемы инструментов и неизменный префикс истории на каждом ходу, поэтому
+    повторный подсчёт сводится к хэшированию. Сам текст не хранится, память
+    ограничена числом записей, вычисленным из бюджета в байтах.
+    """
+
+    # Примерный объём одной записи: bytes-ключ, int и узел OrderedDict
+    ENTRY_BYTES = 160
+
+    def __init__(self, max_bytes: int):
+        """
+        Args:
+            max_bytes: Бюджет памяти кэша (0 - кэш отключён)
+        """
+        self.max_entries = max(0, max_bytes) // self.ENTRY_BYTES
+        self._entries: "OrderedDict[bytes, int]" = OrderedDict()
+        self._lock = Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_entries > 0
+
+    @staticmethod
+    def key(text: str) -> bytes:
+        """Хэш текста, используемый как ключ кэша."""
+        return hashlib.blake2b(text.encode("utf-8", "surrogatepass"), digest_size=16).digest()
+
+    def get(self, key: bytes) -> Optional[int]:
+        """Возвращает число токенов или None при промахе."""
+        with self._lock:
+            count = self._entries.get(key)
+            if count is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return count
+
+    def put(self, key: bytes, count: int) -> None:
+        """Сохраняет число токенов, вытесняя самые давние записи."""
+        with self._lock:
+            self._entries[key] = count
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "size": len(self._entries),
+                "maxSize": self.max_entries,
+                "bytes": len(self._entries) * self.ENTRY_BYTES,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hitRate": round(self.hits / total, 4) if total else 0.0,
+            }
+
+
+# Глобальный кэш количества токенов
+token_count_cache = TokenCountCache(int(settings.token_count_cache_mb * 1024 * 1024))
+
 
 def _get_encoding():
     """
@@ -89,8 +178,20 @@ def count_tokens(text: str, apply_claude_correction: bool = True) -> int:
     
     encoding = _get_encoding()
     if encoding:
+        cache_key = None
+        if len(text) >= TOKEN_CACHE_MIN_CHARS and token_count_cache.enabled:
+            cache_key = TokenCountCache.key(text)
+            base_tokens = token_count_cache.get(cache_key)
+            if base_tokens is not None:
+                if apply_claude_correction:
+                    return int(base_tokens * CLAUDE_CORRECTION_FACTOR)
+                return base_tokens
         try:
-            base_tokens = len(encoding.encode(text))
+            # encode_ordinary, как в асинхронном и инкрементальном подсчёте: они пишут
+            # в тот же кэш, а encode() бросает исключение на <|endoftext|> и т.п.
+            base_tokens = len(encoding.encode_ordinary(text))
+            if cache_key is not None:
+                token_count_cache.put(cache_key, base_tokens)
             if apply_claude_correction:
                 return int(base_tokens * CLAUDE_CORRECTION_FACTOR)
             return base_tokens
@@ -106,70 +207,156 @@ def count_tokens(text: str, apply_claude_correction: bool = True) -> int:
     return base_estimate
 
 
-def count_message_tokens(messages: List[Dict[str, Any]], apply_claude_correction: bool = True) -> int:
+def _message_segments(messages: List[Dict[str, Any]]) -> Tuple[int, List[str]]:
     """
-    Подсчитывает токены в списке сообщений чата.
-    
-    Учитывает структуру сообщений OpenAI/Claude:
-    - role: ~1 токен
-    - content: токены текста
-    - Служебные токены между сообщениями: ~3-4 токена
-    
-    Args:
-        messages: Список сообщений в формате OpenAI
-        apply_claude_correction: Применять коэффициент коррекции для Claude
-    
+    Разбирает сообщения на фиксированные служебные токены и тексты для кодирования.
+
     Returns:
-        Приблизительное количество токенов (с коррекцией для Claude)
+        (служебные токены, список текстов)
     """
-    if not messages:
-        return 0
-    
-    total_tokens = 0
+    fixed_tokens = 0
+    texts: List[str] = []
     
     for message in messages:
         # Базовые токены на сообщение (role, разделители)
-        total_tokens += 4  # ~4 токена на служебную информацию
+        fixed_tokens += 4  # ~4 токена на служебную информацию
         
         # Токены роли (без коррекции, это короткие строки)
-        role = message.get("role", "")
-        total_tokens += count_tokens(role, apply_claude_correction=False)
+        texts.append(message.get("role", ""))
         
         # Токены контента
         content = message.get("content")
         if content:
             if isinstance(content, str):
-                total_tokens += count_tokens(content, apply_claude_correction=False)
+                texts.append(content)
             elif isinstance(content, list):
                 # Мультимодальный контент (текст + изображения)
                 for item in content:
                     if isinstance(item, dict):
                         if item.get("type") == "text":
-                            total_tokens += count_tokens(item.get("text", ""), apply_claude_correction=False)
-                        elif item.get("type") == "image_url":
+                            texts.append(item.get("text", ""))
+                        elif item.get("type") in ("image_url", "image"):
                             # Изображения занимают ~85-170 токенов в зависимости от размера
-                            total_tokens += 100  # Средняя оценка
+                            fixed_tokens += 100  # Средняя оценка
+                        elif item.get("type") == "tool_use":
+                            # Блоки Anthropic (count_tokens): вызов и результат инструмента
+                            texts.append(item.get("name") or "")
+                            texts.append(json.dumps(item.get("input") or {}, ensure_ascii=False))
+                        elif item.get("type") == "tool_result":
+                            result = item.get("content")
+                            if isinstance(result, str):
+                                texts.append(result)
+                            elif isinstance(result, list):
+                                texts.extend(
+                                    block.get("text") or "" for block in result
+                                    if isinstance(block, dict) and block.get("type") == "text"
+                                )
         
         # Токены tool_calls (если есть)
         tool_calls = message.get("tool_calls")
         if tool_calls:
             for tc in tool_calls:
-                total_tokens += 4  # Служебные токены
+                fixed_tokens += 4  # Служебные токены
                 func = tc.get("function", {})
-                total_tokens += count_tokens(func.get("name", ""), apply_claude_correction=False)
-                total_tokens += count_tokens(func.get("arguments", ""), apply_claude_correction=False)
+                texts.append(func.get("name", ""))
+                texts.append(func.get("arguments", ""))
         
         # Токены tool_call_id (для ответов от инструментов)
         if message.get("tool_call_id"):
-            total_tokens += count_tokens(message["tool_call_id"], apply_claude_correction=False)
+            texts.append(message["tool_call_id"])
     
     # Финальные служебные токены
-    total_tokens += 3
+    fixed_tokens += 3
+    return fixed_tokens, texts
+
+
+def _tools_segments(tools: List[Dict[str, Any]]) -> Tuple[int, List[str]]:
+    """
+    Разбирает определения инструментов на служебные токены и тексты для кодирования.
+
+    Returns:
+        (служебные токены, список текстов)
+    """
+    fixed_tokens = 0
+    texts: List[str] = []
     
-    # Применяем коррекцию к общему количеству
+    for tool in tools:
+        fixed_tokens += 4  # Служебные токены
+        
+        if tool.get("type") == "function":
+            func = tool.get("function", {})
+            
+            # Имя и описание функции
+            texts.append(func.get("name", ""))
+            texts.append(func.get("description", ""))
+            
+            # Параметры (JSON schema)
+            params = func.get("parameters")
+            if params:
+                texts.append(json.dumps(params, ensure_ascii=False))
+        elif tool.get("name"):
+            # Формат Anthropic (count_tokens): name, description, input_schema
+            texts.append(tool["name"])
+            texts.append(tool.get("description") or "")
+            schema = tool.get("input_schema")
+            if schema:
+                texts.append(json.dumps(schema, ensure_ascii=False))
+    
+    return fixed_tokens, texts
+
+
+def request_segments(
+    messages: Optional[List[Dict[str, Any]]],
+    tools: Optional[List[Dict[str, Any]]] = None
+) -> Tuple[int, List[str]]:
+    """
+    Разбирает запрос (сообщения и инструменты) на служебные токены и тексты.
+
+    Returns:
+        (служебные токены, список текстов) - сумма служебных токенов и
+        count_texts_async(texts) равна подсчёту без коррекции
+    """
+    fixed_tokens = 0
+    texts: List[str] = []
+    if messages:
+        fixed_tokens, texts = _message_segments(messages)
+    if tools:
+        tools_fixed, tools_texts = _tools_segments(tools)
+        fixed_tokens += tools_fixed
+        texts.extend(tools_texts)
+    return fixed_tokens, texts
+
+
+def _apply_correction(tokens: int, apply_claude_correction: bool) -> int:
     if apply_claude_correction:
-        return int(total_tokens * CLAUDE_CORRECTION_FACTOR)
-    return total_tokens
+        return int(tokens * CLAUDE_CORRECTION_FACTOR)
+    return tokens
+
+
+def count_message_tokens(messages: List[Dict[str, Any]], apply_claude_correction: bool = True) -> int:
+    """
+    Подсчитывает токены в списке сообщений чата.
+    
+    Учитывает структуру сообщений OpenAI/Claude:
+    - role: ~1 токен
+    - content: токены текста
+    - Служебные токены между сообщениями: ~3-4 токена
+    
+    Args:
+        messages: Список сообщений в формате OpenAI
+        apply_claude_correction: Применять коэффициент коррекции для Claude
+    
+    Returns:
+        Приблизительное количество токенов (с коррекцией для Claude)
+    """
+    if not messages:
+        return 0
+    
+    fixed_tokens, texts = _message_segments(messages)
+    total_tokens = fixed_tokens + sum(count_tokens(text, apply_claude_correction=False) for text in texts)
+    
+    # Применяем коррекцию к общему количеству
+    return _apply_correction(total_tokens, apply_claude_correction)
 
 
 def count_tools_tokens(tools: Optional[List[Dict[str, Any]]], apply_claude_correction: bool = True) -> int:
@@ -186,31 +373,252 @@ def count_tools_tokens(tools: Optional[List[Dict[str, Any]]], apply_claude_corre
     if not tools:
         return 0
     
-    total_tokens = 0
-    
-    for tool in tools:
-        total_tokens += 4  # Служебные токены
-        
-        if tool.get("type") == "function":
-            func = tool.get("function", {})
-            
-            # Имя функции
-            total_tokens += count_tokens(func.get("name", ""), apply_claude_correction=False)
-            
-            # Описание функции
-            total_tokens += count_tokens(func.get("description", ""), apply_claude_correction=False)
-            
-            # Параметры (JSON schema)
-            params = func.get("parameters")
-            if params:
-                import json
-                params_str = json.dumps(params, ensure_ascii=False)
-                total_tokens += count_tokens(params_str, apply_claude_correction=False)
+    fixed_tokens, texts = _tools_segments(tools)
+    total_tokens = fixed_tokens + sum(count_tokens(text, apply_claude_correction=False) for text in texts)
     
     # Применяем коррекцию к общему количеству
-    if apply_claude_correction:
-        return int(total_tokens * CLAUDE_CORRECTION_FACTOR)
-    return total_tokens
+    return _apply_correction(total_tokens, apply_claude_correction)
+
+
+# ==================================================================================================
+# Асинхронный подсчёт: крупные тексты кодируются в пуле потоков
+# ==================================================================================================
+
+_offload_executor: Optional[ThreadPoolExecutor] = None
+_offload_executor_lock = Lock()
+
+
+def _get_offload_executor() -> ThreadPoolExecutor:
+    global _offload_executor
+    if _offload_executor is None:
+        with _offload_executor_lock:
+            if _offload_executor is None:
+                _offload_executor = ThreadPoolExecutor(
+                    max_workers=max(1, settings.tokenizer_workers),
+                    thread_name_prefix="tokenizer"
+                )
+    return _offload_executor
+
+
+def _encode_batch(texts: List[str]) -> List[int]:
+    """
+    Кодирует тексты в рабочем потоке.
+
+    encode_ordinary_batch отпускает GIL на время BPE-кодирования (Rust),
+    поэтому event loop продолжает обслуживать другие потоки ответа.
+    """
+    encoding = _get_encoding()
+    if len(texts) == 1:
+        return [len(encoding.encode_ordinary(texts[0]))]
+    tokens = encoding.encode_ordinary_batch(texts, num_threads=max(1, settings.tokenizer_workers))
+    return [len(item) for item in tokens]
+
+
+async def count_text_list_async(texts: List[str]) -> List[int]:
+    """
+    Подсчитывает токены (без коррекции) каждого текста, не блокируя event loop.
+
+    Короткие тексты и попадания в кэш считаются сразу; тексты длиннее
+    TOKENIZER_OFFLOAD_CHARS, которых нет в кэше, кодируются одним пакетом в пуле потоков.
+
+    Returns:
+        Количество токенов для каждого текста (в том же порядке)
+    """
+    encoding = _get_encoding()
+    threshold = settings.tokenizer_offload_chars
+    if not encoding or threshold <= 0:
+        return [count_tokens(text, apply_claude_correction=False) for text in texts]
+
+    counts = [0] * len(texts)
+    pending: List[str] = []
+    pending_index: List[int] = []
+    pending_keys: List[Optional[bytes]] = []
+    for index, text in enumerate(texts):
+        if not text:
+            continue
+        if len(text) < threshold:
+            counts[index] = count_tokens(text, apply_claude_correction=False)
+            continue
+        cache_key = TokenCountCache.key(text) if token_count_cache.enabled else None
+        if cache_key is not None:
+            cached = token_count_cache.get(cache_key)
+            if cached is not None:
+                counts[index] = cached
+                continue
+        pending.append(text)
+        pending_index.append(index)
+        pending_keys.append(cache_key)
+
+    if pending:
+        loop = asyncio.get_running_loop()
+        try:
+            encoded = await loop.run_in_executor(_get_offload_executor(), _encode_batch, pending)
+        except Exception as e:
+            logger.warning(f"[Tokenizer] Error encoding text in worker pool: {e}")
+            encoded = [count_tokens(text, apply_claude_correction=False) for text in pending]
+            pending_keys = [None] * len(pending)
+        for index, cache_key, count in zip(pending_index, pending_keys, encoded):
+            if cache_key is not None:
+                token_count_cache.put(cache_key, count)
+            counts[index] = count
+    return counts
+
+
+async def count_texts_async(texts: List[str]) -> int:
+    """Суммирует токены (без коррекции) в списке текстов, не блокируя event loop."""
+    return sum(await count_text_list_async(texts))
+
+
+async def count_tokens_async(text: str, apply_claude_correction: bool = True) -> int:
+    """Асинхронный вариант count_tokens (крупные тексты кодируются в пуле потоков)."""
+    if not text:
+        return 0
+    return _apply_correction(await count_texts_async([text]), apply_claude_correction)
+
+
+async def count_message_tokens_async(
+    messages: List[Dict[str, Any]],
+    apply_claude_correction: bool = True
+) -> int:
+    """Асинхронный вариант count_message_tokens."""
+    if not messages:
+        return 0
+    fixed_tokens, texts = _message_segments(messages)
+    return _apply_correction(fixed_tokens + await count_texts_async(texts), apply_claude_correction)
+
+
+async def count_tools_tokens_async(
+    tools: Optional[List[Dict[str, Any]]],
+    apply_claude_correction: bool = True
+) -> int:
+    """Асинхронный вариант count_tools_tokens."""
+    if not tools:
+        return 0
+    fixed_tokens, texts = _tools_segments(tools)
+    return _apply_correction(fixed_tokens + await count_texts_async(texts), apply_claude_correction)
+
+
+def _safe_split_point(text: str) -> int:
+    """
+    Находит последнюю позицию, где текст можно разрезать без изменения токенизации.
+
+    Претокенизатор cl100k_base начинает новый фрагмент перед одиночным
+    пробелом или знаком препинания, за которым следуют буквы (" word", "，世界"),
+    если перед ним стоит буква. BPE не объединяет токены через границы
+    фрагментов, поэтому сумма токенов частей равна подсчёту всего текста.
+
+    Returns:
+        Позиция разреза или 0, если безопасной границы нет
+    """
+    for i in range(len(text) - 2, 0, -1):
+        char = text[i]
+        if (
+            not char.isalnum() and char not in "\r\n"
+            and text[i + 1].isalpha()
+            and text[i - 1].isalpha()
+        ):
+            return i
+    return 0
+
+
+def _encode_ordinary_len(text: str) -> int:
+    return len(_get_encoding().encode_ordinary(text))
+
+
+class IncrementalTokenCounter:
+    """
+    Инкрементальный подсчёт токенов ответа по мере поступления дельт.
+
+    Дельты накапливаются в буфере; когда он превышает BATCH_CHARS, часть до
+    последней безопасной границы кодируется в пуле потоков токенизатора,
+    не блокируя event loop. К концу потока остаётся закодировать только
+    хвост буфера (там же), поэтому финальный usage отправляется сразу.
+    """
+
+    BATCH_CHARS = 2048
+
+    def __init__(self):
+        self._encoding = _get_encoding()
+        self._buffer: List[str] = []
+        self._buffered = 0
+        self._chars = 0
+        self._tokens = 0
+        self._flush_at = self.BATCH_CHARS
+        self._pending: List[asyncio.Future] = []
+        self._failed = False
+
+    @property
+    def running_tokens(self) -> int:
+        """Токены уже закодированных частей (без коррекции, без хвоста буфера)."""
+        return self._tokens
+
+    def feed(self, text: str) -> None:
+        """Добавляет дельту ответа."""
+        if not text:
+            return
+        self._chars += len(text)
+        if not self._encoding or self._failed:
+            return
+        self._buffer.append(text)
+        self._buffered += len(text)
+        if self._buffered >= self._flush_at:
+            data = "".join(self._buffer)
+            cut = _safe_split_point(data)
+            if cut <= 0:
+                # Нет безопасной границы (например, длинный CJK-текст без пунктуации) - ждём следующую порцию
+                self._buffer = [data]
+                self._flush_at = self._buffered + self.BATCH_CHARS
+                return
+            tail = data[cut:]
+            self._buffer = [tail]
+            self._buffered = len(tail)
+            self._flush_at = self.BATCH_CHARS
+            self._submit(data[:cut])
+
+    def _submit(self, text: str) -> None:
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            self._add(len(self._encoding.encode_ordinary(text)))
+            return
+        future = loop.run_in_executor(_get_offload_executor(), _encode_ordinary_len, text)
+        future.add_done_callback(self._on_done)
+        self._pending.append(future)
+
+    def _on_done(self, future: asyncio.Future) -> None:
+        if not future.cancelled() and future.exception() is None:
+            self._add(future.result())
+
+    def _add(self, tokens: int) -> None:
+        self._tokens += tokens
+
+    async def finish(self, apply_claude_correction: bool = True) -> int:
+        """
+        Кодирует остаток буфера и возвращает итоговое количество токенов.
+
+        Результат совпадает с count_tokens() для склеенного текста: оба пути
+        используют encode_ordinary, поэтому спецтокены (<|endoftext|> и т.п.)
+        считаются одинаково.
+        """
+        if not self._chars:
+            return 0
+        if self._encoding and not self._failed:
+            try:
+                rest = "".join(self._buffer)
+                self._buffer = []
+                self._buffered = 0
+                if rest:
+                    # Хвост тоже кодируется в пуле потоков, а не в event loop
+                    self._submit(rest)
+                if self._pending:
+                    await asyncio.gather(*self._pending)
+                    self._pending.clear()
+                return _apply_correction(self._tokens, apply_claude_correction)
+            except Exception as e:
+                logger.warning(f"[Tokenizer] Error in incremental encoding: {e}")
+                self._failed = True
+        # Fallback: та же грубая оценка, что и в count_tokens
+        return _apply_correction(self._chars // 4 + 1, apply_claude_correction)
 
 
 def estimate_request_tokens(
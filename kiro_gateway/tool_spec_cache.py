@@ -0,0 +1,171 @@
+# -*- coding: utf-8 -*-
+
+"""
+KiroGate 工具定义转换缓存。
+
+Agent 客户端每轮都发送同一组工具（常见 40+ 个，JSON Schema 很大）。
+转换结果（OpenAI Tool 对象、截断长描述后的工具、移入 system prompt 的工具文档、
+Kiro toolSpecification 列表）按工具数组的规范化哈希缓存，重复请求直接复用。
+
+Anthropic 请求转换出的 Tool 对象在后续 build_kiro_payload 中按对象身份命中，
+无需再次哈希。缓存的对象会被多个请求共享，调用方不得原地修改。
+
+规范化哈希要完整序列化全部 schema，对 40 个工具约 1.6 ms，而直接转换只需
+约 0.14 ms；仅凭 (数量, 名称) 作 key 又会在 schema 变化时返回旧结果。
+因此默认关闭（TOOL_SPEC_CACHE_MB=0），只在转换远比序列化昂贵时才值得开启。
+"""
+
+import hashlib
+import json
+from collections import OrderedDict
+from threading import Lock
+from typing import Any, Dict, Optional, Sequence, Tuple
+
+from kiro_gateway.config import settings
+
+# 每条缓存记录的固定开销估算（对象、key、索引节点）
+ENTRY_OVERHEAD_BYTES = 1024
+
+
+class ToolSpecs:
+    """Converted form of one tools array."""
+
+    __slots__ = ("tools", "processed_tools", "documentation", "kiro_tools", "size")
+
+    def __init__(
+        self,
+        tools: tuple,
+        processed_tools: Optional[tuple],
+        documentation: str,
+        kiro_tools: tuple,
+        size: int = 0
+    ):
+        """
+        Args:
+            tools: OpenAI Tool objects (identity index for build_kiro_payload)
+            processed_tools: Tools with long descriptions replaced by references
+            documentation: Tool documentation appended to the system prompt
+            kiro_tools: Kiro toolSpecification entries
+            size: Approximate memory footprint in bytes
+        """
+        self.tools = tools
+        self.processed_tools = processed_tools
+        self.documentation = documentation
+        self.kiro_tools = kiro_tools
+        self.size = size
+
+
+class ToolSpecCache:
+    """Memory-bounded LRU of converted tool arrays keyed by canonical hash."""
+
+    def __init__(self, max_bytes: int):
+        """
+        Args:
+            max_bytes: Memory budget (0 disables the cache)
+        """
+        self.max_bytes = max(0, max_bytes)
+        self._entries: "OrderedDict[bytes, ToolSpecs]" = OrderedDict()
+        self._by_identity: Dict[Tuple[int, ...], bytes] = {}
+        self._bytes = 0
+        self._lock = Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_bytes > 0
+
+    @staticmethod
+    def key(namespace: str, tools: Sequence[Any]) -> Optional[Tuple[bytes, int]]:
+        """
+        Hash a tools array canonically (sorted keys, None fields dropped).
+
+        Returns:
+            (key, serialized size) or None if the tools cannot be serialized
+        """
+        try:
+            data = json.dumps(
+                [tool.model_dump(exclude_none=True) if hasattr(tool, "model_dump") else tool for tool in tools],
+                ensure_ascii=False,
+                sort_keys=True,
+            ).encode("utf-8", "surrogatepass")
+        except (TypeError, ValueError):
+            return None
+        h = hashlib.blake2b(namespace.encode(), digest_size=16)
+        h.update(data)
+        return h.digest(), len(data)
+
+    def get(self, key: bytes) -> Optional[ToolSpecs]:
+        """Return cached specs for a key (None on miss)."""
+        with self._lock:
+            specs = self._entries.get(key)
+            if specs is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return specs
+
+    def get_by_identity(self, tools: Sequence[Any]) -> Optional[ToolSpecs]:
+        """
+        Return cached specs whose Tool objects are exactly these objects.
+
+        Does not count a hit: identity matches only come from tools that
+        convert_anthropic_tools_to_openai already looked up (and counted)
+        for the same request.
+        """
+        with self._lock:
+            key = self._by_identity.get(tuple(map(id, tools)))
+            specs = self._entries.get(key) if key is not None else None
+            if specs is None or len(specs.tools) != len(tools):
+                return None
+            if not all(cached is tool for cached, tool in zip(specs.tools, tools)):
+                return None
+            self._entries.move_to_end(key)
+            return specs
+
+    def put(self, key: bytes, specs: ToolSpecs) -> None:
+        """Store specs, evicting least recently used entries beyond the budget."""
+        specs.size += ENTRY_OVERHEAD_BYTES
+        if specs.size > self.max_bytes:
+            return
+        with self._lock:
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self._forget(previous)
+            self._entries[key] = specs
+            self._by_identity[tuple(map(id, specs.tools))] = key
+            self._bytes += specs.size
+            while self._bytes > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self._forget(evicted)
+                self.evictions += 1
+
+    def _forget(self, specs: ToolSpecs) -> None:
+        """Drop the accounting and identity index of a removed entry (caller holds lock)."""
+        self._bytes -= specs.size
+        self._by_identity.pop(tuple(map(id, specs.tools)), None)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._by_identity.clear()
+            self._bytes = 0
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "size": len(self._entries),
+                "bytes": self._bytes,
+                "maxBytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hitRate": round(self.hits / total, 4) if total else 0.0,
+            }
+
+
+# Global tool spec cache instance
+tool_spec_cache = ToolSpecCache(int(settings.tool_spec_cache_mb * 1024 * 1024))
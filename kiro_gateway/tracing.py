@@ -0,0 +1,244 @@
+# -*- coding: utf-8 -*-
+
+"""
+KiroGate 请求阶段计时（trace spans）。
+
+GatewayMiddleware 为每个请求创建一个 SpanRecorder，挂在 request.state.spans 上，
+并通过 contextvar 暴露给同一请求内的代码（认证、请求转换、上游请求、流式生成器），
+调用方无需层层传递。请求结束时各阶段耗时写入 metrics 直方图，非流式响应附带
+Server-Timing 头；配置 TRACE_EXPORT_FILE 后，span 以 OTLP/JSON 格式逐行追加到本地文件。
+"""
+
+import json
+import os
+import queue
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar, Token
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from loguru import logger
+
+from kiro_gateway.config import APP_VERSION, settings
+
+_current: ContextVar[Optional["SpanRecorder"]] = ContextVar("kirogate_spans", default=None)
+
+
+class SpanRecorder:
+    """Phase timings of one request."""
+
+    __slots__ = ("name", "trace_id", "span_id", "start_ns", "_start", "spans")
+
+    def __init__(self, name: str):
+        """
+        Args:
+            name: Root span name (e.g. "POST /v1/messages")
+        """
+        self.name = name
+        self.trace_id = os.urandom(16).hex()
+        self.span_id = os.urandom(8).hex()
+        self.start_ns = time.time_ns()
+        self._start = time.perf_counter()
+        self.spans: List[Tuple[str, float, float]] = []  # (name, offset, duration) in seconds
+
+    def record(self, name: str, duration: float, start: Optional[float] = None) -> None:
+        """
+        Record a finished phase.
+
+        Args:
+            name: Phase name (Server-Timing token, no spaces)
+            duration: Duration in seconds
+            start: perf_counter() at phase start (defaults to now - duration)
+        """
+        if start is None:
+            start = time.perf_counter() - duration
+        self.spans.append((name, start - self._start, duration))
+
+    @contextmanager
+    def span(self, name: str) -> Iterator[None]:
+        """Time the enclosed block as phase name."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(name, time.perf_counter() - start, start)
+
+    def elapsed(self) -> float:
+        """Seconds since the request started."""
+        return time.perf_counter() - self._start
+
+    def phase_totals(self) -> Dict[str, float]:
+        """Total duration per phase name (phases may repeat, e.g. on retries)."""
+        totals: Dict[str, float] = {}
+        for name, _offset, duration in self.spans:
+            totals[name] = totals.get(name, 0.0) + duration
+        return totals
+
+    def server_timing(self) -> str:
+        """Format phases as a Server-Timing header value (milliseconds)."""
+        parts = [f"{name};dur={duration * 1000:.1f}" for name, duration in self.phase_totals().items()]
+        parts.append(f"total;dur={self.elapsed() * 1000:.1f}")
+        return ", ".join(parts)
+
+    def to_otlp(self, status_code: int, attributes: Optional[Dict[str, object]] = None) -> Dict:
+        """Build an OTLP/JSON ExportTraceServiceRequest with the root span and one child per phase."""
+        def attr(key: str, value: object) -> Dict:
+            if isinstance(value, bool) or not isinstance(value, (int, float)):
+                return {"key": key, "value": {"stringValue": str(value)}}
+            if isinstance(value, int):
+                return {"key": key, "value": {"intValue": str(value)}}
+            return {"key": key, "value": {"doubleValue": value}}
+
+        end_ns = self.start_ns + int(self.elapsed() * 1e9)
+        root_attributes = [attr("http.response.status_code", status_code)]
+        root_attributes += [attr(k, v) for k, v in (attributes or {}).items() if v is not None]
+        spans = [{
+            "traceId": self.trace_id,
+            "spanId": self.span_id,
+            "name": self.name,
+            "kind": 2,  # SPAN_KIND_SERVER
+            "startTimeUnixNano": str(self.start_ns),
+            "endTimeUnixNano": str(end_ns),
+            "attributes": root_attributes,
+            "status": {"code": 2 if status_code >= 500 else 1},
+        }]
+        for name, offset, duration in self.spans:
+            start_ns = self.start_ns + int(offset * 1e9)
+            spans.append({
+                "traceId": self.trace_id,
+                "spanId": os.urandom(8).hex(),
+                "parentSpanId": self.span_id,
+                "name": name,
+                "kind": 1,  # SPAN_KIND_INTERNAL
+                "startTimeUnixNano": str(start_ns),
+                "endTimeUnixNano": str(start_ns + int(duration * 1e9)),
+            })
+        return {
+            "resourceSpans": [{
+                "resource": {"attributes": [
+                    attr("service.name", "kirogate"),
+                    attr("service.version", APP_VERSION),
+                ]},
+                "scopeSpans": [{"scope": {"name": "kiro_gateway"}, "spans": spans}],
+            }]
+        }
+
+
+def start_trace(name: str) -> Tuple[SpanRecorder, Token]:
+    """Create the recorder for the current request and make it current."""
+    recorder = SpanRecorder(name)
+    return recorder, _current.set(recorder)
+
+
+def end_trace(token: Token) -> None:
+    """Restore the previous recorder (call from the context that started the trace)."""
+    _current.reset(token)
+
+
+def current_spans() -> Optional[SpanRecorder]:
+    """Return the recorder of the current request, if any."""
+    return _current.get()
+
+
+@contextmanager
+def span(name: str) -> Iterator[None]:
+    """Time the enclosed block as a phase of the current request (no-op outside requests)."""
+    recorder = _current.get()
+    if recorder is None:
+        yield
+        return
+    with recorder.span(name):
+        yield
+
+
+def record_span(name: str, duration: float, start: Optional[float] = None) -> None:
+    """Record a measured phase on the current request (no-op outside requests)."""
+    recorder = _current.get()
+    if recorder is not None:
+        recorder.record(name, duration, start)
+
+
+class SpanExporter:
+    """Append OTLP/JSON traces to a local file from a background thread."""
+
+    MAX_QUEUE = 10000
+
+    def __init__(self, path: str = ""):
+        """
+        Args:
+            path: Output file (JSON lines); empty disables export
+        """
+        self.path = path
+        self._queue: queue.Queue = queue.Queue(maxsize=self.MAX_QUEUE)
+        self._thread: Optional[threading.Thread] = None
+        self._start_lock = threading.Lock()
+        self._dropped = 0
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.path)
+
+    def export(self, payload: Dict) -> None:
+        """Queue one trace; dropped (and counted) if the writer falls behind."""
+        if not self.path:
+            return
+        if self._thread is None:
+            with self._start_lock:
+                if self._thread is None:
+                    self._thread = threading.Thread(target=self._worker, name="span-exporter", daemon=True)
+                    self._thread.start()
+        try:
+            self._queue.put_nowait(payload)
+        except queue.Full:
+            self._dropped += 1
+
+    def stop(self, timeout: float = 5.0) -> None:
+        """Write queued traces and stop the writer thread."""
+        thread = self._thread
+        if thread is None:
+            return
+        self._queue.put(None)
+        thread.join(timeout)
+        self._thread = None
+
+    def _worker(self) -> None:
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        while True:
+            payload = self._queue.get()
+            if payload is None:
+                return
+            batch = [payload]
+            stop = False
+            while True:
+                try:
+                    payload = self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                if payload is None:
+                    stop = True
+                    break
+                batch.append(payload)
+            try:
+                with open(self.path, "a", encoding="utf-8") as f:
+                    for item in batch:
+                        f.write(json.dumps(item, ensure_ascii=False, separators=(",", ":")))
+                        f.write("\n")
+            except OSError as e:
+                logger.warning(f"Failed to export spans to {self.path}: {e}")
+            if stop:
+                return
+
+    def get_stats(self) -> Dict:
+        """Return exporter state."""
+        return {
+            "enabled": self.enabled,
+            "queueDepth": self._queue.qsize(),
+            "dropped": self._dropped,
+        }
+
+
+# Global span exporter instance
+span_exporter = SpanExporter(settings.trace_export_file)
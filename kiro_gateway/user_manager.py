@@ -27,7 +27,7 @@ from kiro_gateway.config import (
     GITHUB_TOKEN_URL,
     GITHUB_USER_URL,
 )
-from kiro_gateway.database import user_db, User
+from kiro_gateway.database import user_db, user_db_executor, User
 
 
 class UserSessionManager:
@@ -53,7 +53,7 @@ class UserSessionManager:
             "session_version": session_version
         })
 
-    def verify_session(self, token: str) -> Optional[int]:
+    async def verify_session(self, token: str) -> Optional[int]:
         """
         Verify session token and return user_id if valid.
 
@@ -62,26 +62,69 @@ class UserSessionManager:
         Returns:
             user_id if valid, None otherwise
         """
+        user = await self.get_session_user(token)
+        return user.id if user else None
+
+    async def get_session_user(self, token: str) -> Optional[User]:
+        """
+        Verify session token and return the user row if valid.
+
+        Verified sessions are cached by token until the cache TTL or the token's
+        max_age runs out; session_version bumps (logout), bans and other user
+        row changes invalidate them, so unchanged sessions need no DB reads.
+        Misses are loaded on a database reader thread.
+
+        Returns:
+            User if valid, None otherwise
+        """
         if not token:
             return None
-        try:
-            data = self._serializer.loads(token, max_age=settings.user_session_max_age)
-            user_id = data.get("user_id")
-            token_version = data.get("session_version", 1)
+        cached = user_db.session_cache.get(token)
+        if cached:
+            return cached[0]
+        return await user_db_executor.read(self.load_session_user, token)
 
-            if not user_id:
-                return None
+    def load_session_user(self, token: str) -> Optional[User]:
+        """
+        Verify a session token against the database and fill the session cache.
 
-            # Verify session version against database
-            current_version = user_db.get_session_version(user_id)
-            if token_version != current_version:
-                logger.debug(f"Session version mismatch for user {user_id}: token={token_version}, db={current_version}")
-                return None
+        Blocking; runs on a database reader thread (see get_session_user).
 
-            return user_id
+        Returns:
+            User if valid, None otherwise
+        """
+        generation = user_db.session_cache.generation
+        try:
+            data, signed_at = self._serializer.loads(
+                token,
+                max_age=settings.user_session_max_age,
+                return_timestamp=True
+            )
         except (BadSignature, SignatureExpired):
             return None
 
+        user_id = data.get("user_id")
+        token_version = data.get("session_version", 1)
+        if not user_id:
+            return None
+
+        # Verify session version against database
+        user = user_db.get_user(user_id)
+        if not user:
+            return None
+        if token_version != user.session_version:
+            logger.debug(f"Session version mismatch for user {user_id}: token={token_version}, db={user.session_version}")
+            return None
+
+        user_db.session_cache.put(
+            token,
+            user,
+            user.session_version,
+            generation,
+            expires_at=signed_at.timestamp() + settings.user_session_max_age
+        )
+        return user
+
     def create_oauth_state(self) -> str:
         """Create a random state for OAuth2 CSRF protection."""
         import time
@@ -321,7 +364,7 @@ class UserManager:
         user = user_db.get_user_by_linuxdo(linuxdo_id)
         if user:
             # Update last login
-            user_db.update_last_login(user.id)
+            await user_db_executor.run(user_db.update_last_login, user.id)
             # Check if banned
             if user.is_banned:
                 return None, "用户已被封禁"
@@ -332,7 +375,8 @@ class UserManager:
             if metrics.is_self_use_enabled():
                 return None, "自用模式下暂不开放注册"
             # Create new user
-            user = user_db.create_user(
+            user = await user_db_executor.run(
+                user_db.create_user,
                 linuxdo_id=linuxdo_id,
                 username=username,
                 avatar_url=avatar_url,
@@ -381,7 +425,7 @@ class UserManager:
         user = user_db.get_user_by_github(github_id)
         if user:
             # Update last login
-            user_db.update_last_login(user.id)
+            await user_db_executor.run(user_db.update_last_login, user.id)
             # Check if banned
             if user.is_banned:
                 return None, "用户已被封禁"
@@ -392,7 +436,8 @@ class UserManager:
             if metrics.is_self_use_enabled():
                 return None, "自用模式下暂不开放注册"
             # Create new user with GitHub ID
-            user = user_db.create_user(
+            user = await user_db_executor.run(
+                user_db.create_user,
                 github_id=github_id,
                 username=username,
                 avatar_url=avatar_url,
@@ -405,17 +450,14 @@ class UserManager:
         session_token = self.session.create_session(user.id, user.session_version)
         return user, session_token
 
-    def get_current_user(self, session_token: str) -> Optional[User]:
+    async def get_current_user(self, session_token: str) -> Optional[User]:
         """Get current user from session token."""
-        user_id = self.session.verify_session(session_token)
-        if not user_id:
-            return None
-        user = user_db.get_user(user_id)
+        user = await self.session.get_session_user(session_token)
         if user and (user.is_banned or user.approval_status != "approved"):
             return None
         return user
 
-    def register_with_email(
+    async def register_with_email(
         self,
         email: str,
         password: str,
@@ -436,7 +478,8 @@ class UserManager:
         display_name = (username or "").strip() or email.split("@", 1)[0]
         approval_status = "pending" if metrics.is_require_approval() else "approved"
         password_hash = self._hash_password(password)
-        user = user_db.create_user(
+        user = await user_db_executor.run(
+            user_db.create_user,
             username=display_name,
             email=email,
             password_hash=password_hash,
@@ -447,7 +490,7 @@ class UserManager:
         session_token = self.session.create_session(user.id, user.session_version)
         return user, session_token
 
-    def login_with_email(self, email: str, password: str) -> Tuple[Optional[User], Optional[str]]:
+    async def login_with_email(self, email: str, password: str) -> Tuple[Optional[User], Optional[str]]:
         """Login with email/password."""
         email = (email or "").strip().lower()
         if not email or not password:
@@ -461,11 +504,11 @@ class UserManager:
             return None, "用户已被封禁"
         if user.approval_status != "approved":
             return None, "账号审核中" if user.approval_status == "pending" else "账号已被拒绝"
-        user_db.update_last_login(user.id)
+        await user_db_executor.run(user_db.update_last_login, user.id)
         session_token = self.session.create_session(user.id, user.session_version)
         return user, session_token
 
-    def logout(self, user_id: int) -> bool:
+    async def logout(self, user_id: int) -> bool:
         """
         Logout user by incrementing session version.
 
@@ -477,7 +520,7 @@ class UserManager:
         Returns:
             True on success
         """
-        user_db.increment_session_version(user_id)
+        await user_db_executor.run(user_db.increment_session_version, user_id)
         logger.info(f"User {user_id} logged out, session version incremented")
         return True
 
@@ -38,7 +38,7 @@ from loguru import logger
 
 from kiro_gateway.auth import KiroAuthManager
 from kiro_gateway.models import AnthropicMessagesRequest
-from kiro_gateway.tokenizer import count_message_tokens, count_tools_tokens
+from kiro_gateway.tokenizer import count_message_tokens_async, count_tools_tokens_async
 from kiro_gateway.utils import get_kiro_headers
 
 
@@ -504,9 +504,9 @@ async def handle_websearch_request(
     try:
         messages_list = [msg.model_dump() for msg in request_data.messages]
         tools_list = [tool.model_dump() for tool in request_data.tools] if request_data.tools else None
-        input_tokens = count_message_tokens(messages_list)
+        input_tokens = await count_message_tokens_async(messages_list)
         if tools_list:
-            input_tokens += count_tools_tokens(tools_list)
+            input_tokens += await count_tools_tokens_async(tools_list)
     except Exception:
         input_tokens = 100  # 默认值
 
@@ -50,7 +50,7 @@ from kiro_gateway.auth import KiroAuthManager
 from kiro_gateway.cache import ModelInfoCache
 from kiro_gateway.routes import router, limiter, rate_limit_handler
 from kiro_gateway.exceptions import validation_exception_handler
-from kiro_gateway.middleware import RequestTrackingMiddleware, MetricsMiddleware, SiteGuardMiddleware
+from kiro_gateway.middleware import GatewayMiddleware
 from kiro_gateway.http_client import close_global_http_client
 
 
@@ -278,6 +278,10 @@ async def lifespan(app: FastAPI):
     from kiro_gateway.health_checker import health_checker
     await health_checker.start()
 
+    # Start event loop lag monitor
+    from kiro_gateway.loop_monitor import loop_monitor
+    await loop_monitor.start()
+
     yield
 
     logger.info("Shutting down application...")
@@ -285,6 +289,9 @@ async def lifespan(app: FastAPI):
     # Stop health checker
     await health_checker.stop()
 
+    # Stop event loop lag monitor
+    await loop_monitor.stop()
+
     # 停止后台任务
     if has_global_credentials:
         await model_cache.stop_background_refresh()
@@ -292,6 +299,18 @@ async def lifespan(app: FastAPI):
     # 关闭全局 HTTP 客户端
     await close_global_http_client()
 
+    # 写入排队中的数据库操作并停止执行线程
+    from kiro_gateway.database import user_db_executor
+    from kiro_gateway.metrics import metrics
+    from kiro_gateway.token_calibration import token_calibrator
+    token_calibrator.save()
+    await asyncio.to_thread(user_db_executor.stop)
+    await asyncio.to_thread(metrics.close)
+
+    # 写入排队中的 span 导出数据
+    from kiro_gateway.tracing import span_exporter
+    await asyncio.to_thread(span_exporter.stop)
+
     logger.info("Application shutdown complete.")
 
 
@@ -305,10 +324,8 @@ app = FastAPI(
     redoc_url=None  # 禁用默认的 /redoc
 )
 
-# 添加中间件（顺序很重要：最后添加的最先执行）
-app.add_middleware(RequestTrackingMiddleware)
-app.add_middleware(MetricsMiddleware)
-app.add_middleware(SiteGuardMiddleware)
+# 添加中间件：站点/IP 检查、统计、请求追踪合并为单层原生 ASGI 中间件
+app.add_middleware(GatewayMiddleware)
 
 # 设置速率限制器
 app.state.limiter = limiter
@@ -0,0 +1,79 @@
+# -*- coding: utf-8 -*-
+
+"""随机 Anthropic Messages 请求生成器（差分测试共用）。"""
+
+import random
+from typing import Any, Dict, List, Optional
+
+MODEL = "claude-sonnet-4"
+
+
+def _block(rng: random.Random, role: str, index: int) -> Dict[str, Any]:
+    choice = rng.random()
+    if role == "assistant":
+        if choice < 0.3:
+            return {"type": "tool_use", "id": f"toolu_{index}", "name": f"tool_{index % 3}",
+                    "input": {"query": f"q{index}", "limit": [1, 2]}}
+        if choice < 0.4:
+            return {"type": "thinking", "thinking": f"thinking {index}", "signature": "sig"}
+        return {"type": "text", "text": f"answer {index} 中文"}
+    if choice < 0.3:
+        content = rng.choice(["ok", [{"type": "text", "text": f"result {index}"}], None, ""])
+        block = {"type": "tool_result", "tool_use_id": f"toolu_{index}", "is_error": rng.random() < 0.2}
+        if content is not None:
+            block["content"] = content
+        return block
+    if choice < 0.4:
+        return {"type": "image", "source": {"type": "base64", "media_type": "image/jpeg", "data": "QUJD"}}
+    if choice < 0.45:
+        return {"type": "document", "source": {"type": "text", "data": "doc"}}
+    return {"type": "text", "text": f"question {index}"}
+
+
+def _content(rng: random.Random, role: str, index: int) -> Any:
+    if rng.random() < 0.3:
+        return f"plain {role} {index}"
+    return [_block(rng, role, index * 10 + k) for k in range(rng.randint(0, 3))]
+
+
+def _tools(rng: random.Random) -> Optional[List[Dict[str, Any]]]:
+    if rng.random() < 0.3:
+        return None
+    return [
+        {
+            "name": f"tool_{k}",
+            "description": "d" * rng.choice([3, 100, 12000]),
+            "input_schema": {"type": "object", "properties": {"query": {"type": "string"}}, "k": k},
+        }
+        for k in range(rng.randint(1, 5))
+    ]
+
+
+def _system(rng: random.Random) -> Any:
+    return rng.choice([
+        None,
+        "system prompt",
+        [{"type": "text", "text": "A"}, {"type": "text", "text": "B", "cache_control": {"type": "ephemeral"}}],
+        [],
+    ])
+
+
+def random_anthropic_request(rng: random.Random) -> Dict[str, Any]:
+    """Random /v1/messages body covering text, images, tools, tool results, thinking and system blocks."""
+    messages = [
+        {"role": rng.choice(["user", "assistant", "user"]), "content": None}
+        for _ in range(rng.randint(1, 12))
+    ]
+    for index, message in enumerate(messages):
+        message["content"] = _content(rng, message["role"], index)
+    body = {
+        "model": MODEL,
+        "max_tokens": 100,
+        "messages": messages,
+        "system": _system(rng),
+        "tools": _tools(rng),
+        "thinking": rng.choice([None, {"type": "enabled", "budget_tokens": 2000}]),
+    }
+    if rng.random() < 0.3:
+        body["tool_choice"] = rng.choice([{"type": "auto"}, {"type": "any"}, {"type": "tool", "name": "tool_0"}])
+    return body
@@ -0,0 +1,26 @@
+# -*- coding: utf-8 -*-
+
+"""
+测试环境配置。
+
+kiro_gateway.config 在导入时读取环境变量，容器中检测到默认密钥会拒绝启动，
+数据库默认写入 data/ 目录，因此在导入任何 kiro_gateway 模块之前设置测试用的
+密钥和临时数据库路径。
+"""
+
+import os
+import sys
+import tempfile
+from pathlib import Path
+
+_TEST_DATA_DIR = tempfile.mkdtemp(prefix="kirogate-tests-")
+
+os.environ.setdefault("PROXY_API_KEY", "test-proxy-key")
+os.environ.setdefault("ADMIN_PASSWORD", "test-admin-password")
+os.environ.setdefault("ADMIN_SECRET_KEY", "test-admin-secret-key-0123456789abcdef")
+os.environ.setdefault("USER_SESSION_SECRET", "test-user-session-secret-0123456789abcdef")
+os.environ.setdefault("TOKEN_ENCRYPT_KEY", "test-token-encrypt-key-0123456789")
+os.environ.setdefault("USER_DB_FILE", os.path.join(_TEST_DATA_DIR, "users.db"))
+os.environ.setdefault("METRICS_DB_FILE", os.path.join(_TEST_DATA_DIR, "metrics.db"))
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
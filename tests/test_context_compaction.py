@@ -0,0 +1,246 @@
+# -*- coding: utf-8 -*-
+
+"""
+上下文压缩测试。
+
+token 计数替换为按字符计数（系数 1.0），使预算可以精确构造。检查按轮次丢弃
+历史、当前消息带 toolResults 时保留最后一轮、裁剪后 toolUse/toolResult
+仍然成对，以及原始（可能与缓存共享的）history 条目不被修改。
+"""
+
+import asyncio
+import copy
+import json
+import random
+import threading
+from types import SimpleNamespace
+
+import pytest
+from fastapi import HTTPException
+
+from kiro_gateway import context_compaction, request_handler
+from kiro_gateway.context_compaction import ContextCompactor
+from kiro_gateway.models import ChatCompletionRequest
+from kiro_gateway.token_calibration import token_calibrator
+
+SYSTEM = "You are a careful assistant."
+
+
+@pytest.fixture(autouse=True)
+def char_tokens(monkeypatch):
+    monkeypatch.setattr(context_compaction, "count_tokens", lambda text, apply_claude_correction=True: len(text))
+    monkeypatch.setattr(token_calibrator, "factor", lambda model, bucket="latin": 1.0)
+
+
+def _user(content, results=()):
+    message = {"content": content, "modelId": "CLAUDE_SONNET_4_20250514_V1_0", "origin": "AI_EDITOR"}
+    if results:
+        message["userInputMessageContext"] = {"toolResults": [
+            {"toolUseId": tool_use_id, "status": "success", "content": [{"text": text}]}
+            for tool_use_id, text in results
+        ]}
+    return {"userInputMessage": message}
+
+
+def _assistant(content, tool_use_ids=()):
+    message = {"content": content}
+    if tool_use_ids:
+        message["toolUses"] = [
+            {"toolUseId": tool_use_id, "name": "lookup", "input": {"q": tool_use_id}} for tool_use_id in tool_use_ids
+        ]
+    return {"assistantResponseMessage": message}
+
+
+def _compactor(budget):
+    return ContextCompactor(budget, "claude-sonnet-4", target=1.0, tool_result_max_chars=1000)
+
+
+def _total(history, current):
+    counter = _compactor(1)
+    return sum(counter._entry_tokens(entry) for entry in history) + counter._entry_tokens(current)
+
+
+def _assert_tool_pairing(history, current):
+    """Every toolResult answers a toolUse of the assistant entry right before it."""
+    entries = history + [{"userInputMessage": current}]
+    for index, entry in enumerate(entries):
+        message = entry.get("userInputMessage")
+        if not message:
+            continue
+        ids = [result["toolUseId"] for result in message.get("userInputMessageContext", {}).get("toolResults", ())]
+        if not ids:
+            continue
+        assert index > 0 and "assistantResponseMessage" in entries[index - 1], entries
+        tool_uses = entries[index - 1]["assistantResponseMessage"].get("toolUses", ())
+        assert set(ids) <= {tool_use["toolUseId"] for tool_use in tool_uses}, entries
+
+
+def test_history_within_budget_is_returned_unchanged():
+    history = [_user(f"{SYSTEM}\n\nhello"), _assistant("hi")]
+    current = _user("how are you")["userInputMessage"]
+    compactor = _compactor(10_000)
+
+    assert compactor.compact(history, current, SYSTEM) is history
+    assert not compactor.trimmed
+    assert current["content"] == "how are you"
+
+
+def test_oldest_turns_are_dropped_at_turn_boundaries():
+    history = [
+        _user(f"{SYSTEM}\n\n" + "a" * 400), _assistant("b" * 400),
+        _user("c" * 400), _assistant("d" * 400), _assistant("e" * 50),
+        _user("f" * 400), _assistant("g" * 400),
+    ]
+    original = copy.deepcopy(history)
+    current = _user("latest question")["userInputMessage"]
+    # 只需丢弃第一轮即可满足预算
+    budget = _total(history, current) - 500
+    compactor = _compactor(budget)
+    result = compactor.compact(history, current, SYSTEM)
+
+    assert compactor.dropped_messages == 2
+    assert result[1:] == history[3:]
+    first = result[0]["userInputMessage"]["content"]
+    assert first == "\n\n".join([SYSTEM, ContextCompactor.OMITTED_NOTE.format(count=2), "c" * 400])
+    assert compactor.tokens_after == _total(result, current) <= budget
+    assert history == original
+
+
+def test_whole_turn_is_dropped_with_trailing_assistant_messages():
+    history = [
+        _user("a" * 400), _assistant("b" * 400), _assistant("c" * 400),
+        _user("d" * 400), _assistant("e" * 400),
+    ]
+    current = _user("latest")["userInputMessage"]
+    compactor = _compactor(_total(history, current) - 500)
+    result = compactor.compact(history, current, SYSTEM)
+
+    assert compactor.dropped_messages == 3
+    assert "userInputMessage" in result[0]
+    assert result[1:] == history[4:]
+
+
+def test_all_history_may_be_dropped_without_tool_results():
+    history = [_user(f"{SYSTEM}\n\n" + "a" * 800), _assistant("b" * 800)]
+    current = _user("latest question")["userInputMessage"]
+    compactor = _compactor(300)
+    result = compactor.compact(history, current, SYSTEM)
+
+    assert result == []
+    assert compactor.dropped_messages == 2
+    note = ContextCompactor.OMITTED_NOTE.format(count=2)
+    assert current["content"] == f"{SYSTEM}\n\n{note}\n\nlatest question"
+    assert compactor.tokens_after == _total(result, current) <= 300
+
+
+def test_last_turn_is_kept_when_current_message_answers_its_tool_uses():
+    history = [
+        _user("a" * 800), _assistant("b" * 800),
+        _user("c" * 800), _assistant("d" * 800, ["toolu_1", "toolu_2"]),
+    ]
+    current = _user("", [("toolu_1", "one"), ("toolu_2", "two")])["userInputMessage"]
+    compactor = _compactor(400)
+    result = compactor.compact(history, current, SYSTEM)
+
+    # limit：最后一轮（包含对应 toolUses 的 assistant）不能丢弃
+    assert compactor.dropped_messages == 2
+    assert len(result) == 2
+    assert result[1]["assistantResponseMessage"]["toolUses"] == history[3]["assistantResponseMessage"]["toolUses"]
+    assert current["userInputMessageContext"]["toolResults"][0]["content"] == [{"text": "one"}]
+    _assert_tool_pairing(result, current)
+    assert compactor.tokens_after == _total(result, current)
+
+
+def test_tool_results_of_dropped_tool_uses_are_removed():
+    history = [
+        _user("a" * 800), _assistant("b" * 800, ["toolu_1"]),
+        _user("c" * 100, [("toolu_1", "r" * 100)]), _assistant("d" * 100),
+    ]
+    original = copy.deepcopy(history)
+    current = _user("next")["userInputMessage"]
+    compactor = _compactor(_total(history, current) - 1000)
+    result = compactor.compact(history, current, SYSTEM)
+
+    assert compactor.dropped_messages == 2
+    first = result[0]["userInputMessage"]
+    assert "userInputMessageContext" not in first
+    assert first["content"].endswith("c" * 100)
+    _assert_tool_pairing(result, current)
+    assert history == original
+
+
+def test_old_tool_results_are_truncated_before_dropping_turns():
+    history = [
+        _user("a" * 100), _assistant("b" * 100, ["toolu_1"]),
+        _user("c" * 100, [("toolu_1", "r" * 5000)]), _assistant("d" * 100),
+    ]
+    current = _user("next")["userInputMessage"]
+    compactor = _compactor(_total(history, current) - 3000)
+    result = compactor.compact(history, current, SYSTEM)
+
+    assert compactor.truncated_tool_results == 1
+    assert compactor.dropped_messages == 0
+    assert len(result) == 4
+    text = result[2]["userInputMessage"]["userInputMessageContext"]["toolResults"][0]["content"][0]["text"]
+    assert text.startswith("r" * 500) and text.endswith("r" * 500) and "omitted by KiroGate" in text
+    assert history[2]["userInputMessage"]["userInputMessageContext"]["toolResults"][0]["content"][0]["text"] == "r" * 5000
+
+
+def _random_conversation(rng: random.Random):
+    """Kiro history with valid tool pairing and a current message that may answer the last tool uses."""
+    history = []
+    pending = []
+    for turn in range(rng.randint(1, 8)):
+        results = [(tool_use_id, "r" * rng.randint(10, 3000)) for tool_use_id in pending]
+        history.append(_user("u" * rng.randint(1, 1500), results))
+        pending = [f"toolu_{turn}_{k}" for k in range(rng.choice([0, 0, 1, 2]))]
+        history.append(_assistant("a" * rng.randint(1, 1500), pending))
+        if not pending and rng.random() < 0.2:
+            history.append(_assistant("x" * rng.randint(1, 300)))
+    results = [(tool_use_id, "r" * rng.randint(10, 3000)) for tool_use_id in pending]
+    current = _user("q" * rng.randint(0, 2000), results)["userInputMessage"]
+    return history, current
+
+
+@pytest.mark.parametrize("seed", range(200))
+def test_random_compaction_keeps_tool_pairing_and_budget(seed):
+    rng = random.Random(seed)
+    history, current = _random_conversation(rng)
+    original = copy.deepcopy(history)
+    total = _total(history, current)
+    budget = max(int(total * rng.uniform(0.05, 1.1)), 2500)
+    compactor = _compactor(budget)
+    result = compactor.compact(history, current, SYSTEM)
+
+    _assert_tool_pairing(result, current)
+    assert history == original
+    if compactor.tokens_before:
+        assert compactor.tokens_after == _total(result, current)
+        assert compactor.tokens_after <= budget
+    if result and compactor.dropped_messages:
+        assert "userInputMessage" in result[0]
+
+
+def test_build_runs_in_worker_thread_when_compaction_is_enabled(monkeypatch):
+    threads = []
+
+    def fake_build(*args, **kwargs):
+        threads.append((threading.current_thread(), kwargs["compactor"]))
+        raise ValueError("stop")
+
+    monkeypatch.setattr(request_handler, "build_kiro_payload", fake_build)
+    request = SimpleNamespace(
+        state=SimpleNamespace(auth_manager=SimpleNamespace(profile_arn="arn")),
+        app=SimpleNamespace(state=SimpleNamespace(model_cache=SimpleNamespace(get_max_input_tokens=lambda model: 200_000))),
+    )
+    request_data = ChatCompletionRequest(model="claude-sonnet-4", messages=[{"role": "user", "content": "hi"}])
+
+    for enabled in (True, False):
+        monkeypatch.setattr(request_handler.settings, "context_compaction_enabled", enabled)
+        with pytest.raises(HTTPException) as error:
+            asyncio.run(request_handler.RequestHandler.process_request(request, request_data, "/v1/chat/completions"))
+        assert error.value.status_code == 400
+
+    (compacting_thread, compactor), (plain_thread, no_compactor) = threads
+    assert compactor is not None and compacting_thread is not threading.main_thread()
+    assert no_compactor is None and plain_thread is threading.main_thread()
@@ -0,0 +1,96 @@
+# -*- coding: utf-8 -*-
+
+"""
+Anthropic 直接构建 payload 的差分测试。
+
+build_kiro_payload_from_anthropic 必须与原路径
+convert_anthropic_to_openai_request -> build_kiro_payload 生成完全相同的
+Kiro payload，并返回相同的 token 计数输入（消息字段和 tools）。
+"""
+
+import copy
+import random
+
+import pytest
+
+from anthropic_requests import random_anthropic_request
+from kiro_gateway.converters import (
+    build_kiro_payload,
+    build_kiro_payload_from_anthropic,
+    convert_anthropic_to_openai_request,
+)
+from kiro_gateway.history_cache import history_cache
+from kiro_gateway.models import AnthropicMessagesRequest, ChatMessage
+from kiro_gateway.tool_spec_cache import tool_spec_cache
+
+# ChatMessage.model_dump() 中未显式给出的字段
+MESSAGE_DEFAULTS = {name: None for name in ("name", "tool_calls", "tool_call_id")}
+
+
+def _two_step(body: dict):
+    request = AnthropicMessagesRequest(**copy.deepcopy(body))
+    try:
+        openai_request = convert_anthropic_to_openai_request(request)
+        payload = build_kiro_payload(openai_request, "conversation", "arn", thinking_config=request.thinking)
+    except ValueError as e:
+        return ("error", str(e)), None
+    payload["conversationState"].pop("agentContinuationId")
+    messages = [message.model_dump() for message in openai_request.messages]
+    tools = [tool.model_dump() for tool in openai_request.tools] if openai_request.tools else None
+    return payload, (messages, tools)
+
+
+def _direct(body: dict):
+    request = AnthropicMessagesRequest(**copy.deepcopy(body))
+    try:
+        payload, message_fields, tools = build_kiro_payload_from_anthropic(
+            request, "conversation", "arn", thinking_config=request.thinking
+        )
+    except ValueError as e:
+        return ("error", str(e)), None
+    payload["conversationState"].pop("agentContinuationId")
+    messages = [{**MESSAGE_DEFAULTS, **fields} for fields in message_fields]
+    tools = [tool.model_dump() for tool in tools] if tools else None
+    return payload, (messages, tools)
+
+
+@pytest.fixture(params=["caches-on", "caches-off"])
+def caches(request):
+    """Run each comparison with the history and tool spec caches enabled and disabled."""
+    budgets = history_cache.max_bytes, tool_spec_cache.max_bytes
+    if request.param == "caches-off":
+        history_cache.max_bytes = tool_spec_cache.max_bytes = 0
+    else:
+        history_cache.max_bytes = tool_spec_cache.max_bytes = 64 * 1024 * 1024
+    history_cache.clear()
+    tool_spec_cache.clear()
+    yield
+    history_cache.max_bytes, tool_spec_cache.max_bytes = budgets
+    history_cache.clear()
+    tool_spec_cache.clear()
+
+
+@pytest.mark.parametrize("seed", range(8))
+def test_direct_payload_matches_two_step_conversion(seed, caches):
+    rng = random.Random(seed)
+    for _ in range(50):
+        body = random_anthropic_request(rng)
+        expected_payload, expected_inputs = _two_step(body)
+        # 直接路径先运行一次、再在已填充的缓存上运行一次
+        for _ in range(2):
+            payload, inputs = _direct(body)
+            assert payload == expected_payload, body
+            assert inputs == expected_inputs, body
+
+
+def test_token_inputs_build_the_same_messages(caches):
+    rng = random.Random(1234)
+    for _ in range(50):
+        body = random_anthropic_request(rng)
+        request = AnthropicMessagesRequest(**copy.deepcopy(body))
+        try:
+            _, message_fields, _ = build_kiro_payload_from_anthropic(request, "conversation", "arn")
+        except ValueError:
+            continue
+        openai_request = convert_anthropic_to_openai_request(AnthropicMessagesRequest(**copy.deepcopy(body)))
+        assert [ChatMessage(**fields) for fields in message_fields] == openai_request.messages
@@ -0,0 +1,43 @@
+# -*- coding: utf-8 -*-
+
+"""/v1/messages/count_tokens/batch 端点测试。"""
+
+import os
+
+import pytest
+from fastapi.testclient import TestClient
+
+BODY = {"requests": [
+    {"model": "claude-sonnet-4", "messages": [{"role": "user", "content": "hello world"}]},
+    {"model": "claude-sonnet-4", "system": "be brief", "messages": [{"role": "user", "content": "hello world"}]},
+]}
+
+
+@pytest.fixture(scope="module")
+def client():
+    import main
+
+    main.app.state.auth_manager = object()
+    return TestClient(main.app)
+
+
+def test_requires_api_key(client):
+    assert client.post("/v1/messages/count_tokens/batch", json=BODY).status_code == 401
+
+
+def test_matches_single_count_tokens(client):
+    headers = {"x-api-key": os.environ["PROXY_API_KEY"]}
+    response = client.post("/v1/messages/count_tokens/batch", json=BODY, headers=headers)
+    assert response.status_code == 200
+
+    single = [
+        client.post("/v1/messages/count_tokens", json={**item, "max_tokens": 1}, headers=headers).json()
+        for item in BODY["requests"]
+    ]
+    assert response.json()["results"] == single
+
+
+def test_rejects_empty_batch(client):
+    headers = {"x-api-key": os.environ["PROXY_API_KEY"]}
+    response = client.post("/v1/messages/count_tokens/batch", json={"requests": []}, headers=headers)
+    assert response.status_code == 422
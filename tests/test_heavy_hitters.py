@@ -0,0 +1,95 @@
+# -*- coding: utf-8 -*-
+
+"""
+SpaceSavingCounter 分页测试：维护的顺序（计数、最近访问、Key、前缀搜索）
+必须与对全部条目排序后切片的结果一致。
+"""
+
+import random
+
+import pytest
+
+from kiro_gateway.heavy_hitters import SpaceSavingCounter, _SortedKeys
+
+ORDER_FIELDS = {"count": 1, "last_seen": 2, "key": 0}
+
+
+def _random_ip(rng: random.Random) -> str:
+    return f"10.{rng.randint(0, 3)}.{rng.randint(0, 20)}.{rng.randint(0, 9)}"
+
+
+def _exercise(rng: random.Random, capacity):
+    counter = SpaceSavingCounter(capacity)
+    now = 0
+    for _ in range(rng.randint(0, 40)):
+        now += 1
+        counter.load(_random_ip(rng), rng.randint(1, 30), now)
+    for _ in range(rng.randint(0, 3000)):
+        now += 1
+        roll = rng.random()
+        ip = _random_ip(rng)
+        if roll < 0.01:
+            counter.pin(ip)
+        elif roll < 0.02:
+            counter.unpin(ip)
+        else:
+            counter.add(ip, now, pinned=roll < 0.03)
+    return counter
+
+
+def _check_pages(counter: SpaceSavingCounter, order: str, descending: bool, prefix: str, page_size: int):
+    field = ORDER_FIELDS[order]
+    expected = sorted(
+        (row for row in counter.items() if row[0].startswith(prefix)),
+        key=lambda row: row[field],
+        reverse=descending,
+    )
+    seen = []
+    for offset in range(0, len(expected) + page_size, page_size):
+        rows, total = counter.page(order, descending, offset, page_size, prefix=prefix)
+        assert total == len(expected)
+        assert rows == [counter._row(row[0]) for row in rows]
+        # 同值条目之间的顺序不作要求，只比较排序字段
+        assert [row[field] for row in rows] == [row[field] for row in expected[offset:offset + page_size]]
+        seen.extend(row[0] for row in rows)
+    assert sorted(seen) == sorted(row[0] for row in expected)
+
+
+@pytest.mark.parametrize("seed", range(30))
+@pytest.mark.parametrize("capacity", [None, 25])
+def test_pages_match_sorted_items(seed, capacity):
+    rng = random.Random(seed)
+    counter = _exercise(rng, capacity)
+    for order in ORDER_FIELDS:
+        for descending in (True, False):
+            for prefix in ("", "10.1.", "10.2.1", "10.9"):
+                _check_pages(counter, order, descending, prefix, rng.choice([1, 7, 50]))
+
+
+def test_sorted_keys_split_and_shrink_blocks():
+    rng = random.Random(5)
+    index = _SortedKeys()
+    reference = set()
+    for _ in range(20000):
+        key = f"k{rng.randint(0, 5000):05d}"
+        if key in reference and rng.random() < 0.5:
+            index.remove(key)
+            reference.discard(key)
+        elif key not in reference:
+            index.add(key)
+            reference.add(key)
+    expected = sorted(reference)
+    assert len(index) == len(expected)
+    assert index.range(0, len(index)) == expected
+    assert index.range(1000, 1010) == expected[1000:1010]
+    assert index.position("k02500") == sum(1 for key in expected if key < "k02500")
+    assert len(index._blocks) > 1
+
+
+def test_recent_hits_move_to_the_front_of_last_seen_order():
+    counter = SpaceSavingCounter()
+    for now, ip in enumerate(["a", "b", "c", "a"], start=1):
+        counter.add(ip, now)
+    rows, total = counter.page("last_seen", True, 0, 10)
+    assert total == 3
+    assert [row[0] for row in rows] == ["a", "c", "b"]
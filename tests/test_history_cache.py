@@ -0,0 +1,199 @@
+# -*- coding: utf-8 -*-
+
+"""
+history 增量缓存等价性测试。
+
+缓存命中、未命中、关闭缓存三种情况下构建出的 payload 必须与逐条合并后
+整体转换（build_kiro_history(merge_adjacent_messages(...))）的结果一致。
+"""
+
+import json
+import random
+
+import pytest
+
+from kiro_gateway.config import get_internal_model_id
+from kiro_gateway.converters import (
+    _extract_system_and_tool_docs,
+    build_kiro_history,
+    build_kiro_payload,
+    extract_text_content,
+    merge_adjacent_messages,
+)
+from kiro_gateway.history_cache import history_cache
+from kiro_gateway.models import ChatCompletionRequest, ChatMessage
+
+MODEL = "claude-sonnet-4"
+IMAGE_URL = "data:image/png;base64,iVBORw0KGgo="
+
+
+def _user_message(rng: random.Random, turn: int) -> dict:
+    kind = rng.choice(["text", "text", "image", "blocks"])
+    if kind == "text":
+        return {"role": "user", "content": f"question {turn} {rng.random():.6f}"}
+    if kind == "image":
+        return {"role": "user", "content": [
+            {"type": "text", "text": f"look at picture {turn}"},
+            {"type": "image_url", "image_url": {"url": IMAGE_URL}},
+        ]}
+    return {"role": "user", "content": [{"type": "text", "text": f"block {turn}"}]}
+
+
+def _assistant_turn(rng: random.Random, turn: int) -> list:
+    if rng.random() < 0.4:
+        calls = [
+            {
+                "id": f"call_{turn}_{i}",
+                "type": "function",
+                "function": {"name": "lookup", "arguments": json.dumps({"q": f"{turn}-{i}"})},
+            }
+            for i in range(rng.randint(1, 2))
+        ]
+        messages = [{"role": "assistant", "content": f"calling tools {turn}", "tool_calls": calls}]
+        messages += [
+            {"role": "tool", "tool_call_id": call["id"], "content": f"result {call['id']}"}
+            for call in calls
+        ]
+        return messages
+    return [{"role": "assistant", "content": f"answer {turn} {rng.random():.6f}"}]
+
+
+def _conversation(seed: int) -> list:
+    """Random OpenAI-format conversation with tool runs, images and same-role runs."""
+    rng = random.Random(seed)
+    messages = []
+    if rng.random() < 0.6:
+        messages.append({"role": "system", "content": f"system prompt {seed}"})
+    turn = 0
+    # 约三分之一的对话以 assistant 开头（system prompt 不能附加到 history 首条）
+    if rng.random() < 0.35:
+        messages += _assistant_turn(rng, turn)
+    for turn in range(1, rng.randint(3, 9)):
+        messages.append(_user_message(rng, turn))
+        if rng.random() < 0.25:
+            messages.append(_user_message(rng, turn))
+        messages += _assistant_turn(rng, turn)
+        if rng.random() < 0.15:
+            messages.append({"role": "assistant", "content": f"more {turn}"})
+    return messages
+
+
+def _reference_history(messages: list) -> list:
+    """History as built before the prefix cache: merge everything, then convert."""
+    chat_messages = [ChatMessage(**json.loads(json.dumps(m))) for m in messages]
+    system_prompt, non_system, _ = _extract_system_and_tool_docs(chat_messages, None)
+    merged = merge_adjacent_messages(non_system)
+    history_messages = merged[:-1]
+    if system_prompt and history_messages and history_messages[0].role == "user":
+        first = history_messages[0]
+        first.content = f"{system_prompt}\n\n{extract_text_content(first.content)}"
+    history = build_kiro_history(history_messages, get_internal_model_id(MODEL))
+    if merged[-1].role == "assistant":
+        # 当前消息为 assistant 时移入 history；history 为空时 system prompt 附加在它前面
+        content = extract_text_content(merged[-1].content)
+        if system_prompt and not history:
+            content = f"{system_prompt}\n\n{content}"
+        history.append({"assistantResponseMessage": {"content": content}})
+    return history
+
+
+def _payload(messages: list) -> dict:
+    request = ChatCompletionRequest(model=MODEL, messages=json.loads(json.dumps(messages)))
+    payload = build_kiro_payload(request, "conversation", "")
+    payload["conversationState"].pop("agentContinuationId")
+    return payload
+
+
+def _prefixes(messages: list) -> list:
+    start = 1 if messages and messages[0]["role"] == "system" else 0
+    return [messages[:end] for end in range(start + 1, len(messages) + 1)]
+
+
+@pytest.fixture
+def cache_budget():
+    """Restore the global history cache budget and contents after each test."""
+    original = history_cache.max_bytes
+    history_cache.clear()
+    yield
+    history_cache.max_bytes = original
+    history_cache.clear()
+
+
+@pytest.mark.parametrize("seed", range(40))
+def test_history_matches_reference_with_and_without_cache(seed, cache_budget):
+    conversation = _conversation(seed)
+
+    history_cache.max_bytes = 0
+    uncached = [_payload(prefix) for prefix in _prefixes(conversation)]
+
+    history_cache.max_bytes = 64 * 1024 * 1024
+    # 逐轮增长：除第一轮外都应命中前一轮缓存的前缀
+    warm = [_payload(prefix) for prefix in _prefixes(conversation)]
+    history_cache.clear()
+    cold = [_payload(prefix) for prefix in reversed(_prefixes(conversation))][::-1]
+
+    assert warm == uncached
+    assert cold == uncached
+    for prefix, payload in zip(_prefixes(conversation), uncached):
+        assert payload["conversationState"].get("history", []) == _reference_history(prefix)
+
+
+def test_growing_conversation_reuses_cached_prefix(cache_budget):
+    history_cache.max_bytes = 64 * 1024 * 1024
+    conversation = [
+        {"role": "system", "content": "be brief"},
+        {"role": "user", "content": "hello"},
+        {"role": "assistant", "content": "hi"},
+        {"role": "user", "content": "how are you"},
+        {"role": "assistant", "content": "fine"},
+        {"role": "user", "content": "bye"},
+    ]
+    _payload(conversation[:4])
+    hits = history_cache.hits
+    payload = _payload(conversation)
+
+    assert history_cache.hits == hits + 1
+    history = payload["conversationState"]["history"]
+    assert history == _reference_history(conversation)
+    assert history[0]["userInputMessage"]["content"] == "be brief\n\nhello"
+
+
+def test_system_prompt_not_prepended_to_assistant_first_history(cache_budget):
+    history_cache.max_bytes = 64 * 1024 * 1024
+    conversation = [
+        {"role": "system", "content": "be brief"},
+        {"role": "assistant", "content": "greeting"},
+        {"role": "user", "content": "hello"},
+        {"role": "assistant", "content": "hi"},
+        {"role": "user", "content": "bye"},
+    ]
+    _payload(conversation[:3])
+    payload = _payload(conversation)
+
+    history = payload["conversationState"]["history"]
+    assert history == _reference_history(conversation)
+    assert history[0] == {"assistantResponseMessage": {"content": "greeting"}}
+    assert all("be brief" not in json.dumps(entry) for entry in history)
+
+
+def test_history_images_become_placeholders_and_request_is_not_modified(cache_budget):
+    history_cache.max_bytes = 64 * 1024 * 1024
+    conversation = [
+        {"role": "user", "content": [
+            {"type": "text", "text": "what is this"},
+            {"type": "image_url", "image_url": {"url": IMAGE_URL}},
+        ]},
+        {"role": "user", "content": "second part"},
+        {"role": "assistant", "content": "a cat"},
+        {"role": "user", "content": "thanks"},
+    ]
+    request = ChatCompletionRequest(model=MODEL, messages=conversation)
+    before = [message.model_dump() for message in request.messages]
+    first = build_kiro_payload(request, "conversation", "")
+    second = build_kiro_payload(request, "conversation", "")
+
+    assert [message.model_dump() for message in request.messages] == before
+    history = first["conversationState"]["history"]
+    assert history == second["conversationState"]["history"] == _reference_history(conversation)
+    assert "张图片" in history[0]["userInputMessage"]["content"]
+    assert "images" not in history[0]["userInputMessage"]
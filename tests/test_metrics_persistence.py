@@ -0,0 +1,154 @@
+# -*- coding: utf-8 -*-
+
+"""
+指标持久化测试：管理端写入经由指标数据库执行器提交，不在事件循环上打开 SQLite；
+多进程模式下各 worker 的增量在共享库中累加。
+"""
+
+import asyncio
+import sqlite3
+import threading
+
+import pytest
+
+from kiro_gateway import metrics as metrics_module
+from kiro_gateway.config import settings
+from kiro_gateway.metrics import PrometheusMetrics
+
+
+@pytest.fixture
+def metrics_db(tmp_path, monkeypatch):
+    """Fresh metrics DB path; instances created by the test are closed afterwards."""
+    path = str(tmp_path / "metrics.db")
+    monkeypatch.setattr(metrics_module, "METRICS_DB_FILE", path)
+    monkeypatch.setattr(settings, "metrics_multiprocess", False)
+    instances = []
+
+    def create() -> PrometheusMetrics:
+        instance = PrometheusMetrics()
+        instances.append(instance)
+        return instance
+
+    yield create
+    for instance in instances:
+        instance.close()
+
+
+def test_admin_settings_persist_through_the_executor(metrics_db):
+    collector = metrics_db()
+
+    async def update():
+        assert await collector.ban_ip("203.0.113.0/24", "abuse")
+        assert await collector.ban_ip("198.51.100.7")
+        assert await collector.unban_ip("198.51.100.7")
+        assert await collector.set_site_enabled(False)
+        assert await collector.set_self_use_enabled(True)
+        assert await collector.set_require_approval(False)
+        assert await collector.set_proxy_api_key("new-proxy-key")
+
+    asyncio.run(update())
+    reloaded = metrics_db()
+
+    assert reloaded.is_ip_banned("203.0.113.9")
+    assert not reloaded.is_ip_banned("198.51.100.7")
+    assert not reloaded.is_site_enabled()
+    assert reloaded.is_self_use_enabled()
+    assert not reloaded.is_require_approval()
+    assert reloaded.get_proxy_api_key() == "new-proxy-key"
+
+
+def test_ban_waits_for_the_executor_without_blocking_the_loop(metrics_db):
+    collector = metrics_db()
+    release = threading.Event()
+    # 占住执行器线程，封禁的写入只能排队
+    collector._db_executor.submit(release.wait, 10)
+
+    async def scenario():
+        ban = asyncio.create_task(collector.ban_ip("192.0.2.1"))
+        await asyncio.sleep(0.05)
+        assert not ban.done()
+        # 内存状态已生效，且持有的锁已释放
+        assert collector.is_ip_banned("192.0.2.1")
+        assert collector._lock.acquire(timeout=1)
+        collector._lock.release()
+        release.set()
+        assert await ban
+
+    asyncio.run(scenario())
+
+
+def test_ip_stats_pages_survive_a_reload(metrics_db):
+    collector = metrics_db()
+    clock = iter(range(1_000, 10_000))
+    with pytest.MonkeyPatch.context() as patch:
+        patch.setattr(metrics_module.time, "time", lambda: next(clock))
+        for ip, hits in (("198.51.100.1", 3), ("198.51.100.2", 1), ("203.0.113.5", 1)):
+            for _ in range(hits):
+                collector.record_ip(ip)
+        collector.record_ip("198.51.100.2")
+    collector.flush()
+
+    for instance in (collector, metrics_db()):
+        by_count, total = instance.get_ip_stats(limit=2)
+        assert total == 3
+        assert [(item["ip"], item["count"]) for item in by_count] == [("198.51.100.1", 3), ("198.51.100.2", 2)]
+        recent, _ = instance.get_ip_stats(sort_field="last_seen")
+        assert [item["ip"] for item in recent] == ["198.51.100.2", "203.0.113.5", "198.51.100.1"]
+        found, found_total = instance.get_ip_stats(search="198.51.100.", sort_field="ip", sort_order="asc")
+        assert found_total == 2
+        assert [item["ip"] for item in found] == ["198.51.100.1", "198.51.100.2"]
+
+
+def test_stream_sketch_model_labels_are_escaped_and_bounded(metrics_db):
+    collector = metrics_db()
+    collector.observe_stream("claude-sonnet-4-5", "openai", "stream", 1.0)
+    collector.observe_stream('evil"}\nkirogate_up 1', "openai", "stream", 1.0)
+    for index in range(collector.MAX_STREAM_SKETCH_MODELS + 10):
+        collector.observe_stream(f"client-model-{index}", "anthropic", "stream", 2.0)
+
+    stats = collector._stream_quantile_stats()["response_duration_seconds"]
+    models = {entry["model"] for entry in stats}
+    assert "claude-sonnet-4-5" in models
+    # 已知模型不占名额，未知模型超过上限后归入 other
+    assert len(models - {"claude-sonnet-4-5", "other"}) == collector.MAX_STREAM_SKETCH_MODELS
+    assert next(entry["count"] for entry in stats if entry["model"] == "other") == 11
+
+    exported = collector.export_prometheus()
+    assert 'model="evil\\"}\\nkirogate_up 1"' in exported
+    assert "\nkirogate_up 1" not in exported
+
+
+def _sync_shared(instance: PrometheusMetrics) -> None:
+    """One shared-state sync, as the flush loop runs it after a flush."""
+    with instance._flush_lock:
+        instance._db_executor.call(instance._sync_shared, *instance._worker_state()).result()
+
+
+def _record(instance: PrometheusMetrics, count: int) -> None:
+    for _ in range(count):
+        instance.record_request("/v1/messages", 200, 10.0, is_stream=True, api_type="anthropic")
+
+
+def test_workers_keep_unflushed_increments_across_a_sync(metrics_db, monkeypatch):
+    monkeypatch.setattr(settings, "metrics_multiprocess", True)
+    first, second = metrics_db(), metrics_db()
+    second._worker_id += ":second"
+
+    _record(first, 1)
+    first.flush()
+    _record(second, 100)
+    second.flush()
+    # 同步时 first 还有未写入的增量
+    _record(first, 10)
+    _sync_shared(first)
+    first.flush()
+    _sync_shared(second)
+
+    with sqlite3.connect(first._db_path) as conn:
+        counters = dict(conn.execute("SELECT key, value FROM counters"))
+        hourly_total = conn.execute("SELECT SUM(count) FROM hourly_requests").fetchone()[0]
+    assert counters["stream_requests"] == counters["api:anthropic"] == 111
+    assert hourly_total == 111
+    for instance in (first, second):
+        assert instance._stream_requests == 111
+        assert sum(instance._hourly_requests.values()) == 111
@@ -0,0 +1,190 @@
+# -*- coding: utf-8 -*-
+
+"""
+RAW_BODY_FAST_PATH 一致性测试。
+
+快速路径用 model_validate_json 解析请求体，Anthropic 内容块保持 dict；
+默认路径由 FastAPI 先 json.loads 再校验为模型。两种模式对同一请求体必须给出
+相同的校验结果、Kiro payload 和 token 计数输入（converters 中
+_validates_as_content_blocks 依赖此测试保护）。
+
+默认模式下内容块为 dict 说明严格校验未通过，引入快速路径之前这类列表一律按
+dict 分支转换，因此参考结果为默认模式请求在该检查恒为 False 时的转换结果。
+"""
+
+import copy
+import json
+import random
+
+import pytest
+from pydantic import ValidationError
+
+from anthropic_requests import MODEL, random_anthropic_request
+from kiro_gateway import converters
+from kiro_gateway.converters import build_kiro_payload_from_anthropic
+from kiro_gateway.models import (
+    AnthropicCountTokensBatchRequest,
+    AnthropicMessagesRawRequest,
+    AnthropicMessagesRequest,
+    ChatCompletionRequest,
+)
+from kiro_gateway.tokenizer import count_message_tokens, count_tools_tokens
+
+MESSAGE_DEFAULTS = {name: None for name in ("name", "tool_calls", "tool_call_id")}
+
+
+def _odd_value(rng: random.Random, kind: str):
+    """Values of the wrong type, the kind pydantic coerces or rejects depending on strictness."""
+    return rng.choice({
+        "str": ["x", "", None, 0, 1, False, True, {"a": 1}],
+        "bool": [True, False, None, "true", "no", "1", 0, 1, 2, 1.0, "x"],
+        "dict": [{"a": 1}, None, "s", [1]],
+        "content": ["text", [{"type": "text", "text": "r"}], None, 5, {"k": 1}],
+    }[kind])
+
+
+def _odd_block(rng: random.Random, index: int):
+    if rng.random() < 0.05:
+        return rng.choice(["bare string", 5, None, {"no": "type"}])
+    odd = rng.random() < 0.15
+    block_type = rng.choice(["text", "image", "tool_use", "tool_result", "thinking", "redacted_thinking"])
+    block = {"type": block_type}
+    if block_type == "text":
+        block["text"] = _odd_value(rng, "str") if odd else f"text {index} 中文"
+    elif block_type == "image":
+        block["source"] = _odd_value(rng, "dict") if odd else {
+            "type": "base64", "media_type": "image/png", "data": "QUJD"
+        }
+    elif block_type == "tool_use":
+        block.update(
+            id=_odd_value(rng, "str") if odd else f"toolu_{index}",
+            name="lookup",
+            input=_odd_value(rng, "dict") if odd else {"index": index},
+        )
+    elif block_type == "tool_result":
+        block.update(
+            tool_use_id=f"toolu_{index}",
+            content=_odd_value(rng, "content") if odd else "ok",
+            is_error=_odd_value(rng, "bool") if odd else False,
+        )
+    elif block_type == "thinking":
+        block["thinking"] = _odd_value(rng, "str") if odd else "hmm"
+    if rng.random() < 0.2:
+        block["cache_control"] = {"type": "ephemeral"}
+    if rng.random() < 0.1:
+        del block["type"]
+    return block
+
+
+def _odd_request(rng: random.Random) -> dict:
+    """Request body with malformed blocks, coerced values and non-dict items."""
+    messages = [{"role": rng.choice(["user", "assistant", "user"])} for _ in range(rng.randint(1, 8))]
+    for index, message in enumerate(messages):
+        if rng.random() < 0.2:
+            message["content"] = f"plain {message['role']} {index}"
+        else:
+            message["content"] = [_odd_block(rng, index * 10 + k) for k in range(rng.randint(0, 3))]
+    return {
+        "model": MODEL,
+        "max_tokens": 100,
+        "messages": messages,
+        "system": rng.choice([None, "system", [{"type": "text", "text": "A"}]]),
+        "tools": rng.choice([None, [{"name": "lookup", "description": "d" * 90, "input_schema": {"type": "object"}}]]),
+    }
+
+
+def _convert(request):
+    try:
+        payload, message_fields, tools = build_kiro_payload_from_anthropic(copy.deepcopy(request), "conversation", "arn")
+    except Exception as e:
+        return ("error", type(e).__name__, str(e))
+    payload["conversationState"].pop("agentContinuationId")
+    messages = [{**MESSAGE_DEFAULTS, **fields} for fields in message_fields]
+    tool_dumps = [tool.model_dump() for tool in tools] if tools else None
+    return payload, messages, tool_dumps
+
+
+def _default_mode(body: str):
+    """FastAPI Body(...): json.loads, then model validation."""
+    try:
+        return AnthropicMessagesRequest.model_validate(json.loads(body))
+    except ValidationError:
+        return None
+
+
+def _fast_mode(body: str):
+    """RAW_BODY_FAST_PATH: one model_validate_json pass, content blocks stay dicts."""
+    try:
+        return AnthropicMessagesRawRequest.model_validate_json(body)
+    except ValidationError:
+        return None
+
+
+def _assert_modes_agree(body: str) -> None:
+    default_request = _default_mode(body)
+    fast_request = _fast_mode(body)
+    assert (default_request is None) == (fast_request is None), body
+    if default_request is None:
+        return
+    with pytest.MonkeyPatch.context() as patch:
+        patch.setattr(converters, "_validates_as_content_blocks", lambda content: False)
+        reference = _convert(default_request)
+    default = _convert(default_request)
+    fast = _convert(fast_request)
+    assert default == reference, body
+    assert fast == default, body
+    if not isinstance(default[0], str):
+        messages, tools = default[1], default[2]
+        assert count_message_tokens(messages) == count_message_tokens(fast[1])
+        assert count_tools_tokens(tools) == count_tools_tokens(fast[2])
+
+
+@pytest.mark.parametrize("seed", range(6))
+def test_modes_agree_on_malformed_bodies(seed):
+    rng = random.Random(seed)
+    for _ in range(250):
+        _assert_modes_agree(json.dumps(_odd_request(rng)))
+
+
+@pytest.mark.parametrize("seed", range(4))
+def test_modes_agree_on_well_formed_bodies(seed):
+    rng = random.Random(1000 + seed)
+    for _ in range(100):
+        _assert_modes_agree(json.dumps(random_anthropic_request(rng)))
+
+
+def test_modes_agree_for_chat_completions():
+    rng = random.Random(7)
+    for _ in range(100):
+        body = {
+            "model": MODEL,
+            "messages": [
+                {"role": "user", "content": rng.choice(["hi", [{"type": "text", "text": "hi"}], None])},
+                {"role": "assistant", "content": "ok", "tool_calls": rng.choice([None, []])},
+            ],
+            "stream": rng.choice([True, False, "true", 1]),
+            "temperature": rng.choice([None, 0.5, "0.5", 1]),
+        }
+        raw = json.dumps(body)
+        try:
+            default = ChatCompletionRequest.model_validate(json.loads(raw)).model_dump()
+        except ValidationError:
+            default = None
+        try:
+            fast = ChatCompletionRequest.model_validate_json(raw).model_dump()
+        except ValidationError:
+            fast = None
+        assert fast == default, raw
+
+
+def test_count_tokens_batch_modes_agree():
+    rng = random.Random(99)
+    body = {"requests": [
+        {key: value for key, value in random_anthropic_request(rng).items() if key in ("model", "messages", "system", "tools")}
+        for _ in range(20)
+    ]}
+    raw = json.dumps(body)
+    assert (
+        AnthropicCountTokensBatchRequest.model_validate_json(raw)
+        == AnthropicCountTokensBatchRequest.model_validate(json.loads(raw))
+    )
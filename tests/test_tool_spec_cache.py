@@ -0,0 +1,41 @@
+# -*- coding: utf-8 -*-
+
+"""工具定义转换缓存的命中统计测试。"""
+
+import pytest
+
+from kiro_gateway.converters import build_kiro_payload_from_anthropic
+from kiro_gateway.models import AnthropicMessagesRequest
+from kiro_gateway.tool_spec_cache import tool_spec_cache
+
+
+def _request() -> AnthropicMessagesRequest:
+    return AnthropicMessagesRequest(
+        model="claude-sonnet-4",
+        max_tokens=100,
+        messages=[{"role": "user", "content": "hi"}],
+        tools=[{
+            "name": "lookup",
+            "description": "Look something up",
+            "input_schema": {"type": "object", "properties": {"q": {"type": "string"}}},
+        }],
+    )
+
+
+@pytest.fixture
+def fresh_cache():
+    original = tool_spec_cache.max_bytes
+    tool_spec_cache.max_bytes = 16 * 1024 * 1024
+    tool_spec_cache.clear()
+    tool_spec_cache.hits = tool_spec_cache.misses = 0
+    yield
+    tool_spec_cache.max_bytes = original
+    tool_spec_cache.clear()
+
+
+def test_anthropic_request_counts_one_lookup(fresh_cache):
+    build_kiro_payload_from_anthropic(_request(), "conversation", "")
+    assert (tool_spec_cache.hits, tool_spec_cache.misses) == (0, 1)
+
+    build_kiro_payload_from_anthropic(_request(), "conversation", "")
+    assert (tool_spec_cache.hits, tool_spec_cache.misses) == (1, 1)
@@ -0,0 +1,169 @@
+# -*- coding: utf-8 -*-
+
+"""
+用户库缓存失效时机测试（认证主体缓存与管理端计数缓存）。
+
+写操作经 user_db_executor 在批次事务中执行。缓存必须在批次提交之后才失效：
+否则批次进行中的并发读取会读到已提交的旧行，并以失效后的新代数写入缓存，
+被封禁的用户、已吊销的 Key 或已登出的会话在整个 TTL 内仍能通过认证。
+"""
+
+import asyncio
+import hashlib
+import threading
+
+import pytest
+
+from kiro_gateway import database
+from kiro_gateway.database import UserDatabase
+from kiro_gateway.db_executor import DatabaseExecutor
+
+
+@pytest.fixture
+def user_db(tmp_path, monkeypatch):
+    monkeypatch.setattr(database, "USER_DB_FILE", str(tmp_path / "users.db"))
+    db = UserDatabase()
+    executor = DatabaseExecutor("test-user-db", batch=db.batch, readers=2)
+    yield db, executor
+    executor.stop()
+    db.reset_connections()
+
+
+def _read_concurrently(fn, *args):
+    """Run a read on another thread while the calling batch is still open."""
+    result = []
+    reader = threading.Thread(target=lambda: result.append(fn(*args)))
+    reader.start()
+    reader.join(10)
+    return result[0]
+
+
+def _batched(executor: DatabaseExecutor, *calls):
+    """Run calls as jobs of a single executor batch."""
+    async def run():
+        hold = threading.Event()
+        # 第一个任务占住执行线程，其余任务排队后在同一批次中执行
+        executor.submit(hold.wait, 10)
+        futures = [executor.call(fn, *args) for fn, *args in calls]
+        hold.set()
+        return [await asyncio.wrap_future(future) for future in futures]
+    return asyncio.run(run())
+
+
+def _new_user_with_key(db: UserDatabase):
+    user = db.create_user("alice", email="alice@example.com")
+    plain_key, api_key = db.generate_api_key(user.id, "main")
+    return user, plain_key, api_key
+
+
+def test_ban_during_batch_is_not_hidden_by_a_concurrent_read(user_db):
+    db, executor = user_db
+    user, plain_key, _api_key = _new_user_with_key(db)
+
+    _, (cached_user, _), _ = _batched(
+        executor,
+        (db.set_user_banned, user.id, True),
+        (_read_concurrently, db.get_api_key_principal, plain_key),
+        (lambda: None,),
+    )
+
+    # 读取发生在提交之前，看到的是旧行，但不能留在缓存里
+    assert not cached_user.is_banned
+    assert db.get_user(user.id).is_banned
+    assert db.get_cached_api_key_principal(plain_key) is None
+    principal, _ = db.get_api_key_principal(plain_key)
+    assert principal.is_banned
+
+
+@pytest.mark.parametrize("revoke", ["revoke_api_key", "delete_api_key", "set_api_key_active"])
+def test_revoked_key_is_not_recached_by_a_concurrent_read(user_db, revoke):
+    db, executor = user_db
+    user, plain_key, api_key = _new_user_with_key(db)
+    if revoke == "set_api_key_active":
+        call = (db.set_api_key_active, api_key.id, user.id, False)
+    else:
+        call = (getattr(db, revoke), api_key.id, user.id)
+
+    _batched(executor, call, (_read_concurrently, db.get_api_key_principal, plain_key))
+
+    key_hash = hashlib.sha256(plain_key.encode()).hexdigest()
+    assert db.api_key_cache.get(key_hash) is None
+    assert db.get_api_key_principal(plain_key) is None
+
+
+def test_invalidation_outside_a_batch_runs_after_commit(user_db):
+    db, _executor = user_db
+    user, plain_key, _api_key = _new_user_with_key(db)
+    db.get_api_key_principal(plain_key)
+    assert db.get_cached_api_key_principal(plain_key) is not None
+
+    db.set_user_banned(user.id, True)
+
+    assert db.get_cached_api_key_principal(plain_key) is None
+
+
+def test_logout_during_batch_is_not_hidden_by_a_concurrent_session_read():
+    from kiro_gateway.database import user_db, user_db_executor
+    from kiro_gateway.user_manager import user_manager
+
+    sessions = user_manager.session
+    user = user_db.create_user("bob", email="bob-logout@example.com")
+    token = sessions.create_session(user.id, user.session_version)
+
+    _, loaded = _batched(
+        user_db_executor,
+        (user_db.increment_session_version, user.id),
+        (_read_concurrently, sessions.load_session_user, token),
+    )
+
+    # 提交前读到的旧 session_version 仍然匹配，但不能被缓存
+    assert loaded is not None
+    assert user_db.session_cache.get(token) is None
+    assert asyncio.run(sessions.get_session_user(token)) is None
+
+
+def test_session_misses_load_on_a_reader_thread(monkeypatch):
+    from kiro_gateway.database import user_db
+    from kiro_gateway.user_manager import user_manager
+
+    sessions = user_manager.session
+    user = user_db.create_user("carol", email="carol-session@example.com")
+    token = sessions.create_session(user.id, user.session_version)
+    threads = []
+    get_user = user_db.get_user
+
+    def recording_get_user(user_id):
+        threads.append(threading.current_thread())
+        return get_user(user_id)
+
+    monkeypatch.setattr(user_db, "get_user", recording_get_user)
+
+    async def lookups():
+        return [await sessions.get_session_user(token) for _ in range(2)]
+
+    first, second = asyncio.run(lookups())
+
+    assert first.id == second.id == user.id
+    # 第二次命中缓存，不再读库
+    assert len(threads) == 1
+    assert threads[0] is not threading.main_thread()
+
+
+def test_admin_counts_are_not_cached_stale_by_a_concurrent_count(user_db):
+    db, executor = user_db
+    user = db.create_user("erin", email="erin@example.com")
+    assert db.get_token_count()["total"] == 0
+    assert db.get_user_count(is_banned=True) == 0
+
+    _, _, stale_tokens, stale_banned = _batched(
+        executor,
+        (db.donate_token, user.id, "refresh-token-1"),
+        (db.set_user_banned, user.id, True),
+        (_read_concurrently, db.get_token_count),
+        (_read_concurrently, db.get_user_count, "", None, True),
+    )
+
+    # 并发计数读到的是提交前的值，提交后缓存必须失效
+    assert stale_tokens["total"] == 0 and stale_banned == 0
+    assert db.get_token_count()["total"] == 1
+    assert db.get_user_count(is_banned=True) == 1